@@ -1,13 +1,32 @@
 # app/academic_agent.py
+from typing import Any, Dict, List, Optional
+
 from app.services.rag import generate_answer
+from app.services.categories import profile_for
+from app.services.deadline import Deadline
 
 
 class AcademicAgent:
     """ตอบคำถามด้านการเรียน/ลงทะเบียน/ปฏิทินการศึกษา"""
 
-    def answer(self, question: str) -> str:
-        q = "คำถามด้านการเรียน/ลงทะเบียน/ปฏิทินการศึกษา: " + (question or "").strip()
-        result = generate_answer(q)
+    def generate(
+        self,
+        question: str,
+        deadline: Optional[Deadline] = None,
+        mode: str = "auto",
+        chunks: Optional[List[Dict[str, Any]]] = None,
+        history: str = "",
+        search_query: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """คืนผลเต็มจาก generate_answer (answer / next_topics / skipped)"""
+        # hint ของ intent อยู่ใน profile (ใส่ใน prompt) + ค้นเฉพาะหมวด academic / general
+        return generate_answer(
+            question, deadline=deadline, mode=mode, profile=profile_for("academic"), chunks=chunks,
+            history=history, search_query=search_query,
+        )
+
+    def answer(self, question: str, deadline: Optional[Deadline] = None) -> str:
+        result = self.generate(question, deadline=deadline)
         if isinstance(result, dict):
             return (result.get("answer") or "").strip()
         return str(result).strip()
@@ -6,6 +6,10 @@ AnswerStylerAgent:
 - ปลอดภัยต่อ Multi-Agent Pipeline
 """
 
+# ประโยคปิดท้ายที่เติมให้ทุกคำตอบ (conversation ตัดออกก่อนเก็บเป็นประวัติ)
+CLOSING_LINE = "หากต้องการสอบถามเพิ่มเติม บอกผมได้เลยครับ 🙂"
+
+
 class AnswerStylerAgent:
     def style(self, answer: str) -> str:
         if not answer:
@@ -15,6 +19,6 @@ class AnswerStylerAgent:
 
         # เพิ่มความนุ่มแบบ ChatGPT — แต่ไม่ซ้ำกับ followups จริง
         if "หัวข้อถัดไป" not in text:
-            text += "\n\nหากต้องการสอบถามเพิ่มเติม บอกผมได้เลยครับ 🙂"
+            text += f"\n\n{CLOSING_LINE}"
 
         return text
@@ -7,8 +7,6 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import List, Optional, Dict, Any, Tuple, Protocol
 
-from sentence_transformers import util
-
 
 # ---------- Shared Types ----------
 
@@ -22,6 +20,8 @@ class AgentState:
     answer: str = ""
     followups: str = ""
     debug: Dict[str, Any] = None
+    # ผลกลางของแต่ละ stage ใน pipeline (app/agents/pipeline.py) เช่น FAQ ที่ match / chunk ที่ retrieve มา
+    data: Dict[str, Any] = None
 
     def __post_init__(self):
         if self.intent_keywords is None:
@@ -30,6 +30,8 @@ class AgentState:
             self.contexts = []
         if self.debug is None:
             self.debug = {}
+        if self.data is None:
+            self.data = {}
 
 
 class Agent(Protocol):
@@ -69,6 +71,18 @@ class QueryRewriterAgent:
         return state
 
 
+# keyword boost ตาม intent ของ IntentClassifierAgent (ใช้ใน multi-query expansion ด้วย)
+INTENT_KEYWORDS: Dict[str, List[str]] = {
+    "dress_code": ["ระเบียบ", "แต่งกาย", "เครื่องแบบ"],
+    "registration_calendar": ["ปฏิทิน", "ลงทะเบียน", "เพิ่มถอน"],
+    "scholarship": ["ทุน", "scholarship", "กยศ"],
+    "dormitory": ["หอพัก", "หอใน", "หอนอก"],
+    "fees": ["ค่าเทอม", "ค่าธรรมเนียม"],
+    "activities": ["กิจกรรม", "ชมรม", "อีเวนต์"],
+    "administration": ["สำนัก", "งานทะเบียน", "กองกิจการ"],
+}
+
+
 class IntentClassifierAgent:
     name = "IntentClassifierAgent"
 
@@ -101,16 +115,7 @@ class IntentClassifierAgent:
         state.intent = intent
 
         # keyword boost พื้นฐานตาม intent
-        mapping = {
-            "dress_code": ["ระเบียบ", "แต่งกาย", "เครื่องแบบ"],
-            "registration_calendar": ["ปฏิทิน", "ลงทะเบียน", "เพิ่มถอน"],
-            "scholarship": ["ทุน", "scholarship", "กยศ"],
-            "dormitory": ["หอพัก", "หอใน", "หอนอก"],
-            "fees": ["ค่าเทอม", "ค่าธรรมเนียม"],
-            "activities": ["กิจกรรม", "ชมรม", "อีเวนต์"],
-            "administration": ["สำนัก", "งานทะเบียน", "กองกิจการ"],
-        }
-        state.intent_keywords = mapping.get(intent, [])
+        state.intent_keywords = list(INTENT_KEYWORDS.get(intent, []))
         state.debug["intent"] = state.intent
         state.debug["intent_keywords"] = state.intent_keywords
         return state
@@ -119,12 +124,26 @@ class IntentClassifierAgent:
 class RetrieverAgent:
     name = "RetrieverAgent"
 
-    def __init__(self, collection, embedder, top_k=10, keep=4, threshold=0.32):
+    def __init__(
+        self,
+        collection,
+        embedder,
+        top_k=10,
+        keep=4,
+        threshold=0.32,
+        lexical=None,
+        lexical_weight=0.0,
+        rrf_k=60,
+    ):
         self.collection = collection
         self.embedder = embedder
         self.top_k = top_k
         self.keep = keep
         self.threshold = threshold
+        # lexical: LexicalIndex (BM25) ของ collection เดียวกัน → รวมผลด้วย RRF
+        self.lexical = lexical
+        self.lexical_weight = lexical_weight
+        self.rrf_k = rrf_k
 
     def run(self, state: AgentState) -> AgentState:
         q = state.rewritten or state.question
@@ -139,36 +158,75 @@ class RetrieverAgent:
         k = min(self.top_k, total)
         q_emb = self.embedder.encode([q])[0].tolist()
         res = self.collection.query(query_embeddings=[q_emb], n_results=k)
+        ids = (res.get("ids") or [[]])[0] or []
         docs = (res.get("documents") or [[]])[0] or []
+
+        lex_ids: List[str] = []
+        if self.lexical is not None and self.lexical_weight > 0:
+            # ใช้คำถามเดิม (ไม่เติม keyword ของ intent) — BM25 ต้องการคำที่ผู้ใช้พิมพ์จริง
+            lex_ids = [cid for cid, _ in self.lexical.search(state.rewritten or state.question, k=k)]
+            seen = set(ids)
+            missing = [cid for cid in lex_ids if cid not in seen]
+            if missing:
+                got = self.collection.get(ids=missing, include=["documents"])
+                ids = list(ids) + list(got.get("ids") or [])
+                docs = list(docs) + list(got.get("documents") or [])
+
         if not docs:
             state.contexts = []
             return state
 
         # rerank
+        from sentence_transformers import util
+
         q_vec = self.embedder.encode(q)
         doc_vecs = self.embedder.encode(docs)
         scores = util.cos_sim(q_vec, doc_vecs)[0].tolist()
-        scored = sorted(zip(scores, docs), key=lambda x: x[0], reverse=True)
-        filtered = [d for s, d in scored if s >= self.threshold][: self.keep]
+
+        if lex_ids:
+            from app.services.lexical import rrf_fuse
+
+            text_by_id = dict(zip(ids, docs))
+            score_by_id = dict(zip(ids, scores))
+            dense_order = [cid for _, cid in sorted(zip(scores, ids), key=lambda x: x[0], reverse=True)]
+            lexical_top = set(lex_ids[: self.keep])
+            filtered = [
+                text_by_id[cid]
+                for cid, _ in rrf_fuse(dense_order, lex_ids, self.lexical_weight, self.rrf_k)
+                if cid in text_by_id and (score_by_id[cid] >= self.threshold or cid in lexical_top)
+            ][: self.keep]
+        else:
+            scored = sorted(zip(scores, docs), key=lambda x: x[0], reverse=True)
+            filtered = [d for s, d in scored if s >= self.threshold][: self.keep]
 
         state.contexts = filtered
         state.debug["contexts_count"] = len(filtered)
+        state.debug["lexical_hits"] = len(lex_ids)
         return state
 
 
 class AnswerAgent:
     name = "AnswerAgent"
 
-    def __init__(self, call_gemini: GeminiCaller, max_tokens=220):
+    def __init__(self, call_gemini: GeminiCaller, max_tokens=220, max_input_tokens=None):
         self.call_gemini = call_gemini
         self.max_tokens = max_tokens
+        # budget ของ context (token แบบประมาณ) — None = ไม่จำกัด
+        self.max_input_tokens = max_input_tokens
 
     def run(self, state: AgentState) -> AgentState:
         if not state.contexts:
             state.answer = "ไม่พบข้อมูลในระบบ กรุณาติดต่อเจ้าหน้าที่มหาวิทยาลัย"
             return state
 
-        context_text = "\n\n---\n\n".join(state.contexts)
+        contexts = state.contexts
+        if self.max_input_tokens is not None:
+            from app.services.prompt_budget import pack_context
+
+            # state.contexts เรียงจาก RetrieverAgent แล้ว (ดีสุดก่อน)
+            contexts, stats = pack_context(contexts, self.max_input_tokens)
+            state.debug["prompt_budget"] = stats
+        context_text = "\n\n---\n\n".join(contexts)
         system = (
             "คุณเป็นผู้ช่วยนักศึกษามหาวิทยาลัยแม่ฟ้าหลวง (MFU)\n"
             "ตอบคำถามให้ตรงที่สุด โดยใช้เฉพาะข้อมูลใน CONTEXT เท่านั้น\n"
@@ -1,7 +1,11 @@
+from typing import List, Optional
 from sqlalchemy.orm import Session
 from app.models.sql import Document
-import google.generativeai as genai
+from app.services.deadline import Deadline
 import os
+import time
+
+from app.core.metrics import record_llm_call
 
 class CapabilitiesAgent:
     """
@@ -10,11 +14,32 @@ class CapabilitiesAgent:
     """
     
     def __init__(self):
+        # สร้าง model ตอนเรียกครั้งแรก (import google.generativeai ช้า — ไม่ทำตอน start)
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = self._make_model()
+        return self._model
+
+    def _make_model(self):
+        import google.generativeai as genai
+
         # ตั้งค่า Gemini
-        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-        self.model = genai.GenerativeModel("gemini-2.0-flash-exp")
+        base_url = os.getenv("GEMINI_BASE_URL")
+        if base_url:
+            # REST transport เพื่อให้ชี้ไป fake Gemini (benchmarks) ได้
+            genai.configure(
+                api_key=os.getenv("GEMINI_API_KEY"),
+                transport="rest",
+                client_options={"api_endpoint": base_url},
+            )
+        else:
+            genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        return genai.GenerativeModel("gemini-2.0-flash-exp")
     
-    def answer(self, db: Session) -> str:
+    def answer(self, db: Session, deadline: Optional[Deadline] = None) -> str:
         # ดึงรายชื่อเอกสารทั้งหมด
         docs = db.query(Document).all()
         
@@ -37,6 +62,11 @@ class CapabilitiesAgent:
         
         if not all_titles:
             return "ขณะนี้ระบบยังไม่มีข้อมูลเอกสารใดๆ ครับ"
+
+        # เวลาไม่พอเรียก LLM → แสดงแค่รายชื่อเอกสาร
+        if deadline is not None and not deadline.allows("generate"):
+            deadline.skip("generate")
+            return self._title_list(all_titles)
         
         # สร้าง prompt สำหรับ LLM
         documents_text = "\n\n---\n\n".join(all_content_samples[:10])  # จำกัด 10 เอกสารแรก
@@ -62,8 +92,12 @@ class CapabilitiesAgent:
 ห้ามใส่ชื่อเอกสารโดยตรง ให้สรุปเป็นหัวข้อที่เข้าใจง่ายแทน
 """
         
+        t0 = time.perf_counter()
         try:
             response = self.model.generate_content(prompt)
+            record_llm_call(
+                "capabilities", time.perf_counter() - t0, response, prompt_chars=len(prompt)
+            )
             summary = response.text.strip()
             
             # เพิ่มคำแนะนำท้าย
@@ -74,10 +108,16 @@ class CapabilitiesAgent:
             return result
             
         except Exception as e:
+            record_llm_call(
+                "capabilities", time.perf_counter() - t0, error=True, prompt_chars=len(prompt)
+            )
             print(f"[CapabilitiesAgent] LLM Error: {e}", flush=True)
             # Fallback: แสดงแค่รายชื่อเอกสาร
-            doc_list = [f"- {title}" for title in all_titles]
-            text = "ตอนนี้ผมสามารถตอบคำถามจากเอกสารเหล่านี้ได้ครับ:\n\n"
-            text += "\n".join(doc_list)
-            text += "\n\nคุณสามารถถามรายละเอียดเกี่ยวกับหัวข้อเหล่านี้ได้เลยครับ"
-            return text
+            return self._title_list(all_titles)
+
+    def _title_list(self, all_titles: List[str]) -> str:
+        doc_list = [f"- {title}" for title in all_titles]
+        text = "ตอนนี้ผมสามารถตอบคำถามจากเอกสารเหล่านี้ได้ครับ:\n\n"
+        text += "\n".join(doc_list)
+        text += "\n\nคุณสามารถถามรายละเอียดเกี่ยวกับหัวข้อเหล่านี้ได้เลยครับ"
+        return text
@@ -1,10 +1,19 @@
 # app/agents/faq_agent.py
-import json
-from typing import Optional
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from sentence_transformers import SentenceTransformer, util
+from sqlalchemy.exc import IntegrityError
 
+from app.core.startup import embedding_swap
 from app.models.sql import FaqEntry
+from app.services.quantize import check_dtype, decode_vector, encode_vector
+
+# precision ของ embedding ที่เก็บใน faq_entries: float32 (JSON เดิม) | float16 | int8
+FAQ_VECTOR_DTYPE = check_dtype(os.getenv("FAQ_VECTOR_DTYPE", "float32"))
 
 
 class FaqAgent:
@@ -12,47 +21,134 @@ class FaqAgent:
     ใช้สำหรับ:
     - หา FAQ ที่คล้ายกับคำถาม (semantic match)
     - บันทึกคำถามที่ถามบ่อย พร้อม embedding
+
+    embedding ของ FAQ ทั้งหมดถูก decode เป็น matrix เก็บไว้ใน memory (โหลดตอน warmup)
+    แต่ละ lookup เช็คแค่ (จำนวนแถว, id ล่าสุด) — เปลี่ยน (worker อื่นเพิ่ม FAQ) → โหลดใหม่
     """
 
-    def __init__(self, embedder: SentenceTransformer, threshold: float = 0.85):
+    def __init__(
+        self,
+        embedder,
+        threshold: float = 0.85,
+        vector_dtype: str = FAQ_VECTOR_DTYPE,
+    ):
         self.embedder = embedder
         self.threshold = threshold
+        self.vector_dtype = check_dtype(vector_dtype)
+        # (signature, faq ids, matrix ที่ normalize แล้ว)
+        self._index: Optional[Tuple[Tuple[int, int], List[int], Optional[np.ndarray]]] = None
+        self._index_lock = threading.Lock()
+
+    # ------------------------------------------------------------
+    # FAQ index (in-memory)
+    # ------------------------------------------------------------
+    @property
+    def loaded(self) -> bool:
+        return self._index is not None
+
+    @staticmethod
+    def _signature(db: Session) -> Tuple[int, int]:
+        count, max_id = db.query(func.count(FaqEntry.id), func.max(FaqEntry.id)).one()
+        return int(count or 0), int(max_id or 0)
+
+    def load_index(self, db: Session) -> int:
+        """decode embedding ของ FAQ ทุกแถวเป็น matrix — คืนจำนวนแถวที่ใช้ได้"""
+        with self._index_lock:
+            sig = self._signature(db)
+            ids, vecs = [], []
+            for faq_id, emb in db.query(FaqEntry.id, FaqEntry.question_embedding).all():
+                if not emb:
+                    continue
+                try:
+                    vecs.append(decode_vector(emb))
+                except Exception:
+                    continue
+                ids.append(faq_id)
+            mat = None
+            if vecs:
+                dims = {v.shape for v in vecs}
+                # มีหลายขนาด (เปลี่ยน embedding model) → ใช้ขนาดที่พบมากที่สุด
+                shape = max(dims, key=lambda d: sum(v.shape == d for v in vecs))
+                keep = [i for i, v in enumerate(vecs) if v.shape == shape]
+                ids = [ids[i] for i in keep]
+                mat = np.vstack([vecs[i] for i in keep]).astype(np.float32)
+                mat /= np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+            self._index = (sig, ids, mat)
+            return len(ids)
+
+    def _current_index(self, db: Session):
+        index = self._index
+        if index is None or index[0] != self._signature(db):
+            self.load_index(db)
+            index = self._index
+        return index
+
+    def invalidate_index(self):
+        self._index = None
+
+    def prepare_reembed(self, db: Session, encoder) -> Callable[[Session], int]:
+        """embed คำถามของ FAQ ทุกแถวด้วย encoder ใหม่ (เปลี่ยน embedding model)
+
+        คืน commit(db): เขียน vector ใหม่ลง question_embedding ใน transaction เดียว
+        (FAQ ที่เพิ่มหลัง prepare ถูก embed ตอน commit) แล้วล้าง index ใน memory
+        """
+        rows = db.query(FaqEntry.id, FaqEntry.question).all()
+        encoded = self._encode_rows(rows, encoder)
+
+        def commit(db: Session) -> int:
+            missing = db.query(FaqEntry.id, FaqEntry.question).filter(~FaqEntry.id.in_(list(encoded) or [0])).all()
+            encoded.update(self._encode_rows(missing, encoder))
+            for faq_id, emb in encoded.items():
+                db.query(FaqEntry).filter(FaqEntry.id == faq_id).update(
+                    {FaqEntry.question_embedding: emb}, synchronize_session=False
+                )
+            db.commit()
+            self.invalidate_index()
+            return len(encoded)
+
+        return commit
+
+    def _encode_rows(self, rows, encoder) -> Dict[int, str]:
+        if not rows:
+            return {}
+        vecs = encoder.encode([q or "" for _, q in rows], show_progress_bar=False)
+        return {faq_id: encode_vector(v, self.vector_dtype) for (faq_id, _), v in zip(rows, vecs)}
 
     # ------------------------------------------------------------
     # ใช้ตอน Multi-Agent Router → ตรวจว่าเป็น FAQ หรือไม่
     # ------------------------------------------------------------
     def find_best_faq(self, question: str, db: Session) -> Optional[FaqEntry]:
-        faqs = db.query(FaqEntry).all()
-        if not faqs:
-            return None
+        return self.find_best_faq_scored(question, db)[0]
 
-        q_vec = self.embedder.encode(question)
+    @embedding_swap.shared()
+    def find_best_faq_scored(self, question: str, db: Session) -> Tuple[Optional[FaqEntry], float]:
+        """เหมือน find_best_faq แต่คืน similarity ที่ดีที่สุดด้วย (ใช้ใน debug trace)"""
+        _, ids, mat = self._current_index(db)
+        if not ids:
+            return None, 0.0
+
+        q_vec = np.asarray(self.embedder.encode(question), dtype=np.float32)
+        if mat.shape[1] != q_vec.shape[0]:
+            return None, 0.0
 
         best = None
         best_score = 0.0
 
-        for f in faqs:
-            if not f.question_embedding:
-                continue
-
-            try:
-                v = json.loads(f.question_embedding)
-            except:
-                continue
-
-            score = float(util.cos_sim(q_vec, v).item())  # ← FIXED
-
-            if score > best_score:
-                best_score = score
-                best = f
+        sims = (mat @ q_vec) / max(float(np.linalg.norm(q_vec)), 1e-12)
+        i = int(np.argmax(sims))
+        if sims[i] > 0:
+            best_score = float(sims[i])
+            if best_score >= self.threshold:
+                best = db.get(FaqEntry, ids[i])
 
         if best and best_score >= self.threshold:
-            return best
-        return None
+            return best, best_score
+        return None, best_score
 
     # ------------------------------------------------------------
     # บันทึกคำถามใหม่เป็น FAQ (ต้องกรองก่อน)
     # ------------------------------------------------------------
+    @embedding_swap.shared()
     def register_faq(self, question: str, answer: str, db: Session):
         """
         บันทึกเฉพาะคำถามที่:
@@ -69,17 +165,22 @@ class FaqAgent:
         if existing:
             return
 
-        vec = self.embedder.encode(question).tolist()
+        vec = self.embedder.encode(question)
 
         new_faq = FaqEntry(
             question=question,
             answer=answer,
-            question_embedding=json.dumps(vec),
+            question_embedding=encode_vector(vec, self.vector_dtype),
             hits=1,
         )
 
         db.add(new_faq)
-        db.commit()
+        try:
+            db.commit()
+        except IntegrityError:
+            # request อื่น (หรือ worker อื่น) สร้าง FAQ เดียวกันไปก่อนแล้ว
+            db.rollback()
+        self.invalidate_index()
 
     # ------------------------------------------------------------
     # ใช้ตอนตอบ FAQ → นับสถิติความนิยม
@@ -0,0 +1,207 @@
+# app/agents/pipeline.py
+"""
+DAG executor ของ Agent (app/agents/base.py)
+
+stage แต่ละตัวคือ Agent (name + run(state)) ที่ประกาศว่าต้องรอ stage ไหนก่อน (after)
+- stage ที่ dependency ครบแล้วรันพร้อมกันบน asyncio (Agent เป็นโค้ด sync → รันใน thread pool
+  พร้อม contextvars ของ request — trace / metrics ของ stage ยังลง request เดิม)
+  → latency รวม = critical path ของ graph แทนผลรวมของทุก stage
+- when(state) → False: ข้าม stage (ตรวจตอน dependency ครบ)
+- speculative=True: งานที่เริ่มล่วงหน้าเผื่อได้ใช้ (เช่น retrieval ระหว่างรอ router / FAQ)
+  เมื่อ short_circuit(state) เป็นจริงหลัง stage ใดจบ → ยกเลิก speculative stage ที่ยังรันอยู่
+  และไม่เริ่มตัวที่ยังไม่ได้เริ่ม (thread ที่รันอยู่แล้วทำต่อจนจบ แต่ไม่มีใครรอผล)
+  + set state.data["cancel"] (threading.Event) → stage ตรวจเองก่อนงานแพง (Gemini / retrieval)
+    เพื่อไม่เสีย call ที่ไม่มีใครใช้ผล
+- stage ที่ถูกข้าม / ยกเลิก นับว่า "จบ" สำหรับ stage ที่รอมัน → ตัวที่รอตรวจ state เองใน when
+- concurrent=False: รันทีละ stage ตามลำดับ topological (กติกาเดียวกัน — ใช้เทียบ / debug)
+
+เวลาเริ่ม / จบของแต่ละ stage (ms นับจากเริ่ม pipeline) อยู่ใน state.debug["dag"]
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.agents.base import Agent, AgentState
+
+logger = logging.getLogger(__name__)
+
+# thread สำหรับ stage ของทุก request (stage ส่วนใหญ่รอ I/O: Gemini / DB)
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "64"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="stage")
+    return _executor
+
+
+class FunctionAgent:
+    """Agent จากฟังก์ชัน fn(state) (ไม่ต้องคืนค่า — เขียนผลลง state)"""
+
+    def __init__(self, name: str, fn: Callable[[AgentState], Any]):
+        self.name = name
+        self.fn = fn
+
+    def run(self, state: AgentState) -> AgentState:
+        self.fn(state)
+        return state
+
+
+@dataclass
+class Stage:
+    agent: Agent
+    after: Sequence[str] = ()
+    when: Optional[Callable[[AgentState], bool]] = None
+    speculative: bool = False
+
+    @property
+    def name(self) -> str:
+        return self.agent.name
+
+
+def stage_fn(name: str, fn: Callable[[AgentState], Any], **kwargs) -> Stage:
+    return Stage(FunctionAgent(name, fn), **kwargs)
+
+
+class Pipeline:
+    name = "Pipeline"
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        short_circuit: Optional[Callable[[AgentState], bool]] = None,
+        concurrent: bool = True,
+    ):
+        self.stages = stages
+        self.short_circuit = short_circuit
+        self.concurrent = concurrent
+        self._order = self._toposort(stages)
+
+    @staticmethod
+    def _toposort(stages: List[Stage]) -> List[Stage]:
+        by_name = {st.name: st for st in stages}
+        if len(by_name) != len(stages):
+            raise ValueError("duplicate stage name")
+        for st in stages:
+            for dep in st.after:
+                if dep not in by_name:
+                    raise ValueError(f"stage {st.name} depends on unknown stage {dep}")
+        order: List[Stage] = []
+        done: set = set()
+        pending = list(stages)
+        while pending:
+            ready = [st for st in pending if all(d in done for d in st.after)]
+            if not ready:
+                raise ValueError(f"dependency cycle among: {', '.join(st.name for st in pending)}")
+            for st in ready:
+                order.append(st)
+                done.add(st.name)
+            pending = [st for st in pending if st.name not in done]
+        return order
+
+    # ------------------------------------------------------------
+    # Agent interface
+    # ------------------------------------------------------------
+    def run(self, state: AgentState) -> AgentState:
+        if not self.concurrent:
+            return self._run_sequential(state)
+        return asyncio.run(self.run_async(state))
+
+    # ------------------------------------------------------------
+    # bookkeeping
+    # ------------------------------------------------------------
+    def _start(self, state: AgentState, st: Stage, started: float, halted: bool) -> bool:
+        """ตรวจก่อนเริ่ม stage → True = รันได้ (ไม่งั้นบันทึกสถานะข้าม / ยกเลิก)"""
+        dag = state.debug["dag"]
+        if halted and st.speculative:
+            dag[st.name] = {"status": "cancelled"}
+            return False
+        if st.when is not None and not st.when(state):
+            dag[st.name] = {"status": "skipped"}
+            return False
+        dag[st.name] = {"status": "running", "start_ms": round((time.perf_counter() - started) * 1000.0, 2)}
+        return True
+
+    @staticmethod
+    def _finish(state: AgentState, name: str, started: float, status: str):
+        info = state.debug["dag"][name]
+        info["status"] = status
+        if "start_ms" in info:
+            info["end_ms"] = round((time.perf_counter() - started) * 1000.0, 2)
+
+    def _run_sequential(self, state: AgentState) -> AgentState:
+        state.data.setdefault("cancel", threading.Event())
+        state.debug["dag"] = {}
+        started = time.perf_counter()
+        halted = False
+        for st in self._order:
+            if not self._start(state, st, started, halted):
+                continue
+            st.agent.run(state)
+            self._finish(state, st.name, started, "done")
+            if not halted and self.short_circuit and self.short_circuit(state):
+                halted = True
+                state.data["cancel"].set()
+        return state
+
+    async def run_async(self, state: AgentState) -> AgentState:
+        loop = asyncio.get_running_loop()
+        executor = _get_executor()
+        cancel = state.data.setdefault("cancel", threading.Event())
+        state.debug["dag"] = {}
+        dag = state.debug["dag"]
+        started = time.perf_counter()
+        halted = False
+        running: Dict[asyncio.Future, Stage] = {}
+
+        def launch():
+            progressed = True
+            while progressed:
+                progressed = False
+                for st in self._order:
+                    if st.name in dag or not all(d in dag and dag[d]["status"] != "running" for d in st.after):
+                        continue
+                    progressed = True
+                    if self._start(state, st, started, halted):
+                        ctx = contextvars.copy_context()
+                        fut = loop.run_in_executor(executor, functools.partial(ctx.run, st.agent.run, state))
+                        running[fut] = st
+
+        try:
+            launch()
+            while running:
+                done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+                for fut in done:
+                    st = running.pop(fut)
+                    fut.result()  # stage error → ทั้ง pipeline error (เหมือนรันทีละขั้น)
+                    self._finish(state, st.name, started, "done")
+                if not halted and self.short_circuit and self.short_circuit(state):
+                    halted = True
+                    cancel.set()
+                    for fut, st in list(running.items()):
+                        if st.speculative:
+                            fut.cancel()
+                            running.pop(fut)
+                            self._finish(state, st.name, started, "cancelled")
+                launch()
+        finally:
+            if running:
+                cancel.set()
+            for fut, st in running.items():
+                fut.cancel()
+                self._finish(state, st.name, started, "cancelled")
+        return state
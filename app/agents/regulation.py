@@ -1,12 +1,28 @@
 # app/agents/regulation_agent.py
+from typing import Any, Dict, List, Optional
+
 from app.services.rag import generate_answer
+from app.services.categories import profile_for
+from app.services.deadline import Deadline
 
 class RegulationAgent:
-    def answer(self, question: str) -> str:
-        # เพิ่ม prefix เพื่อโฟกัส intent ด้านกฎ/ระเบียบ
-        q = "คำถามด้านระเบียบ/กฎ/แต่งกาย/วินัยนักศึกษา: " + question.strip()
+    def generate(
+        self,
+        question: str,
+        deadline: Optional[Deadline] = None,
+        mode: str = "auto",
+        chunks: Optional[List[Dict[str, Any]]] = None,
+        history: str = "",
+        search_query: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        # prefix ของ intent ด้านกฎ/ระเบียบอยู่ใน profile (ใส่ใน prompt) + ค้นเฉพาะหมวด regulation / general
+        return generate_answer(
+            question, deadline=deadline, mode=mode, profile=profile_for("regulation"), chunks=chunks,
+            history=history, search_query=search_query,
+        )
 
-        result = generate_answer(q)
+    def answer(self, question: str, deadline: Optional[Deadline] = None) -> str:
+        result = self.generate(question, deadline=deadline)
 
         # generate_answer() อาจคืน dict หรือ str
         if isinstance(result, dict):
@@ -1,24 +1,37 @@
 # app/agents/router.py
 from dataclasses import dataclass
-from typing import List
-from google import genai
-from google.genai.types import HttpOptions, GenerateContentConfig
+from typing import Dict, List, Optional
 import os
 import json
 import re
+import time
+
+from app.core.metrics import record_llm_call
+from app.core.startup import Lazy
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 ROUTER_MODEL = os.getenv("ROUTER_MODEL_NAME") or os.getenv(
     "GEMINI_MODEL_NAME", "gemini-2.0-flash"
 )
 
-if not GEMINI_API_KEY:
-    raise RuntimeError("GEMINI_API_KEY is not set in .env")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL") or None
 
-client = genai.Client(
-    api_key=GEMINI_API_KEY,
-    http_options=HttpOptions(api_version="v1"),
-)
+
+
+def _make_client():
+    if not GEMINI_API_KEY:
+        raise RuntimeError("GEMINI_API_KEY is not set in .env")
+    from google import genai
+    from google.genai.types import HttpOptions
+
+    return genai.Client(
+        api_key=GEMINI_API_KEY,
+        http_options=HttpOptions(api_version="v1", base_url=GEMINI_BASE_URL),
+    )
+
+
+# สร้างตอนใช้ครั้งแรก / ตอน warmup (ดู app/core/startup.py)
+client = Lazy("router_client", _make_client, required=False)  # ไม่มี → heuristic router
 
 ALLOWED_INTENTS: List[str] = [
     "academic",
@@ -32,6 +45,20 @@ ALLOWED_INTENTS: List[str] = [
 ]
 
 
+# keyword สำหรับ heuristic router (ใช้ตอนเวลาไม่พอเรียก LLM router)
+HEURISTIC_KEYWORDS: Dict[str, List[str]] = {
+    "capabilities": ["ทำอะไรได้", "ตอบอะไรได้", "มีความรู้อะไร", "ถามอะไรได้", "what can you"],
+    "scholarship": ["ทุน", "กยศ", "กรอ", "ผ่อนผัน", "ค่าธรรมเนียม", "ค่าเทอม", "scholarship", "tuition"],
+    "dorm": ["หอพัก", "หอใน", "หอนอก", "ค่าหอ", "เข้าพัก", "dorm"],
+    "contact": ["ติดต่อ", "เบอร์", "โทร", "อีเมล", "email", "สำนักงาน", "contact"],
+    "regulation": ["ระเบียบ", "แต่งกาย", "เครื่องแบบ", "วินัย", "ข้อบังคับ", "ลงโทษ", "regulation"],
+    "academic": [
+        "ลงทะเบียน", "รายวิชา", "วิชา", "เกรด", "เกียรตินิยม", "ปฏิทิน", "สอบ",
+        "เพิ่มถอน", "หน่วยกิต", "จบการศึกษา", "register", "course", "grade", "gpa",
+    ],
+}
+
+
 @dataclass
 class RouteResult:
     intent: str
@@ -39,6 +66,31 @@ class RouteResult:
     confidence: float
 
 
+def _intent_to_route(intent: str) -> str:
+    if intent in ["academic", "regulation", "scholarship", "dorm", "contact", "general_rag"]:
+        return "rag"
+    if intent == "capabilities":
+        return "local"
+    return "unknown"
+
+
+def heuristic_route(question: str) -> RouteResult:
+    """Router แบบ local (keyword) — ไม่เรียก LLM ใช้ตอน deadline ใกล้หมด / Gemini router ล้มเหลว"""
+    q = (question or "").strip().lower()
+    if not q:
+        return RouteResult(intent="unknown", route="unknown", confidence=0.0)
+
+    best_intent = "general_rag"
+    best_hits = 0
+    for intent, words in HEURISTIC_KEYWORDS.items():
+        hits = sum(1 for w in words if w in q)
+        if hits > best_hits:
+            best_intent, best_hits = intent, hits
+
+    conf = 0.3 if best_hits == 0 else min(0.5 + 0.1 * best_hits, 0.8)
+    return RouteResult(intent=best_intent, route=_intent_to_route(best_intent), confidence=conf)
+
+
 class RouterAgent:
     """Router ตัวหลัก ใช้ Gemini จำแนก intent ของคำถามนักศึกษา MFU"""
 
@@ -65,65 +117,72 @@ class RouterAgent:
 
 ห้ามใส่คำอธิบายอื่นเพิ่มเติม""".strip()
 
-    def route(self, question: str) -> RouteResult:
-        intent = "unknown"
-        conf = 0.0
+    def route(self, question: str, timeout: Optional[float] = None) -> RouteResult:
+        """timeout (วินาที) มาจาก Deadline ของ request — Gemini error / timeout → heuristic_route"""
+        try:
+            return self.classify(question, timeout=timeout)
+        except Exception as e:
+            print("[RouterAgent][WARN] route failed, heuristic fallback:", e, flush=True)
+            return heuristic_route(question)
 
+    def classify(self, question: str, timeout: Optional[float] = None) -> RouteResult:
+        """เหมือน route แต่ไม่ fallback: Gemini error / timeout → raise (caller ตัดสินใจเอง)"""
         q = (question or "").strip()
         if not q:
-            return RouteResult(intent=intent, route="unknown", confidence=conf)
-
+            return RouteResult(intent="unknown", route="unknown", confidence=0.0)
+
+        from google.genai.types import GenerateContentConfig, HttpOptions
+
+        prompt = self._build_prompt(q)
+        config = GenerateContentConfig(
+            temperature=0.0,
+            max_output_tokens=128,
+        )
+        if timeout is not None:
+            config.http_options = HttpOptions(timeout=max(1, int(timeout * 1000)))
+        t0 = time.perf_counter()
         try:
-            prompt = self._build_prompt(q)
             resp = client.models.generate_content(
                 model=self.model,
                 contents=prompt,
-                config=GenerateContentConfig(
-                    temperature=0.0,
-                    max_output_tokens=128,
-                ),
+                config=config,
             )
-            text = getattr(resp, "text", "") or ""
-            text = text.strip()
-
-            # ตัด ```json ... ``` ถ้ามี
-            if text.startswith("```"):
-                text = re.sub(r"^```[a-zA-Z]*", "", text)
-                text = re.sub(r"```$", "", text).strip()
-
-            # ดึง JSON แรก
-            m = re.search(r"\{.*\}", text, re.S)
-            data = json.loads(m.group()) if m else {}
-
-            raw_intent = str(data.get("intent", "unknown")).strip().lower()
-            raw_conf = data.get("confidence", 0.0)
-
-            # validate intent
-            if raw_intent in ALLOWED_INTENTS:
-                intent = raw_intent
-            else:
-                intent = "unknown"
-
-            # parse confidence
-            try:
-                conf = float(raw_conf)
-            except Exception:
-                conf = 0.0
-
-            conf = max(0.0, min(conf, 1.0))
+        except Exception:
+            record_llm_call(
+                "router", time.perf_counter() - t0, error=True, prompt_chars=len(prompt)
+            )
+            raise
+        record_llm_call("router", time.perf_counter() - t0, resp, prompt_chars=len(prompt))
+        text = getattr(resp, "text", "") or ""
+        text = text.strip()
+
+        # ตัด ```json ... ``` ถ้ามี
+        if text.startswith("```"):
+            text = re.sub(r"^```[a-zA-Z]*", "", text)
+            text = re.sub(r"```$", "", text).strip()
+
+        # ดึง JSON แรก
+        m = re.search(r"\{.*\}", text, re.S)
+        data = json.loads(m.group()) if m else {}
+
+        raw_intent = str(data.get("intent", "unknown")).strip().lower()
+        raw_conf = data.get("confidence", 0.0)
+
+        # validate intent
+        if raw_intent in ALLOWED_INTENTS:
+            intent = raw_intent
+        else:
+            intent = "unknown"
 
-        except Exception as e:
-            print("[RouterAgent][WARN] route failed:", e, flush=True)
+        # parse confidence
+        try:
+            conf = float(raw_conf)
+        except Exception:
+            conf = 0.0
 
-        # map intent -> route
-        if intent in ["academic", "regulation", "scholarship", "dorm", "contact", "general_rag"]:
-            route = "rag"
-        elif intent == "capabilities":
-            route = "local"
-        else:
-            route = "unknown"
+        conf = max(0.0, min(conf, 1.0))
 
-        return RouteResult(intent=intent, route=route, confidence=conf)
+        return RouteResult(intent=intent, route=_intent_to_route(intent), confidence=conf)
 
 
 router = RouterAgent()
@@ -1,13 +1,33 @@
 # app/studentlife_agent.py
+from typing import Any, Dict, List, Optional
+
 from app.services.rag import generate_answer
+from app.services.categories import profile_for
+from app.services.deadline import Deadline
 
 
 class StudentLifeAgent:
     """ตอบคำถามเกี่ยวกับทุนการศึกษา หอพัก และบริการนักศึกษา"""
 
-    def answer(self, question: str) -> str:
-        q = "คำถามด้านทุนการศึกษา/หอพัก/บริการนักศึกษา: " + (question or "").strip()
-        result = generate_answer(q)
+    def generate(
+        self,
+        question: str,
+        deadline: Optional[Deadline] = None,
+        mode: str = "auto",
+        intent: Optional[str] = None,
+        chunks: Optional[List[Dict[str, Any]]] = None,
+        history: str = "",
+        search_query: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """intent: scholarship / dorm / contact → ค้นเฉพาะหมวดนั้น (ไม่ระบุ = ทุกหมวด)"""
+        profile = profile_for(intent) or profile_for("general_rag")
+        return generate_answer(
+            question, deadline=deadline, mode=mode, profile=profile, chunks=chunks,
+            history=history, search_query=search_query,
+        )
+
+    def answer(self, question: str, deadline: Optional[Deadline] = None) -> str:
+        result = self.generate(question, deadline=deadline)
         if isinstance(result, dict):
             return (result.get("answer") or "").strip()
         return str(result).strip()
@@ -1,15 +1,56 @@
 # app/suggestion_agent.py
-from typing import List
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, List
+
+import numpy as np
 from sqlalchemy.orm import Session
 from sqlalchemy import func
-from sentence_transformers import SentenceTransformer, util
 
+from app.core.startup import embedding_swap
 from app.models.sql import QuestionLog
 
+# จำนวน vector ของคำถามยอดนิยมที่ cache ไว้ (pool เปลี่ยนช้า → ไม่ต้อง encode 200 ข้อทุก request)
+SUGGESTION_CACHE_SIZE = int(os.getenv("SUGGESTION_CACHE_SIZE", "2000"))
+
 
 class SuggestionAgent:
-    def __init__(self, embedder: SentenceTransformer):
+    def __init__(self, embedder, cache_size: int = SUGGESTION_CACHE_SIZE):
         self.embedder = embedder
+        self.cache_size = cache_size
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _pool_vectors(self, pool: List[str]) -> np.ndarray:
+        """vector ของ pool — encode เฉพาะข้อที่ยังไม่อยู่ใน cache"""
+        with self._lock:
+            have = {t: self._vectors[t] for t in pool if t in self._vectors}
+            for t in have:
+                self._vectors.move_to_end(t)
+        missing = [t for t in pool if t not in have]
+        if missing:
+            vecs = self.embedder.encode(missing)
+            with self._lock:
+                for t, v in zip(missing, vecs):
+                    have[t] = self._vectors[t] = np.asarray(v, dtype=np.float32)
+                while len(self._vectors) > self.cache_size:
+                    self._vectors.popitem(last=False)
+        return np.vstack([have[t] for t in pool])
+
+    def prepare_reembed(self, encoder) -> Callable[[], int]:
+        """embed คำถามใน cache ด้วย encoder ใหม่ (เปลี่ยน embedding model) → commit() สลับ cache"""
+        with self._lock:
+            texts = list(self._vectors)
+        vecs = encoder.encode(texts, show_progress_bar=False) if texts else []
+        new = OrderedDict((t, np.asarray(v, dtype=np.float32)) for t, v in zip(texts, vecs))
+
+        def commit() -> int:
+            with self._lock:
+                self._vectors = new
+            return len(new)
+
+        return commit
 
     def suggest_next_topics(self, question: str, db: Session, limit: int = 3) -> List[str]:
         """แนะนำหัวข้อคำถามถัดไปจาก QuestionLog โดยใช้ semantic similarity"""
@@ -30,11 +71,14 @@ class SuggestionAgent:
         if not pool:
             return []
 
-        # สร้าง vector
-        q_vec = self.embedder.encode(q)
-        pool_vecs = self.embedder.encode(pool)
+        # สร้าง vector (model + cache ของ pool ต้องเป็นชุดเดียวกัน → ถือ shared ระหว่าง encode)
+        with embedding_swap.shared():
+            q_vec = self.embedder.encode(q)
+            pool_vecs = self._pool_vectors(pool)
 
         # คำนวณ cosine similarity
+        from sentence_transformers import util
+
         scores = util.cos_sim(q_vec, pool_vecs)[0].tolist()
         scored = list(zip(scores, pool))  # (score, question_text)
 
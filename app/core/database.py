@@ -1,7 +1,7 @@
 # app/database.py
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 
 load_dotenv()
@@ -46,3 +46,28 @@ SessionLocal = sessionmaker(
     autoflush=False,
     bind=engine,
 )
+
+
+def ensure_columns(table: str, columns: dict):
+    """
+    เพิ่มคอลัมน์ที่ model มีแต่ตารางเดิมยังไม่มี (create_all ไม่ ALTER ตารางที่มีอยู่แล้ว)
+    columns = { "ชื่อคอลัมน์": "DDL type" } เช่น {"category": "VARCHAR(50)"}
+
+    หลาย worker เริ่มพร้อมกันตอน upgrade → ทุกตัวเห็นว่าคอลัมน์ยังไม่มี แต่ ALTER สำเร็จแค่ตัวเดียว
+    → ALTER ทีละคอลัมน์ (transaction ของตัวเอง) ถ้า error ให้ตรวจตารางใหม่: มีคอลัมน์แล้ว = worker อื่นเพิ่มให้
+    """
+    insp = inspect(engine)
+    if not insp.has_table(table):
+        return
+    existing = {c["name"] for c in insp.get_columns(table)}
+    for name, ddl in columns.items():
+        if name in existing:
+            continue
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+            print(f">> Added column {table}.{name}", flush=True)
+        except Exception:
+            if name not in {c["name"] for c in inspect(engine).get_columns(table)}:
+                raise
+            print(f">> Column {table}.{name} already added by another worker", flush=True)
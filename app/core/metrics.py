@@ -0,0 +1,230 @@
+# app/core/metrics.py
+"""
+Prometheus metrics + timing spans ของแต่ละ stage ใน pipeline
+
+- stage("router") / stage("retrieval_encode") ... → histogram mfu_stage_seconds{stage=...}
+  และเก็บเวลาลง trace ของ request ปัจจุบัน (app.core.trace) เพื่อ log แบบ structured
+- นับ LLM calls / tokens, cache hit/miss, embedder batch size, DB pool status
+- export ผ่าน /metrics (ดู main.py)
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    Counter,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+from app.core.trace import trace_cache, trace_llm_call, trace_timing
+
+# ============================================================
+# METRICS
+# ============================================================
+
+_LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0,
+)
+
+STAGE_SECONDS = Histogram(
+    "mfu_stage_seconds",
+    "Latency of each chat pipeline stage",
+    ["stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+CHAT_SECONDS = Histogram(
+    "mfu_chat_seconds",
+    "End-to-end latency of /chat",
+    ["source"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+CHAT_REQUESTS = Counter(
+    "mfu_chat_requests_total",
+    "Chat requests by answer source and mode",
+    ["source", "answer_mode"],
+)
+
+LLM_CALLS = Counter(
+    "mfu_llm_calls_total",
+    "Gemini calls by purpose and status",
+    ["call", "status"],
+)
+
+LLM_SECONDS = Histogram(
+    "mfu_llm_call_seconds",
+    "Latency of each Gemini call",
+    ["call"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+LLM_TOKENS = Counter(
+    "mfu_llm_tokens_total",
+    "Gemini tokens by purpose and kind (prompt / completion)",
+    ["call", "kind"],
+)
+
+CACHE_LOOKUPS = Counter(
+    "mfu_cache_lookups_total",
+    "Cache lookups by layer and result (hit / miss)",
+    ["cache", "result"],
+)
+
+COALESCED_REQUESTS = Counter(
+    "mfu_coalesced_requests_total",
+    "Chat requests served from another in-flight request (single-flight)",
+)
+
+STAGE_SKIPPED = Counter(
+    "mfu_stage_skipped_total",
+    "Pipeline stages skipped because of the request deadline",
+    ["stage"],
+)
+
+EMBED_BATCH_SIZE = Histogram(
+    "mfu_embed_batch_size",
+    "Number of texts per embedder.encode call",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512),
+)
+
+EMBED_SECONDS = Histogram(
+    "mfu_embed_seconds",
+    "Latency of embedder.encode calls",
+    buckets=_LATENCY_BUCKETS,
+)
+
+EMBED_BATCH_REQUESTS = Histogram(
+    "mfu_embed_batch_requests",
+    "Number of concurrent encode requests merged into one batch by the embedding batcher",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
+EMBED_QUEUE_WAIT_SECONDS = Histogram(
+    "mfu_embed_queue_wait_seconds",
+    "Time an encode request waited in the embedding batcher queue",
+    buckets=(0.0001, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+
+# ============================================================
+# SPANS (→ histogram + trace ของ request ปัจจุบัน)
+# ============================================================
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """span ของ stage: observe histogram + บวกเวลา (ms) ลง trace ของ request"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        STAGE_SECONDS.labels(stage=name).observe(elapsed)
+        trace_timing(name, elapsed * 1000.0)
+
+
+def record_llm_call(
+    call: str,
+    elapsed: float,
+    resp=None,
+    error: bool = False,
+    prompt_chars: Optional[int] = None,
+    est_prompt_tokens: Optional[int] = None,
+    est_completion_tokens: Optional[int] = None,
+):
+    """นับ Gemini call + token จาก usage_metadata (ถ้ามี) แล้วเขียนลง trace
+
+    ไม่มี usage_metadata (error / endpoint ที่ไม่คืน usage) → ใช้ค่าประมาณ est_* แทน (estimated=True)
+    """
+    LLM_CALLS.labels(call=call, status="error" if error else "ok").inc()
+    LLM_SECONDS.labels(call=call).observe(elapsed)
+
+    usage = getattr(resp, "usage_metadata", None)
+    prompt_tokens = (getattr(usage, "prompt_token_count", None) or 0) if usage else 0
+    completion_tokens = (getattr(usage, "candidates_token_count", None) or 0) if usage else 0
+    estimated = False
+    if not prompt_tokens and est_prompt_tokens:
+        prompt_tokens, estimated = est_prompt_tokens, True
+    if not completion_tokens and est_completion_tokens:
+        completion_tokens, estimated = est_completion_tokens, True
+    if prompt_tokens:
+        LLM_TOKENS.labels(call=call, kind="prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(call=call, kind="completion").inc(completion_tokens)
+
+    trace_llm_call({
+        "call": call,
+        "status": "error" if error else "ok",
+        "latency_ms": round(elapsed * 1000.0, 2),
+        "prompt_chars": prompt_chars,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "estimated": estimated,
+    })
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache=cache, result="hit" if hit else "miss").inc()
+    trace_cache(cache, hit)
+
+
+def record_embed(batch_size: int, elapsed: float):
+    EMBED_BATCH_SIZE.observe(batch_size)
+    EMBED_SECONDS.observe(elapsed)
+
+
+def record_embed_batch(requests: int, waits):
+    EMBED_BATCH_REQUESTS.observe(requests)
+    for w in waits:
+        EMBED_QUEUE_WAIT_SECONDS.observe(w)
+
+
+# ============================================================
+# DB POOL COLLECTOR
+# ============================================================
+
+class DbPoolCollector:
+    """อ่านสถานะ connection pool ของ SQLAlchemy engine ตอน scrape"""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def collect(self):
+        pool = self.engine.pool
+        for name, attr, doc in (
+            ("mfu_db_pool_size", "size", "Configured DB pool size"),
+            ("mfu_db_pool_checked_out", "checkedout", "DB connections in use"),
+            ("mfu_db_pool_checked_in", "checkedin", "Idle DB connections in the pool"),
+            ("mfu_db_pool_overflow", "overflow", "DB connections above pool_size"),
+        ):
+            fn = getattr(pool, attr, None)
+            if fn is None:
+                continue
+            try:
+                value = float(fn())
+            except Exception:
+                continue
+            g = GaugeMetricFamily(name, doc)
+            g.add_metric([], value)
+            yield g
+
+
+_registered_engines = set()
+
+
+def register_db_pool(engine):
+    if id(engine) in _registered_engines:
+        return
+    REGISTRY.register(DbPoolCollector(engine))
+    _registered_engines.add(id(engine))
+
+
+def render_latest():
+    """(body, content_type) สำหรับ /metrics"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,271 @@
+# app/core/startup.py
+"""
+Lazy init + warmup ของ resource หนัก (embedding model, vector store, Gemini client, FAQ index, ...)
+
+- import module ไม่โหลดอะไรหนัก → process พร้อมตอบ /health ได้ทันที
+- Lazy(name, factory): สร้าง object ตอนใช้ครั้งแรก (thread-safe) — attribute ทั้งหมด delegate ไปที่ object จริง
+  จึงแทนตัวแปร module เดิมได้ (`embedder`, `collection`, `client` ...) โดย caller ไม่ต้องแก้
+- Task(name, fn): งาน startup ที่ไม่ได้สร้าง object (backfill, warm cache)
+- warmup(): รันทุก component พร้อมกันใน thread pool (lifespan ของ FastAPI เรียก)
+  component ที่พึ่งกัน (เช่น lexical index ใช้ vector store) รอกันเองผ่าน lock ของ Lazy
+- readiness(): สถานะต่อ component สำหรับ /ready
+- embedding_swap: lock อ่าน/สลับ ของชุด resource ที่ผูกกับ embedding model (ดู SwapLock)
+"""
+
+import logging
+import threading
+import time
+from contextlib import ContextDecorator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_components: Dict[str, "Component"] = {}
+_registry_lock = threading.Lock()
+
+
+class Component:
+    """สถานะของ resource / งาน startup หนึ่งอย่าง: cold → loading → ready | error"""
+
+    def __init__(self, name: str, required: bool = True):
+        self.name = name
+        self.required = required
+        self.state = "cold"
+        self.ms: Optional[float] = None
+        self.error: Optional[str] = None
+        with _registry_lock:
+            _components[name] = self
+
+    def _run(self):
+        raise NotImplementedError
+
+    def run(self):
+        t0 = time.perf_counter()
+        self.state = "loading"
+        try:
+            self._run()
+        except Exception as e:
+            self.state, self.error = "error", f"{type(e).__name__}: {e}"
+            self.ms = round((time.perf_counter() - t0) * 1000.0, 1)
+            raise
+        self.state, self.error = "ready", None
+        self.ms = round((time.perf_counter() - t0) * 1000.0, 1)
+
+    def status(self) -> Dict[str, Any]:
+        return {"state": self.state, "required": self.required, "ms": self.ms, "error": self.error}
+
+
+class Task(Component):
+    """loaded (optional): งานนี้ถูกทำไปแล้วจาก path อื่นไหม (เช่น FAQ index โหลดตอน request แรก)
+    → ready ได้โดยไม่ต้องผ่าน warmup()
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[], Any],
+        required: bool = False,
+        loaded: Optional[Callable[[], bool]] = None,
+    ):
+        super().__init__(name, required=required)
+        self._fn = fn
+        self._loaded = loaded
+
+    def _run(self):
+        self._fn()
+
+    def status(self) -> Dict[str, Any]:
+        if self.state == "cold" and self._loaded is not None and self._loaded():
+            self.state = "ready"
+        return super().status()
+
+
+class Lazy(Component):
+    """object ที่สร้างตอนใช้ครั้งแรก — warmup(obj) (optional) รันตอน warmup() เท่านั้น เช่น dummy encode
+
+    method ของ Lazy เองตั้งชื่อไม่ให้ชนกับของ object ที่ห่อ (เช่น vector store มี get / count)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], Any],
+        warmup: Optional[Callable[[Any], Any]] = None,
+        required: bool = True,
+    ):
+        super().__init__(name, required=required)
+        self._factory = factory
+        self._warmup = warmup
+        self._obj = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._obj is not None
+
+    def instance(self):
+        obj = self._obj
+        if obj is not None:
+            return obj
+        with self._lock:
+            if self._obj is None:
+                t0 = time.perf_counter()
+                try:
+                    self._obj = self._factory()
+                except Exception as e:
+                    self.state, self.error = "error", f"{type(e).__name__}: {e}"
+                    raise
+                ms = (time.perf_counter() - t0) * 1000.0
+                logger.info(f"[STARTUP] {self.name} loaded in {ms:.0f} ms")
+                if self.state != "loading":
+                    # โหลดจาก request แรก (ไม่ผ่าน warmup)
+                    self.state, self.ms = "ready", round(ms, 1)
+            return self._obj
+
+    def replace(self, obj):
+        """แทน object จริง (เช่น เปลี่ยน embedding model / vector store ตอน runtime)"""
+        with self._lock:
+            self._obj = obj
+
+    def _run(self):
+        obj = self.instance()
+        if self._warmup is not None:
+            self._warmup(obj)
+
+    def __getattr__(self, name):
+        # เรียกเฉพาะ attribute ที่ไม่มีใน Lazy เอง → ของ object จริง
+        if name.startswith("__") or name in ("_obj", "_factory", "_warmup", "_lock"):
+            raise AttributeError(name)
+        return getattr(self.instance(), name)
+
+    def __len__(self):
+        return len(self.instance())
+
+    def __repr__(self):
+        return f"<Lazy {self.name} {'loaded' if self.loaded else 'cold'}>"
+
+
+# ============================================================
+# SWAP LOCK (สลับ resource หลายตัวพร้อมกันแบบ atomic)
+# ============================================================
+
+class SwapLock:
+    """read/write lock สำหรับ resource ที่ต้องสลับพร้อมกันหลายตัว (เช่น embedding model + vector store + matrix)
+
+    - shared(): ฝั่งอ่าน — ถือได้หลาย thread พร้อมกัน, ซ้อนใน thread เดียวกันได้ (ใช้เป็น decorator ได้)
+    - exclusive(): ฝั่งสลับ — รอ reader ที่ค้างอยู่ให้จบ และกัน reader ใหม่ (writer มาก่อน → ไม่อดตาย)
+      thread ที่ถือ exclusive อยู่เรียก shared() ซ้อนได้ (เช่น commit ของ FAQ ที่ใช้ path อ่านเดิม)
+
+    ถือเฉพาะรอบ operation ระดับล่าง (encode + ค้น) ไม่ใช่ทั้ง request → thread ย่อยของ DAG ไม่ deadlock กัน
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    def _depth(self) -> int:
+        return getattr(self._local, "depth", 0)
+
+    def _acquire_shared(self):
+        depth = self._depth()
+        if depth == 0 and self._writer != threading.get_ident():
+            with self._cond:
+                while self._writer is not None or self._writers_waiting:
+                    self._cond.wait()
+                self._readers += 1
+        self._local.depth = depth + 1
+
+    def _release_shared(self):
+        depth = self._depth() - 1
+        self._local.depth = depth
+        if depth == 0 and self._writer != threading.get_ident():
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    def shared(self) -> "_SwapGuard":
+        return _SwapGuard(self._acquire_shared, self._release_shared)
+
+    def _acquire_exclusive(self):
+        if self._depth():
+            raise RuntimeError("SwapLock.exclusive() called while holding shared()")
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = threading.get_ident()
+
+    def _release_exclusive(self):
+        with self._cond:
+            self._writer = None
+            self._cond.notify_all()
+
+    def exclusive(self) -> "_SwapGuard":
+        return _SwapGuard(self._acquire_exclusive, self._release_exclusive)
+
+
+class _SwapGuard(ContextDecorator):
+    """context manager / decorator (`@embedding_swap.shared()`) — ไม่มี state ต่อครั้ง จึงใช้ซ้ำได้"""
+
+    def __init__(self, acquire: Callable[[], None], release: Callable[[], None]):
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self):
+        self._acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self._release()
+        return False
+
+
+# embedding model / vector store / lexical index / matrix ของ FAQ, answer cache, suggestion
+# ต้องเป็นชุดเดียวกันเสมอ → path ที่ encode แล้วค้นถือ shared(), cutover ของ migration ถือ exclusive()
+embedding_swap = SwapLock()
+
+
+# ============================================================
+# WARMUP / READINESS
+# ============================================================
+
+_warmup_started: Optional[float] = None
+_warmup_ms: Optional[float] = None
+
+
+def components() -> List[Component]:
+    with _registry_lock:
+        return list(_components.values())
+
+
+def warmup(names: Optional[List[str]] = None, max_workers: Optional[int] = None) -> Dict[str, Any]:
+    """รัน component ทั้งหมด (หรือเฉพาะ names) พร้อมกัน — error ไม่หยุดตัวอื่น (ดูใน readiness)"""
+    global _warmup_started, _warmup_ms
+    todo = [c for c in components() if names is None or c.name in names]
+    _warmup_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers or max(1, len(todo)), thread_name_prefix="warmup") as pool:
+        futures = {c.name: pool.submit(c.run) for c in todo}
+        for name, fut in futures.items():
+            try:
+                fut.result()
+            except Exception as e:
+                logger.warning(f"[STARTUP] warmup of {name} failed: {e}")
+    _warmup_ms = round((time.perf_counter() - _warmup_started) * 1000.0, 1)
+    logger.info(f"[STARTUP] warmup finished in {_warmup_ms:.0f} ms")
+    return readiness()
+
+
+def readiness(cold_ok: bool = False) -> Dict[str, Any]:
+    """cold_ok: component ที่ยังไม่โหลด (cold) ไม่ทำให้ not ready — ใช้เมื่อปิด warmup (โหลดตอน request แรก)"""
+    ok = ("ready", "cold") if cold_ok else ("ready",)
+    comps = {c.name: c.status() for c in components()}
+    ready = all(s["state"] in ok for s in comps.values() if s["required"])
+    return {"ready": ready, "warmup_ms": _warmup_ms, "components": comps}
@@ -0,0 +1,101 @@
+# app/core/trace.py
+"""
+Request trace (debug mode / trace sampling)
+
+เก็บข้อมูลของ request ปัจจุบันผ่าน contextvar — stage ต่าง ๆ เขียนลงได้โดยไม่ต้องส่ง object ต่อกัน
+- route / confidence, FAQ score
+- chunk ที่ retrieve มา (id + score)
+- LLM call แต่ละครั้ง: latency, ขนาด prompt (ตัวอักษร + token), completion tokens
+- cache layer ที่ hit / miss
+- timings ของแต่ละ stage (จาก app.core.metrics.stage)
+
+ไม่มี trace ที่ active (เช่น script / benchmark) → ทุกฟังก์ชันเป็น no-op
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+
+class RequestTrace:
+    def __init__(self, question: str = ""):
+        self.question = question
+        self.started = time.perf_counter()
+        self.values: Dict[str, Any] = {}
+        self.timings: Dict[str, float] = {}
+        self.llm_calls: List[Dict[str, Any]] = []
+        self.chunks: List[Dict[str, Any]] = []
+        self.cache: Dict[str, bool] = {}
+
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000.0, 2)
+
+    def llm_usage(self) -> Dict[str, int]:
+        """ยอดรวม LLM call / token ของ request (เก็บลง QuestionLog)"""
+        return {
+            "calls": len(self.llm_calls),
+            "prompt_tokens": sum(c.get("prompt_tokens") or 0 for c in self.llm_calls),
+            "completion_tokens": sum(c.get("completion_tokens") or 0 for c in self.llm_calls),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        prompt_chars = sum(c.get("prompt_chars") or 0 for c in self.llm_calls)
+        usage = self.llm_usage()
+        return {
+            **self.values,
+            "total_ms": self.total_ms(),
+            "timings_ms": dict(self.timings),
+            "retrieved": list(self.chunks),
+            "llm": {
+                "calls": usage["calls"],
+                "prompt_chars": prompt_chars,
+                "prompt_tokens": usage["prompt_tokens"],
+                "completion_tokens": usage["completion_tokens"],
+                "detail": list(self.llm_calls),
+            },
+            "cache": dict(self.cache),
+        }
+
+
+_current: ContextVar[Optional[RequestTrace]] = ContextVar("mfu_trace", default=None)
+
+
+def start_trace(question: str = "") -> RequestTrace:
+    trace = RequestTrace(question)
+    _current.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current.get()
+
+
+def trace_set(key: str, value: Any):
+    trace = _current.get()
+    if trace is not None:
+        trace.values[key] = value
+
+
+def trace_timing(stage: str, ms: float):
+    trace = _current.get()
+    if trace is not None:
+        trace.timings[stage] = round(trace.timings.get(stage, 0.0) + ms, 2)
+
+
+def trace_llm_call(call: Dict[str, Any]):
+    trace = _current.get()
+    if trace is not None:
+        trace.llm_calls.append(call)
+
+
+def trace_chunks(chunks: List[Dict[str, Any]]):
+    trace = _current.get()
+    if trace is not None:
+        for c in chunks:
+            trace.chunks.append({"id": c.get("id"), "score": round(float(c.get("score", 0.0)), 4)})
+
+
+def trace_cache(layer: str, hit: bool):
+    trace = _current.get()
+    if trace is not None:
+        trace.cache[layer] = hit
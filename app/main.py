@@ -1,5 +1,11 @@
 # app/main.py
+import time
 
+_IMPORT_T0 = time.perf_counter()
+
+import asyncio
+import threading
+from contextlib import asynccontextmanager
 from typing import List, Optional, Tuple, Any, Dict, Union
 
 from fastapi import (
@@ -10,17 +16,21 @@ from fastapi import (
     Request,
     UploadFile,
     File,
+    Form,
 )
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from dotenv import load_dotenv
 from pypdf import PdfReader
 import os
 import io
+import json
+import random
 import logging
+from dataclasses import asdict
 
 # Configure logging
 logging.basicConfig(
@@ -30,8 +40,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-from app.core.database import SessionLocal, engine
-from app.models.sql import Base, Document, DocumentRevision, QuestionLog, AnswerFeedback
+from app.core.database import SessionLocal, engine, ensure_columns
+from app.core.metrics import (
+    CHAT_REQUESTS,
+    CHAT_SECONDS,
+    COALESCED_REQUESTS,
+    STAGE_SKIPPED,
+    register_db_pool,
+    render_latest,
+    stage,
+)
+from app.core.trace import RequestTrace, start_trace
+from app.core.startup import Task, readiness, warmup
+from app.agents.base import AgentState
+from app.models.sql import (
+    Base,
+    Document,
+    DocumentRevision,
+    QuestionLog,
+    AnswerFeedback,
+    ChatTrace,
+    RetrievalLabel,
+)
 from app.models.schemas import (
     ChatRequest,
     ChatResponse,
@@ -40,26 +70,102 @@ from app.models.schemas import (
     DocumentOut,
     FeedbackCreate,
     FeedbackOut,
+    ChatTraceOut,
+    RetrievalLabelCreate,
+    RetrievalLabelOut,
+    EmbeddingMigrationCreate,
 )
 
-# ✅ Multi-Agent pipeline (ตัว Router หลัก)
-from app.services.orchestrator import run_pipeline
+# ✅ Multi-Agent pipeline (ตัว Router หลัก) + semantic answer cache
+from app.services.orchestrator import (
+    run_cached_pipeline,
+    stream_pipeline,
+    answer_cache,
+    inflight,
+    conversations,
+    faq_agent,
+    suggest_agent,
+)
+from app.services import migration
+from app.services.deadline import Deadline
 
 # ✅ RAG vector functions (ยังใช้ตอน admin upload)
 from app.services.rag import (
     add_or_update_doc_to_vector,
     delete_doc_from_vector,
+    rechunk_doc_in_vector,
+    set_doc_category_in_vector,
 )
+from app.services.categories import CATEGORIES, infer_category, normalize_category, resolve_category
 
 # โหลด .env
 load_dotenv()
 
 MAX_PDF_CHARS = int(os.getenv("MAX_PDF_CHARS", "300000"))
 
+# startup: background (ตอบ /health ทันที, warmup ใน thread) | blocking (รอ warmup ก่อนรับ request)
+#          | off (โหลดตอน request แรกใช้)
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background").lower()
+
+# trace sampling: เก็บ trace ลงตาราง chat_traces เพื่อวิเคราะห์ request ช้าย้อนหลัง
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_SLOW_MS = int(os.getenv("TRACE_SLOW_MS", "0"))  # 0 = ไม่บังคับเก็บ request ช้า
+
 # DB INIT
 Base.metadata.create_all(bind=engine)
+ensure_columns("documents", {"category": "VARCHAR(50)"})
+ensure_columns(
+    "question_logs",
+    {"llm_calls": "INTEGER", "prompt_tokens": "INTEGER", "completion_tokens": "INTEGER"},
+)
+register_db_pool(engine)
+
+
+def _backfill_document_categories():
+    """เอกสารเก่าที่ยังไม่มีหมวด → เดาจากเนื้อหา แล้วเขียนลง metadata ของ chunk (ไม่ re-embed)"""
+    with SessionLocal() as db:
+        docs = db.query(Document).filter(Document.category.is_(None)).all()
+        for d in docs:
+            d.category = infer_category(d.title, d.current_content or "")
+            try:
+                set_doc_category_in_vector(str(d.id), d.category)
+            except Exception as e:
+                logger.warning(f"[CATEGORY] Cannot update vector metadata of doc {d.id}: {e}")
+        if docs:
+            db.commit()
+            print(f">> Backfilled category for {len(docs)} documents", flush=True)
+
+
+def _bump_answer_cache(db: Session):
+    """เอกสารเปลี่ยน → corpus version เปลี่ยน → คำตอบใน cache ชุดเก่าใช้ไม่ได้"""
+    try:
+        answer_cache.bump_corpus_version(db)
+    except Exception as e:
+        logger.warning(f"[CACHE] Cannot bump corpus version: {e}")
+
+
+def _init_answer_cache():
+    """corpus version ปัจจุบัน + warm จาก DB ถ้าเปิด persist"""
+    with SessionLocal() as db:
+        _bump_answer_cache(db)
+    answer_cache.warm()
+
+
+# งาน startup ที่ใช้ vector store / embedder → รันพร้อม warmup (app/core/startup.py)
+Task("category_backfill", _backfill_document_categories)
+Task("answer_cache", _init_answer_cache)
 
-app = FastAPI(title="University RAG Chatbot (Multi-Agent + Gemini)")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if STARTUP_WARMUP == "blocking":
+        await asyncio.get_running_loop().run_in_executor(None, warmup)
+    elif STARTUP_WARMUP != "off":
+        threading.Thread(target=warmup, name="warmup", daemon=True).start()
+    yield
+
+
+app = FastAPI(title="University RAG Chatbot (Multi-Agent + Gemini)", lifespan=lifespan)
 
 # CORS
 # CORS
@@ -105,50 +211,195 @@ def get_db():
 # CHAT ENDPOINT (Multi-Agent Router + Log)
 # ============================================================
 
+def _build_debug(question: str, answer: str, meta: Dict[str, Any], trace: RequestTrace) -> Dict[str, Any]:
+    """AgentState ของ request (contexts = chunk id ที่ retrieve มา) + trace ทั้งหมดใน debug"""
+    trace_dict = trace.to_dict()
+    state = AgentState(
+        question=question,
+        intent=meta.get("intent") or "general",
+        contexts=[c["id"] for c in trace_dict["retrieved"]],
+        answer=answer,
+        debug=trace_dict,
+    )
+    return asdict(state)
+
+
+def _maybe_persist_trace(db: Session, question: str, meta: Dict[str, Any], trace: RequestTrace):
+    total_ms = trace.total_ms()
+    sampled = TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+    slow = TRACE_SLOW_MS > 0 and total_ms >= TRACE_SLOW_MS
+    if not (sampled or slow):
+        return
+    try:
+        db.add(ChatTrace(
+            question=question,
+            intent=meta.get("intent"),
+            source=meta.get("source"),
+            total_ms=int(total_ms),
+            trace=json.dumps(trace.to_dict(), ensure_ascii=False, default=str),
+        ))
+        db.commit()
+    except Exception as e:
+        logger.warning(f"[CHAT] Cannot write ChatTrace: {e}")
+        db.rollback()
+
+
 @app.post("/chat", response_model=ChatResponse)
-def chat(req: ChatRequest, db: Session = Depends(get_db)):
+def chat(
+    req: ChatRequest,
+    db: Session = Depends(get_db),
+    debug: int = 0,
+    x_api_key: Optional[str] = Header(default=None),
+):
     """✅ Multi-Agent entrypoint
 
-    - run_pipeline(question, db) → คืน (answer, meta)
-    - meta มี intent / route / confidence / next_topics ได้
+    - run_cached_pipeline(question, db) → คืน (answer, meta)
+      (semantic answer cache ด้านหน้า run_pipeline)
+    - meta มี intent / route / confidence / next_topics / skipped ได้
+    - deadline_ms (optional) → ส่งต่อทุก stage, stage ที่ข้ามจะอยู่ใน skipped
     - เก็บคำถามลง QuestionLog เพื่อดู Top FAQ
+    - ?debug=1 (admin เท่านั้น, header X-API-Key) → คืน AgentState + trace ใน field debug
+    - session_id → ถามต่อในบทสนทนาเดิม (ประวัติใน prompt / retrieval), response คืน session_id เสมอ
     """  # noqa: D401
     question = (req.question or "").strip()
     if not question:
         raise HTTPException(status_code=400, detail="Question is empty")
 
-    # รองรับ user_id แบบ optional
+    if debug and x_api_key != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="debug mode requires admin")
+
+    # รองรับ user_id แบบ optional (ใช้ใน log — ตาราง question_logs ไม่มีคอลัมน์ user_id)
     user_id = getattr(req, "user_id", None) or "guest"
 
+    t0 = time.perf_counter()
+    trace = start_trace(question)
+
+    conversation = conversations.open(req.session_id, req.user_id)
     try:
-        answer, meta = run_pipeline(question, db)
+        deadline = Deadline.from_request(req.deadline_ms)
+        answer, meta = run_cached_pipeline(
+            question, db, deadline=deadline, mode=req.mode, conversation=conversation
+        )
     except Exception as e:
         logger.error(f"[CHAT] run_pipeline failed: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Multi-agent pipeline error")
+    with stage("conversation_save"):
+        conversations.record(conversation, question, answer)
 
     # เก็บ log ลง DB (ไม่ให้ chat ล่มถ้า log fail)
     try:
-        log = QuestionLog(
-            user_id=user_id,
-            question=question,
-            intent=meta.get("intent"),
-            route=meta.get("route"),
-            confidence=str(meta.get("confidence")),
-        )
-        db.add(log)
-        db.commit()
+        usage = trace.llm_usage()
+        with stage("log_write"):
+            log = QuestionLog(
+                question=question,
+                intent=meta.get("intent"),
+                route=meta.get("route"),
+                confidence=str(meta.get("confidence")),
+                llm_calls=usage["calls"],
+                prompt_tokens=usage["prompt_tokens"],
+                completion_tokens=usage["completion_tokens"],
+            )
+            db.add(log)
+            db.commit()
     except Exception as e:
         logger.warning(f"[CHAT] Cannot write QuestionLog: {e}")
         db.rollback()
 
     next_topics = meta.get("next_topics") or []
 
+    elapsed = time.perf_counter() - t0
+    source = meta.get("source") or "unknown"
+    CHAT_SECONDS.labels(source=source).observe(elapsed)
+    CHAT_REQUESTS.labels(source=source, answer_mode=meta.get("answer_mode") or "none").inc()
+    for skipped_stage in meta.get("skipped") or []:
+        STAGE_SKIPPED.labels(stage=skipped_stage).inc()
+    if meta.get("coalesced"):
+        COALESCED_REQUESTS.inc()
+    logger.info("[CHAT] " + json.dumps({
+        "user_id": user_id,
+        "intent": meta.get("intent"),
+        "source": source,
+        "answer_mode": meta.get("answer_mode"),
+        "total_ms": round(elapsed * 1000.0, 2),
+        "stages_ms": trace.timings,
+        "skipped": meta.get("skipped") or [],
+    }, ensure_ascii=False))
+
+    _maybe_persist_trace(db, question, meta, trace)
+
     return ChatResponse(
         answer=answer,
         next_topics=next_topics,
+        skipped=meta.get("skipped") or [],
+        answer_mode=meta.get("answer_mode"),
+        session_id=conversation.session_id if conversation else None,
+        debug=_build_debug(question, answer, meta, trace) if debug else None,
     )
 
 
+@app.post("/chat/stream")
+def chat_stream(req: ChatRequest):
+    """Streaming chat (NDJSON ทีละบรรทัด)
+
+    - {"type": "pre_answer"} คำตอบแบบ extractive ที่ได้ภายในไม่กี่สิบ ms (แสดงก่อน)
+    - {"type": "delta"} ข้อความจาก Gemini ทีละส่วน
+    - {"type": "final"} คำตอบสุดท้าย + next_topics + skipped + session_id
+    """
+    question = (req.question or "").strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question is empty")
+
+    deadline = Deadline.from_request(req.deadline_ms)
+    conversation = conversations.open(req.session_id, req.user_id)
+
+    def _events():
+        # เปิด session เอง: dependency ของ FastAPI ปิด session ก่อน stream จบ
+        db = SessionLocal()
+        try:
+            meta: Dict[str, Any] = {}
+            try:
+                for event in stream_pipeline(question, db, deadline=deadline, conversation=conversation):
+                    if event["type"] == "final":
+                        meta = event.pop("meta", {})
+                        event["skipped"] = meta.get("skipped") or []
+                        event["answer_mode"] = meta.get("answer_mode")
+                        event["session_id"] = conversation.session_id if conversation else None
+                        conversations.record(conversation, question, event["answer"])
+                    yield json.dumps(event, ensure_ascii=False) + "\n"
+            except Exception as e:
+                logger.error(f"[CHAT_STREAM] pipeline failed: {e}", exc_info=True)
+                yield json.dumps({"type": "error", "detail": "Multi-agent pipeline error"}) + "\n"
+                return
+
+            try:
+                usage = meta.get("llm") or {}
+                db.add(QuestionLog(
+                    question=question,
+                    intent=meta.get("intent"),
+                    route=meta.get("route"),
+                    confidence=str(meta.get("confidence")),
+                    llm_calls=usage.get("calls", 0),
+                    prompt_tokens=usage.get("prompt_tokens", 0),
+                    completion_tokens=usage.get("completion_tokens", 0),
+                ))
+                db.commit()
+            except Exception as e:
+                logger.warning(f"[CHAT_STREAM] Cannot write QuestionLog: {e}")
+                db.rollback()
+        finally:
+            db.close()
+
+    return StreamingResponse(_events(), media_type="application/x-ndjson")
+
+
+@app.delete("/chat/session/{session_id}")
+def end_chat_session(session_id: str):
+    """เริ่มบทสนทนาใหม่: ลบประวัติของ session (id เป็นความลับของ client อยู่แล้ว)"""
+    if not conversations.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"message": "deleted"}
+
+
 
 # ============================================================
 # ADMIN: DOCUMENT CRUD
@@ -166,7 +417,11 @@ def create_document(
     if not doc.content.strip():
         raise HTTPException(status_code=400, detail="Empty content")
 
-    db_doc = Document(title=doc.title, current_content=doc.content)
+    db_doc = Document(
+        title=doc.title,
+        current_content=doc.content,
+        category=resolve_category(doc.category, doc.title, doc.content),
+    )
     db.add(db_doc)
     db.commit()
     db.refresh(db_doc)
@@ -184,8 +439,9 @@ def create_document(
     add_or_update_doc_to_vector(
         doc_id=str(db_doc.id),
         content=doc.content,
-        metadata={"title": db_doc.title, "source": "manual"},
+        metadata={"title": db_doc.title, "source": "manual", "category": db_doc.category},
     )
+    _bump_answer_cache(db)
 
     db.refresh(db_doc)
     return db_doc
@@ -210,6 +466,12 @@ def update_document(
 
     db_doc.title = doc.title
     db_doc.current_content = doc.content
+    # ไม่ส่งหมวดมา → คงหมวดเดิม (ถ้ามี) ไม่เดาใหม่ทับที่ admin ตั้งไว้
+    db_doc.category = (
+        normalize_category(doc.category)
+        or db_doc.category
+        or infer_category(doc.title, doc.content)
+    )
     db.commit()
 
     rev = DocumentRevision(
@@ -223,8 +485,9 @@ def update_document(
     add_or_update_doc_to_vector(
         doc_id=str(db_doc.id),
         content=doc.content,
-        metadata={"title": db_doc.title, "source": "manual"},
+        metadata={"title": db_doc.title, "source": "manual", "category": db_doc.category},
     )
+    _bump_answer_cache(db)
 
     db.refresh(db_doc)
     return db_doc
@@ -247,10 +510,62 @@ def delete_document(
     db.commit()
 
     delete_doc_from_vector(str(doc_id))
+    _bump_answer_cache(db)
 
     return {"message": "deleted"}
 
 
+@app.put("/admin/documents/{doc_id}/category")
+def set_document_category(
+    doc_id: int,
+    category: str,
+    db: Session = Depends(get_db),
+    _admin_ok: bool = Depends(verify_admin),
+):
+    """
+    Admin เปลี่ยนหมวดเอกสาร → DB + metadata ของ chunk (ไม่ต้อง re-embed)
+    """
+    cat = normalize_category(category)
+    if cat is None:
+        raise HTTPException(status_code=400, detail=f"category must be one of {CATEGORIES}")
+
+    db_doc = db.query(Document).filter(Document.id == doc_id).first()
+    if not db_doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    db_doc.category = cat
+    db.commit()
+    chunks = set_doc_category_in_vector(str(doc_id), cat)
+    _bump_answer_cache(db)
+
+    return {"id": doc_id, "category": cat, "chunks": chunks}
+
+
+@app.post("/admin/documents/reindex")
+def reindex_documents(
+    db: Session = Depends(get_db),
+    _admin_ok: bool = Depends(verify_admin),
+):
+    """
+    Admin chunk + embed เอกสารทุกฉบับใหม่จากเนื้อหาใน DB
+    (ใช้หลังเปลี่ยนวิธีแบ่ง chunk เช่น CHILD_CHUNK_SIZE / PARENT_CHUNK_SIZE / SMALL_TO_BIG)
+    """
+    docs = db.query(Document).all()
+    done = 0
+    for d in docs:
+        if not d.current_content:
+            continue
+        rechunk_doc_in_vector(
+            str(d.id),
+            d.current_content,
+            {"title": d.title, "source": "manual", "category": d.category},
+        )
+        done += 1
+    _bump_answer_cache(db)
+    print(f"[REINDEX] Re-chunked {done} documents", flush=True)
+    return {"documents": done}
+
+
 # ============================================================
 # PDF UTILS
 # ============================================================
@@ -306,12 +621,14 @@ def extract_text_from_pdf_bytes(
 async def upload_pdf(
     request: Request,
     file: UploadFile = File(...),
+    category: Optional[str] = Form(None),
     db: Session = Depends(get_db),
     _admin_ok: bool = Depends(verify_admin),
 ):
     """
     Admin upload PDF:
       - extract text
+      - category (form field, optional) → ไม่ส่ง/ไม่ถูกต้อง = เดาจากเนื้อหา
       - create Document + revision
       - upsert vector
     """
@@ -357,7 +674,11 @@ async def upload_pdf(
 
     try:
         print(f"[PDF_UPLOAD] Creating document: {title}", flush=True)
-        db_doc = Document(title=title, current_content=text)
+        db_doc = Document(
+            title=title,
+            current_content=text,
+            category=resolve_category(category, title, text),
+        )
         db.add(db_doc)
         db.commit()
         db.refresh(db_doc)
@@ -380,14 +701,17 @@ async def upload_pdf(
                 "title": db_doc.title,
                 "source": "pdf",
                 "filename": file.filename,
+                "category": db_doc.category,
             },
         )
         print(f"[PDF_UPLOAD] Vector store updated", flush=True)
+        _bump_answer_cache(db)
 
         result = {
             "id": db_doc.id,
             "title": db_doc.title,
             "filename": file.filename,
+            "category": db_doc.category,
             "pages": page_count,
             "chars": len(text),
         }
@@ -611,6 +935,253 @@ def get_intent_stats(
     return [{"intent": i or "unknown", "count": c} for i, c in results]
 
 
+@app.get("/admin/stats/tokens")
+def get_token_stats(
+    db: Session = Depends(get_db),
+    _admin_ok: bool = Depends(verify_admin),
+    days: int = 7,
+):
+    """
+    Get Gemini token usage grouped by intent (last N days, 0 = all)
+    - นับเฉพาะ log ที่มีคอลัมน์ token (request หลังเพิ่ม token accounting)
+    - avg_* เฉลี่ยต่อ request (รวม request ที่ไม่เรียก LLM เช่น FAQ / cache hit)
+    """
+    from datetime import datetime, timedelta
+    from sqlalchemy import func
+
+    q = db.query(
+        QuestionLog.intent,
+        func.count(QuestionLog.id),
+        func.sum(QuestionLog.llm_calls),
+        func.sum(QuestionLog.prompt_tokens),
+        func.sum(QuestionLog.completion_tokens),
+    ).filter(QuestionLog.prompt_tokens.isnot(None))
+    if days > 0:
+        q = q.filter(QuestionLog.created_at >= datetime.utcnow() - timedelta(days=days))
+    rows = q.group_by(QuestionLog.intent).all()
+
+    out = []
+    for intent, n, calls, prompt, completion in rows:
+        prompt, completion = int(prompt or 0), int(completion or 0)
+        out.append({
+            "intent": intent or "unknown",
+            "requests": n,
+            "llm_calls": int(calls or 0),
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "avg_prompt_tokens": round(prompt / n, 1) if n else 0,
+            "avg_completion_tokens": round(completion / n, 1) if n else 0,
+        })
+    out.sort(key=lambda r: r["prompt_tokens"] + r["completion_tokens"], reverse=True)
+    return out
+
+
+# ============================================================
+# ADMIN: ANSWER CACHE
+# ============================================================
+
+@app.get("/admin/cache/stats")
+def get_answer_cache_stats(
+    _admin_ok: bool = Depends(verify_admin),
+):
+    """
+    hit / miss / eviction ของ semantic answer cache
+    """
+    return answer_cache.stats()
+
+
+@app.post("/admin/cache/clear")
+def clear_answer_cache(
+    _admin_ok: bool = Depends(verify_admin),
+):
+    answer_cache.clear()
+    return {"message": "cleared"}
+
+
+@app.get("/admin/inflight/stats")
+def get_inflight_stats(
+    _admin_ok: bool = Depends(verify_admin),
+):
+    """
+    จำนวน request ที่ถูกรวม (coalesced) เข้ากับคำถามเดียวกันที่กำลังรันอยู่
+    """
+    return inflight.stats()
+
+
+# ============================================================
+# ADMIN: CONVERSATION SESSIONS
+# ============================================================
+
+@app.get("/admin/conversations/stats")
+def get_conversation_stats(
+    _admin_ok: bool = Depends(verify_admin),
+):
+    """
+    จำนวน session ที่ยังไม่หมดอายุ + จำนวนที่ถูกลบเพราะหมดอายุ / เกิน CONVERSATION_MAX_SESSIONS
+    """
+    return conversations.stats()
+
+
+# ============================================================
+# ADMIN: CHAT TRACES (sampled)
+# ============================================================
+
+@app.get("/admin/traces", response_model=List[ChatTraceOut])
+def list_chat_traces(
+    db: Session = Depends(get_db),
+    _admin_ok: bool = Depends(verify_admin),
+    limit: int = 50,
+    min_ms: int = 0,
+):
+    """
+    trace ที่ถูก sample ไว้ (ช้าสุดก่อน) — ตั้ง TRACE_SAMPLE_RATE / TRACE_SLOW_MS ใน .env
+    """
+    return (
+        db.query(ChatTrace)
+        .filter(ChatTrace.total_ms >= min_ms)
+        .order_by(ChatTrace.total_ms.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+# ============================================================
+# ADMIN: RETRIEVAL LABELS (ground truth ของ benchmarks/eval_retrieval.py)
+# ============================================================
+
+@app.get("/admin/eval/labels", response_model=List[RetrievalLabelOut])
+def list_retrieval_labels(
+    db: Session = Depends(get_db),
+    _admin_ok: bool = Depends(verify_admin),
+    limit: int = 500,
+):
+    return (
+        db.query(RetrievalLabel)
+        .order_by(RetrievalLabel.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+@app.post("/admin/eval/labels", response_model=RetrievalLabelOut)
+def create_retrieval_label(
+    label: RetrievalLabelCreate,
+    db: Session = Depends(get_db),
+    _admin_ok: bool = Depends(verify_admin),
+):
+    """
+    Admin จับคู่คำถาม → เอกสารที่ควรตอบคำถามนั้น
+    """
+    if not label.question.strip():
+        raise HTTPException(status_code=400, detail="Empty question")
+    if not db.query(Document).filter(Document.id == label.document_id).first():
+        raise HTTPException(status_code=404, detail="Document not found")
+
+    row = RetrievalLabel(
+        question=label.question.strip(),
+        document_id=label.document_id,
+        created_by=label.created_by,
+    )
+    db.add(row)
+    db.commit()
+    db.refresh(row)
+    return row
+
+
+@app.delete("/admin/eval/labels/{label_id}")
+def delete_retrieval_label(
+    label_id: int,
+    db: Session = Depends(get_db),
+    _admin_ok: bool = Depends(verify_admin),
+):
+    row = db.query(RetrievalLabel).filter(RetrievalLabel.id == label_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Label not found")
+    db.delete(row)
+    db.commit()
+    return {"message": "deleted"}
+
+
+# ============================================================
+# ADMIN: EMBEDDING MIGRATION (blue/green — app/services/migration.py)
+# ============================================================
+
+def _migration_or_404() -> migration.EmbeddingMigration:
+    m = migration.current()
+    if m is None:
+        raise HTTPException(status_code=404, detail="No embedding migration")
+    return m
+
+
+@app.post("/admin/embedding-migration")
+def start_embedding_migration(
+    body: EmbeddingMigrationCreate,
+    _admin_ok: bool = Depends(verify_admin),
+):
+    """
+    เริ่ม build shadow index ด้วย embedding model (และขนาด chunk) ใหม่ใน background
+    ระบบยังตอบจาก index เดิมจนกว่าจะสั่ง cutover
+    """
+    kwargs: Dict[str, Any] = {"backend": body.backend, "threads": body.threads, "chunk_size": body.chunk_size}
+    if body.mirror_rate is not None:
+        kwargs["mirror_rate"] = body.mirror_rate
+    try:
+        m = migration.start_migration(SessionLocal, body.model, **kwargs)
+    except migration.MigrationError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return m.status()
+
+
+@app.get("/admin/embedding-migration")
+def get_embedding_migration(
+    _admin_ok: bool = Depends(verify_admin),
+):
+    """
+    ความคืบหน้าของการ build + ผลเทียบ query ที่ mirror (overlap ของเอกสาร top-k, latency p50/p95)
+    """
+    return _migration_or_404().status()
+
+
+@app.post("/admin/embedding-migration/evaluate")
+def evaluate_embedding_migration(
+    k: int = 10,
+    _admin_ok: bool = Depends(verify_admin),
+):
+    """
+    recall@k ของ index เดิม vs shadow บนคำถามที่มี label (/admin/eval/labels)
+    """
+    try:
+        return _migration_or_404().evaluate(SessionLocal, k=k)
+    except migration.MigrationError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/admin/embedding-migration/cutover")
+def cutover_embedding_migration(
+    _admin_ok: bool = Depends(verify_admin),
+):
+    """
+    สลับไปใช้ model + index ใหม่ (FAQ / answer cache / suggestion ถูก re-embed ก่อนสลับ)
+    """
+    try:
+        return _migration_or_404().cutover(SessionLocal, faq_agent, answer_cache, suggest_agent)
+    except migration.MigrationError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@app.delete("/admin/embedding-migration")
+def abort_embedding_migration(
+    _admin_ok: bool = Depends(verify_admin),
+):
+    m = _migration_or_404()
+    if m.state not in ("building", "ready"):
+        raise HTTPException(status_code=409, detail=f"Migration is already {m.state}")
+    m.abort()
+    return m.status()
+
+
 # ============================================================
 # HEALTH CHECK
 # ============================================================
@@ -618,3 +1189,38 @@ def get_intent_stats(
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready_check():
+    """
+    Readiness probe: สถานะต่อ component (embedder / vector store / FAQ index / Gemini client ...)
+    - 200 เมื่อ component ที่ required พร้อมทั้งหมด ไม่งั้น 503
+    - /health ตอบได้ทันทีตั้งแต่ process เริ่ม (liveness)
+    """
+    # warmup ปิด → component โหลดตอน request แรก: cold ไม่นับเป็น not ready (error ยังนับ)
+    status = readiness(cold_ok=STARTUP_WARMUP == "off")
+    status["import_ms"] = IMPORT_MS
+    return Response(
+        content=json.dumps(status, ensure_ascii=False),
+        media_type="application/json",
+        status_code=200 if status["ready"] else 503,
+    )
+
+
+# ============================================================
+# METRICS (Prometheus)
+# ============================================================
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus scrape endpoint: stage latency, LLM calls/tokens,
+    cache hit/miss, embedder batch size, DB pool status
+    """
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
+
+IMPORT_MS = round((time.perf_counter() - _IMPORT_T0) * 1000.0, 1)
+logger.info(f"[STARTUP] app.main imported in {IMPORT_MS:.0f} ms (warmup: {STARTUP_WARMUP})")
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 
 # ===========================
@@ -10,11 +10,25 @@ from typing import List, Optional
 class ChatRequest(BaseModel):
     question: str
     user_id: Optional[str] = None
+    # latency budget ของ request (ms) — ไม่ส่ง = ใช้ CHAT_DEADLINE_MS
+    deadline_ms: Optional[int] = Field(default=None, ge=100, le=120000)
+    # auto = Gemini (+ extractive fallback), fast = extractive จาก chunk ไม่เรียก LLM
+    mode: Literal["auto", "fast"] = "auto"
+    # session_id จาก response ก่อนหน้า → ถามต่อในบทสนทนาเดิม (ไม่ส่ง / หมดอายุ = เริ่ม session ใหม่)
+    session_id: Optional[str] = Field(default=None, max_length=64)
 
 
 class ChatResponse(BaseModel):
     answer: str
     next_topics: List[str] = Field(default_factory=list)
+    # stage ที่ถูกข้ามเพราะ deadline (followups / suggestion / router / generate)
+    skipped: List[str] = Field(default_factory=list)
+    # llm / extractive (None = FAQ / cache / capabilities)
+    answer_mode: Optional[str] = None
+    # ส่งกลับมาใน request ถัดไปเพื่อถามต่อ (None = ปิด CONVERSATION_ENABLED)
+    session_id: Optional[str] = None
+    # เฉพาะ admin + debug=1: AgentState พร้อม trace (timings / chunks / LLM calls / cache)
+    debug: Optional[Dict[str, Any]] = None
 
 
 # ===========================
@@ -24,6 +38,8 @@ class ChatResponse(BaseModel):
 class DocumentBase(BaseModel):
     title: str
     content: str
+    # ไม่ส่ง = เดาจากเนื้อหา
+    category: Optional[str] = None
 
 
 class DocumentCreate(DocumentBase):
@@ -47,6 +63,7 @@ class DocumentOut(BaseModel):
     id: int
     title: str
     current_content: str
+    category: Optional[str] = None
     created_at: datetime
     updated_at: datetime
     revisions: List[DocumentRevisionOut]
@@ -89,3 +106,51 @@ class FeedbackOut(BaseModel):
     created_at: datetime
 
     model_config = {"from_attributes": True}
+
+
+# ===========================
+# CHAT TRACES (debug sampling)
+# ===========================
+
+class ChatTraceOut(BaseModel):
+    id: int
+    question: str
+    intent: Optional[str] = None
+    source: Optional[str] = None
+    total_ms: int
+    trace: str
+    created_at: datetime
+
+    model_config = {"from_attributes": True}
+
+
+# ===========================
+# RETRIEVAL LABELS (eval ground truth)
+# ===========================
+
+class RetrievalLabelCreate(BaseModel):
+    question: str
+    document_id: int
+    created_by: str = "admin"
+
+
+class RetrievalLabelOut(BaseModel):
+    id: int
+    question: str
+    document_id: int
+    created_by: str
+    created_at: datetime
+
+    model_config = {"from_attributes": True}
+
+
+# ===========================
+# EMBEDDING MIGRATION (blue/green — app/services/migration.py)
+# ===========================
+
+class EmbeddingMigrationCreate(BaseModel):
+    model: str
+    backend: str = "torch"
+    threads: int = 0
+    chunk_size: Optional[int] = None     # None = ขนาด chunk เดิม
+    mirror_rate: Optional[float] = None  # None = MIGRATION_MIRROR_RATE
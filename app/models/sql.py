@@ -25,6 +25,10 @@ class Document(Base):
     title = Column(String(255), nullable=False, index=True)
     current_content = Column(Text, nullable=True)
 
+    # หมวดเอกสาร (academic / regulation / scholarship / dorm / contact / general)
+    # ใช้เป็น where filter ตอน retrieve ตาม intent — ดู app/services/categories.py
+    category = Column(String(50), nullable=True, index=True)
+
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(
         DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False
@@ -73,6 +77,11 @@ class QuestionLog(Base):
     route = Column(String(50), nullable=True)
     confidence = Column(String(20), nullable=True)
 
+    # token ของ Gemini ทุก call ใน request (router / answer / followups) — NULL = log ก่อนมีคอลัมน์
+    llm_calls = Column(Integer, nullable=True)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
 
@@ -118,3 +127,90 @@ class AnswerFeedback(Base):
     comment = Column(Text, nullable=True)
 
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+# =====================================================
+# ANSWER CACHE (semantic cache หน้า run_pipeline)
+# - แยกจาก FaqEntry โดยสิ้นเชิง (FAQ ที่ admin ดูแลต้องชนะเสมอ)
+# - ผูกกับ corpus_version → เอกสารเปลี่ยน entry เก่าใช้ไม่ได้
+# =====================================================
+
+class AnswerCacheEntry(Base):
+    __tablename__ = "answer_cache_entries"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    question = Column(Text, nullable=False)
+    answer = Column(Text, nullable=False)
+
+    # JSON string ของ embedding (normalized, list of float)
+    question_embedding = Column(Text, nullable=False)
+
+    # JSON string ของ meta จาก pipeline (intent / route / next_topics ...)
+    meta = Column(Text, nullable=True)
+
+    corpus_version = Column(String(64), nullable=False, index=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+# =====================================================
+# CHAT TRACE (debug trace ที่ถูก sample ไว้วิเคราะห์ request ช้า)
+# =====================================================
+
+class ChatTrace(Base):
+    __tablename__ = "chat_traces"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    question = Column(Text, nullable=False)
+    intent = Column(String(100), nullable=True)
+    source = Column(String(50), nullable=True)
+    total_ms = Column(Integer, nullable=False, index=True)
+
+    # JSON string ของ trace ทั้งหมด (timings / retrieved / llm / cache)
+    trace = Column(Text, nullable=False)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+
+# =====================================================
+# RETRIEVAL LABEL (คำถาม → เอกสารที่ควรถูก retrieve)
+# - admin กำหนดเอง ใช้เป็น ground truth ของ retrieval eval
+# =====================================================
+
+class RetrievalLabel(Base):
+    __tablename__ = "retrieval_labels"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    question = Column(Text, nullable=False)
+    document_id = Column(
+        Integer,
+        ForeignKey("documents.id", ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    )
+
+    created_by = Column(String(100), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+# =====================================================
+# CONVERSATION SESSION (ประวัติแชทหลายรอบ — CONVERSATION_BACKEND=sql)
+# - turns = รอบล่าสุด (JSON) / summary = สรุปย่อของรอบที่เก่ากว่า
+# =====================================================
+
+class ConversationSession(Base):
+    __tablename__ = "conversation_sessions"
+
+    session_id = Column(String(64), primary_key=True)
+    user_id = Column(String(100), nullable=True)
+
+    summary = Column(Text, nullable=False, default="")
+    # JSON string ของ list [{"question", "answer", "at"}]
+    turns = Column(Text, nullable=False, default="[]")
+    turn_count = Column(Integer, nullable=False, default=0)
+
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
@@ -0,0 +1,442 @@
+# app/services/answer_cache.py
+"""
+Semantic answer cache (อยู่หน้า run_pipeline)
+
+- lookup ด้วย embedding ของคำถาม → หา entry ที่ใกล้ที่สุดภายใน threshold
+- ทุก entry ผูกกับ corpus version (สร้าง/แก้/ลบเอกสาร → version เปลี่ยน)
+- TTL + LRU จำกัดขนาด
+- corpus version ตรวจจาก DB ซ้ำทุก ANSWER_CACHE_VERSION_CHECK_S วินาที (worker อื่นแก้เอกสารก็เห็น)
+- (optional) persist ลงตาราง answer_cache_entries → restart แล้วยัง warm
+- ไม่เกี่ยวกับ FaqEntry: caller ต้องเช็ค FAQ ก่อนใช้คำตอบจาก cache เสมอ
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.startup import embedding_swap
+from app.models.sql import AnswerCacheEntry, Document
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "1") == "1"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.93"))
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", "21600"))  # วินาที (6 ชม.)
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2000"))
+ANSWER_CACHE_PERSIST = os.getenv("ANSWER_CACHE_PERSIST", "0") == "1"
+# ตรวจ corpus version จาก DB ทุกกี่วินาที (ตอน lookup / store) — หลาย worker: เอกสารถูกแก้ใน worker อื่น
+# ก็เลิกใช้คำตอบเก่าภายในเวลานี้ (0 = เชื่อ version ใน memory อย่างเดียว)
+ANSWER_CACHE_VERSION_CHECK_S = float(os.getenv("ANSWER_CACHE_VERSION_CHECK_S", "5"))
+
+# คำตอบแบบนี้ไม่ควร cache (ไม่มีข้อมูล / ระบบ error)
+_UNCACHEABLE_MARKERS = (
+    "ไม่พบข้อมูล",
+    "ระบบไม่สามารถสร้างคำตอบได้",
+)
+
+
+def normalize_question(question: str) -> str:
+    """key สำหรับ exact match: ตัดช่องว่างซ้ำ + lower-case + ตัด ? ท้ายประโยค"""
+    q = " ".join((question or "").split()).lower()
+    return q.rstrip(" ?？!.")
+
+
+def compute_corpus_version(db: Session) -> str:
+    """fingerprint ของ corpus จากตาราง documents
+
+    สร้าง/แก้/ลบเอกสาร → จำนวนหรือ max(id)/max(updated_at) เปลี่ยน
+    ใช้ค่าจาก DB (ไม่ใช่ counter ใน memory) เพื่อให้ restart แล้ว entry ที่ persist ไว้ยังใช้ได้
+    """
+    count, max_id, max_updated = db.query(
+        func.count(Document.id),
+        func.max(Document.id),
+        func.max(Document.updated_at),
+    ).one()
+    stamp = max_updated.strftime("%Y%m%d%H%M%S%f") if max_updated else "0"
+    return f"{count or 0}-{max_id or 0}-{stamp}"
+
+
+@dataclass
+class _CacheEntry:
+    question: str
+    vector: np.ndarray
+    answer: str
+    meta: Dict[str, Any]
+    corpus_version: str
+    created_at: float = field(default_factory=time.time)
+
+
+class SemanticAnswerCache:
+    """cache คำตอบของ pipeline แบบ semantic (embedding nearest neighbour)"""
+
+    def __init__(
+        self,
+        embedder,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl_seconds: int = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        persist: bool = ANSWER_CACHE_PERSIST,
+        session_factory: Optional[Callable[[], Session]] = None,
+        version_check_s: float = ANSWER_CACHE_VERSION_CHECK_S,
+    ):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.persist = persist and session_factory is not None
+        self.session_factory = session_factory
+
+        self.corpus_version = "0"
+        self.version_check_s = version_check_s
+        self._version_checked_at = 0.0
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self._lock = threading.Lock()
+
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expired": 0,
+        }
+
+    # ------------------------------------------------------------
+    # helpers
+    # ------------------------------------------------------------
+    def _encode(self, question: str) -> np.ndarray:
+        vec = np.asarray(self.embedder.encode(question), dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm > 0 else vec
+
+    def _invalidate_matrix(self):
+        self._matrix = None
+        self._matrix_keys = []
+
+    def _ensure_matrix(self):
+        if self._matrix is None and self._entries:
+            self._matrix_keys = list(self._entries.keys())
+            self._matrix = np.stack([self._entries[k].vector for k in self._matrix_keys])
+
+    def _is_expired(self, entry: _CacheEntry, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - entry.created_at > self.ttl_seconds
+
+    def _drop(self, key: str):
+        self._entries.pop(key, None)
+        self._invalidate_matrix()
+
+    # ------------------------------------------------------------
+    # corpus version
+    # ------------------------------------------------------------
+    def bump_corpus_version(self, db: Session) -> str:
+        """เรียกหลังสร้าง/แก้/ลบเอกสาร → entry ของ version เก่าใช้ไม่ได้ทันที"""
+        try:
+            version = compute_corpus_version(db)
+        except Exception as e:
+            logger.warning(f"[ANSWER_CACHE] Cannot compute corpus version: {e}")
+            version = f"local-{time.time_ns()}"
+        return self._apply_version(version)
+
+    def _apply_version(self, version: str) -> str:
+        with self._lock:
+            self._version_checked_at = time.monotonic()
+            changed = version != self.corpus_version
+            if changed:
+                self.corpus_version = version
+                self._entries.clear()
+                self._invalidate_matrix()
+
+        if self.persist and changed:
+            self._purge_stale_rows(version)
+        return version
+
+    def _refresh_corpus_version(self):
+        """ตรวจ corpus version จาก DB ถ้าไม่ได้ตรวจมานานกว่า version_check_s (request เดียวต่อรอบที่ไป query)"""
+        if self.version_check_s <= 0 or self.session_factory is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._version_checked_at < self.version_check_s:
+                return
+            self._version_checked_at = now
+        try:
+            with self.session_factory() as db:
+                version = compute_corpus_version(db)
+        except Exception as e:
+            # DB ล่มชั่วคราว → ใช้ version เดิมต่อ (ไม่ล้าง cache ทุกรอบที่ตรวจ)
+            logger.warning(f"[ANSWER_CACHE] Cannot refresh corpus version: {e}")
+            return
+        self._apply_version(version)
+
+    # ------------------------------------------------------------
+    # public API
+    # ------------------------------------------------------------
+    @embedding_swap.shared()
+    def lookup(self, question: str) -> Optional[Tuple[str, Dict[str, Any], float]]:
+        """คืน (answer, meta, score) ถ้าเจอคำถามที่ใกล้พอ ไม่งั้น None"""
+        if not ANSWER_CACHE_ENABLED:
+            return None
+
+        key = normalize_question(question)
+        if not key:
+            return None
+        self._refresh_corpus_version()
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._is_expired(entry, now):
+                    self._drop(key)
+                    self._stats["expired"] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry.answer, dict(entry.meta), 1.0
+            has_entries = bool(self._entries)
+
+        if not has_entries:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        q_vec = self._encode(question)
+
+        with self._lock:
+            self._ensure_matrix()
+            if self._matrix is None:
+                self._stats["misses"] += 1
+                return None
+
+            scores = self._matrix @ q_vec
+            for idx in np.argsort(-scores):
+                score = float(scores[idx])
+                if score < self.threshold:
+                    break
+                best_key = self._matrix_keys[idx]
+                entry = self._entries.get(best_key)
+                if entry is None:
+                    continue
+                if self._is_expired(entry, now):
+                    self._drop(best_key)
+                    self._stats["expired"] += 1
+                    break
+                self._entries.move_to_end(best_key)
+                self._stats["hits"] += 1
+                return entry.answer, dict(entry.meta), score
+
+            self._stats["misses"] += 1
+        return None
+
+    @embedding_swap.shared()
+    def store(self, question: str, answer: str, meta: Dict[str, Any]):
+        """เก็บคำตอบจาก RAG (ไม่เก็บคำตอบจาก FAQ / คำตอบที่ไม่มีข้อมูล)"""
+        if not ANSWER_CACHE_ENABLED:
+            return
+        key = normalize_question(question)
+        if not key or not answer:
+            return
+        if (meta or {}).get("source") != "rag":
+            return
+        if any(m in answer for m in _UNCACHEABLE_MARKERS):
+            return
+        self._refresh_corpus_version()
+
+        vec = self._encode(question)
+        clean_meta = {
+            k: v for k, v in (meta or {}).items()
+            if k in ("intent", "route", "confidence", "next_topics", "source")
+        }
+
+        with self._lock:
+            version = self.corpus_version
+            self._entries[key] = _CacheEntry(
+                question=question,
+                vector=vec,
+                answer=answer,
+                meta=clean_meta,
+                corpus_version=version,
+            )
+            self._entries.move_to_end(key)
+            self._stats["stores"] += 1
+
+            evicted: List[_CacheEntry] = []
+            while len(self._entries) > self.max_entries:
+                _, old = self._entries.popitem(last=False)
+                evicted.append(old)
+                self._stats["evictions"] += 1
+            self._invalidate_matrix()
+
+        if self.persist:
+            self._persist_entry(question, answer, vec, clean_meta, version, evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._invalidate_matrix()
+
+    def prepare_reembed(self, encoder) -> Callable[[], int]:
+        """embed คำถามของทุก entry ด้วย encoder ใหม่ (เปลี่ยน embedding model) → commit() สลับ vector
+
+        entry ที่เข้ามาหลัง prepare (vector ของ model เดิม) ถูกทิ้งตอน commit
+        """
+        with self._lock:
+            items = [(k, e.question) for k, e in self._entries.items()]
+        new: Dict[str, np.ndarray] = {}
+        if items:
+            mat = np.asarray(encoder.encode([q for _, q in items], show_progress_bar=False), dtype=np.float32)
+            mat /= np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+            new = {k: v for (k, _), v in zip(items, mat)}
+
+        def commit() -> int:
+            with self._lock:
+                for key in list(self._entries):
+                    vec = new.get(key)
+                    if vec is None:
+                        self._entries.pop(key)
+                    else:
+                        self._entries[key].vector = vec
+                self._invalidate_matrix()
+                entries = list(self._entries.values())
+            if self.persist:
+                self._rewrite_rows(entries)
+            return len(entries)
+
+        return commit
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            s["size"] = len(self._entries)
+        total = s["hits"] + s["misses"]
+        s["hit_ratio"] = round(s["hits"] / total, 4) if total else 0.0
+        s["corpus_version"] = self.corpus_version
+        s["threshold"] = self.threshold
+        s["persist"] = self.persist
+        return s
+
+    # ------------------------------------------------------------
+    # persistence (best-effort: DB ล่มก็ไม่ทำให้ chat ล่ม)
+    # ------------------------------------------------------------
+    def warm(self) -> int:
+        """โหลด entry ของ corpus version ปัจจุบันจาก DB (ใช้ตอน startup)"""
+        if not self.persist:
+            return 0
+
+        db = self.session_factory()
+        try:
+            rows = (
+                db.query(AnswerCacheEntry)
+                .filter(AnswerCacheEntry.corpus_version == self.corpus_version)
+                .order_by(AnswerCacheEntry.created_at.desc())
+                .limit(self.max_entries)
+                .all()
+            )
+        except Exception as e:
+            logger.warning(f"[ANSWER_CACHE] Warm load failed: {e}")
+            return 0
+        finally:
+            db.close()
+
+        loaded = 0
+        with self._lock:
+            # เก่าสุดก่อน → ใหม่สุดอยู่ท้าย OrderedDict (LRU)
+            for row in reversed(rows):
+                created = row.created_at.timestamp() if row.created_at else time.time()
+                if self.ttl_seconds > 0 and time.time() - created > self.ttl_seconds:
+                    continue
+                try:
+                    vec = np.asarray(json.loads(row.question_embedding), dtype=np.float32)
+                    meta = json.loads(row.meta) if row.meta else {}
+                except Exception:
+                    continue
+                self._entries[normalize_question(row.question)] = _CacheEntry(
+                    question=row.question,
+                    vector=vec,
+                    answer=row.answer,
+                    meta=meta,
+                    corpus_version=row.corpus_version,
+                    created_at=created,
+                )
+                loaded += 1
+            self._invalidate_matrix()
+
+        logger.info(f"[ANSWER_CACHE] Warm loaded {loaded} entries")
+        return loaded
+
+    def _persist_entry(self, question, answer, vec, meta, version, evicted):
+        db = self.session_factory()
+        try:
+            db.query(AnswerCacheEntry).filter(
+                AnswerCacheEntry.question == question,
+                AnswerCacheEntry.corpus_version == version,
+            ).delete(synchronize_session=False)
+            for old in evicted:
+                db.query(AnswerCacheEntry).filter(
+                    AnswerCacheEntry.question == old.question,
+                    AnswerCacheEntry.corpus_version == old.corpus_version,
+                ).delete(synchronize_session=False)
+            db.add(
+                AnswerCacheEntry(
+                    question=question,
+                    answer=answer,
+                    question_embedding=json.dumps([round(float(x), 6) for x in vec]),
+                    meta=json.dumps(meta, ensure_ascii=False),
+                    corpus_version=version,
+                )
+            )
+            db.commit()
+        except Exception as e:
+            logger.warning(f"[ANSWER_CACHE] Persist failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _rewrite_rows(self, entries: List[_CacheEntry]):
+        db = self.session_factory()
+        try:
+            db.query(AnswerCacheEntry).delete(synchronize_session=False)
+            for e in entries:
+                db.add(
+                    AnswerCacheEntry(
+                        question=e.question,
+                        answer=e.answer,
+                        question_embedding=json.dumps([round(float(x), 6) for x in e.vector]),
+                        meta=json.dumps(e.meta, ensure_ascii=False),
+                        corpus_version=e.corpus_version,
+                    )
+                )
+            db.commit()
+        except Exception as e:
+            logger.warning(f"[ANSWER_CACHE] Rewrite rows failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def _purge_stale_rows(self, version: str):
+        db = self.session_factory()
+        try:
+            db.query(AnswerCacheEntry).filter(
+                AnswerCacheEntry.corpus_version != version
+            ).delete(synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.warning(f"[ANSWER_CACHE] Purge stale rows failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
@@ -0,0 +1,116 @@
+# app/services/batcher.py
+"""
+Micro-batching ของ embedder.encode จากหลาย request พร้อมกัน
+
+request แต่ละตัว (chat / FAQ / suggestion / answer cache) มัก encode ทีละ 1-2 ข้อความ
+จากหลาย thread พร้อมกัน → model ตัวเดียวแย่ง CPU thread กันเองและไม่ได้ประโยชน์จาก batch
+
+EmbeddingBatcher:
+  - encode() ใส่ข้อความลงคิวพร้อม Future แล้วรอผล (interface เดิม: str → 1 vector, list → matrix)
+  - worker thread เดียวดึงจากคิว: รอจนได้ max_batch ข้อความ หรือครบ max_wait_ms นับจาก
+    request แรกของ batch แล้ว encode รวดเดียว → แจกผลคืนทาง Future
+  - call ที่ส่งข้อความมาเยอะอยู่แล้ว (≥ max_batch เช่น ingest) หรือใช้ option อื่น
+    (normalize_embeddings, convert_to_tensor, ...) → encode ตรงใน thread ของ caller
+  - metric: จำนวน request ต่อ batch + เวลารอในคิว (mfu_embed_batch_requests / mfu_embed_queue_wait_seconds)
+    ขนาด batch จริงนับที่ embedder ชั้นล่าง (mfu_embed_batch_size)
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional
+
+import numpy as np
+
+from app.core.metrics import record_embed_batch
+from app.core.trace import trace_timing
+
+logger = logging.getLogger(__name__)
+
+# kwargs ที่ไม่เปลี่ยนผลของ encode → รวม batch ได้
+_BATCHABLE_KWARGS = {"show_progress_bar", "batch_size"}
+
+
+class _Item:
+    __slots__ = ("texts", "future", "enqueued")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+        self.enqueued = time.perf_counter()
+
+
+class EmbeddingBatcher:
+    def __init__(self, model, max_batch: int = 32, max_wait_ms: float = 3.0):
+        self._model = model
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "queue.Queue[_Item]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    # ------------------------------------------------------------
+    # API แบบ SentenceTransformer
+    # ------------------------------------------------------------
+    def encode(self, sentences, *args, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if args or set(kwargs) - _BATCHABLE_KWARGS or not texts or len(texts) >= self.max_batch:
+            return self._model.encode(sentences, *args, **kwargs)
+
+        self._ensure_worker()
+        item = _Item(texts)
+        self._queue.put(item)
+        vecs, waited = item.future.result()
+        trace_timing("embed_queue_wait", waited * 1000.0)
+        return vecs[0] if single else vecs
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+    # ------------------------------------------------------------
+    # WORKER
+    # ------------------------------------------------------------
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._start_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._worker.start()
+
+    def _collect(self) -> List[_Item]:
+        first = self._queue.get()
+        items = [first]
+        n = len(first.texts)
+        deadline = first.enqueued + self.max_wait
+        while n < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            items.append(item)
+            n += len(item.texts)
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            started = time.perf_counter()
+            texts = [t for it in items for t in it.texts]
+            try:
+                vecs = np.asarray(self._model.encode(texts, show_progress_bar=False))
+            except Exception as e:
+                logger.warning(f"[EMBED] batch of {len(texts)} texts failed: {e}")
+                for it in items:
+                    it.future.set_exception(e)
+                continue
+            waits = [started - it.enqueued for it in items]
+            record_embed_batch(len(items), waits)
+            pos = 0
+            for it, waited in zip(items, waits):
+                it.future.set_result((vecs[pos:pos + len(it.texts)], waited))
+                pos += len(it.texts)
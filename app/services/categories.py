@@ -0,0 +1,135 @@
+# app/services/categories.py
+"""
+หมวดของเอกสาร + retrieval profile ต่อ intent
+
+- เอกสารมี category (admin กำหนดตอนสร้าง/อัปโหลด หรือเดาจากเนื้อหา) เก็บใน Document.category
+  และใน metadata ของทุก chunk ("category") → ใช้เป็น where filter ของ Chroma
+- หลัง router ได้ intent แล้ว agent จะค้นเฉพาะหมวดที่เกี่ยวข้อง (+ "general") ด้วย top_k / threshold
+  ของ profile นั้น → HNSW ค้นในชุดที่เล็กลง และ context ที่ไม่เกี่ยวไม่หลุดเข้า prompt
+- filter แล้วไม่เจออะไร → retrieve ทั้ง collection ตามเดิม (กันหมวดผิด/เอกสารยังไม่มีหมวด)
+
+override profile ได้ผ่าน env RETRIEVAL_PROFILES (JSON) เช่น
+  {"academic": {"top_k": 8, "threshold": 0.3}, "dorm": {"categories": ["dorm", "contact"]}}
+"""
+
+import json
+import logging
+import os
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES: List[str] = ["academic", "regulation", "scholarship", "dorm", "contact", "general"]
+DEFAULT_CATEGORY = "general"
+
+# keyword ระดับเอกสาร (นับจำนวนครั้งที่พบใน title + เนื้อหาช่วงต้น)
+CATEGORY_KEYWORDS: Dict[str, List[str]] = {
+    "academic": [
+        "ลงทะเบียน", "รายวิชา", "หน่วยกิต", "เกรด", "ผลการเรียน", "ปฏิทินการศึกษา", "หลักสูตร",
+        "การสอบ", "เพิ่มถอน", "สำเร็จการศึกษา", "เกียรตินิยม", "course", "credit", "curriculum",
+    ],
+    "regulation": [
+        "ระเบียบ", "ข้อบังคับ", "วินัย", "แต่งกาย", "เครื่องแบบ", "ลงโทษ", "ความประพฤติ",
+        "ภาคทัณฑ์", "regulation",
+    ],
+    "scholarship": [
+        "ทุน", "กยศ", "กรอ", "ผ่อนผัน", "ค่าธรรมเนียม", "ค่าเทอม", "scholarship", "tuition",
+    ],
+    "dorm": ["หอพัก", "หอใน", "ค่าหอ", "เข้าพัก", "ห้องพัก", "dormitory"],
+    "contact": ["ติดต่อ", "โทรศัพท์", "อีเมล", "เวลาทำการ", "สำนักงาน", "contact", "e-mail"],
+}
+
+_INFER_CHARS = 4000
+_INFER_MIN_HITS = 2
+
+
+def normalize_category(value: Optional[str]) -> Optional[str]:
+    v = (value or "").strip().lower()
+    return v if v in CATEGORIES else None
+
+
+def infer_category(title: str, content: str) -> str:
+    """เดาหมวดจาก keyword (title นับ 3 เท่า) — ไม่ชัดเจน → general"""
+    title = (title or "").lower()
+    body = (content or "")[:_INFER_CHARS].lower()
+    best, best_score = DEFAULT_CATEGORY, 0
+    for cat, words in CATEGORY_KEYWORDS.items():
+        score = sum(3 * title.count(w) + body.count(w) for w in words)
+        if score > best_score:
+            best, best_score = cat, score
+    return best if best_score >= _INFER_MIN_HITS else DEFAULT_CATEGORY
+
+
+def resolve_category(requested: Optional[str], title: str, content: str) -> str:
+    """ใช้หมวดที่ admin เลือก (ถ้าถูกต้อง) ไม่งั้นเดาจากเนื้อหา"""
+    return normalize_category(requested) or infer_category(title, content)
+
+
+# ============================================================
+# RETRIEVAL PROFILES
+# ============================================================
+
+@dataclass(frozen=True)
+class RetrievalProfile:
+    name: str
+    categories: List[str] = field(default_factory=list)
+    top_k: int = 10
+    keep: int = 4
+    threshold: float = 0.32
+    # ใส่หน้าคำถามใน prompt ของ LLM เท่านั้น (ไม่ใช้ตอน retrieve)
+    hint: str = ""
+
+    def where(self) -> Optional[Dict[str, Any]]:
+        if not self.categories:
+            return None
+        return {"category": {"$in": list(self.categories)}}
+
+
+def _default_profiles() -> Dict[str, RetrievalProfile]:
+    from app.services.rag import RERANK_KEEP, SIM_THRESHOLD, TOP_K_RETRIEVE
+
+    def p(name, cats, hint, top_k=None, keep=None, threshold=None):
+        return RetrievalProfile(
+            name=name,
+            categories=cats,
+            top_k=top_k or TOP_K_RETRIEVE,
+            keep=keep or RERANK_KEEP,
+            threshold=SIM_THRESHOLD if threshold is None else threshold,
+            hint=hint,
+        )
+
+    return {
+        # ชุดที่เล็กลง → ไม่ต้องดึง candidate มากเท่า collection ทั้งหมด
+        "academic": p("academic", ["academic", "general"], "คำถามด้านการเรียน/ลงทะเบียน/ปฏิทินการศึกษา", top_k=8),
+        "regulation": p("regulation", ["regulation", "general"], "คำถามด้านระเบียบ/ข้อบังคับ/การแต่งกาย", top_k=8),
+        "scholarship": p("scholarship", ["scholarship", "general"], "คำถามด้านทุนการศึกษา/ค่าธรรมเนียม", top_k=6, keep=3),
+        "dorm": p("dorm", ["dorm", "general"], "คำถามด้านหอพัก", top_k=6, keep=3),
+        "contact": p("contact", ["contact", "general"], "คำถามด้านการติดต่อหน่วยงาน", top_k=6, keep=3),
+        # general_rag / อื่น ๆ → ทั้ง collection
+        "general_rag": p("general_rag", [], "คำถามด้านทุนการศึกษา/หอพัก/บริการนักศึกษา"),
+    }
+
+
+_profiles: Optional[Dict[str, RetrievalProfile]] = None
+
+
+def _load_profiles() -> Dict[str, RetrievalProfile]:
+    profiles = _default_profiles()
+    raw = os.getenv("RETRIEVAL_PROFILES")
+    if raw:
+        try:
+            for name, override in json.loads(raw).items():
+                base = profiles.get(name) or RetrievalProfile(name=name)
+                profiles[name] = replace(base, **override)
+        except Exception as e:
+            logger.warning(f"[PROFILE] ignore invalid RETRIEVAL_PROFILES: {e}")
+    return profiles
+
+
+def profile_for(intent: Optional[str]) -> Optional[RetrievalProfile]:
+    """profile ของ intent (None = ค้นทั้ง collection ด้วยค่า default)"""
+    global _profiles
+    if _profiles is None:
+        _profiles = _load_profiles()
+    return _profiles.get(intent or "")
@@ -0,0 +1,428 @@
+# app/services/conversation.py
+"""
+Conversation session (แชทหลายรอบ) ฝั่ง server
+
+- ทุก /chat ได้ session_id กลับไป → ส่งกลับมาใน request ถัดไปเพื่อถามต่อ ("แล้วค่าหอล่ะ")
+- เก็บ CONVERSATION_MAX_TURNS รอบล่าสุดแบบเต็ม (คำตอบตัดไม่เกิน CONVERSATION_TURN_TOKENS)
+  รอบที่เก่ากว่าถูกย่อเป็นบรรทัดเดียว ("คำถาม → ประโยคแรกของคำตอบ") ต่อท้าย summary
+  summary เกิน CONVERSATION_SUMMARY_TOKENS → ทิ้งบรรทัดเก่าสุด (rolling summary, ไม่เรียก LLM)
+- ประวัติที่ใส่ใน prompt ไม่เกิน CONVERSATION_HISTORY_TOKENS (รอบใหม่สุดก่อน → summary)
+- คำถามที่ดูเป็นคำถามต่อเนื่อง → เติมคำถามก่อนหน้า (ไม่เกิน CONVERSATION_RETRIEVAL_TOKENS)
+  ลงใน query ที่ใช้ route / retrieve (prompt ยังใช้คำถามจริง)
+- session หมดอายุเมื่อไม่มีการใช้ภายใน CONVERSATION_TTL วินาที, จำนวน session ไม่เกิน
+  CONVERSATION_MAX_SESSIONS (เกิน → ทิ้งตัวที่ใช้ล่าสุดนานที่สุด)
+
+backend (CONVERSATION_BACKEND):
+  memory — OrderedDict ใน process (หายเมื่อ restart / ไม่แชร์ระหว่าง worker)
+  sql    — ตาราง conversation_sessions (ใช้ร่วมกันได้หลาย worker)
+"""
+
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field, replace
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.agents.answer_styler import CLOSING_LINE
+from app.models.sql import ConversationSession
+from app.services.prompt_budget import split_sentences, trim_to_tokens
+from app.services.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================================
+# CONFIG
+# ============================================================
+
+CONVERSATION_ENABLED = os.getenv("CONVERSATION_ENABLED", "1") == "1"
+CONVERSATION_BACKEND = os.getenv("CONVERSATION_BACKEND", "memory").lower()
+CONVERSATION_TTL = int(os.getenv("CONVERSATION_TTL", "1800"))  # วินาที (30 นาที)
+CONVERSATION_MAX_SESSIONS = int(os.getenv("CONVERSATION_MAX_SESSIONS", "10000"))
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "4"))
+CONVERSATION_TURN_TOKENS = int(os.getenv("CONVERSATION_TURN_TOKENS", "150"))
+CONVERSATION_SUMMARY_TOKENS = int(os.getenv("CONVERSATION_SUMMARY_TOKENS", "200"))
+CONVERSATION_HISTORY_TOKENS = int(os.getenv("CONVERSATION_HISTORY_TOKENS", "400"))
+CONVERSATION_RETRIEVAL_TOKENS = int(os.getenv("CONVERSATION_RETRIEVAL_TOKENS", "48"))
+
+# ความยาวคำตอบต่อบรรทัดของ summary
+_SUMMARY_ANSWER_TOKENS = 40
+
+# คำที่บอกว่าคำถามอ้างถึงรอบก่อน (ขึ้นต้น / ลงท้าย / อยู่ในประโยค)
+_FOLLOWUP_PREFIXES = ("แล้ว", "และ", "ส่วน", "งั้น", "ถ้างั้น", "what about", "how about", "and ")
+_FOLLOWUP_SUFFIXES = ("ล่ะ", "หล่ะ", "ละ", "ด้วยไหม", "ด้วยมั้ย", "ด้วยหรือเปล่า")
+_FOLLOWUP_WORDS = ("อันนั้น", "อันนี้", "ที่ว่า", "ดังกล่าว", "เมื่อกี้", "ข้างบน", "เหมือนกันไหม")
+
+
+@dataclass
+class Turn:
+    question: str
+    answer: str
+    at: float = field(default_factory=time.time)
+
+
+@dataclass
+class Conversation:
+    session_id: str
+    user_id: Optional[str] = None
+    summary: str = ""
+    turns: List[Turn] = field(default_factory=list)
+    turn_count: int = 0
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def has_history(self) -> bool:
+        return bool(self.turns or self.summary)
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(16)
+
+
+# ============================================================
+# BACKENDS
+# ============================================================
+
+class MemorySessionStore:
+    """session ใน process: LRU ตามเวลาใช้ล่าสุด + TTL"""
+
+    name = "memory"
+
+    def __init__(self, ttl_seconds: int = CONVERSATION_TTL, max_sessions: int = CONVERSATION_MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"expired": 0, "evictions": 0}
+
+    def _is_expired(self, conv: Conversation, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - conv.updated_at > self.ttl_seconds
+
+    def get(self, session_id: str) -> Optional[Conversation]:
+        now = time.time()
+        with self._lock:
+            conv = self._sessions.get(session_id)
+            if conv is None:
+                return None
+            if self._is_expired(conv, now):
+                self._sessions.pop(session_id, None)
+                self._stats["expired"] += 1
+                return None
+            # คืนสำเนา: caller แก้ได้โดยไม่กระทบ session ที่ request อื่นกำลังอ่าน
+            return replace(conv, turns=list(conv.turns))
+
+    def save(self, conv: Conversation):
+        now = time.time()
+        with self._lock:
+            self._sessions[conv.session_id] = conv
+            self._sessions.move_to_end(conv.session_id)
+            # เรียงตามเวลาใช้ล่าสุด → ตัวที่หมดอายุอยู่ด้านหน้าเสมอ
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if not self._is_expired(oldest, now):
+                    break
+                self._sessions.popitem(last=False)
+                self._stats["expired"] += 1
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": self.name, "sessions": len(self._sessions), **self._stats}
+
+
+class SqlSessionStore:
+    """session ในตาราง conversation_sessions
+
+    ลบ session ที่หมดอายุ / เกินจำนวน ทุก sweep_interval วินาที (ตอน save) ไม่ใช่ทุก request
+    """
+
+    name = "sql"
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session],
+        ttl_seconds: int = CONVERSATION_TTL,
+        max_sessions: int = CONVERSATION_MAX_SESSIONS,
+        sweep_interval: float = 60.0,
+    ):
+        self.session_factory = session_factory
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"expired": 0, "evictions": 0}
+
+    def _cutoff(self) -> Optional[datetime]:
+        if self.ttl_seconds <= 0:
+            return None
+        return datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+
+    @staticmethod
+    def _to_conversation(row: ConversationSession) -> Conversation:
+        try:
+            turns = [Turn(**t) for t in json.loads(row.turns or "[]")]
+        except Exception as e:
+            logger.warning(f"[CONV] ignore invalid turns of session {row.session_id}: {e}")
+            turns = []
+        return Conversation(
+            session_id=row.session_id,
+            user_id=row.user_id,
+            summary=row.summary or "",
+            turns=turns,
+            turn_count=row.turn_count or 0,
+            updated_at=(row.updated_at - datetime(1970, 1, 1)).total_seconds(),
+        )
+
+    def get(self, session_id: str) -> Optional[Conversation]:
+        with self.session_factory() as db:
+            row = db.get(ConversationSession, session_id)
+            if row is None:
+                return None
+            cutoff = self._cutoff()
+            if cutoff is not None and row.updated_at < cutoff:
+                return None
+            return self._to_conversation(row)
+
+    def save(self, conv: Conversation):
+        with self.session_factory() as db:
+            row = db.get(ConversationSession, conv.session_id)
+            if row is None:
+                row = ConversationSession(session_id=conv.session_id)
+                db.add(row)
+            row.user_id = conv.user_id
+            row.summary = conv.summary
+            row.turns = json.dumps([asdict(t) for t in conv.turns], ensure_ascii=False)
+            row.turn_count = conv.turn_count
+            row.updated_at = datetime.utcnow()
+            db.commit()
+        self._maybe_sweep()
+
+    def _maybe_sweep(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        try:
+            self.sweep()
+        except Exception as e:
+            logger.warning(f"[CONV] session sweep failed: {e}")
+
+    def sweep(self):
+        """ลบ session ที่หมดอายุ แล้วตัดตัวที่ใช้ล่าสุดนานที่สุดจนเหลือไม่เกิน max_sessions"""
+        with self.session_factory() as db:
+            cutoff = self._cutoff()
+            if cutoff is not None:
+                expired = (
+                    db.query(ConversationSession)
+                    .filter(ConversationSession.updated_at < cutoff)
+                    .delete(synchronize_session=False)
+                )
+                self._stats["expired"] += expired
+            excess = db.query(ConversationSession).count() - self.max_sessions
+            if excess > 0:
+                old_ids = [
+                    sid for (sid,) in db.query(ConversationSession.session_id)
+                    .order_by(ConversationSession.updated_at.asc())
+                    .limit(excess)
+                ]
+                db.query(ConversationSession).filter(
+                    ConversationSession.session_id.in_(old_ids)
+                ).delete(synchronize_session=False)
+                self._stats["evictions"] += len(old_ids)
+            db.commit()
+
+    def delete(self, session_id: str) -> bool:
+        with self.session_factory() as db:
+            n = db.query(ConversationSession).filter(
+                ConversationSession.session_id == session_id
+            ).delete(synchronize_session=False)
+            db.commit()
+        return n > 0
+
+    def clear(self):
+        with self.session_factory() as db:
+            db.query(ConversationSession).delete(synchronize_session=False)
+            db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.session_factory() as db:
+            sessions = db.query(ConversationSession).count()
+        return {"backend": self.name, "sessions": sessions, **self._stats}
+
+
+def open_session_store(
+    backend: str = CONVERSATION_BACKEND,
+    session_factory: Optional[Callable[[], Session]] = None,
+):
+    """เปิด session store ตาม CONVERSATION_BACKEND (memory | sql)"""
+    backend = (backend or "memory").lower()
+    if backend == "memory":
+        if os.getenv("MODEL_SERVER_MODE", "off").lower() == "client":
+            # หลาย worker (docker-compose.workers.yml): session อยู่ใน worker ที่สร้างเท่านั้น
+            logger.warning(
+                "[CONV] CONVERSATION_BACKEND=memory with MODEL_SERVER_MODE=client: sessions are not "
+                "shared between workers, follow-ups on another worker lose context — use sql"
+            )
+        return MemorySessionStore()
+    if backend == "sql":
+        if session_factory is None:
+            raise ValueError("CONVERSATION_BACKEND=sql requires a session factory")
+        return SqlSessionStore(session_factory)
+    raise ValueError(f"unknown CONVERSATION_BACKEND: {backend}")
+
+
+# ============================================================
+# HISTORY
+# ============================================================
+
+def is_followup(question: str) -> bool:
+    """คำถามที่อ้างถึงรอบก่อน ("แล้วค่าหอล่ะ", "อันนั้นต้องยื่นที่ไหน")"""
+    q = " ".join((question or "").lower().split()).rstrip(" ?？!.ๆ")
+    if not q:
+        return False
+    return (
+        q.startswith(_FOLLOWUP_PREFIXES)
+        or q.endswith(_FOLLOWUP_SUFFIXES)
+        or any(w in q for w in _FOLLOWUP_WORDS)
+    )
+
+
+def _summary_line(turn: Turn) -> str:
+    sentences = split_sentences(turn.answer)
+    gist = trim_to_tokens(sentences[0], _SUMMARY_ANSWER_TOKENS) if sentences else ""
+    return f"- {turn.question} → {gist}" if gist else f"- {turn.question}"
+
+
+def _trim_summary(summary: str, budget: int) -> str:
+    """ทิ้งบรรทัดเก่าสุดจนเหลือไม่เกิน budget token"""
+    lines = [ln for ln in summary.splitlines() if ln.strip()]
+    while lines and estimate_tokens("\n".join(lines)) > budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class ConversationManager:
+    """เปิด / บันทึก session + สร้างประวัติสำหรับ prompt และ query สำหรับ retrieval"""
+
+    def __init__(self, store):
+        self.store = store
+        # load → เพิ่มรอบ → save ของ session เดียวกันภายใน process ไม่ชนกัน
+        # (backend sql หลาย worker: ตัวที่ save ทีหลังชนะ)
+        self._lock = threading.Lock()
+
+    def open(self, session_id: Optional[str], user_id: Optional[str] = None) -> Optional[Conversation]:
+        """session เดิม (ยังไม่หมดอายุ + user เดียวกัน) หรือ session ใหม่ (id ใหม่)
+
+        id ที่ไม่รู้จัก / หมดอายุ → ออก id ใหม่ (ไม่รับ id ที่ client ตั้งเอง)
+        """
+        if not CONVERSATION_ENABLED:
+            return None
+        conv = None
+        if session_id:
+            try:
+                conv = self.store.get(session_id)
+            except Exception as e:
+                logger.warning(f"[CONV] cannot load session: {e}")
+            if conv is not None and conv.user_id != user_id:
+                conv = None
+        return conv or Conversation(session_id=new_session_id(), user_id=user_id)
+
+    def record(self, conv: Optional[Conversation], question: str, answer: str):
+        """เพิ่มรอบล่าสุด → รอบที่เกิน CONVERSATION_MAX_TURNS ย่อลง summary → save"""
+        if conv is None:
+            return
+        answer = (answer or "").replace(CLOSING_LINE, "").strip()
+        turn = Turn(question=question, answer=trim_to_tokens(answer, CONVERSATION_TURN_TOKENS))
+        with self._lock:
+            try:
+                latest = self.store.get(conv.session_id)
+            except Exception as e:
+                logger.warning(f"[CONV] cannot reload session: {e}")
+                latest = None
+            if latest is not None:
+                conv = latest
+            conv.turns.append(turn)
+            conv.turn_count += 1
+            folded = conv.turns[:-CONVERSATION_MAX_TURNS] if CONVERSATION_MAX_TURNS > 0 else list(conv.turns)
+            if folded:
+                conv.turns = conv.turns[len(folded):]
+                lines = [conv.summary] if conv.summary else []
+                lines.extend(_summary_line(t) for t in folded)
+                conv.summary = _trim_summary("\n".join(lines), CONVERSATION_SUMMARY_TOKENS)
+            conv.updated_at = time.time()
+            try:
+                self.store.save(conv)
+            except Exception as e:
+                logger.warning(f"[CONV] cannot save session: {e}")
+
+    def history_text(self, conv: Optional[Conversation], budget: int = CONVERSATION_HISTORY_TOKENS) -> str:
+        """ประวัติสำหรับ prompt ไม่เกิน budget token
+
+        ใส่รอบใหม่สุดก่อน (ทั้งรอบ) → summary (ตัดบรรทัดเก่าทิ้ง) ในที่ที่เหลือ
+        ผลเรียงตามเวลา: summary → รอบเก่า → รอบใหม่
+        """
+        if conv is None or not conv.has_history or budget <= 0:
+            return ""
+        blocks: List[str] = []
+        used = 0
+        for t in reversed(conv.turns):
+            block = f"นักศึกษา: {t.question}\nผู้ช่วย: {t.answer}"
+            cost = estimate_tokens(block) + 1
+            if used + cost > budget:
+                break
+            blocks.insert(0, block)
+            used += cost
+        if conv.summary and len(blocks) == len(conv.turns):
+            summary = _trim_summary(conv.summary, budget - used - estimate_tokens("สรุปก่อนหน้า:\n"))
+            if summary:
+                blocks.insert(0, f"สรุปก่อนหน้า:\n{summary}")
+        return "\n".join(blocks)
+
+    def search_query(
+        self,
+        conv: Optional[Conversation],
+        question: str,
+        budget: int = CONVERSATION_RETRIEVAL_TOKENS,
+    ) -> str:
+        """query สำหรับ route / retrieve: คำถามต่อเนื่อง → เติมคำถามก่อนหน้า (ใหม่สุดก่อน) ไม่เกิน budget"""
+        if conv is None or not conv.turns or budget <= 0 or not is_followup(question):
+            return question
+        previous: List[str] = []
+        used = 0
+        for t in reversed(conv.turns):
+            cost = estimate_tokens(t.question) + 1
+            if used + cost > budget:
+                break
+            previous.insert(0, t.question)
+            used += cost
+        if not previous:
+            previous = [trim_to_tokens(conv.turns[-1].question, budget)]
+        return " ".join(previous + [question])
+
+    def delete(self, session_id: str) -> bool:
+        return self.store.delete(session_id)
+
+    def clear(self):
+        self.store.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return self.store.stats()
@@ -0,0 +1,98 @@
+# app/services/deadline.py
+"""
+Deadline (latency budget) ต่อ request
+
+ใช้ส่งต่อทุก stage ของ run_pipeline เพื่อให้ตัดงานที่ไม่จำเป็นเมื่อเวลาใกล้หมด
+ลำดับการ degrade (ตัดก่อน → ตัดหลัง):
+  1. query_rewrite (LLM rewrite ของ multi-query retrieval)
+  2. multi_query   (ค้นด้วยหลาย variant ของคำถาม → ค้นด้วยคำถามเดิมอย่างเดียว)
+  3. followups     (คำถามต่อเนื่องจาก Gemini)
+  4. suggestion    (หัวข้อถัดไปจาก QuestionLog)
+  5. router        (LLM router → heuristic router แบบ local)
+  6. generate      (Gemini answer → extractive answer จาก chunk ที่ retrieve มา)
+
+แต่ละ stage จะรันได้ก็ต่อเมื่อเวลาที่เหลือ >= cost ของตัวเอง + cost ของ stage
+ที่สำคัญกว่าซึ่งยังต้องรันต่อจากนั้น (reserve) → ได้ลำดับการ degrade ข้างบนโดยอัตโนมัติ
+"""
+
+import os
+import time
+from typing import Dict, List, Optional
+
+# deadline ตั้งต้นของ /chat ถ้า request ไม่ได้ส่งมา (0 = ไม่จำกัด)
+CHAT_DEADLINE_MS = int(os.getenv("CHAT_DEADLINE_MS", "0"))
+
+# cost โดยประมาณของแต่ละ stage (ms)
+STAGE_COST_MS: Dict[str, int] = {
+    "router": int(os.getenv("DEADLINE_ROUTER_MS", "1500")),
+    "generate": int(os.getenv("DEADLINE_GENERATE_MS", "3000")),
+    "followups": int(os.getenv("DEADLINE_FOLLOWUPS_MS", "2000")),
+    "suggestion": int(os.getenv("DEADLINE_SUGGESTION_MS", "300")),
+    "multi_query": int(os.getenv("DEADLINE_MULTI_QUERY_MS", "150")),
+    "query_rewrite": int(os.getenv("DEADLINE_QUERY_REWRITE_MS", "1200")),
+}
+
+# ลำดับการ degrade: stage ทางซ้ายถูกตัดก่อน
+DEGRADE_ORDER: List[str] = ["query_rewrite", "multi_query", "followups", "suggestion", "router", "generate"]
+
+# stage ที่สำคัญกว่า ซึ่งต้องกันเวลาไว้ให้ก่อน
+STAGE_RESERVE: Dict[str, List[str]] = {
+    "router": ["generate"],
+    "generate": [],
+    "followups": ["suggestion"],
+    "suggestion": [],
+    "multi_query": ["generate"],
+    "query_rewrite": ["multi_query", "generate"],
+}
+
+
+class Deadline:
+    """budget เวลาของ request (budget_ms=None → ไม่จำกัด)"""
+
+    def __init__(self, budget_ms: Optional[int] = None):
+        self.budget_ms = budget_ms if budget_ms and budget_ms > 0 else None
+        self.started = time.monotonic()
+        self.skipped: List[str] = []
+
+    @classmethod
+    def from_request(cls, budget_ms: Optional[int]) -> "Deadline":
+        return cls(budget_ms if budget_ms else CHAT_DEADLINE_MS)
+
+    @property
+    def unlimited(self) -> bool:
+        return self.budget_ms is None
+
+    def elapsed_ms(self) -> float:
+        return (time.monotonic() - self.started) * 1000.0
+
+    def remaining_ms(self) -> float:
+        if self.budget_ms is None:
+            return float("inf")
+        return max(0.0, self.budget_ms - self.elapsed_ms())
+
+    def expired(self) -> bool:
+        return self.remaining_ms() <= 0
+
+    def allows(self, stage: str) -> bool:
+        """มีเวลาพอให้รัน stage นี้ (รวมเวลาที่ต้องกันไว้ให้ stage ที่สำคัญกว่า) ไหม"""
+        if self.budget_ms is None:
+            return True
+        # stage ที่สำคัญกว่าถูกตัดไปแล้ว → stage ที่ตัดก่อนในลำดับต้องถูกตัดด้วย
+        if stage in DEGRADE_ORDER:
+            later = DEGRADE_ORDER[DEGRADE_ORDER.index(stage) + 1:]
+            if any(s in self.skipped for s in later):
+                return False
+        need = STAGE_COST_MS.get(stage, 0)
+        need += sum(STAGE_COST_MS.get(s, 0) for s in STAGE_RESERVE.get(stage, []))
+        return self.remaining_ms() >= need
+
+    def skip(self, stage: str):
+        if stage not in self.skipped:
+            self.skipped.append(stage)
+
+    def timeout_s(self, cap: Optional[float] = None) -> Optional[float]:
+        """timeout (วินาที) สำหรับ I/O ที่ต้องไม่เกิน deadline"""
+        if self.budget_ms is None:
+            return cap
+        remaining = self.remaining_ms() / 1000.0
+        return remaining if cap is None else min(cap, remaining)
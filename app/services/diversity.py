@@ -0,0 +1,179 @@
+# app/services/diversity.py
+"""
+ลด context ซ้ำซ้อนก่อนส่งให้ LLM
+
+PDF ระเบียบมี header / footer / ข้อความเดิมซ้ำในหลายฉบับแก้ไข → RERANK_KEEP ช่องมักเต็มไปด้วย chunk
+ที่เกือบเหมือนกัน เปลือง token และได้คำตอบแย่ลง
+
+- SimHash (64-bit, token แบบเดียวกับ BM25) คิดตอน ingest → chunk ที่ห่างจาก chunk เดิมไม่เกิน
+  SIMHASH_MAX_DISTANCE บิต ถูกบันทึก `dup_of` ใน metadata (หา candidate ด้วย 4 band ละ 16 บิต:
+  ระยะ ≤ 3 บิต ต้องมีอย่างน้อย 1 band ที่ตรงกันทั้งหมด)
+- ตอน retrieve: ยุบ chunk ที่ซ้ำกันเหลืออันที่ score ดีที่สุด → เลือกด้วย Maximal Marginal Relevance
+  บน vector ของ candidate → รวม chunk ที่ติดกัน (doc_id เดียวกัน, chunk_index ต่อเนื่อง) เป็นก้อนเดียว
+"""
+
+import hashlib
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.services.lexical import tokenize
+
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+_BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+
+# ============================================================
+# SIMHASH
+# ============================================================
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text: str) -> int:
+    weights = [0] * SIMHASH_BITS
+    for tok, tf in Counter(tokenize(text)).items():
+        h = _token_hash(tok)
+        for b in range(SIMHASH_BITS):
+            weights[b] += tf if (h >> b) & 1 else -tf
+    out = 0
+    for b, w in enumerate(weights):
+        if w > 0:
+            out |= 1 << b
+    return out
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def simhash_bands(h: int) -> List[int]:
+    return [(h >> (i * _BAND_BITS)) & _BAND_MASK for i in range(SIMHASH_BANDS)]
+
+
+def simhash_metadata(h: int) -> Dict[str, Any]:
+    """metadata ที่เก็บคู่ chunk: hex ของ simhash + band (int) ไว้ค้นด้วย where filter"""
+    meta: Dict[str, Any] = {"simhash": f"{h:016x}"}
+    for i, band in enumerate(simhash_bands(h)):
+        meta[f"sh{i}"] = band
+    return meta
+
+
+def band_where(hashes: Sequence[int]) -> Dict[str, Any]:
+    """where ที่ดึง chunk ที่มี band ตรงกับ hash ใดก็ได้ใน hashes"""
+    per_band: List[set] = [set() for _ in range(SIMHASH_BANDS)]
+    for h in hashes:
+        for i, band in enumerate(simhash_bands(h)):
+            per_band[i].add(band)
+    return {"$or": [{f"sh{i}": {"$in": sorted(vals)}} for i, vals in enumerate(per_band)]}
+
+
+def chunk_simhash(chunk: Dict[str, Any]) -> int:
+    raw = (chunk.get("metadata") or {}).get("simhash")
+    if raw:
+        try:
+            return int(raw, 16)
+        except ValueError:
+            pass
+    return simhash(chunk.get("text") or "")
+
+
+# ============================================================
+# RETRIEVAL-TIME SELECTION
+# ============================================================
+
+def collapse_duplicates(chunks: List[Dict[str, Any]], max_distance: int) -> List[Dict[str, Any]]:
+    """chunks เรียงจากดีที่สุด → ตัดตัวที่ซ้ำกับตัวที่เก็บไว้แล้ว (dup_of เดียวกัน หรือ simhash ใกล้กัน)"""
+    kept: List[Dict[str, Any]] = []
+    groups, hashes = set(), []
+    for c in chunks:
+        meta = c.get("metadata") or {}
+        group = meta.get("dup_of") or c["id"]
+        h = chunk_simhash(c)
+        if group in groups or c["id"] in groups or any(hamming(h, o) <= max_distance for o in hashes):
+            continue
+        groups.add(group)
+        hashes.append(h)
+        kept.append(c)
+    return kept
+
+
+def mmr_select(
+    query_vec: Sequence[float],
+    cand_vecs: np.ndarray,
+    relevance: Sequence[float],
+    k: int,
+    lambda_: float,
+) -> List[int]:
+    """Maximal Marginal Relevance: เลือกทีละตัวที่ λ·relevance − (1−λ)·max sim กับตัวที่เลือกแล้ว สูงสุด"""
+    n = len(relevance)
+    if n <= 1 or k <= 0:
+        return list(range(min(n, k)))
+    m = np.asarray(cand_vecs, dtype=np.float32)
+    m = m / np.maximum(np.linalg.norm(m, axis=1, keepdims=True), 1e-12)
+    sim = m @ m.T
+    rel = np.asarray(relevance, dtype=np.float32)
+
+    selected = [int(np.argmax(rel))]
+    max_sim = sim[selected[0]].copy()
+    while len(selected) < min(k, n):
+        score = lambda_ * rel - (1.0 - lambda_) * max_sim
+        score[selected] = -np.inf
+        nxt = int(np.argmax(score))
+        selected.append(nxt)
+        np.maximum(max_sim, sim[nxt], out=max_sim)
+    return selected
+
+
+def merge_adjacent(chunks: List[Dict[str, Any]], max_chars: Optional[int] = None) -> List[Dict[str, Any]]:
+    """รวม chunk ของเอกสารเดียวกันที่ chunk_index ต่อกันเป็นก้อนเดียว (ลำดับตามก้อนที่ score ดีสุด)
+
+    ไม่รวมถ้าข้อความรวมจะยาวเกิน max_chars
+    """
+    by_doc: Dict[str, List[Dict[str, Any]]] = {}
+    for c in chunks:
+        meta = c.get("metadata") or {}
+        if meta.get("doc_id") is None or meta.get("chunk_index") is None:
+            continue
+        by_doc.setdefault(str(meta["doc_id"]), []).append(c)
+
+    merged_into: Dict[str, Dict[str, Any]] = {}
+    for doc_chunks in by_doc.values():
+        if len(doc_chunks) < 2:
+            continue
+        doc_chunks = sorted(doc_chunks, key=lambda c: int(c["metadata"]["chunk_index"]))
+        run = [doc_chunks[0]]
+        for c in doc_chunks[1:] + [None]:
+            prev = run[-1]
+            if (
+                c is not None
+                and int(c["metadata"]["chunk_index"]) == int(prev["metadata"]["chunk_index"]) + 1
+                and (max_chars is None or sum(len(x["text"]) for x in run) + len(c["text"]) <= max_chars)
+            ):
+                run.append(c)
+                continue
+            if len(run) > 1:
+                block = dict(max(run, key=lambda x: x["score"]))
+                block["id"] = run[0]["id"]
+                block["text"] = "\n".join(x["text"] for x in run)
+                block["metadata"] = dict(
+                    run[0]["metadata"],
+                    chunk_span=f"{run[0]['metadata']['chunk_index']}-{run[-1]['metadata']['chunk_index']}",
+                )
+                block["merged_ids"] = [x["id"] for x in run]
+                for x in run:
+                    merged_into[x["id"]] = block
+            run = [c] if c is not None else []
+
+    out, seen = [], set()
+    for c in chunks:
+        block = merged_into.get(c["id"], c)
+        if id(block) in seen:
+            continue
+        seen.add(id(block))
+        out.append(block)
+    return out
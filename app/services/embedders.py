@@ -0,0 +1,114 @@
+# app/services/embedders.py
+"""
+Embedding backend บน CPU (สลับได้ด้วย EMBED_BACKEND)
+
+ทุก backend คืน SentenceTransformer (หรือ object ที่มี encode แบบเดียวกัน) → caller เดิม
+(rag / FaqAgent / SuggestionAgent / answer cache / extractive) ไม่ต้องแก้
+
+- torch:      PyTorch fp32 (ของเดิม)
+- torch-int8: dynamic quantization ของ nn.Linear เป็น int8 (torch.quantization.quantize_dynamic)
+              ไม่ต้อง export / calibrate, weight เล็กลง ~4 เท่า
+- onnx:       ONNX Runtime (sentence-transformers backend="onnx") — ใช้ไฟล์ onnx/*.onnx ใน HF cache
+              ของโมเดลถ้ามี (EMBED_MODEL_FILE เช่น onnx/model_qint8_avx512_vnni.onnx) ไม่มี → export ตอนโหลด
+- openvino:   OpenVINO (backend="openvino") สำหรับ CPU Intel
+
+threads: จำนวน thread ที่ใช้ encode (0 = ค่า default ของ runtime)
+  torch → torch.set_num_threads (ทั้ง process), onnx → intra_op_num_threads, openvino → INFERENCE_NUM_THREADS
+
+vector จาก backend อื่นไม่เท่ากับ fp32 ทุกบิต (cosine ~0.99) — ตรวจด้วย benchmarks/embedders.py
+ก่อนเปลี่ยนกับ index ที่ embed ด้วย fp32 ไว้แล้ว
+"""
+
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+EMBED_BACKENDS = ("torch", "torch-int8", "onnx", "openvino")
+
+
+def check_backend(backend: str) -> str:
+    backend = (backend or "torch").lower()
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(f"unknown EMBED_BACKEND: {backend} (expected one of {', '.join(EMBED_BACKENDS)})")
+    return backend
+
+
+def _set_torch_threads(threads: int):
+    if threads > 0:
+        import torch
+
+        torch.set_num_threads(threads)
+
+
+def _onnx_kwargs(file_name: Optional[str], threads: int) -> dict:
+    kwargs = {"provider": "CPUExecutionProvider"}
+    if file_name:
+        kwargs["file_name"] = file_name
+    if threads > 0:
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        kwargs["session_options"] = opts
+    return kwargs
+
+
+def _openvino_kwargs(file_name: Optional[str], threads: int) -> dict:
+    kwargs = {}
+    if file_name:
+        kwargs["file_name"] = file_name
+    if threads > 0:
+        kwargs["ov_config"] = {"INFERENCE_NUM_THREADS": str(threads)}
+    return kwargs
+
+
+def load_embedder(
+    model_name: str,
+    backend: str = "torch",
+    threads: int = 0,
+    file_name: Optional[str] = None,
+    local_files_only: bool = False,
+):
+    """โหลด embedding model ตาม backend — backend โหลดไม่ได้ (เช่นไม่ได้ลง onnxruntime / optimum)
+    → log warning แล้วใช้ torch fp32 (โมเดลเดียวกัน vector เข้ากับ index เดิมได้)
+    """
+    from sentence_transformers import SentenceTransformer
+
+    backend = check_backend(backend)
+    common = {"device": "cpu"}
+    if local_files_only:
+        common["local_files_only"] = True
+
+    try:
+        if backend == "onnx":
+            model = SentenceTransformer(
+                model_name, backend="onnx", model_kwargs=_onnx_kwargs(file_name, threads), **common
+            )
+        elif backend == "openvino":
+            model = SentenceTransformer(
+                model_name, backend="openvino", model_kwargs=_openvino_kwargs(file_name, threads), **common
+            )
+        else:
+            _set_torch_threads(threads)
+            model = SentenceTransformer(model_name, **common)
+            if backend == "torch-int8":
+                import torch
+
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    except Exception as e:
+        if backend == "torch":
+            raise
+        logger.warning(f"[EMBED] backend {backend} unavailable ({type(e).__name__}: {e}); using torch fp32")
+        _set_torch_threads(threads)
+        model = SentenceTransformer(model_name, **common)
+        backend = "torch"
+
+    # ให้ /ready, benchmark รู้ว่าใช้ backend ไหนจริง (หลัง fallback)
+    try:
+        model.embed_backend = backend
+    except Exception:
+        pass
+    logger.info(f"[EMBED] {model_name} backend={backend} threads={threads or 'default'}")
+    return model
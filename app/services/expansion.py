@@ -0,0 +1,176 @@
+# app/services/expansion.py
+"""
+Small-to-big: ค้นด้วย chunk เล็ก (ตรงประเด็น, embedding คมกว่า) → ขยายเป็นช่วงที่ใหญ่ขึ้นตอนประกอบ prompt
+
+chunk ทุกอันมี metadata `doc_id`, `chunk_index` และ `parent_index` (หมวด / ส่วน ของเอกสาร
+ดู rag._split_sections) → ดึง chunk ข้างเคียงจาก vector store ด้วย where filter
+(ไม่ต้องโหลดเนื้อหาเต็มของเอกสารจาก SQL)
+
+mode:
+  - "neighbors": chunk_index ± window
+  - "parent":    chunk ใน parent_index เดียวกัน (chunk เก่าที่ไม่มี parent_index → ใช้ neighbors)
+
+เพิ่มทีละ chunk สลับหลัง/หน้า วนตามลำดับของ hit (hit ที่ดีกว่าได้ขยายก่อน) จนเต็ม budget_tokens
+(นับรวมข้อความของ hit เดิม) — hit ของเอกสารเดียวกันที่ขยายจนชนกันถูกรวมเป็นก้อนเดียว
+(chunk ข้างเคียงที่มี `dup_of` ยังถูกเติม: เป็นเนื้อความต่อเนื่องของส่วนเดียวกัน)
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from app.services.tokens import estimate_tokens
+
+EXPANSION_MODES = ("off", "neighbors", "parent")
+
+
+def _span(chunk: Dict[str, Any]) -> Optional[Tuple[str, int, int]]:
+    """(doc_id, chunk_index แรก, สุดท้าย) ของ hit — รองรับก้อนที่ merge_adjacent รวมแล้ว (chunk_span)"""
+    meta = chunk.get("metadata") or {}
+    if meta.get("doc_id") is None or meta.get("chunk_index") is None:
+        return None
+    span = meta.get("chunk_span")
+    if span:
+        lo, hi = str(span).split("-", 1)
+        return str(meta["doc_id"]), int(lo), int(hi)
+    idx = int(meta["chunk_index"])
+    return str(meta["doc_id"]), idx, idx
+
+
+def _where(clauses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def _fetch(store, hits, mode: str, window: int) -> Dict[Tuple[str, int], Tuple[str, Dict[str, Any]]]:
+    """chunk ที่อาจถูกเติม (รวม chunk ของ hit เอง) → {(doc_id, chunk_index): (text, metadata)}"""
+    by_doc: Dict[str, Set[int]] = {}
+    parents: Dict[str, Set[int]] = {}
+    for c, (doc_id, lo, hi) in hits:
+        parent = (c.get("metadata") or {}).get("parent_index")
+        idxs = by_doc.setdefault(doc_id, set())
+        idxs.update(range(lo, hi + 1))
+        if mode == "parent" and parent is not None:
+            parents.setdefault(doc_id, set()).add(int(parent))
+        else:
+            idxs.update(range(max(0, lo - window), hi + window + 1))
+
+    clauses: List[Dict[str, Any]] = []
+    for doc_id, idxs in by_doc.items():
+        clauses.append({"$and": [{"doc_id": {"$eq": doc_id}}, {"chunk_index": {"$in": sorted(idxs)}}]})
+    for doc_id, ps in parents.items():
+        clauses.append({"$and": [{"doc_id": {"$eq": doc_id}}, {"parent_index": {"$in": sorted(ps)}}]})
+
+    got = store.get(where=_where(clauses), include=["documents", "metadatas"])
+    out: Dict[Tuple[str, int], Tuple[str, Dict[str, Any]]] = {}
+    for doc, meta in zip(got.get("documents") or [], got.get("metadatas") or []):
+        meta = meta or {}
+        if meta.get("doc_id") is None or meta.get("chunk_index") is None:
+            continue
+        out[(str(meta["doc_id"]), int(meta["chunk_index"]))] = (doc or "", meta)
+    return out
+
+
+def expand_chunks(
+    chunks: List[Dict[str, Any]],
+    store,
+    budget_tokens: int,
+    mode: str = "parent",
+    window: int = 2,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """chunks (เรียงจากดีสุด, ผลจาก retrieve_chunks) → (ก้อน context ที่ขยายแล้ว, สถิติสำหรับ trace)
+
+    ก้อนที่ขยายมี metadata.chunk_span "a-b" และ `expanded` = จำนวน chunk ที่เติม
+    """
+    hits = [(c, _span(c)) for c in chunks]
+    spans = [(c, s) for c, s in hits if s is not None]
+    used = sum(count_tokens(c.get("text") or "") for c in chunks)
+    stats = {"mode": mode, "hits": len(chunks), "added": 0, "tokens": used, "budget": budget_tokens}
+    if mode == "off" or not spans or used >= budget_tokens:
+        return chunks, stats
+
+    pool = _fetch(store, spans, mode, window)
+
+    included: Dict[str, Set[int]] = {}
+    for _, (doc_id, lo, hi) in spans:
+        included.setdefault(doc_id, set()).update(range(lo, hi + 1))
+
+    def allowed(c: Dict[str, Any], doc_id: str, idx: int) -> bool:
+        got = pool.get((doc_id, idx))
+        if got is None:
+            return False
+        parent = (c.get("metadata") or {}).get("parent_index")
+        if mode == "parent" and parent is not None:
+            return got[1].get("parent_index") == parent
+        return True
+
+    # ต่อ hit: ตำแหน่งถัดไปทางหลัง / ทางหน้า (None = หยุดฝั่งนั้นแล้ว)
+    frontier = [[c, doc_id, hi + 1, lo - 1] for c, (doc_id, lo, hi) in spans]
+    grew = True
+    while grew:
+        grew = False
+        for f in frontier:
+            c, doc_id = f[0], f[1]
+            for side in (2, 3):
+                idx = f[side]
+                # ข้าม chunk ที่ hit อื่นเติมไว้แล้ว
+                while idx is not None and idx in included[doc_id]:
+                    idx = idx + 1 if side == 2 else idx - 1
+                if idx is None or idx < 0 or not allowed(c, doc_id, idx):
+                    f[side] = None
+                    continue
+                cost = count_tokens(pool[(doc_id, idx)][0])
+                if used + cost > budget_tokens:
+                    f[side] = None
+                    continue
+                included[doc_id].add(idx)
+                used += cost
+                stats["added"] += 1
+                f[side] = idx + 1 if side == 2 else idx - 1
+                grew = True
+                break   # สลับฝั่ง: รอบละ 1 chunk ต่อ hit
+    stats["tokens"] = used
+    if not stats["added"]:
+        return chunks, stats
+
+    # ช่วงต่อเนื่องของแต่ละเอกสาร → ก้อน context (ลำดับตาม hit ที่ดีที่สุดในช่วง)
+    runs: Dict[Tuple[str, int], Tuple[int, int]] = {}
+    for doc_id, idxs in included.items():
+        ordered = sorted(idxs)
+        start = prev = ordered[0]
+        for idx in ordered[1:] + [None]:
+            if idx is not None and idx == prev + 1:
+                prev = idx
+                continue
+            for i in range(start, prev + 1):
+                runs[(doc_id, i)] = (start, prev)
+            if idx is not None:
+                start = prev = idx
+
+    out: List[Dict[str, Any]] = []
+    emitted: Set[Tuple[str, int, int]] = set()
+    for c, span in hits:
+        if span is None:
+            out.append(c)
+            continue
+        doc_id, lo, hi = span
+        start, end = runs[(doc_id, lo)]
+        if (doc_id, start, end) in emitted:
+            continue
+        emitted.add((doc_id, start, end))
+        if (start, end) == (lo, hi):
+            out.append(c)
+            continue
+        parts = []
+        for i in range(start, end + 1):
+            if lo <= i <= hi and (doc_id, i) not in pool:
+                # chunk ของ hit เองที่ดึงไม่ได้ → ใช้ข้อความของ hit ทั้งก้อน
+                if i == lo:
+                    parts.append(c.get("text") or "")
+                continue
+            if (doc_id, i) in pool:
+                parts.append(pool[(doc_id, i)][0])
+        block = dict(c)
+        block["text"] = "\n".join(p for p in parts if p)
+        block["metadata"] = dict(c.get("metadata") or {}, chunk_span=f"{start}-{end}")
+        block["expanded"] = (end - start) - (hi - lo)
+        out.append(block)
+    return out, stats
@@ -0,0 +1,130 @@
+# app/services/extractive.py
+"""
+Extractive answer engine (ไม่ใช้ LLM)
+
+- แตก chunk ที่ retrieve มาเป็นประโยค/วลี
+- encode ประโยคทั้งหมดใน batch เดียว แล้วจัดอันดับด้วย cosine กับ query embedding
+- ประกอบเป็นคำตอบแบบ bullet สั้น ๆ พร้อมอ้างอิงเอกสารต้นทาง [1], [2], ...
+
+ใช้ CPU อย่างเดียว (จำกัดจำนวนประโยคที่ encode) → ใช้เวลาระดับสิบ ms
+ใช้เป็น: fallback ตอน Gemini ล่ม/ช้า, โหมด fast ต่อ request, และ pre-answer ระหว่างรอ LLM stream
+"""
+
+import os
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.startup import embedding_swap
+
+EXTRACTIVE_MAX_SENTENCES = int(os.getenv("EXTRACTIVE_MAX_SENTENCES", "48"))
+EXTRACTIVE_MAX_ITEMS = int(os.getenv("EXTRACTIVE_MAX_ITEMS", "4"))
+EXTRACTIVE_MIN_SCORE = float(os.getenv("EXTRACTIVE_MIN_SCORE", "0.2"))
+
+NO_INFO_ANSWER = "ไม่พบข้อมูลในระบบ กรุณาติดต่อเจ้าหน้าที่มหาวิทยาลัย"
+
+# ภาษาไทยไม่มีเครื่องหมายจบประโยค → ใช้ขึ้นบรรทัด / . ! ? / ช่องว่างหลายตัว เป็นตัวแบ่ง
+_SENT_SPLIT = re.compile(r"(?<=[.!?。])\s+|\n+|\s{2,}|(?<=\S)\s+(?=[-•]\s)|(?<=\S)\s+(?=\d{1,2}[.)]\s)")
+
+_MIN_SENT_CHARS = 15
+_MAX_SENT_CHARS = 220
+
+
+def split_sentences(text: str) -> List[str]:
+    """แบ่งข้อความเป็นประโยค/วลี ความยาวไม่เกิน _MAX_SENT_CHARS (ตัดที่ช่องว่าง)"""
+    out: List[str] = []
+    for part in _SENT_SPLIT.split(text or ""):
+        part = " ".join(part.split()).strip(" -•")
+        if not part:
+            continue
+        while len(part) > _MAX_SENT_CHARS:
+            cut = part.rfind(" ", 0, _MAX_SENT_CHARS)
+            if cut < _MIN_SENT_CHARS:
+                cut = _MAX_SENT_CHARS
+            out.append(part[:cut].strip())
+            part = part[cut:].strip()
+        if len(part) >= _MIN_SENT_CHARS:
+            out.append(part)
+    return out
+
+
+def _unit(mat: np.ndarray) -> np.ndarray:
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+class ExtractiveAnswerer:
+    """สร้างคำตอบจากประโยคใน chunk ที่ใกล้กับคำถามที่สุด"""
+
+    def __init__(
+        self,
+        embedder,
+        max_sentences: int = EXTRACTIVE_MAX_SENTENCES,
+        max_items: int = EXTRACTIVE_MAX_ITEMS,
+        min_score: float = EXTRACTIVE_MIN_SCORE,
+    ):
+        self.embedder = embedder
+        self.max_sentences = max_sentences
+        self.max_items = max_items
+        self.min_score = min_score
+
+    def answer(
+        self,
+        query: str,
+        chunks: List[Dict[str, Any]],
+        q_vec: Optional[np.ndarray] = None,
+    ) -> Dict[str, Any]:
+        """
+        chunks: ผลจาก retrieve_chunks (มี text / score / metadata)
+        คืน { "answer": str, "sources": [title...], "sentences": int }
+        """
+        candidates = []  # (chunk_rank, chunk_score, sentence, chunk)
+        for rank, ch in enumerate(chunks):
+            for sent in split_sentences(ch.get("text", "")):
+                candidates.append((rank, float(ch.get("score", 0.0)), sent, ch))
+                if len(candidates) >= self.max_sentences:
+                    break
+            if len(candidates) >= self.max_sentences:
+                break
+
+        if not candidates:
+            return {"answer": NO_INFO_ANSWER, "sources": [], "sentences": 0}
+
+        with embedding_swap.shared():
+            if q_vec is None:
+                q_vec = self.embedder.encode(query)
+            q = _unit(np.asarray(q_vec).reshape(1, -1))[0]
+            sent_vecs = _unit(self.embedder.encode([c[2] for c in candidates]))
+
+        sims = sent_vecs @ q
+        # ให้น้ำหนักกับ chunk ที่ rerank มาอันดับดีด้วยเล็กน้อย
+        scores = [0.8 * float(sims[i]) + 0.2 * c[1] for i, c in enumerate(candidates)]
+        order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+
+        picked: List[int] = []
+        for i in order:
+            if scores[i] < self.min_score and picked:
+                break
+            # กันประโยคซ้ำ/เกือบซ้ำ (header/footer ของ PDF)
+            if any(float(sent_vecs[i] @ sent_vecs[j]) > 0.92 for j in picked):
+                continue
+            picked.append(i)
+            if len(picked) >= self.max_items:
+                break
+
+        sources: List[str] = []
+        lines: List[str] = []
+        for i in picked:
+            _, _, sent, ch = candidates[i]
+            meta = ch.get("metadata") or {}
+            title = str(meta.get("title") or meta.get("doc_id") or "เอกสาร")
+            if title not in sources:
+                sources.append(title)
+            lines.append(f"- {sent} [{sources.index(title) + 1}]")
+
+        answer = "ข้อมูลที่เกี่ยวข้องจากเอกสารในระบบ:\n" + "\n".join(lines)
+        answer += "\n\nที่มา: " + ", ".join(f"[{n}] {t}" for n, t in enumerate(sources, 1))
+        return {"answer": answer, "sources": sources, "sentences": len(candidates)}
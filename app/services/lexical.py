@@ -0,0 +1,280 @@
+# app/services/lexical.py
+"""
+Lexical (BM25) index ของ chunk ใน collection "uni_docs"
+
+dense retrieval (MiniLM) มักพลาดคำที่ต้องตรงตัว เช่น รหัสวิชา 1001101, เลขแบบฟอร์ม มฟล.01,
+"ข้อ 12" ของระเบียบ → ใช้ BM25 คู่กับ vector แล้วรวมผลด้วย reciprocal rank fusion (RRF)
+
+Tokenization (ภาษาไทยไม่มีช่องว่างระหว่างคำ และไม่อยากพึ่ง word segmenter):
+- ช่วงตัวอักษรไทย → character bigram (ตัวเดียว → unigram)
+- ตัวเลข / ภาษาอังกฤษ / รหัส (เช่น 4/2567, gen-101) → เก็บทั้ง token เต็ม (lowercase)
+  และแยกส่วนตัวเลขของรหัสออกมาอีก token
+- "ข้อ 12" → token พิเศษ "ข้อ#12" ให้เลขข้อของระเบียบ match แบบตรงตัว
+
+Index เก็บแบบ compact: chunk id ถูก intern เป็นเลข, postings = [chunk_no, tf, chunk_no, tf, ...]
+persist เป็น JSON + gzip (เขียนแบบ atomic) — process อื่นที่เปิด index เดียวกันจะ reload เมื่อไฟล์เปลี่ยน
+"""
+
+import gzip
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+_THAI_RUN = re.compile(r"[฀-๿]+")
+_CODE = re.compile(r"[0-9a-z]+(?:[./\-][0-9a-z]+)*")
+_ARTICLE = re.compile(r"ข้อ\s*(\d+)")
+_DIGITS = re.compile(r"\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    text = (text or "").lower()
+    tokens: List[str] = []
+
+    for m in _ARTICLE.finditer(text):
+        tokens.append(f"ข้อ#{m.group(1)}")
+
+    for run in _THAI_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+
+    for m in _CODE.finditer(_THAI_RUN.sub(" ", text)):
+        tok = m.group(0)
+        tokens.append(tok)
+        if not tok.isdigit():
+            tokens.extend(d for d in _DIGITS.findall(tok) if d != tok)
+
+    return tokens
+
+
+def rrf_fuse(
+    dense_ids: Sequence[str],
+    lexical_ids: Sequence[str],
+    lexical_weight: float,
+    k: int = 60,
+) -> List[Tuple[str, float]]:
+    """reciprocal rank fusion: (1-w)/(k+rank_dense) + w/(k+rank_lexical)"""
+    scores: Dict[str, float] = {}
+    for rank, cid in enumerate(dense_ids, 1):
+        scores[cid] = scores.get(cid, 0.0) + (1.0 - lexical_weight) / (k + rank)
+    for rank, cid in enumerate(lexical_ids, 1):
+        scores[cid] = scores.get(cid, 0.0) + lexical_weight / (k + rank)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+
+class LexicalIndex:
+    """BM25 inverted index ของ chunk (key = chunk id แบบเดียวกับใน Chroma: "{doc_id}::{i}")"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._lock = threading.RLock()
+        self._chunk_ids: List[Optional[str]] = []     # chunk_no → chunk id (None = ลบแล้ว)
+        self._chunk_no: Dict[str, int] = {}
+        self._chunk_len: List[int] = []
+        self._doc_chunks: Dict[str, List[int]] = {}
+        self._postings: Dict[str, List[int]] = {}     # term → [chunk_no, tf, ...]
+        self._total_len = 0
+        self._live = 0
+        self._mtime = 0.0
+        self._bulk = 0
+        self._dirty = False
+        if path:
+            self._load()
+
+    # ------------------------------------------------------------
+    # persistence
+    # ------------------------------------------------------------
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"[LEXICAL] cannot load {self.path}: {e}")
+            return
+        self._chunk_ids = data["chunk_ids"]
+        self._chunk_len = data["chunk_len"]
+        self._doc_chunks = data["doc_chunks"]
+        self._postings = data["postings"]
+        self._chunk_no = {cid: i for i, cid in enumerate(self._chunk_ids) if cid is not None}
+        self._live = len(self._chunk_no)
+        self._total_len = sum(self._chunk_len[i] for i in self._chunk_no.values())
+        self._mtime = os.path.getmtime(self.path)
+
+    def _maybe_reload(self):
+        """index ถูกแก้โดย process อื่น (เช่น uvicorn worker ที่รับ upload) → โหลดใหม่"""
+        if not self.path or self._bulk or self._dirty:
+            return
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._load()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            self._compact()
+            data = {
+                "chunk_ids": self._chunk_ids,
+                "chunk_len": self._chunk_len,
+                "doc_chunks": self._doc_chunks,
+                "postings": self._postings,
+            }
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.tmp{os.getpid()}"
+            with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=5) as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.path)
+            self._mtime = os.path.getmtime(self.path)
+            self._dirty = False
+
+    def _changed(self):
+        self._dirty = True
+        if not self._bulk:
+            self.save()
+
+    @contextmanager
+    def bulk(self) -> Iterator["LexicalIndex"]:
+        """เพิ่ม/ลบหลายเอกสารแล้ว save ครั้งเดียวตอนจบ"""
+        with self._lock:
+            self._bulk += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._bulk -= 1
+                if not self._bulk and self._dirty:
+                    self.save()
+
+    def _compact(self):
+        """ลบ posting ของ chunk ที่ถูกลบ และเรียงเลข chunk ใหม่ (ทำตอน save)"""
+        if self._live == len(self._chunk_ids):
+            return
+        remap: Dict[int, int] = {}
+        ids, lens = [], []
+        for old, cid in enumerate(self._chunk_ids):
+            if cid is None:
+                continue
+            remap[old] = len(ids)
+            ids.append(cid)
+            lens.append(self._chunk_len[old])
+        postings: Dict[str, List[int]] = {}
+        for term, plist in self._postings.items():
+            out = []
+            for i in range(0, len(plist), 2):
+                new = remap.get(plist[i])
+                if new is not None:
+                    out.extend((new, plist[i + 1]))
+            if out:
+                postings[term] = out
+        self._chunk_ids, self._chunk_len, self._postings = ids, lens, postings
+        self._chunk_no = {cid: i for i, cid in enumerate(ids)}
+        self._doc_chunks = {
+            d: [remap[n] for n in nos if n in remap] for d, nos in self._doc_chunks.items()
+        }
+
+    # ------------------------------------------------------------
+    # update
+    # ------------------------------------------------------------
+    def _remove_doc(self, doc_id: str):
+        for n in self._doc_chunks.pop(doc_id, []):
+            cid = self._chunk_ids[n]
+            if cid is None:
+                continue
+            self._chunk_ids[n] = None
+            self._chunk_no.pop(cid, None)
+            self._total_len -= self._chunk_len[n]
+            self._live -= 1
+
+    def upsert_doc(self, doc_id: str, chunk_ids: Sequence[str], texts: Sequence[str]):
+        with self._lock:
+            self._maybe_reload()
+            self._remove_doc(doc_id)
+            nos = []
+            for cid, text in zip(chunk_ids, texts):
+                tf = Counter(tokenize(text))
+                n = len(self._chunk_ids)
+                self._chunk_ids.append(cid)
+                self._chunk_no[cid] = n
+                length = sum(tf.values())
+                self._chunk_len.append(length)
+                self._total_len += length
+                self._live += 1
+                for term, c in tf.items():
+                    self._postings.setdefault(term, []).extend((n, c))
+                nos.append(n)
+            self._doc_chunks[doc_id] = nos
+            self._changed()
+
+    def delete_doc(self, doc_id: str):
+        with self._lock:
+            self._maybe_reload()
+            if doc_id not in self._doc_chunks:
+                return
+            self._remove_doc(doc_id)
+            self._changed()
+
+    def rebuild(self, items: Iterable[Tuple[str, str, str]]):
+        """สร้างใหม่ทั้งหมดจาก (doc_id, chunk_id, text)"""
+        by_doc: Dict[str, Tuple[List[str], List[str]]] = {}
+        for doc_id, cid, text in items:
+            ids, texts = by_doc.setdefault(doc_id, ([], []))
+            ids.append(cid)
+            texts.append(text)
+        with self._lock:
+            self._chunk_ids, self._chunk_no, self._chunk_len = [], {}, []
+            self._doc_chunks, self._postings = {}, {}
+            self._total_len = self._live = 0
+            with self.bulk():
+                for doc_id, (ids, texts) in by_doc.items():
+                    self.upsert_doc(doc_id, ids, texts)
+                self._dirty = True
+
+    # ------------------------------------------------------------
+    # search
+    # ------------------------------------------------------------
+    def __len__(self) -> int:
+        return self._live
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            self._maybe_reload()
+            if not self._live:
+                return []
+            avg_len = self._total_len / self._live
+            scores: Dict[int, float] = {}
+            for term in terms:
+                plist = self._postings.get(term)
+                if not plist:
+                    continue
+                # df นับรวม chunk ที่ถูกลบแต่ยังไม่ compact (ต่างกันเล็กน้อย ไม่กระทบการจัดอันดับ)
+                df = len(plist) // 2
+                idf = math.log(1.0 + (self._live - df + 0.5) / (df + 0.5))
+                for i in range(0, len(plist), 2):
+                    n = plist[i]
+                    if self._chunk_ids[n] is None:
+                        continue
+                    tf = plist[i + 1]
+                    norm = tf + BM25_K1 * (1.0 - BM25_B + BM25_B * self._chunk_len[n] / avg_len)
+                    scores[n] = scores.get(n, 0.0) + idf * tf * (BM25_K1 + 1.0) / norm
+            top = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+            return [(self._chunk_ids[n], s) for n, s in top]
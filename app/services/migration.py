@@ -0,0 +1,408 @@
+# app/services/migration.py
+"""
+Blue/green migration ของ embedding model (เช่นย้ายไปโมเดลที่เล็ก/เร็วกว่า) โดยไม่มีช่วงที่ระบบพัง
+
+1. start: โหลดโมเดลใหม่ + เปิด shadow index (vector store + BM25 ใน MIGRATION_DIR/<ชื่อ>)
+   แล้ว build ใน background จากเนื้อหาเอกสารใน SQL (เปลี่ยนขนาด chunk ได้ด้วย chunk_size)
+   ระหว่าง build การเพิ่ม/แก้/ลบเอกสารถูกเขียนตามลง shadow ด้วย (write hook ใน rag)
+2. ready: mirror query จริงส่วนหนึ่ง (MIGRATION_MIRROR_RATE) ไปค้น shadow ใน background thread
+   → เทียบ overlap ของเอกสาร top-k กับ index หลัก + latency (encode + query) ของทั้งสองฝั่ง
+   evaluate(): recall@k ของทั้งสอง index บนคำถามที่มี label (retrieval_labels)
+3. cutover: embed FAQ / answer cache / vector ของ suggestion ด้วยโมเดลใหม่ไว้ก่อน (ยังไม่สลับ)
+   แล้วสลับทุกอย่างใน embedding_swap.exclusive(): FAQ vector (transaction เดียว) → embedder + store + BM25
+   (rag.switch_embedding บันทึก EMBED_ACTIVE_FILE) → answer cache → suggestion
+   path อ่าน/เขียน (retrieve, FAQ, answer cache, suggestion, ingest) ถือ shared() → ไม่มี request ไหน
+   เห็น model ใหม่คู่กับ matrix / index เดิม (หรือกลับกัน) — request ที่เข้ามาระหว่างสลับรอจนสลับเสร็จ
+   index เดิมไม่ถูกลบ (ย้อนกลับ = migrate กลับไป model เดิม — vector ของ FAQ / answer cache ใน SQL เป็นของ model ใหม่แล้ว)
+
+ใช้ได้เฉพาะ MODEL_SERVER_MODE=off และ worker process เดียว (process ที่ถือ model / store / index ทั้งหมดเอง)
+"""
+
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from app.core.startup import embedding_swap
+from app.services import rag
+from app.services.embedders import check_backend, load_embedder
+from app.services.lexical import LexicalIndex
+from app.services.vectorstore import open_vector_store
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_MIRROR_RATE = float(os.getenv("MIGRATION_MIRROR_RATE", "0.1"))
+MIGRATION_DIR = os.getenv(
+    "MIGRATION_DIR", os.path.join(os.path.dirname(rag.CHROMA_PATH) or ".", "embedding_shadow")
+)
+# mirror ค้างในคิวเกินนี้ → ทิ้ง sample (ไม่ให้ shadow แย่ง CPU จาก request จริง)
+MIGRATION_MIRROR_MAX_PENDING = int(os.getenv("MIGRATION_MIRROR_MAX_PENDING", "8"))
+
+_SAMPLES = 1000
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+def _percentile(xs, p: float) -> Optional[float]:
+    if not xs:
+        return None
+    s = sorted(xs)
+    return round(s[min(len(s) - 1, int(p / 100.0 * len(s)))], 2)
+
+
+def _doc_ids(metas) -> List[str]:
+    out: List[str] = []
+    for m in metas or []:
+        d = str((m or {}).get("doc_id"))
+        if d not in out:
+            out.append(d)
+    return out
+
+
+class EmbeddingMigration:
+    def __init__(
+        self,
+        model: str,
+        backend: str = "torch",
+        threads: int = 0,
+        chunk_size: Optional[int] = None,
+        mirror_rate: float = MIGRATION_MIRROR_RATE,
+    ):
+        self.model_name = model
+        self.backend = check_backend(backend)
+        self.threads = threads
+        self.chunk_size = chunk_size
+        self.mirror_rate = mirror_rate
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", model).strip("_")[-60:]
+        self.path = os.path.join(MIGRATION_DIR, f"{slug}-{datetime.now(timezone.utc):%Y%m%d%H%M%S}")
+
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.progress = {"documents": 0, "done": 0, "chunks": 0, "failed": 0}
+        self.started_at = time.time()
+        self.build_s: Optional[float] = None
+
+        self.model = None
+        self.store = None
+        self.lexical = None
+
+        self._write_lock = threading.RLock()
+        self._mirror_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mirror")
+        self._pending = 0
+        self._mirror_lock = threading.Lock()
+        self._mirror = {
+            "samples": 0, "dropped": 0, "errors": 0,
+            "overlap": deque(maxlen=_SAMPLES),
+            "primary_ms": deque(maxlen=_SAMPLES),
+            "shadow_ms": deque(maxlen=_SAMPLES),
+        }
+
+    # ------------------------------------------------------------
+    # build
+    # ------------------------------------------------------------
+    def _index(self, doc_id: str, content: str, metadata: dict) -> int:
+        return rag.index_document(
+            doc_id, content, metadata, self.store, self.lexical, self.model, chunk_size=self.chunk_size
+        )
+
+    def _on_write(self, op: str, doc_id: str, *args):
+        if self.store is None or self.state not in ("building", "ready"):
+            return
+        with self._write_lock:
+            if op == "upsert":
+                content, metadata = args
+                self._index(doc_id, content, metadata)
+            elif op == "delete":
+                self.store.delete(where={"doc_id": doc_id})
+                self.lexical.delete_doc(doc_id)
+            elif op == "category":
+                got = self.store.get(where={"doc_id": doc_id}, include=["metadatas"])
+                ids = got.get("ids") or []
+                if ids:
+                    metas = [dict(m or {}, category=args[0]) for m in got.get("metadatas") or [{}] * len(ids)]
+                    self.store.update(ids=ids, metadatas=metas)
+
+    def start(self, session_factory):
+        self.state = "building"
+        threading.Thread(target=self._build, args=(session_factory,), name="embed-migration", daemon=True).start()
+
+    def _build(self, session_factory):
+        from app.models.sql import Document
+
+        t0 = time.perf_counter()
+        try:
+            self.model = load_embedder(self.model_name, backend=self.backend, threads=self.threads)
+            primary_backend = rag.collection.backend
+            self.store = open_vector_store(
+                primary_backend,
+                chroma_path=os.path.join(self.path, "chroma"),
+                numpy_path=os.path.join(self.path, "vectors"),
+                numpy_options={
+                    "dtype": rag.VECTOR_DTYPE,
+                    "keep_float32": rag.VECTOR_KEEP_FLOAT32,
+                    "rescore_factor": rag.VECTOR_RESCORE_FACTOR,
+                },
+            )
+            self.lexical = LexicalIndex(os.path.join(self.path, "lexical_index.json.gz"))
+            # เขียนตามตั้งแต่ก่อน scan: เอกสารที่แก้ระหว่าง build ไม่หลุด
+            rag._write_hooks.append(self._on_write)
+
+            with session_factory() as db:
+                doc_ids = [d for (d,) in db.query(Document.id).order_by(Document.id).all()]
+            self.progress["documents"] = len(doc_ids)
+            for doc_id in doc_ids:
+                if self.state != "building":
+                    return
+                with session_factory() as db:
+                    doc = db.get(Document, doc_id)
+                    if doc is None or not doc.current_content:
+                        self.progress["done"] += 1
+                        continue
+                    content, title, category = doc.current_content, doc.title, doc.category
+                meta = dict(rag.doc_metadata(str(doc_id)), title=title, category=category)
+                try:
+                    with self._write_lock, self.store.bulk(), self.lexical.bulk():
+                        self.progress["chunks"] += self._index(str(doc_id), content, meta)
+                except Exception as e:
+                    self.progress["failed"] += 1
+                    logger.warning(f"[MIGRATION] doc {doc_id} failed: {e}")
+                self.progress["done"] += 1
+
+            self.build_s = round(time.perf_counter() - t0, 2)
+            self.state = "ready"
+            rag._query_hooks.append(self._on_query)
+            logger.info(
+                f"[MIGRATION] shadow index for {self.model_name} ready: "
+                f"{self.progress['chunks']} chunks in {self.build_s} s"
+            )
+        except Exception as e:
+            self.state, self.error = "failed", f"{type(e).__name__}: {e}"
+            self._detach()
+            logger.error(f"[MIGRATION] build failed: {self.error}")
+
+    # ------------------------------------------------------------
+    # mirror
+    # ------------------------------------------------------------
+    def _on_query(self, q: str, k: int, where, res: Dict[str, Any], primary_ms: float):
+        if self.state != "ready" or random.random() >= self.mirror_rate:
+            return
+        with self._mirror_lock:
+            if self._pending >= MIGRATION_MIRROR_MAX_PENDING:
+                self._mirror["dropped"] += 1
+                return
+            self._pending += 1
+        primary_docs = _doc_ids((res.get("metadatas") or [[]])[0])
+        self._mirror_pool.submit(self._compare, q, k, where, primary_docs, primary_ms)
+
+    def _search(self, q: str, k: int, where) -> List[str]:
+        q_emb = self.model.encode([q], show_progress_bar=False)[0].tolist()
+        res = self.store.query(query_embeddings=[q_emb], n_results=k, where=where, include=["metadatas"])
+        return _doc_ids((res.get("metadatas") or [[]])[0])
+
+    def _compare(self, q: str, k: int, where, primary_docs: List[str], primary_ms: float):
+        try:
+            t0 = time.perf_counter()
+            shadow_docs = self._search(q, k, where)
+            shadow_ms = (time.perf_counter() - t0) * 1000.0
+            overlap = len(set(primary_docs) & set(shadow_docs)) / len(primary_docs) if primary_docs else 1.0
+            with self._mirror_lock:
+                self._mirror["samples"] += 1
+                self._mirror["overlap"].append(overlap)
+                self._mirror["primary_ms"].append(primary_ms)
+                self._mirror["shadow_ms"].append(shadow_ms)
+        except Exception as e:
+            with self._mirror_lock:
+                self._mirror["errors"] += 1
+            logger.warning(f"[MIGRATION] mirror failed: {e}")
+        finally:
+            with self._mirror_lock:
+                self._pending -= 1
+
+    def evaluate(self, session_factory, k: int = 10) -> Dict[str, Any]:
+        """recall@k ของ index หลัก vs shadow บนคำถามที่มี label (เอกสารที่ถูกต้อง อยู่ใน top-k หรือไม่)"""
+        from app.models.sql import RetrievalLabel
+
+        if self.state != "ready":
+            raise MigrationError(f"shadow index is {self.state}")
+        with session_factory() as db:
+            labels: Dict[str, Set[str]] = {}
+            for question, doc_id in db.query(RetrievalLabel.question, RetrievalLabel.document_id).all():
+                labels.setdefault(question, set()).add(str(doc_id))
+        out: Dict[str, Any] = {"questions": len(labels), "k": k}
+        for name, search in (
+            ("primary", lambda q: _doc_ids((rag.collection.query(
+                query_embeddings=[rag.embedder.encode([q])[0].tolist()], n_results=k, include=["metadatas"],
+            ).get("metadatas") or [[]])[0])),
+            ("shadow", lambda q: self._search(q, k, None)),
+        ):
+            hits, latencies = 0, []
+            for question, docs in labels.items():
+                t0 = time.perf_counter()
+                got = search(question)
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+                hits += bool(docs & set(got))
+            out[name] = {
+                f"recall@{k}": round(hits / len(labels), 4) if labels else None,
+                "p50_ms": _percentile(latencies, 50),
+                "p95_ms": _percentile(latencies, 95),
+            }
+        return out
+
+    # ------------------------------------------------------------
+    # cutover / abort
+    # ------------------------------------------------------------
+    def cutover(self, session_factory, faq_agent, answer_cache, suggest_agent) -> Dict[str, Any]:
+        if self.state != "ready":
+            raise MigrationError(f"shadow index is {self.state}")
+        _check_owner()
+        t0 = time.perf_counter()
+        # embed ล่วงหน้า (ช้า) นอก lock — ยังไม่เปลี่ยนอะไร
+        with session_factory() as db:
+            commit_faq = faq_agent.prepare_reembed(db, self.model)
+        commit_cache = answer_cache.prepare_reembed(self.model)
+        commit_suggest = suggest_agent.prepare_reembed(self.model)
+
+        active = {
+            "model": self.model_name,
+            "backend": self.backend,
+            "chroma_dir": os.path.join(self.path, "chroma"),
+            "vector_dir": os.path.join(self.path, "vectors"),
+            "lexical_index_path": os.path.join(self.path, "lexical_index.json.gz"),
+            "switched_at": datetime.now(timezone.utc).isoformat(),
+            "previous_model": rag.EMBED_MODEL_NAME,
+        }
+        if self.chunk_size is not None:
+            # ขนาดที่ chunk_document ใช้จริง: child chunk เมื่อเปิด small-to-big
+            active["chunk_size" if rag.SMALL_TO_BIG == "off" else "child_chunk_size"] = self.chunk_size
+
+        # exclusive ก่อน _write_lock: ฝั่งเขียนถือ shared แล้วจึงเข้า _write_lock ใน write hook
+        with embedding_swap.exclusive(), self._write_lock:
+            with session_factory() as db:
+                faqs = commit_faq(db)
+            self._detach()
+            rag.switch_embedding(self.model, self.store, self.lexical, active)
+            cached = commit_cache()
+            suggestions = commit_suggest()
+            self.state = "switched"
+
+        result = {
+            "model": self.model_name,
+            "faq_vectors": faqs,
+            "answer_cache_entries": cached,
+            "suggestion_vectors": suggestions,
+            "ms": round((time.perf_counter() - t0) * 1000.0, 1),
+        }
+        logger.info(f"[MIGRATION] cutover done: {result}")
+        return result
+
+    def _detach(self):
+        for hooks, fn in ((rag._write_hooks, self._on_write), (rag._query_hooks, self._on_query)):
+            if fn in hooks:
+                hooks.remove(fn)
+
+    def abort(self):
+        self.state = "aborted"
+        self._detach()
+        self._mirror_pool.shutdown(wait=False)
+
+    def status(self) -> Dict[str, Any]:
+        with self._mirror_lock:
+            m = self._mirror
+            overlap = list(m["overlap"])
+            mirror = {
+                "rate": self.mirror_rate,
+                "samples": m["samples"],
+                "dropped": m["dropped"],
+                "errors": m["errors"],
+                "doc_overlap_mean": round(sum(overlap) / len(overlap), 4) if overlap else None,
+                "primary_p50_ms": _percentile(m["primary_ms"], 50),
+                "primary_p95_ms": _percentile(m["primary_ms"], 95),
+                "shadow_p50_ms": _percentile(m["shadow_ms"], 50),
+                "shadow_p95_ms": _percentile(m["shadow_ms"], 95),
+            }
+        return {
+            "state": self.state,
+            "error": self.error,
+            "model": self.model_name,
+            "backend": self.backend,
+            "chunk_size": self.chunk_size,
+            "current_model": rag.EMBED_MODEL_NAME,
+            "path": self.path,
+            "progress": dict(self.progress),
+            "build_s": self.build_s,
+            "mirror": mirror,
+        }
+
+
+# ============================================================
+# SINGLETON
+# ============================================================
+
+_current: Optional[EmbeddingMigration] = None
+_lock = threading.Lock()
+
+
+def current() -> Optional[EmbeddingMigration]:
+    return _current
+
+
+def _worker_count() -> int:
+    """จำนวน worker process ของ server (uvicorn / gunicorn: --workers / -w หรือ WEB_CONCURRENCY)
+
+    worker ที่ spawn จาก supervisor ได้ sys.argv ของ process แม่ → เห็น --workers ด้วย
+    """
+    args = sys.argv[1:]
+    for i, arg in enumerate(args):
+        for flag in ("--workers", "-w"):
+            if arg == flag and i + 1 < len(args):
+                value = args[i + 1]
+            elif arg.startswith(flag + "="):
+                value = arg[len(flag) + 1:]
+            else:
+                continue
+            try:
+                return int(value)
+            except ValueError:
+                pass
+    try:
+        return int(os.getenv("WEB_CONCURRENCY", "1"))
+    except ValueError:
+        return 1
+
+
+def _check_owner():
+    """migration ต้องรันใน process เดียวที่ถือ embedding ทั้งหมด
+
+    หลาย worker (MODEL_SERVER_MODE=off): worker อื่นยัง encode ด้วย model เดิม แต่ FAQ / answer cache ใน SQL
+    ถูก re-embed เป็น model ใหม่ และ ingest ของ worker อื่นไม่ถูกเขียนตามลง shadow index → ปฏิเสธ
+    """
+    if rag.MODEL_SERVER_MODE != "off":
+        raise MigrationError("embedding migration runs in the process that owns the model (MODEL_SERVER_MODE=off)")
+    workers = _worker_count()
+    if workers > 1:
+        raise MigrationError(
+            f"embedding migration needs a single worker process (found {workers}); "
+            "other workers would keep the old model"
+        )
+
+
+def start_migration(session_factory, model: str, **kwargs) -> EmbeddingMigration:
+    global _current
+    _check_owner()
+    with _lock:
+        if _current is not None and _current.state in ("building", "ready"):
+            raise MigrationError(f"a migration to {_current.model_name} is already {_current.state}")
+        if model == rag.EMBED_MODEL_NAME and kwargs.get("chunk_size") is None:
+            raise MigrationError(f"{model} is already the active model")
+        _current = EmbeddingMigration(model, **kwargs)
+        _current.start(session_factory)
+        return _current
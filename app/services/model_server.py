@@ -0,0 +1,135 @@
+# app/services/model_server.py
+"""
+Model server: process เดียวที่ถือ embedding model + vector store + BM25 index
+
+  python -m app.services.model_server --socket /run/mfu/model.sock
+
+แล้วรัน API หลาย worker โดยชี้มาที่ socket เดียวกัน:
+
+  MODEL_SERVER_MODE=client MODEL_SERVER_SOCKET=/run/mfu/model.sock uvicorn app.main:app --workers 4
+
+- worker ไม่โหลดโมเดล / Chroma เอง → memory ต่อ worker เหลือเท่าตัว API
+- Chroma PersistentClient (SQLite) มี writer process เดียว
+- encode จากทุก worker เข้า EmbeddingBatcher ตัวเดียว (รวม batch ข้าม worker ได้)
+- write (upsert / update / delete ของ store และ index, ฟังก์ชัน ingest ใน rag.OWNED_CALLS)
+  รันทีละงานภายใต้ lock เดียว → ingest จากหลาย worker ไม่ชนกัน
+- read (query / get / search) รันพร้อมกันได้ (thread ต่อ connection)
+
+Protocol ดู app/services/remote.py
+"""
+
+import argparse
+import logging
+import os
+import socketserver
+import threading
+from typing import Any, Dict
+
+import numpy as np
+
+from app.services.remote import recv_message, send_message
+
+logger = logging.getLogger(__name__)
+
+_STORE_READS = {"count", "get", "query"}
+_STORE_WRITES = {"upsert", "update", "delete"}
+_LEXICAL_READS = {"search", "len"}
+_LEXICAL_WRITES = {"upsert_doc", "delete_doc"}
+
+_write_lock = threading.RLock()
+
+
+def _to_lists(x):
+    return x.tolist() if isinstance(x, np.ndarray) else x
+
+
+def dispatch(rag, msg: Dict[str, Any]) -> Any:
+    op = msg.get("op")
+    if op == "ping":
+        return {
+            "pid": os.getpid(),
+            "embed_backend": getattr(rag.embedder, "embed_backend", rag.EMBED_BACKEND),
+            "dim": rag.embedder.get_sentence_embedding_dimension(),
+            "vector_backend": rag.collection.backend,
+        }
+    if op == "encode":
+        vecs = rag.embedder.encode(msg["texts"], show_progress_bar=False, **(msg.get("kwargs") or {}))
+        return np.asarray(vecs, dtype=np.float32)
+    if op == "store":
+        method, kwargs = msg["method"], dict(msg.get("kwargs") or {})
+        if method in _STORE_READS:
+            if "query_embeddings" in kwargs:
+                kwargs["query_embeddings"] = _to_lists(kwargs["query_embeddings"])
+            return getattr(rag.collection, method)(**kwargs)
+        if method in _STORE_WRITES:
+            if kwargs.get("embeddings") is not None:
+                kwargs["embeddings"] = _to_lists(kwargs["embeddings"])
+            with _write_lock:
+                return getattr(rag.collection, method)(**kwargs)
+    if op == "lexical":
+        method, args = msg["method"], msg.get("args") or []
+        if method == "len":
+            return len(rag.lexical_index)
+        if method in _LEXICAL_READS:
+            return rag.lexical_index.search(*args)
+        if method in _LEXICAL_WRITES:
+            with _write_lock:
+                return getattr(rag.lexical_index, method)(*args)
+    if op == "call":
+        fn = rag.OWNED_CALLS.get(msg.get("fn"))
+        if fn is not None:
+            with _write_lock:
+                return fn(*(msg.get("args") or []), **(msg.get("kwargs") or {}))
+    raise ValueError(f"unsupported request: {op} {msg.get('method') or msg.get('fn') or ''}".strip())
+
+
+def make_server(rag, path: str) -> socketserver.ThreadingUnixStreamServer:
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            while True:
+                try:
+                    msg = recv_message(self.request)
+                except (ConnectionError, OSError):
+                    return
+                try:
+                    resp = {"ok": True, "result": dispatch(rag, msg)}
+                except Exception as e:
+                    logger.warning(f"[MODEL] {msg.get('op')} failed: {type(e).__name__}: {e}")
+                    resp = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                try:
+                    send_message(self.request, resp)
+                except OSError:
+                    return
+
+    if os.path.exists(path):
+        os.unlink(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    server = socketserver.ThreadingUnixStreamServer(path, Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Shared embedding + vector store process for multi-worker serving")
+    ap.add_argument("--socket", default=os.getenv("MODEL_SERVER_SOCKET", "/tmp/mfu-model.sock"))
+    args = ap.parse_args(argv)
+
+    # process นี้เป็นเจ้าของ model / store เอง (ไม่ใช่ client ของตัวเอง)
+    os.environ["MODEL_SERVER_MODE"] = "off"
+    logging.basicConfig(level=logging.INFO)
+    from app.services import rag
+    from app.core.startup import warmup
+
+    warmup(["embedder", "vector_store", "lexical_index"])
+    server = make_server(rag, args.socket)
+    logger.info(f"[MODEL] serving on {args.socket} (pid {os.getpid()})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
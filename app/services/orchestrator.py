@@ -1,7 +1,28 @@
 # app/orchestrator.py
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterator, Optional
+
 from sqlalchemy.orm import Session
 
-from app.services.rag import _get_router, generate_answer, embedder  # ใช้ของจาก rag.py
+from app.services.rag import (  # ใช้ของจาก rag.py
+    _get_router,
+    generate_answer,
+    stream_answer,
+    embedder,
+    retrieve_for_profile,
+)
+from app.services.answer_cache import SemanticAnswerCache, normalize_question
+from app.services.singleflight import SingleFlight
+from app.services.conversation import Conversation, ConversationManager, open_session_store
+from app.services.deadline import Deadline
+from app.services.categories import profile_for
+from app.core.database import SessionLocal
+from app.core.metrics import stage, record_cache
+from app.core.startup import Task
+from app.core.trace import trace_set
+from app.services.tokens import estimate_tokens
 from app.models.sql import QuestionLog
 from app.agents.faq import FaqAgent
 from app.agents.answer_styler import AnswerStylerAgent
@@ -10,6 +31,17 @@ from app.agents.regulation import RegulationAgent
 from app.agents.studentlife import StudentLifeAgent
 from app.agents.suggestion import SuggestionAgent
 from app.agents.capabilities import CapabilitiesAgent
+from app.agents.router import heuristic_route
+from app.agents.base import AgentState
+from app.agents.pipeline import Pipeline, stage_fn
+
+logger = logging.getLogger(__name__)
+
+# 1 = รัน stage ของ run_pipeline พร้อมกันตาม dependency (DAG), 0 = ทีละ stage (ลำดับ topological)
+PIPELINE_CONCURRENT = os.getenv("PIPELINE_CONCURRENT", "1") == "1"
+# router / retrieval แบบ speculative รอผล FAQ lookup ไม่เกินกี่ ms ก่อนเริ่มงานแพง
+# (FAQ hit ภายในเวลานี้ → ไม่เรียก Gemini router / ไม่ retrieve เลย; 0 = เริ่มทันที)
+PIPELINE_SPECULATIVE_GRACE_MS = int(os.getenv("PIPELINE_SPECULATIVE_GRACE_MS", "50"))
 
 academic_agent = AcademicAgent()
 reg_agent = RegulationAgent()
@@ -20,73 +52,394 @@ answer_agent = AnswerStylerAgent()
 suggest_agent = SuggestionAgent(embedder=embedder)
 cap_agent = CapabilitiesAgent()
 
+answer_cache = SemanticAnswerCache(embedder=embedder, session_factory=SessionLocal)
+inflight = SingleFlight()
+conversations = ConversationManager(open_session_store(session_factory=SessionLocal))
 
-def run_pipeline(question: str, db: Session):
-    """Multi-agent pipeline หลักของระบบแชทบอท"""
 
-    # 0) Router – ใช้ LLM จำแนก intent
-    router = _get_router()
+def _load_faq_index():
+    with SessionLocal() as db:
+        n = faq_agent.load_index(db)
+    logger.info(f"[ORCH] FAQ index: {n} entries")
+
+
+Task("faq_index", _load_faq_index, required=True, loaded=lambda: faq_agent.loaded)
+
+
+def _answer_profile(intent: str):
+    """profile ที่ agent ของ intent นี้ใช้ retrieve (ต้องตรงกับ dispatch ใน _generate)
+
+    คืน (key, profile) — key ใช้เทียบว่า speculative retrieval ใช้ได้ไหม; None = intent นี้ไม่ retrieve
+    """
+    if intent == "capabilities":
+        return None, None
+    if intent in ("academic", "regulation"):
+        profile = profile_for(intent)
+    elif intent in ("scholarship", "dorm", "contact", "general_rag"):
+        profile = profile_for(intent) or profile_for("general_rag")
+    else:
+        profile = None
+    return (profile.name if profile else "*"), profile
+
+
+def _route_meta(route_result, router: Optional[str] = None) -> Dict[str, Any]:
+    meta = {
+        "intent": route_result.intent,
+        "route": route_result.route,
+        "confidence": route_result.confidence,
+    }
     if router:
-        route_result = router.route(question)
-        intent = route_result.intent
-        meta = {
-            "intent": intent,
-            "route": route_result.route,
-            "confidence": route_result.confidence,
-        }
+        meta["router"] = router
+    return meta
+
+
+def _generate(question, intent, db, deadline, mode, chunks=None, history="", search_query=None):
+    """เลือก agent ตาม intent → (answer, meta ที่เพิ่ม)"""
+    extra: Dict[str, Any] = {}
+    conv = {"chunks": chunks, "history": history, "search_query": search_query}
+    if intent == "academic":
+        result = academic_agent.generate(question, deadline=deadline, mode=mode, **conv)
+    elif intent == "regulation":
+        result = reg_agent.generate(question, deadline=deadline, mode=mode, **conv)
+    elif intent == "capabilities":
+        with stage("capabilities"):
+            result = cap_agent.answer(db, deadline=deadline)
+    elif intent in ("scholarship", "dorm", "contact", "general_rag"):
+        result = life_agent.generate(question, deadline=deadline, mode=mode, intent=intent, **conv)
+    else:
+        # default → เรียก RAG ตรง ๆ
+        result = generate_answer(question, deadline=deadline, mode=mode, **conv)
+        if isinstance(result, dict):
+            extra["rag_next_topics"] = result.get("next_topics", [])
+
+    if isinstance(result, dict):
+        answer = (result.get("answer") or "").strip()
+        extra["answer_mode"] = result.get("answer_mode")
+    else:
+        answer = str(result).strip()
+    return answer, extra
+
+
+def run_pipeline(
+    question: str,
+    db: Session,
+    deadline: Optional[Deadline] = None,
+    mode: str = "auto",
+    conversation: Optional[Conversation] = None,
+):
+    """Multi-agent pipeline หลักของระบบแชทบอท
+
+    deadline: budget เวลาของ request → ส่งต่อทุก stage
+    stage ที่ถูกข้ามเพราะเวลาไม่พอจะอยู่ใน meta["skipped"]
+    mode: "auto" (Gemini + extractive fallback) | "fast" (ไม่เรียก LLM เลย)
+
+    รันเป็น DAG (app/agents/pipeline.py) — stage ที่ไม่ขึ้นต่อกันรันพร้อมกัน:
+
+      faq_lookup ────────────┬─→ answer ─┬─→ auto_faq
+      router (speculative) ──┤           └─→ styling
+      retrieval (speculative)┘
+      faq_count (speculative) ───────────────→ auto_faq
+      suggestion
+
+    - retrieval เริ่มทันทีด้วย intent จาก heuristic router; router (LLM) ให้ intent ที่ใช้ profile
+      เดียวกัน → answer ใช้ chunk ชุดนั้น ไม่งั้น retrieve ใหม่
+    - FAQ hit → ยกเลิก router / retrieval / faq_count (ไม่รอ LLM router — intent ใน meta มาจาก heuristic)
+    - suggestion / faq_count ใช้ session ของตัวเอง (Session ของ request ไม่ thread-safe)
+    - router / suggestion ตัดสินจาก deadline ครั้งเดียวก่อนเริ่ม DAG (ตามลำดับ DEGRADE_ORDER:
+      router ถูกข้าม → suggestion ถูกข้ามด้วย) — stage ที่รันพร้อมกันไม่เห็น deadline.skipped ของกันและกัน
+    - router / retrieval รอ FAQ lookup ไม่เกิน PIPELINE_SPECULATIVE_GRACE_MS แล้วตรวจ state.data["cancel"]
+      ก่อนเรียก Gemini / retrieve (FAQ hit แล้วไม่ต้องทำ)
+
+    conversation: session ของแชทหลายรอบ (app/services/conversation.py)
+    - router / retrieval ใช้ search query (คำถามต่อเนื่อง + คำถามก่อนหน้า), prompt มีประวัติแชท
+    - คำตอบที่อิงประวัติไม่ถูกนำไปสร้าง FAQ อัตโนมัติ
+    """
+    deadline = deadline or Deadline()
+    router = _get_router()
+    history = conversations.history_text(conversation)
+    search = conversations.search_query(conversation, question)
+    if conversation is not None:
+        trace_set("conversation", {
+            "turns": conversation.turn_count,
+            "history_tokens": estimate_tokens(history),
+            "search_query": search if search != question else None,
+        })
+    guess = heuristic_route(search)
+
+    # แผนการ degrade: ตัดสินก่อนเริ่ม DAG ตามลำดับความสำคัญ (router ก่อน suggestion)
+    use_llm_router = bool(router) and mode != "fast" and deadline.allows("router")
+    if router and mode != "fast" and not use_llm_router:
+        deadline.skip("router")
+    use_suggestion = deadline.allows("suggestion")
+    if not use_suggestion:
+        deadline.skip("suggestion")
+
+    faq_done = threading.Event()
+
+    def cancelled(state: AgentState) -> bool:
+        faq_done.wait(PIPELINE_SPECULATIVE_GRACE_MS / 1000.0)
+        return state.data["cancel"].is_set()
+
+    def route(state: AgentState):
+        # Router – ใช้ LLM จำแนก intent (เวลาไม่พอ / fast mode → heuristic แบบ local)
+        if use_llm_router and not cancelled(state):
+            try:
+                with stage("router"):
+                    state.data["meta"] = _route_meta(router.classify(search, timeout=deadline.timeout_s()))
+                return
+            except Exception as e:
+                # Gemini error / timeout → heuristic (timeout ของ deadline = router ถูกตัด)
+                logger.warning(f"[ORCH] LLM router failed, heuristic fallback: {e}")
+                if deadline.expired():
+                    deadline.skip("router")
+            state.data["meta"] = _route_meta(guess, router="heuristic")
+        elif router:
+            state.data["meta"] = _route_meta(guess, router="heuristic")
+        else:
+            state.data["meta"] = {"intent": "general", "route": "fallback", "confidence": 0.0}
+
+    def faq_lookup(state: AgentState):
+        try:
+            with stage("faq_lookup"):
+                faq, faq_score = faq_agent.find_best_faq_scored(question, db)
+            if faq:
+                # set ก่อนปลุก stage ที่รออยู่ (pipeline จะ set ให้ก็ต่อเมื่อ stage นี้จบแล้ว)
+                state.data["cancel"].set()
+        finally:
+            faq_done.set()
+        record_cache("faq", faq is not None)
+        trace_set("faq_score", round(faq_score, 4))
+        if faq:
+            faq_agent.update_hit(faq, db)
+        state.data["faq"] = faq
+
+    def retrieval(state: AgentState):
+        key, profile = _answer_profile(guess.intent if router else "general")
+        if key is None or cancelled(state):
+            return
+        with stage("speculative_retrieval"):
+            chunks = retrieve_for_profile(search, profile, deadline, llm=mode != "fast")
+        state.data["speculative"] = (key, chunks)
+
+    def faq_count(state: AgentState):
+        try:
+            with SessionLocal() as s:
+                state.data["faq_count"] = s.query(QuestionLog).filter(QuestionLog.question == question).count()
+        except Exception as e:
+            state.data["faq_auto_error"] = str(e)
+
+    def suggestion(state: AgentState):
+        # แนะนำหัวข้อคำถามถัดไปจาก QuestionLog
+        next_topics = []
+        if use_suggestion:
+            try:
+                with stage("suggestion"), SessionLocal() as s:
+                    next_topics = suggest_agent.suggest_next_topics(question, s, limit=3)
+            except Exception as e:
+                logger.warning(f"[ORCH] SuggestionAgent failed: {e}")
+        state.data["next_topics"] = next_topics
+
+    def answer(state: AgentState):
+        intent = state.data["meta"]["intent"]
+        key, _ = _answer_profile(intent)
+        spec_key, chunks = state.data.get("speculative") or (None, None)
+        reuse = key is not None and key == spec_key
+        trace_set("speculative_retrieval", "hit" if reuse else "miss")
+        state.answer, extra = _generate(
+            question, intent, db, deadline, mode, chunks if reuse else None, history, search
+        )
+        state.data["answer_meta"] = extra
+
+    def auto_faq(state: AgentState):
+        # ถ้าคำถามเดียวกันถูกถามบ่อย → auto สร้าง FAQ
+        # (ไม่สร้างจากคำตอบแบบ extractive — fast mode / fallback / deadline)
+        try:
+            if (
+                state.data.get("faq_count", 0) >= 5
+                and "ไม่พบข้อมูล" not in state.answer
+                and state.data["answer_meta"].get("answer_mode") != "extractive"
+            ):
+                faq_agent.register_faq(question, state.answer, db)
+                state.data["faq_auto_created"] = True
+        except Exception as e:
+            state.data["faq_auto_error"] = str(e)
+
+    def styling(state: AgentState):
+        # ปรับสไตล์คำตอบให้เหมือน ChatGPT
+        faq = state.data.get("faq")
+        with stage("styling"):
+            state.answer = answer_agent.style(faq.answer if faq else state.answer)
+
+    no_faq = lambda state: state.data.get("faq") is None
+    # ประวัติแชท → คำตอบขึ้นกับบริบทของ session (ไม่ใช่คำตอบของคำถามนี้ทั่วไป) → ไม่สร้าง FAQ
+    faq_candidate = lambda state: no_faq(state) and not history
+    pipeline = Pipeline(
+        [
+            stage_fn("faq_lookup", faq_lookup),
+            stage_fn("router", route, speculative=True),
+            stage_fn("retrieval", retrieval, speculative=True),
+            stage_fn("faq_count", faq_count, speculative=True, when=lambda state: not history),
+            stage_fn("suggestion", suggestion),
+            stage_fn("answer", answer, after=("faq_lookup", "router", "retrieval"), when=no_faq),
+            stage_fn("auto_faq", auto_faq, after=("answer", "faq_count"), when=faq_candidate),
+            stage_fn("styling", styling, after=("faq_lookup", "answer")),
+        ],
+        short_circuit=lambda state: state.data.get("faq") is not None,
+        concurrent=PIPELINE_CONCURRENT,
+    )
+    state = AgentState(question=question)
+    state.data["cancel"] = threading.Event()
+    state = pipeline.run(state)
+    dag = state.debug["dag"]
+
+    meta = dict(state.data["meta"]) if dag["router"]["status"] == "done" else _route_meta(guess, router="heuristic")
+    if state.data.get("faq") is not None:
+        meta["source"] = "faq"
     else:
-        intent = "general"
-        meta = {"intent": "general", "route": "fallback", "confidence": 0.0}
+        meta["source"] = "rag"
+        meta.update(state.data["answer_meta"])
+        for key in ("faq_auto_created", "faq_auto_error"):
+            if key in state.data:
+                meta[key] = state.data[key]
+    meta["next_topics"] = state.data["next_topics"]
+
+    trace_set("route", meta["route"])
+    trace_set("intent", meta["intent"])
+    trace_set("confidence", meta["confidence"])
+    trace_set("router", meta.get("router", "llm"))
+    trace_set("dag", dag)
+
+    meta["skipped"] = list(deadline.skipped)
+    trace_set("source", meta["source"])
+    trace_set("answer_mode", meta.get("answer_mode"))
+    trace_set("skipped", meta["skipped"])
+    return state.answer, meta
+
+
+def run_cached_pipeline(
+    question: str,
+    db: Session,
+    deadline: Optional[Deadline] = None,
+    mode: str = "auto",
+    conversation: Optional[Conversation] = None,
+):
+    """run_pipeline + semantic answer cache + single-flight ด้านหน้า
 
-    # 1) ลองหา FAQ ก่อน
-    faq = faq_agent.find_best_faq(question, db)
+    - cache hit จะใช้ได้ก็ต่อเมื่อไม่มี FAQ ที่ match (FAQ ที่ดูแลโดย admin ต้องชนะเสมอ)
+    - miss → คำถามเดียวกัน (normalized) ที่กำลังรันอยู่จะรอผลจาก leader แทนการยิง Gemini ซ้ำ
+    - leader เก็บผลลง cache เฉพาะคำตอบจาก RAG ที่ไม่ได้ degrade (ไม่มี stage ใน skipped, ไม่ใช่ extractive)
+      ผลที่ degrade เพราะ deadline ของ leader ไม่แชร์ให้ follower (follower รันเอง — deadline อาจต่างกัน)
+    - session มีประวัติแล้ว → ข้ามทั้ง cache และ single-flight
+      (คำถามเดียวกันในบทสนทนาต่างกันอาจต้องได้คำตอบต่างกัน)
+    """
+    deadline = deadline or Deadline()
+
+    if conversation is not None and conversation.has_history:
+        trace_set("answer_cache", "bypass")
+        return run_pipeline(question, db, deadline=deadline, mode=mode, conversation=conversation)
+
+    with stage("answer_cache"):
+        cached = answer_cache.lookup(question)
+        if cached and faq_agent.find_best_faq(question, db) is not None:
+            cached = None
+    record_cache("answer_cache", cached is not None)
+    if cached:
+        answer, meta, score = cached
+        meta["source"] = "answer_cache"
+        meta["cache_score"] = round(score, 4)
+        trace_set("source", "answer_cache")
+        trace_set("cache_score", meta["cache_score"])
+        return answer, meta
+
+    def _run():
+        answer, meta = run_pipeline(question, db, deadline=deadline, mode=mode, conversation=conversation)
+        if meta.get("skipped") or meta.get("answer_mode") == "extractive":
+            return answer, meta
+        try:
+            answer_cache.store(question, answer, meta)
+        except Exception as e:
+            logger.warning(f"[ORCH] answer_cache.store failed: {e}")
+        return answer, meta
+
+    # key รวม mode ด้วย: request แบบ auto ไม่ควรได้คำตอบ extractive ของ fast mode
+    (answer, meta), shared = inflight.do(
+        f"{mode}:{normalize_question(question)}",
+        _run,
+        wait_timeout=deadline.timeout_s(),
+        shareable=lambda result: not result[1].get("skipped"),
+    )
+    meta = dict(meta)
+    if shared:
+        meta["coalesced"] = True
+        trace_set("coalesced", True)
+        # follower ไม่ได้สร้าง FAQ เอง
+        meta.pop("faq_auto_created", None)
+    return answer, meta
+
+
+def stream_pipeline(
+    question: str,
+    db: Session,
+    deadline: Optional[Deadline] = None,
+    conversation: Optional[Conversation] = None,
+) -> Iterator[Dict[str, Any]]:
+    """pipeline แบบ streaming สำหรับ /chat/stream
+
+    - FAQ hit → ส่ง event "final" ทันที
+    - ไม่งั้น → "pre_answer" (extractive, เร็ว) → "delta" จาก Gemini → "final"
+    - ใช้ heuristic router (ไม่รอ LLM router ก่อนแสดง pre-answer)
+    event "final" มี answer (styled) / next_topics / meta
+    (meta["llm"] = ยอด token ของ Gemini call ใน stream — ใช้เขียน QuestionLog)
+    conversation: เหมือน run_pipeline (ประวัติใน prompt + search query สำหรับ route / retrieve)
+    """
+    deadline = deadline or Deadline()
+    history = conversations.history_text(conversation)
+    search = conversations.search_query(conversation, question)
+    route_result = heuristic_route(search)
+    meta: Dict[str, Any] = {
+        "intent": route_result.intent,
+        "route": route_result.route,
+        "confidence": route_result.confidence,
+        "router": "heuristic",
+    }
+
+    with stage("faq_lookup"):
+        faq = faq_agent.find_best_faq(question, db)
+    record_cache("faq", faq is not None)
     if faq:
         faq_agent.update_hit(faq, db)
         answer = faq.answer
         meta["source"] = "faq"
     else:
-        # 2) เลือก agent ตาม intent
         meta["source"] = "rag"
+        answer = ""
+        for event in stream_answer(
+            question, deadline=deadline, profile=profile_for(route_result.intent),
+            history=history, search_query=search,
+        ):
+            if event["type"] == "final":
+                answer = event["answer"]
+                meta["answer_mode"] = event.get("answer_mode")
+                if event.get("usage"):
+                    meta["llm"] = event["usage"]
+                continue
+            yield event
 
-        if intent == "academic":
-            answer = academic_agent.answer(question)
-        elif intent == "regulation":
-            answer = reg_agent.answer(question)
-        elif intent == "capabilities":
-            answer = cap_agent.answer(db)
-        elif intent in ("scholarship", "dorm", "contact", "general_rag"):
-            answer = life_agent.answer(question)
-        else:
-            # default → เรียก RAG ตรง ๆ
-            result = generate_answer(question)
-            if isinstance(result, dict):
-                answer = (result.get("answer") or "").strip()
-                meta["rag_next_topics"] = result.get("next_topics", [])
-            else:
-                answer = str(result).strip()
-
-        # 3) ถ้าคำถามเดียวกันถูกถามบ่อย → auto สร้าง FAQ
+    next_topics = []
+    if deadline.allows("suggestion"):
         try:
-            count = (
-                db.query(QuestionLog)
-                .filter(QuestionLog.question == question)
-                .count()
-            )
-            if count >= 5 and "ไม่พบข้อมูล" not in answer:
-                faq_agent.register_faq(question, answer, db)
-                meta["faq_auto_created"] = True
+            with stage("suggestion"):
+                next_topics = suggest_agent.suggest_next_topics(question, db, limit=3)
         except Exception as e:
-            meta["faq_auto_error"] = str(e)
-
-    # 4) แนะนำหัวข้อคำถามถัดไปจาก QuestionLog
-    try:
-        next_topics = suggest_agent.suggest_next_topics(question, db, limit=3)
-    except Exception as e:
-        print("[ORCH][WARN] SuggestionAgent failed:", e, flush=True)
-        next_topics = []
+            logger.warning(f"[ORCH] SuggestionAgent failed: {e}")
+    else:
+        deadline.skip("suggestion")
     meta["next_topics"] = next_topics
+    meta["skipped"] = list(deadline.skipped)
 
-    # 5) ปรับสไตล์คำตอบให้เหมือน ChatGPT
-    answer = answer_agent.style(answer)
-
-    return answer, meta
+    yield {
+        "type": "final",
+        "answer": answer_agent.style(answer),
+        "next_topics": next_topics,
+        "meta": meta,
+    }
@@ -0,0 +1,89 @@
+# app/services/prompt_budget.py
+"""
+จัด context ลง prompt ภายใน budget ของ input token
+
+- นับ token ด้วย app.services.tokens.estimate_tokens (ไม่เรียก API)
+- ใส่ context ตามลำดับความสำคัญ (score สูงก่อน) ทั้งก้อนจนเต็ม budget
+- ก้อนแรกที่ใส่ไม่พอดี → ตัดที่ขอบประโยคให้พอดีกับที่เหลือ (ถ้าเหลือ ≥ min_piece_tokens)
+  ก้อนที่เหลือถูกทิ้ง (ไม่ตัดทุกก้อนให้เหลือเศษสั้น ๆ)
+"""
+
+import re
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from app.services.tokens import estimate_tokens
+
+# ขอบประโยค: หลัง . ! ? / ขึ้นบรรทัดใหม่ / ช่องว่างระหว่างตัวอักษรไทย (ภาษาไทยเว้นวรรคระหว่างประโยค)
+_SENTENCE_BREAK = re.compile(
+    r"(?<=[.!?])\s+|\n+|(?<=[\u0E00-\u0E7F])\s+(?=[\u0E00-\u0E7F])"
+)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_BREAK.split(text or "") if s.strip()]
+
+
+def trim_to_tokens(
+    text: str,
+    budget: int,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+) -> str:
+    """ประโยคต้น ๆ ของ text ที่รวมกันไม่เกิน budget token
+
+    ประโยคแรกยาวเกิน budget เอง → ตัดตามสัดส่วนตัวอักษร (ไม่คืนข้อความว่างถ้า budget > 0)
+    """
+    if budget <= 0:
+        return ""
+    if count_tokens(text) <= budget:
+        return text
+    kept: List[str] = []
+    used = 0
+    for sent in split_sentences(text):
+        cost = count_tokens(sent) + (1 if kept else 0)
+        if used + cost > budget:
+            break
+        kept.append(sent)
+        used += cost
+    if kept:
+        return " ".join(kept)
+    first = split_sentences(text)[0] if text.strip() else ""
+    cut = max(1, int(len(first) * budget / max(count_tokens(first), 1)))
+    while cut > 1 and count_tokens(first[:cut]) > budget:
+        cut = int(cut * 0.9)
+    return first[:cut]
+
+
+def pack_context(
+    texts: Sequence[str],
+    budget_tokens: int,
+    count_tokens: Callable[[str], int] = estimate_tokens,
+    separator: str = "\n\n---\n\n",
+    min_piece_tokens: int = 40,
+) -> Tuple[List[str], Dict[str, int]]:
+    """texts (เรียงจากสำคัญสุด) → (ก้อนที่ใส่ได้ภายใน budget_tokens, สถิติ)
+
+    สถิติ: tokens (รวม separator), kept, trimmed, dropped, input_tokens (ก่อนตัด)
+    """
+    sep_cost = count_tokens(separator)
+    out: List[str] = []
+    used = 0
+    stats = {"input_tokens": 0, "tokens": 0, "kept": 0, "trimmed": 0, "dropped": 0}
+    for text in texts:
+        cost = count_tokens(text)
+        stats["input_tokens"] += cost
+        room = budget_tokens - used - (sep_cost if out else 0)
+        if cost <= room:
+            out.append(text)
+            used += cost + (sep_cost if len(out) > 1 else 0)
+            stats["kept"] += 1
+            continue
+        if room >= min_piece_tokens and stats["trimmed"] == 0:
+            piece = trim_to_tokens(text, room, count_tokens)
+            if piece:
+                out.append(piece)
+                used += count_tokens(piece) + (sep_cost if len(out) > 1 else 0)
+                stats["trimmed"] += 1
+                continue
+        stats["dropped"] += 1
+    stats["tokens"] = used
+    return out, stats
@@ -0,0 +1,89 @@
+# app/services/quantize.py
+"""
+เก็บ embedding แบบ precision ต่ำ (float16 / int8) เพื่อลด memory + disk
+
+- float16: ครึ่งหนึ่งของ float32, error ~1e-3 ต่อค่า
+- int8: 1/4 ของ float32 + scale (float32) ต่อ vector: q = round(v / scale), scale = max|v| / 127
+
+ใช้กับ
+- NumpyVectorStore (corpus): scan ด้วย matrix ที่ quantize แล้ว → rescore candidate ด้วย float32
+- FAQ (FaqEntry.question_embedding): เก็บเป็น text "f16:<base64>" / "i8:<scale>:<base64>"
+  (ของเดิมที่เป็น JSON list ยังอ่านได้)
+"""
+
+import base64
+import json
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+# แปลงเป็น float32 ทีละ block (numpy ไม่มี BLAS สำหรับ float16 / int8)
+_SCORE_BLOCK = 2048
+
+
+def check_dtype(dtype: str) -> str:
+    dtype = (dtype or "float32").lower()
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"vector dtype must be one of {VECTOR_DTYPES}, got {dtype!r}")
+    return dtype
+
+
+def quantize(m: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """matrix float32 (n × d) → (ค่าที่เก็บ, scale ต่อแถว หรือ None)"""
+    m = np.asarray(m, dtype=np.float32)
+    if dtype == "float32":
+        return m, None
+    if dtype == "float16":
+        return m.astype(np.float16), None
+    scales = np.abs(m).max(axis=1) / 127.0
+    scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+    q = np.clip(np.rint(m / scales[:, None]), -127, 127).astype(np.int8)
+    return q, scales
+
+
+def dequantize(q: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    out = np.asarray(q, dtype=np.float32)
+    if scales is not None:
+        out = out * np.asarray(scales, dtype=np.float32)[:, None]
+    return out
+
+
+def scores(q: np.ndarray, scales: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+    """dot product ของทุกแถวกับ query (float32) — แปลงทีละ block ไม่สร้าง matrix float32 ทั้งก้อน"""
+    query = np.asarray(query, dtype=np.float32)
+    if q.dtype == np.float32:
+        return q @ query
+    out = np.empty(len(q), dtype=np.float32)
+    for i in range(0, len(q), _SCORE_BLOCK):
+        out[i:i + _SCORE_BLOCK] = q[i:i + _SCORE_BLOCK].astype(np.float32) @ query
+    if scales is not None:
+        out *= scales
+    return out
+
+
+# ============================================================
+# TEXT ENCODING (FAQ)
+# ============================================================
+
+def encode_vector(vec: Sequence[float], dtype: str = "float32") -> str:
+    """vector → text สำหรับคอลัมน์ Text (float32 = JSON list แบบเดิม)"""
+    v = np.asarray(vec, dtype=np.float32).reshape(1, -1)
+    if dtype == "float32":
+        return json.dumps(v[0].tolist())
+    q, scales = quantize(v, dtype)
+    payload = base64.b64encode(q[0].tobytes()).decode("ascii")
+    if dtype == "float16":
+        return f"f16:{payload}"
+    return f"i8:{float(scales[0]):.9g}:{payload}"
+
+
+def decode_vector(text: str) -> np.ndarray:
+    """text จาก encode_vector (หรือ JSON list เดิม) → float32"""
+    if text.startswith("f16:"):
+        return np.frombuffer(base64.b64decode(text[4:]), dtype=np.float16).astype(np.float32)
+    if text.startswith("i8:"):
+        _, scale, payload = text.split(":", 2)
+        return np.frombuffer(base64.b64decode(payload), dtype=np.int8).astype(np.float32) * float(scale)
+    return np.asarray(json.loads(text), dtype=np.float32)
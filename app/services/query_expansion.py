@@ -0,0 +1,132 @@
+# app/services/query_expansion.py
+"""
+Multi-query retrieval: คำถามแบบภาษาพูด / คำย่อ ("หอ", "ดรอป", "ค่าเทอม") มัก embed ไกลจาก
+เอกสารที่เขียนภาษาทางการ → สร้างคำถามอีก 2-3 แบบแล้วค้นพร้อมกัน (rag.retrieve_chunks รวมอันดับด้วย RRF)
+
+แหล่งของ variant (เรียงตามลำดับที่ใช้):
+  1. rewrite  — QueryRewriterAgent (Gemini) เขียนคำถามใหม่ให้เป็นทางการ
+                (มี cost เป็น LLM call → เปิดแยกด้วย MULTI_QUERY_REWRITE)
+  2. synonym  — เติมคำทางการของคำพูด/คำย่อที่พบในคำถาม จากตาราง local (ไม่เรียก LLM)
+  3. intent   — เติม keyword ของ intent (ชุดเดียวกับ IntentClassifierAgent)
+
+override / เพิ่มคำพ้องได้ผ่าน env QUERY_SYNONYMS (JSON) เช่น {"หอ": ["หอพัก"], "ดรอป": ["ถอนรายวิชา"]}
+"""
+
+import json
+import logging
+import os
+from typing import Callable, Dict, List, Optional
+
+from app.agents.base import INTENT_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+# คำพูด / คำย่อ → คำที่ใช้ในเอกสารของมหาวิทยาลัย
+DEFAULT_SYNONYMS: Dict[str, List[str]] = {
+    "หอ": ["หอพัก"],
+    "ค่าเทอม": ["ค่าธรรมเนียมการศึกษา"],
+    "ดรอป": ["ถอนรายวิชา"],
+    "ถอนวิชา": ["ถอนรายวิชา"],
+    "ลงวิชา": ["ลงทะเบียนเรียน"],
+    "ลงเรียน": ["ลงทะเบียนเรียน"],
+    "เกรด": ["ผลการเรียน"],
+    "เกรดเฉลี่ย": ["ผลการเรียนเฉลี่ยสะสม"],
+    "จบ": ["สำเร็จการศึกษา"],
+    "ชุดนักศึกษา": ["เครื่องแบบนักศึกษา", "การแต่งกาย"],
+    "ชุดนศ": ["เครื่องแบบนักศึกษา", "การแต่งกาย"],
+    "แต่งตัว": ["การแต่งกาย"],
+    "กู้เงินเรียน": ["กองทุนเงินให้กู้ยืมเพื่อการศึกษา"],
+    "กยศ": ["กองทุนเงินให้กู้ยืมเพื่อการศึกษา"],
+    "ทุน": ["ทุนการศึกษา"],
+    "เบอร์": ["หมายเลขโทรศัพท์"],
+    "ปิดเทอม": ["ปิดภาคการศึกษา"],
+    "เปิดเทอม": ["เปิดภาคการศึกษา"],
+    "เทอม": ["ภาคการศึกษา"],
+    "ย้ายคณะ": ["ย้ายสำนักวิชา"],
+    "คณะ": ["สำนักวิชา"],
+    "สอบซ่อม": ["สอบแก้ตัว"],
+    "ลาพัก": ["ลาพักการศึกษา"],
+    "ซิ่ว": ["ลาออก", "ย้ายสถานศึกษา"],
+}
+
+# intent ของ router → intent ของ IntentClassifierAgent (ที่มี keyword)
+ROUTE_INTENT_KEYWORDS: Dict[str, List[str]] = {
+    "academic": ["registration_calendar"],
+    "regulation": ["dress_code"],
+    "scholarship": ["scholarship", "fees"],
+    "dorm": ["dormitory"],
+    "contact": ["administration"],
+}
+
+
+def _load_synonyms() -> Dict[str, List[str]]:
+    table = dict(DEFAULT_SYNONYMS)
+    raw = os.getenv("QUERY_SYNONYMS")
+    if raw:
+        try:
+            for word, formal in json.loads(raw).items():
+                table[word] = [formal] if isinstance(formal, str) else list(formal)
+        except Exception as e:
+            logger.warning(f"[QUERY] ignore invalid QUERY_SYNONYMS: {e}")
+    # คำยาวก่อน: "เกรดเฉลี่ย" ต้องชนะ "เกรด"
+    return dict(sorted(table.items(), key=lambda kv: len(kv[0]), reverse=True))
+
+
+SYNONYMS = _load_synonyms()
+
+
+def _append_terms(query: str, terms: List[str]) -> Optional[str]:
+    """เติมคำที่ยังไม่อยู่ในคำถามต่อท้าย (ไม่มีคำใหม่ → None)"""
+    extra: List[str] = []
+    for t in terms:
+        if t and t not in query and t not in extra:
+            extra.append(t)
+    return f"{query} {' '.join(extra)}" if extra else None
+
+
+def synonym_variant(query: str) -> Optional[str]:
+    q = query.lower()
+    terms: List[str] = []
+    covered: List[str] = []
+    for word, formal in SYNONYMS.items():
+        # คำสั้นที่เป็นส่วนของคำยาวที่ match ไปแล้ว ("เกรด" ใน "เกรดเฉลี่ย") ไม่นับซ้ำ
+        if word in q and not any(word in c for c in covered):
+            covered.append(word)
+            terms.extend(formal)
+    return _append_terms(query, terms)
+
+
+def intent_variant(query: str, intent: Optional[str]) -> Optional[str]:
+    terms = [kw for label in ROUTE_INTENT_KEYWORDS.get(intent or "", []) for kw in INTENT_KEYWORDS.get(label, [])]
+    return _append_terms(query, terms)
+
+
+def expand_queries(
+    query: str,
+    intent: Optional[str] = None,
+    rewrite: Optional[Callable[[str], str]] = None,
+    max_variants: int = 2,
+) -> List[str]:
+    """variant ของ query (ไม่รวม query เดิม ไม่ซ้ำกัน) ไม่เกิน max_variants
+
+    rewrite: ฟังก์ชันเขียนคำถามใหม่ (LLM) — error → ข้ามไปใช้ variant แบบ local
+    """
+    q = (query or "").strip()
+    if not q or max_variants <= 0:
+        return []
+    candidates: List[Optional[str]] = []
+    if rewrite is not None:
+        try:
+            candidates.append((rewrite(q) or "").strip())
+        except Exception as e:
+            logger.warning(f"[QUERY] rewrite failed: {e}")
+    candidates.append(synonym_variant(q))
+    candidates.append(intent_variant(q, intent))
+
+    out: List[str] = []
+    seen = {q.lower()}
+    for c in candidates:
+        if c and c.lower() not in seen:
+            seen.add(c.lower())
+            out.append(c)
+    return out[:max_variants]
@@ -2,24 +2,54 @@
 """
 RAG Engine for MFU AI Assistant (Google GenAI SDK v1)
 
-- Retrieval: ChromaDB + sentence-transformers
+- Retrieval: vector store (ChromaDB หรือ numpy exact search) + sentence-transformers (+ BM25 แบบ hybrid, ดู app/services/lexical.py)
 - Generation: Gemini via google-genai (รองรับ gemini-2.0-*)
 - ตอบไทย, ตรงคำถาม, ไม่เดานอก context
 - แนะนำหัวข้อถัดไป (next_topics) 2–3 ข้อ
 - รองรับ Multi-Agent Router แบบ lazy import (กัน circular import)
+- embedding model / vector store / BM25 index / Gemini client สร้างแบบ lazy (app/core/startup.py)
+  → import module นี้ไม่โหลดอะไรหนัก, lifespan ของ main.py warmup ให้พร้อมกันใน background
+- MODEL_SERVER_MODE=client: embedding / vector store / BM25 / ingest อยู่ที่ model server process
+  (app/services/model_server.py) — uvicorn หลาย worker ใช้ร่วมกัน
 """
 
+import functools
+import json
 import os
 import re
-from typing import List, Dict, Any, Optional, Tuple, Union
+import time
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
 
-from sentence_transformers import SentenceTransformer, util
-from chromadb import PersistentClient
-from chromadb.config import Settings
+import numpy as np
 
 import logging
-from google import genai
-from google.genai.types import HttpOptions, GenerateContentConfig
+
+from app.services.deadline import Deadline
+from app.services.extractive import ExtractiveAnswerer, NO_INFO_ANSWER
+from app.services.lexical import LexicalIndex, rrf_fuse
+from app.services.query_expansion import expand_queries
+from app.services.vectorstore import open_vector_store
+from app.services.embedders import check_backend, load_embedder
+from app.services.batcher import EmbeddingBatcher
+from app.services.snapshot import import_snapshot
+from app.services.remote import ModelServerClient, RemoteEmbedder, RemoteLexicalIndex, RemoteVectorStore
+from app.services.diversity import (
+    band_where,
+    collapse_duplicates,
+    hamming,
+    merge_adjacent,
+    mmr_select,
+    simhash,
+    simhash_bands,
+    simhash_metadata,
+)
+from app.services.categories import RetrievalProfile, resolve_category
+from app.services.expansion import EXPANSION_MODES, expand_chunks
+from app.services.prompt_budget import pack_context
+from app.services.tokens import estimate_tokens
+from app.core.metrics import stage, record_embed, record_llm_call
+from app.core.startup import Lazy, embedding_swap
+from app.core.trace import trace_chunks, trace_set
 
 logger = logging.getLogger(__name__)
 
@@ -32,64 +62,264 @@ EMBED_MODEL_NAME = os.getenv(
     "EMBED_MODEL_NAME",
     "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
 )
+# embedding backend บน CPU: torch | torch-int8 | onnx | openvino (ดู app/services/embedders.py)
+EMBED_BACKEND = check_backend(os.getenv("EMBED_BACKEND", "torch"))
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+EMBED_MODEL_FILE = os.getenv("EMBED_MODEL_FILE") or None
+EMBED_LOCAL_FILES_ONLY = os.getenv("EMBED_LOCAL_FILES_ONLY", "0") == "1"
+# micro-batching ของ encode จาก request ที่มาพร้อมกัน (ดู app/services/batcher.py)
+EMBED_BATCHING = os.getenv("EMBED_BATCHING", "1") == "1"
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "3"))
 CHROMA_PATH = os.getenv("CHROMA_DIR", "data/chroma")
 
+# vector store backend: chroma | numpy (exact search, memory-mapped .npy) | auto
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+VECTOR_DIR = os.getenv("VECTOR_DIR", os.path.join(os.path.dirname(CHROMA_PATH) or ".", "vectors"))
+VECTOR_NUMPY_MAX_ROWS = int(os.getenv("VECTOR_NUMPY_MAX_ROWS", "200000"))
+# numpy backend: เก็บ vector แบบ float32 | float16 | int8 (scan แบบ quantized → rescore float32)
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+VECTOR_KEEP_FLOAT32 = os.getenv("VECTOR_KEEP_FLOAT32", "1") == "1"
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+# ผลจาก `python -m benchmarks.vector_store --write-choice` (crossover ของ auto)
+VECTOR_BACKEND_CHOICE = os.getenv(
+    "VECTOR_BACKEND_CHOICE", os.path.join(os.path.dirname(CHROMA_PATH) or ".", "vector_backend.json")
+)
+# vector store ว่างตอนเปิด → import snapshot นี้ (app/services/snapshot.py) แทนการ re-embed
+VECTOR_SNAPSHOT_PATH = os.getenv("VECTOR_SNAPSHOT_PATH") or None
+
 MAX_DOC_CHARS = int(os.getenv("MAX_DOC_CHARS", "200000"))
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "600"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))
 MAX_CHUNKS_PER_DOC = int(os.getenv("MAX_CHUNKS_PER_DOC", "2000"))
 
+# small-to-big: embed chunk เล็ก (CHILD_CHUNK_SIZE) → ตอนประกอบ prompt ขยายเป็น chunk ข้างเคียง
+# ("neighbors", ± EXPAND_WINDOW) หรือทั้งส่วนของเอกสาร ("parent", ≤ PARENT_CHUNK_SIZE ตัวอักษร)
+# จนข้อความรวมถึง EXPAND_BUDGET_TOKENS — "off" (default) = chunk ขนาด CHUNK_SIZE แบบเดิม
+# เปิด/ปิดแล้วต้อง POST /admin/documents/reindex — ไม่งั้นเอกสารเดิมยังเป็น chunk ขนาดเก่า (ปนสองขนาดใน collection)
+SMALL_TO_BIG = os.getenv("SMALL_TO_BIG", "off").lower()
+if SMALL_TO_BIG not in EXPANSION_MODES:
+    raise RuntimeError(f"SMALL_TO_BIG must be one of {EXPANSION_MODES}, got {SMALL_TO_BIG!r}")
+CHILD_CHUNK_SIZE = int(os.getenv("CHILD_CHUNK_SIZE", "300"))
+PARENT_CHUNK_SIZE = int(os.getenv("PARENT_CHUNK_SIZE", "2000"))
+EXPAND_WINDOW = int(os.getenv("EXPAND_WINDOW", "2"))
+EXPAND_BUDGET_TOKENS = int(os.getenv("EXPAND_BUDGET_TOKENS", "1500"))
+
 # retrieval tuning
 TOP_K_RETRIEVE = int(os.getenv("TOP_K_RETRIEVE", "10"))
 RERANK_KEEP = int(os.getenv("RERANK_KEEP", "4"))
 SIM_THRESHOLD = float(os.getenv("SIM_THRESHOLD", "0.32"))
 
+# hybrid retrieval (BM25 + vector, รวมด้วย reciprocal rank fusion)
+HYBRID_ENABLED = os.getenv("HYBRID_ENABLED", "1") == "1"
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", "0.5"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# multi-query retrieval (app/services/query_expansion.py): ค้นด้วยคำถามเดิม + variant ใน batch เดียว
+# แล้วรวมอันดับด้วย RRF — ปิดเองเมื่อ deadline เหลือน้อย (stage "multi_query" / "query_rewrite")
+MULTI_QUERY_ENABLED = os.getenv("MULTI_QUERY_ENABLED", "0") == "1"
+MULTI_QUERY_MAX_VARIANTS = int(os.getenv("MULTI_QUERY_MAX_VARIANTS", "2"))
+# 1 = ให้ Gemini (QueryRewriterAgent) เขียนคำถามใหม่เป็น variant แรก (+1 LLM call ต่อ retrieval)
+MULTI_QUERY_REWRITE = os.getenv("MULTI_QUERY_REWRITE", "0") == "1"
+LEXICAL_INDEX_PATH = os.getenv(
+    "LEXICAL_INDEX_PATH", os.path.join(CHROMA_PATH, "lexical_index.json.gz")
+)
+
+# context diversity: ยุบ chunk ซ้ำ (SimHash) → MMR → รวม chunk ที่ติดกัน
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+SIMHASH_MAX_DISTANCE = int(os.getenv("SIMHASH_MAX_DISTANCE", "3"))
+MMR_ENABLED = os.getenv("MMR_ENABLED", "1") == "1"
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+MERGE_ADJACENT_CHUNKS = os.getenv("MERGE_ADJACENT_CHUNKS", "1") == "1"
+MERGE_MAX_CHARS = int(os.getenv("MERGE_MAX_CHARS", str(CHUNK_SIZE * 3)))
+
 # generation tuning
 MAX_OUTPUT_TOKENS = int(os.getenv("MAX_NEW_TOKENS", "220"))
+# budget ของ input (template + context + คำถาม, token แบบประมาณ) → context ที่เกินถูกตัดที่ขอบประโยค
+PROMPT_MAX_INPUT_TOKENS = int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "3000"))
+PROMPT_MIN_PIECE_TOKENS = int(os.getenv("PROMPT_MIN_PIECE_TOKENS", "40"))
 TEMPERATURE = float(os.getenv("TEMPERATURE", "0.2"))
 
 # Follow-ups
 ENABLE_FOLLOWUPS = os.getenv("ENABLE_FOLLOWUPS", "1") == "1"
 FOLLOWUPS_MAX_TOKENS = int(os.getenv("FOLLOWUPS_MAX_TOKENS", "120"))
 
-# Multi-Agent
-ENABLE_MULTI_AGENT = os.getenv("ENABLE_MULTI_AGENT", "1") == "1"
-
 # Gemini
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-2.0-flash")
+# ชี้ไป endpoint อื่นได้ (เช่น benchmarks/fake_gemini.py ตอนทำ load test)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL") or None
+
+# multi-worker: off (โหลด model / store ใน process นี้) | client (เรียก model server ผ่าน Unix socket)
+MODEL_SERVER_MODE = os.getenv("MODEL_SERVER_MODE", "off").lower()
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET", "/tmp/mfu-model.sock")
+MODEL_SERVER_CONNECT_TIMEOUT = float(os.getenv("MODEL_SERVER_CONNECT_TIMEOUT", "120"))
+if MODEL_SERVER_MODE not in ("off", "client"):
+    raise ValueError(f"unknown MODEL_SERVER_MODE: {MODEL_SERVER_MODE}")
+
+# blue/green embedding migration (app/services/migration.py): หลัง cutover model + ที่เก็บ index ชุดใหม่
+# ถูกบันทึกในไฟล์นี้ → restart แล้วใช้ชุดใหม่ต่อ (มีผลเหนือค่าใน env)
+EMBED_ACTIVE_FILE = os.getenv(
+    "EMBED_ACTIVE_FILE", os.path.join(os.path.dirname(CHROMA_PATH) or ".", "embedding_active.json")
+)
 
-if not GEMINI_API_KEY:
-    raise RuntimeError("GEMINI_API_KEY is not set in .env")
+
+def _read_active_embedding(path: str) -> Dict[str, Any]:
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"[RAG] ignore invalid {path}: {e}")
+        return {}
+
+
+_active = _read_active_embedding(EMBED_ACTIVE_FILE)
+if _active:
+    EMBED_MODEL_NAME = _active.get("model", EMBED_MODEL_NAME)
+    EMBED_BACKEND = check_backend(_active.get("backend", EMBED_BACKEND))
+    CHROMA_PATH = _active.get("chroma_dir", CHROMA_PATH)
+    VECTOR_DIR = _active.get("vector_dir", VECTOR_DIR)
+    LEXICAL_INDEX_PATH = _active.get("lexical_index_path", LEXICAL_INDEX_PATH)
+    CHUNK_SIZE = int(_active.get("chunk_size", CHUNK_SIZE))
+    CHILD_CHUNK_SIZE = int(_active.get("child_chunk_size", CHILD_CHUNK_SIZE))
 
 
 # ============================================================
-# INIT EMBEDDING + CHROMA
+# INIT EMBEDDING + VECTOR STORE (lazy)
 # ============================================================
 
-print("[RAG] Loading embedding model:", EMBED_MODEL_NAME, flush=True)
-logger.info(f"[RAG] Loading embedding model: {EMBED_MODEL_NAME}")
-embedder = SentenceTransformer(EMBED_MODEL_NAME)
+class _InstrumentedEmbedder:
+    """wrap SentenceTransformer: นับ batch size / latency ของทุก encode (→ /metrics)"""
+
+    def __init__(self, model):
+        self._model = model
+
+    def encode(self, sentences, *args, **kwargs):
+        n = 1 if isinstance(sentences, str) else len(sentences)
+        t0 = time.perf_counter()
+        try:
+            return self._model.encode(sentences, *args, **kwargs)
+        finally:
+            record_embed(n, time.perf_counter() - t0)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+_model_server = None
 
-logger.info(f"[RAG] Init ChromaDB at: {CHROMA_PATH}")
-chroma = PersistentClient(
-    path=CHROMA_PATH,
-    settings=Settings(anonymized_telemetry=False),
-)
-collection = chroma.get_or_create_collection(
-    name="uni_docs",
-    metadata={"hnsw:space": "cosine"},
-)
+
+def _model_server_client() -> ModelServerClient:
+    global _model_server
+    if _model_server is None:
+        _model_server = ModelServerClient(MODEL_SERVER_SOCKET, connect_timeout=MODEL_SERVER_CONNECT_TIMEOUT)
+    return _model_server
+
+
+def _load_embedder():
+    if MODEL_SERVER_MODE == "client":
+        return RemoteEmbedder(_model_server_client())
+    print("[RAG] Loading embedding model:", EMBED_MODEL_NAME, f"({EMBED_BACKEND})", flush=True)
+    logger.info(f"[RAG] Loading embedding model: {EMBED_MODEL_NAME} ({EMBED_BACKEND})")
+    return load_embedder(
+        EMBED_MODEL_NAME,
+        backend=EMBED_BACKEND,
+        threads=EMBED_THREADS,
+        file_name=EMBED_MODEL_FILE,
+        local_files_only=EMBED_LOCAL_FILES_ONLY,
+    )
+
+
+# dummy encode ตอน warmup: โหลด weight / สร้าง thread pool ของ torch ก่อน request แรก
+_embedder_model = Lazy("embedder", _load_embedder, warmup=lambda m: m.encode(["warmup"], show_progress_bar=False))
+embedder = _InstrumentedEmbedder(_embedder_model)
+if EMBED_BATCHING and MODEL_SERVER_MODE == "off":
+    # caller ทุกตัว (retriever / FAQ / suggestion / answer cache / extractive) ใช้ตัวนี้ → encode
+    # จากหลาย request รวมเป็น batch เดียว; ingest (batch ใหญ่) ผ่านตรง
+    embedder = EmbeddingBatcher(embedder, max_batch=EMBED_BATCH_MAX_SIZE, max_wait_ms=EMBED_BATCH_MAX_WAIT_MS)
+
+
+def _open_collection():
+    if MODEL_SERVER_MODE == "client":
+        return RemoteVectorStore(_model_server_client())
+    store = open_vector_store(
+        VECTOR_BACKEND,
+        chroma_path=CHROMA_PATH,
+        numpy_path=VECTOR_DIR,
+        numpy_max_rows=VECTOR_NUMPY_MAX_ROWS,
+        choice_file=VECTOR_BACKEND_CHOICE,
+        numpy_options={
+            "dtype": VECTOR_DTYPE,
+            "keep_float32": VECTOR_KEEP_FLOAT32,
+            "rescore_factor": VECTOR_RESCORE_FACTOR,
+        },
+    )
+    logger.info(
+        f"[RAG] Vector store: {store.backend} "
+        f"({CHROMA_PATH if store.backend == 'chroma' else VECTOR_DIR})"
+    )
+    if VECTOR_SNAPSHOT_PATH and store.count() == 0:
+        # snapshot ของ model อื่น → SnapshotError (vector_store = error ใน /ready) ไม่ใช่ store ว่างเงียบ ๆ
+        t0 = time.perf_counter()
+        manifest = import_snapshot(store, VECTOR_SNAPSHOT_PATH, EMBED_MODEL_NAME, chunker_config())
+        logger.info(
+            f"[RAG] Bootstrapped {manifest['rows']} chunks from snapshot {VECTOR_SNAPSHOT_PATH} "
+            f"in {(time.perf_counter() - t0) * 1000:.0f} ms"
+        )
+    return store
+
+
+# ชื่อ `collection` คงไว้ (caller เดิมใช้ API แบบ Chroma collection) — ดู app/services/vectorstore.py
+collection = Lazy("vector_store", _open_collection, warmup=lambda store: store.count())
+
+
+def _open_lexical_index():
+    if MODEL_SERVER_MODE == "client":
+        return RemoteLexicalIndex(_model_server_client())
+    # BM25 index คู่กับ collection (สร้างจาก chunk ใน collection ถ้ายังไม่มีไฟล์ index)
+    index = LexicalIndex(LEXICAL_INDEX_PATH)
+    if HYBRID_ENABLED and len(index) == 0:
+        try:
+            existing = collection.get(include=["documents", "metadatas"])
+            ids = existing.get("ids") or []
+            if ids:
+                index.rebuild(
+                    (str((m or {}).get("doc_id") or cid.split("::")[0]), cid, doc or "")
+                    for cid, doc, m in zip(ids, existing.get("documents") or [], existing.get("metadatas") or [])
+                )
+                logger.info(f"[RAG] Built lexical index for {len(ids)} chunks")
+        except Exception as e:
+            logger.warning(f"[RAG] Lexical index bootstrap failed: {e}")
+    return index
+
+
+lexical_index = Lazy("lexical_index", _open_lexical_index)
 
 # ============================================================
-# INIT GEMINI CLIENT (v1)
+# INIT GEMINI CLIENT (v1, lazy)
 # ============================================================
 
-logger.info(f"[RAG] Init Gemini client, model: {GEMINI_MODEL_NAME}")
-client = genai.Client(
-    api_key=GEMINI_API_KEY,
-    http_options=HttpOptions(api_version="v1"),
-)
+def _make_client():
+    # ไม่มี key → error ตอนเรียกครั้งแรก (call_gemini → extractive fallback) และ /ready แสดงสาเหตุ
+    if not GEMINI_API_KEY:
+        raise RuntimeError("GEMINI_API_KEY is not set in .env")
+    from google import genai
+    from google.genai.types import HttpOptions
+
+    logger.info(f"[RAG] Init Gemini client, model: {GEMINI_MODEL_NAME}")
+    return genai.Client(
+        api_key=GEMINI_API_KEY,
+        http_options=HttpOptions(api_version="v1", base_url=GEMINI_BASE_URL),
+    )
+
+
+# ไม่ required: ไม่มี Gemini ยังตอบได้ด้วย extractive answer
+client = Lazy("gemini_client", _make_client, required=False)
+
+# extractive answer engine (fallback / fast mode / pre-answer)
+extractive = ExtractiveAnswerer(embedder)
 
 # cache router singleton (lazy)
 _router = None
@@ -107,100 +337,339 @@ def _truncate(text: str, limit: int = MAX_DOC_CHARS) -> str:
     return text if len(text) <= limit else text[:limit]
 
 
-def _split(text: str) -> List[str]:
+# หัวข้อที่เริ่มส่วนใหม่ของเอกสาร (parent ของ small-to-big)
+_SECTION_HEADING = re.compile(
+    r"^(หมวด(ที่)?\s*\d+|ส่วนที่\s*\d+|บทที่\s*\d+|(chapter|section|part)\s+\d+)",
+    re.IGNORECASE,
+)
+_BREAK_AT = re.compile(r"[.!?。]\s|\s")
+
+
+def _split_long(text: str, size: int) -> List[str]:
+    """ย่อหน้าที่ยาวเกิน size → ตัดที่ท้ายประโยค / ช่องว่างสุดท้ายก่อนถึง size (ไม่มีเลย → ตัดตรง size)"""
+    out = []
+    while len(text) > size:
+        cut = 0
+        for m in _BREAK_AT.finditer(text, 0, size + 1):
+            cut = m.end()
+        cut = cut if cut > size // 2 else size
+        out.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        out.append(text)
+    return out
+
+
+def _split_sections(
+    text: str,
+    chunk_size: Optional[int] = None,
+    parent_size: Optional[int] = None,
+) -> List[Tuple[int, str]]:
     """
-    Paragraph-aware split:
-    - รวมย่อหน้าให้ได้ chunk ~ CHUNK_SIZE
-    - กัน chunk หลายหัวข้อปนกัน
+    Paragraph-aware split → [(parent_index, chunk)]:
+    - รวมย่อหน้า (บรรทัด) ให้ได้ chunk ~ chunk_size (default CHUNK_SIZE — eval ส่งค่าอื่นมาได้)
+    - กัน chunk หลายหัวข้อปนกัน: หัวข้อ (หมวด / ส่วนที่ / บทที่) เริ่ม chunk และ parent ใหม่เสมอ
+    - parent = chunk ที่ติดกันรวมไม่เกิน parent_size ตัวอักษร (default PARENT_CHUNK_SIZE)
+
+    normalize ทีละบรรทัด (ถ้า normalize ทั้งเอกสารก่อน "\n" จะหายและได้ chunk เดียวทั้งเอกสาร)
     """
-    text = _normalize(_truncate(text))
-    if not text:
-        return []
+    chunk_size = chunk_size or CHUNK_SIZE
+    parent_size = parent_size or PARENT_CHUNK_SIZE
+    pieces = [
+        piece
+        for line in _truncate(text).split("\n")
+        for piece in _split_long(_normalize(line), chunk_size)
+    ]
+
+    out: List[Tuple[int, str]] = []
+    parent, parent_chars, buf = 0, 0, ""
+
+    def emit():
+        nonlocal parent, parent_chars, buf
+        if parent_chars and parent_chars + len(buf) > parent_size:
+            parent, parent_chars = parent + 1, 0
+        out.append((parent, _normalize(buf)))
+        parent_chars += len(buf)
+        buf = ""
+
+    for p in pieces:
+        if len(out) >= MAX_CHUNKS_PER_DOC:
+            return out
+        if _SECTION_HEADING.match(p):
+            if buf:
+                emit()
+            if parent_chars:
+                parent, parent_chars = parent + 1, 0
+        elif buf and len(buf) + 1 + len(p) > chunk_size:
+            emit()
+        buf = f"{buf}\n{p}" if buf else p
+
+    if buf and len(out) < MAX_CHUNKS_PER_DOC:
+        emit()
+    return out
+
+
+def _split(text: str, chunk_size: Optional[int] = None) -> List[str]:
+    return [ch for _, ch in _split_sections(text, chunk_size=chunk_size)]
 
-    paras = [p.strip() for p in text.split("\n") if p.strip()]
-    chunks: List[str] = []
-    buf = ""
-    count = 0
 
-    for p in paras:
-        if not buf:
-            buf = p
-            continue
+# ============================================================
+# VECTOR STORE API
+# ============================================================
 
-        if len(buf) + 1 + len(p) <= CHUNK_SIZE:
-            buf += "\n" + p
-        else:
-            chunks.append(_normalize(buf))
-            buf = p
-            count += 1
+def chunker_config() -> Dict[str, Any]:
+    """ค่าที่กำหนดรูปแบบ chunk (เก็บใน snapshot — เทียบตอน import)"""
+    return {
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "small_to_big": SMALL_TO_BIG,
+        "child_chunk_size": CHILD_CHUNK_SIZE,
+        "parent_chunk_size": PARENT_CHUNK_SIZE,
+        "max_chunks_per_doc": MAX_CHUNKS_PER_DOC,
+        "max_doc_chars": MAX_DOC_CHARS,
+    }
+
+
+def chunk_document(
+    doc_id: str,
+    content: str,
+    metadata: dict,
+    chunk_size: Optional[int] = None,
+) -> Tuple[List[str], List[str], List[dict]]:
+    """แบ่งเอกสารเป็น (ids, texts, metadatas) ในรูปแบบที่เก็บลง collection
+
+    ขนาด default: CHILD_CHUNK_SIZE เมื่อเปิด small-to-big ไม่งั้น CHUNK_SIZE
+    """
+    if chunk_size is None:
+        chunk_size = CHUNK_SIZE if SMALL_TO_BIG == "off" else CHILD_CHUNK_SIZE
+    ids, docs, metas = [], [], []
+    for i, (parent, ch) in enumerate(_split_sections(content or "", chunk_size=chunk_size)):
+        ids.append(f"{doc_id}::{i}")
+        docs.append(ch)
+        m = dict(metadata or {})
+        m["doc_id"] = doc_id
+        m["chunk_index"] = i
+        m["parent_index"] = parent
+        metas.append(m)
+    return ids, docs, metas
 
-        if count >= MAX_CHUNKS_PER_DOC:
-            break
 
-    if buf and len(chunks) < MAX_CHUNKS_PER_DOC:
-        chunks.append(_normalize(buf))
+# ฟังก์ชันที่เขียน vector store / BM25 index: ใน client mode ส่งไปรันที่ model server
+# (owner process ของ store) ซึ่งรันทีละงาน → ingest จากหลาย worker ไม่ชนกัน
+OWNED_CALLS: Dict[str, Any] = {}
 
-    return chunks
 
+def _owned(fn):
+    OWNED_CALLS[fn.__name__] = fn
 
-# ============================================================
-# VECTOR STORE API
-# ============================================================
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if MODEL_SERVER_MODE == "client":
+            return _model_server_client().call(fn.__name__, *args, **kwargs)
+        return fn(*args, **kwargs)
 
-def add_or_update_doc_to_vector(doc_id: str, content: str, metadata: dict):
-    if not content:
-        return
+    return wrapper
 
-    chunks = _split(content)
-    if not chunks:
+
+# หลังเขียน collection หลักสำเร็จ → hook(op, doc_id, *args) (shadow index ของ migration เขียนตาม)
+_write_hooks: List[Any] = []
+
+
+def _run_write_hooks(op: str, *args):
+    for hook in list(_write_hooks):
+        try:
+            hook(op, *args)
+        except Exception as e:
+            logger.warning(f"[RAG] write hook {op} failed: {e}")
+
+
+def index_document(
+    doc_id: str,
+    content: str,
+    metadata: dict,
+    store,
+    lexical,
+    encoder,
+    chunk_size: Optional[int] = None,
+) -> int:
+    """chunk + embed + เขียนเอกสารลง store / lexical ที่ให้มา (ใช้กับ collection หลักและ shadow index)"""
+    metadata = dict(metadata or {})
+    metadata["category"] = resolve_category(
+        metadata.get("category"), metadata.get("title", ""), content
+    )
+
+    ids, docs, metas = chunk_document(doc_id, content, metadata, chunk_size=chunk_size)
+    if not docs:
         logger.warning(f"[RAG] No chunks for doc {doc_id}")
-        return
+        return 0
 
     try:
-        collection.delete(where={"doc_id": doc_id})
+        store.delete(where={"doc_id": doc_id})
     except Exception:
         pass
 
-    ids, docs, metas = [], [], []
-    for i, ch in enumerate(chunks):
-        ids.append(f"{doc_id}::{i}")
-        docs.append(ch)
-        m = dict(metadata or {})
-        m["doc_id"] = doc_id
-        m["chunk_index"] = i
-        metas.append(m)
+    if DEDUP_ENABLED:
+        dups = _mark_near_duplicates(ids, docs, metas, store)
+        if dups:
+            logger.info(f"[RAG] doc {doc_id}: {dups}/{len(docs)} chunks are near-duplicates")
 
-    embeds = embedder.encode(docs, show_progress_bar=False).tolist()
+    embeds = encoder.encode(docs, show_progress_bar=False).tolist()
 
-    collection.upsert(
+    store.upsert(
         ids=ids,
         embeddings=embeds,
         documents=docs,
         metadatas=metas,
     )
+    lexical.upsert_doc(doc_id, ids, docs)
+    return len(docs)
+
 
-    logger.info(f"[RAG] Stored {len(chunks)} chunks for doc {doc_id}")
+@_owned
+@embedding_swap.shared()
+def add_or_update_doc_to_vector(doc_id: str, content: str, metadata: dict):
+    if not content:
+        return
 
+    n = index_document(doc_id, content, metadata, collection, lexical_index, embedder)
+    if n:
+        logger.info(f"[RAG] Stored {n} chunks for doc {doc_id}")
+        _run_write_hooks("upsert", doc_id, content, metadata)
 
+
+def _mark_near_duplicates(ids: List[str], docs: List[str], metas: List[dict], store=None) -> int:
+    """ใส่ simhash ลง metadata + `dup_of` (chunk ต้นฉบับ) ให้ chunk ที่เกือบเหมือน chunk ที่มีอยู่แล้ว
+
+    เทียบกับ chunk ในเอกสารอื่น (ดึงด้วย band ของ simhash) และ chunk ก่อนหน้าในเอกสารเดียวกัน
+    (header / footer ซ้ำทุกหน้า) — chunk ซ้ำยังถูกเก็บ (อาจเป็นอันเดียวที่ผ่าน filter หมวด)
+    แต่ตอน retrieve จะเหลือแค่อันเดียวต่อกลุ่ม
+    """
+    hashes = [simhash(d) for d in docs]
+    for m, h in zip(metas, hashes):
+        m.update(simhash_metadata(h))
+
+    # bucket ต่อ band: (band index, ค่า) → [(chunk id, simhash, dup_of)]
+    buckets: Dict[Tuple[int, int], List[Tuple[str, int, Optional[str]]]] = {}
+    try:
+        got = (store if store is not None else collection).get(where=band_where(hashes), include=["metadatas"])
+        for cid, m in zip(got.get("ids") or [], got.get("metadatas") or []):
+            if m and m.get("simhash"):
+                h = int(m["simhash"], 16)
+                for b, band in enumerate(simhash_bands(h)):
+                    buckets.setdefault((b, band), []).append((cid, h, m.get("dup_of")))
+    except Exception as e:
+        logger.warning(f"[RAG] near-duplicate lookup failed: {e}")
+
+    dups = 0
+    for cid, h, m in zip(ids, hashes, metas):
+        canon = None
+        for b, band in enumerate(simhash_bands(h)):
+            for other, oh, other_dup in buckets.get((b, band), ()):
+                if hamming(h, oh) <= SIMHASH_MAX_DISTANCE:
+                    canon = other_dup or other
+                    break
+            if canon:
+                break
+        if canon:
+            m["dup_of"] = canon
+            dups += 1
+        for b, band in enumerate(simhash_bands(h)):
+            buckets.setdefault((b, band), []).append((cid, h, m.get("dup_of")))
+    return dups
+
+
+@_owned
+def rechunk_doc_in_vector(doc_id: str, content: str, metadata: dict):
+    """chunk + embed เอกสารใหม่ โดยคง metadata ระดับเอกสารของ chunk เดิม (source / filename / ...)"""
+    add_or_update_doc_to_vector(doc_id, content, dict(doc_metadata(doc_id), **metadata))
+
+
+def doc_metadata(doc_id: str, store=None) -> Dict[str, Any]:
+    """metadata ระดับเอกสาร (ตัดค่าที่เป็นของแต่ละ chunk ออก) จาก chunk แรกของเอกสารใน store"""
+    try:
+        got = (store if store is not None else collection).get(
+            where={"doc_id": doc_id}, limit=1, include=["metadatas"]
+        )
+        old = dict(((got.get("metadatas") or [None])[0]) or {})
+    except Exception:
+        old = {}
+    for key in ("doc_id", "chunk_index", "parent_index", "chunk_span", "simhash", "dup_of", "sh0", "sh1", "sh2", "sh3"):
+        old.pop(key, None)
+    return old
+
+
+@_owned
+@embedding_swap.shared()
+def set_doc_category_in_vector(doc_id: str, category: str) -> int:
+    """เปลี่ยนหมวดใน metadata ของ chunk เดิม (ไม่ต้อง re-embed) — คืนจำนวน chunk ที่แก้"""
+    got = collection.get(where={"doc_id": doc_id}, include=["metadatas"])
+    ids = got.get("ids") or []
+    if not ids:
+        return 0
+    metas = [dict(m or {}, category=category) for m in (got.get("metadatas") or [{}] * len(ids))]
+    collection.update(ids=ids, metadatas=metas)
+    _run_write_hooks("category", doc_id, category)
+    return len(ids)
+
+
+@_owned
+@embedding_swap.shared()
 def delete_doc_from_vector(doc_id: str):
     try:
         collection.delete(where={"doc_id": doc_id})
         logger.info(f"[RAG] Vector deleted for {doc_id}")
     except Exception:
         pass
+    lexical_index.delete_doc(doc_id)
+    _run_write_hooks("delete", doc_id)
 
 
 # ============================================================
 # RETRIEVE + RERANK
 # ============================================================
 
-def retrieve_context(query: str, k: int = TOP_K_RETRIEVE) -> List[str]:
+@embedding_swap.shared()
+def retrieve_chunks(
+    query: str,
+    k: int = TOP_K_RETRIEVE,
+    keep: Optional[int] = None,
+    threshold: Optional[float] = None,
+    store=None,
+    lexical_weight: Optional[float] = None,
+    where: Optional[Dict[str, Any]] = None,
+    variants: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """retrieve + rerank แบบคืนรายละเอียดของ chunk
+
+    คืน list ของ { "id", "text", "score", "metadata" } เรียงตาม score
+    (score = cosine similarity; collection ใช้ hnsw:space=cosine → score = 1 - distance
+    จึงไม่ต้อง encode chunk ซ้ำเพื่อ rerank)
+
+    hybrid (HYBRID_ENABLED, เฉพาะ collection หลัก): รวมผล vector กับ BM25 ด้วย RRF
+    → ลำดับตาม fused score; chunk ที่ BM25 จัดอยู่ใน keep อันดับแรกไม่ต้องผ่าน SIM_THRESHOLD
+    (exact match ของรหัสวิชา / เลขข้อ มักได้ cosine ต่ำ)
+
+    keep / threshold / store / lexical_weight: override RERANK_KEEP / SIM_THRESHOLD /
+    collection / HYBRID_LEXICAL_WEIGHT (ใช้โดย retrieval eval ที่ sweep ค่าเหล่านี้)
+    where: metadata filter ของ Chroma (เช่น {"category": {"$in": [...]}} จาก retrieval profile)
+    variants: คำถามแบบอื่น (multi_query_variants) → encode พร้อม query เป็น batch เดียว + query store
+      ครั้งเดียว แล้วรวมอันดับของแต่ละ variant ด้วย RRF (score ของ chunk = cosine สูงสุดในทุก variant)
+
+    chunk ที่ผ่าน threshold ถูกคัดอีกรอบก่อนตัดเหลือ keep (ดู _select_context):
+    ยุบ chunk ซ้ำ → MMR → รวม chunk ที่ติดกันของเอกสารเดียวกัน
+    """
     q = query.strip()
     if not q:
         return []
 
+    hybrid = HYBRID_ENABLED and store is None
+    store = store if store is not None else collection
+    keep = RERANK_KEEP if keep is None else keep
+    threshold = SIM_THRESHOLD if threshold is None else threshold
+    lexical_weight = HYBRID_LEXICAL_WEIGHT if lexical_weight is None else lexical_weight
+
     try:
-        total = collection.count()
+        total = store.count()
     except Exception:
         total = 0
 
@@ -209,41 +678,368 @@ def retrieve_context(query: str, k: int = TOP_K_RETRIEVE) -> List[str]:
 
     k = min(k, total)
 
-    q_emb = embedder.encode([q])[0].tolist()
-    res = collection.query(query_embeddings=[q_emb], n_results=k)
+    queries = [q] + [v for v in dict.fromkeys((v or "").strip() for v in variants or []) if v and v != q]
+
+    t0 = time.perf_counter()
+    with stage("retrieval_encode"):
+        q_embs = [e.tolist() for e in embedder.encode(queries)]
+    q_emb = q_embs[0]
+    with stage("retrieval_query"):
+        res = store.query(
+            query_embeddings=q_embs,
+            n_results=k,
+            where=where,
+            include=["documents", "metadatas", "distances", "embeddings"],
+        )
+
+    if _query_hooks and store is collection:
+        first = {key: (val[:1] if val is not None else None) for key, val in res.items()}
+        _run_query_hooks(q, k, where, first, (time.perf_counter() - t0) * 1000.0)
+    if len(queries) > 1:
+        scored = _fuse_variants([_query_rows(res, i) for i in range(len(queries))])
+        trace_set("multi_query", {
+            "queries": queries,
+            "added": sum(1 for c in scored if 0 not in c["variants"]),
+            "ms": round((time.perf_counter() - t0) * 1000.0, 2),
+        })
+    else:
+        scored = _query_rows(res, 0)
+    if not scored:
+        return []
+
+    if hybrid and lexical_weight > 0:
+        ranked = _fuse_lexical(q, q_emb, scored, k, keep, threshold, lexical_weight, store, where)
+    else:
+        ranked = [c for c in scored if c["score"] >= threshold]
+    kept = _select_context(ranked, q_emb, keep)
+    trace_chunks(kept)
+    return kept
+
 
-    docs = (res.get("documents") or [[]])[0]
+def _query_rows(res: Dict[str, Any], i: int) -> List[Dict[str, Any]]:
+    """ผลของ query ที่ i ใน batch → chunk เรียงตาม cosine"""
+    ids = (res.get("ids") or [[]] * (i + 1))[i]
+    docs = (res.get("documents") or [[]] * (i + 1))[i]
     if not docs:
         return []
+    metas = (res.get("metadatas") or [[]] * (i + 1))[i] or [{}] * len(docs)
+    dists = (res.get("distances") or [[]] * (i + 1))[i] or [1.0] * len(docs)
+    embs = res.get("embeddings")
+    embs = embs[i] if embs is not None and len(embs) > i else None
+    embs = [None] * len(docs) if embs is None else embs
+
+    scored = [
+        {"id": cid, "text": doc, "score": 1.0 - float(dist), "metadata": meta or {}, "_emb": emb}
+        for cid, doc, meta, dist, emb in zip(ids, docs, metas, dists, embs)
+    ]
+    scored.sort(key=lambda x: x["score"], reverse=True)
+    return scored
+
+
+def _fuse_variants(rankings: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """RRF ของอันดับจากทุก variant → เรียงตาม fused (variants = index ของ query ที่เจอ chunk นี้)"""
+    by_id: Dict[str, Dict[str, Any]] = {}
+    for v, ranked in enumerate(rankings):
+        for rank, c in enumerate(ranked, 1):
+            cur = by_id.get(c["id"])
+            if cur is None:
+                cur = by_id[c["id"]] = dict(c, fused=0.0, variants=[])
+            elif c["score"] > cur["score"]:
+                cur["score"] = c["score"]
+            cur["fused"] += 1.0 / (RRF_K + rank)
+            cur["variants"].append(v)
+    return sorted(by_id.values(), key=lambda c: c["fused"], reverse=True)
+
+
+def multi_query_variants(
+    query: str,
+    intent: Optional[str] = None,
+    deadline: Optional[Deadline] = None,
+    llm: bool = True,
+) -> List[str]:
+    """variant ของคำถามสำหรับ multi-query retrieval ([] = ปิด / deadline ไม่พอ)
+
+    llm=False (fast mode) → ไม่ใช้ LLM rewrite แม้ MULTI_QUERY_REWRITE=1
+    """
+    if not MULTI_QUERY_ENABLED or MULTI_QUERY_MAX_VARIANTS <= 0:
+        return []
+    deadline = deadline or Deadline()
+    if not deadline.allows("multi_query"):
+        deadline.skip("multi_query")
+        return []
+
+    rewrite = None
+    if MULTI_QUERY_REWRITE and llm:
+        if deadline.allows("query_rewrite"):
+            from app.agents.base import AgentState, QueryRewriterAgent
+
+            agent = QueryRewriterAgent(
+                lambda prompt, max_tokens: call_gemini(
+                    prompt, max_tokens, timeout=deadline.timeout_s(), call="query_rewrite"
+                )
+            )
+            rewrite = lambda q: agent.run(AgentState(question=q)).rewritten  # noqa: E731
+        else:
+            deadline.skip("query_rewrite")
+
+    with stage("multi_query_expand"):
+        return expand_queries(query, intent, rewrite, MULTI_QUERY_MAX_VARIANTS)
 
-    q_vec = embedder.encode(q)
-    doc_vecs = embedder.encode(docs)
-    scores = util.cos_sim(q_vec, doc_vecs)[0].tolist()
 
-    scored = list(zip(scores, docs))
-    scored.sort(key=lambda x: x[0], reverse=True)
+# retrieval ของ collection หลัก → hook(query, k, where, ผล query, latency ms) (mirror ไป shadow index)
+_query_hooks: List[Any] = []
 
-    filtered = [d for s, d in scored if s >= SIM_THRESHOLD][:RERANK_KEEP]
-    return filtered
+
+def _run_query_hooks(q: str, k: int, where, res: Dict[str, Any], elapsed_ms: float):
+    for hook in list(_query_hooks):
+        try:
+            hook(q, k, where, res, elapsed_ms)
+        except Exception as e:
+            logger.warning(f"[RAG] query hook failed: {e}")
+
+
+def switch_embedding(model, store, lexical, active: Dict[str, Any]):
+    """cutover ของ migration: เปลี่ยน embedding model + vector store + BM25 index พร้อมกัน
+    แล้วบันทึก EMBED_ACTIVE_FILE (os.replace → ไฟล์ไม่ค้างครึ่ง ๆ)
+
+    caller (app/services/migration.py) re-embed FAQ / answer cache / suggestion ไว้ก่อนแล้ว
+    และถือ embedding_swap.exclusive() อยู่ → retrieve / index ที่ถือ shared() ไม่เห็นชุดที่สลับไปครึ่งเดียว
+    """
+    global EMBED_MODEL_NAME, EMBED_BACKEND, CHROMA_PATH, VECTOR_DIR, LEXICAL_INDEX_PATH
+    global CHUNK_SIZE, CHILD_CHUNK_SIZE
+    tmp = EMBED_ACTIVE_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(active, f, ensure_ascii=False, indent=2)
+    _embedder_model.replace(model)
+    collection.replace(store)
+    lexical_index.replace(lexical)
+    os.replace(tmp, EMBED_ACTIVE_FILE)
+    EMBED_MODEL_NAME = active.get("model", EMBED_MODEL_NAME)
+    EMBED_BACKEND = active.get("backend", EMBED_BACKEND)
+    CHROMA_PATH = active.get("chroma_dir", CHROMA_PATH)
+    VECTOR_DIR = active.get("vector_dir", VECTOR_DIR)
+    LEXICAL_INDEX_PATH = active.get("lexical_index_path", LEXICAL_INDEX_PATH)
+    CHUNK_SIZE = int(active.get("chunk_size", CHUNK_SIZE))
+    CHILD_CHUNK_SIZE = int(active.get("child_chunk_size", CHILD_CHUNK_SIZE))
+    logger.info(f"[RAG] Switched embedding model to {EMBED_MODEL_NAME} ({store.backend})")
+
+
+def _select_context(ranked: List[Dict[str, Any]], q_emb: List[float], keep: int) -> List[Dict[str, Any]]:
+    """ranked (เรียงจากดีสุด) → keep ก้อนที่ให้ข้อมูลมากที่สุดต่อ token"""
+    n_in = len(ranked)
+    if DEDUP_ENABLED:
+        ranked = collapse_duplicates(ranked, SIMHASH_MAX_DISTANCE)
+    n_unique = len(ranked)
+
+    if MMR_ENABLED and len(ranked) > keep and all(c.get("_emb") is not None for c in ranked):
+        # relevance: fused score (hybrid) ปรับให้อยู่ช่วง 0..1 ไม่งั้น cosine
+        top_fused = max((c.get("fused") or 0.0) for c in ranked)
+        rel = [c["fused"] / top_fused if top_fused and "fused" in c else c["score"] for c in ranked]
+        picked = [ranked[i] for i in mmr_select(q_emb, np.asarray([c["_emb"] for c in ranked]), rel, keep, MMR_LAMBDA)]
+    else:
+        picked = ranked[:keep]
+
+    if MERGE_ADJACENT_CHUNKS:
+        picked = merge_adjacent(picked, MERGE_MAX_CHARS)
+
+    if n_unique < n_in or len(picked) < min(keep, n_unique):
+        trace_set("context_selection", {"candidates": n_in, "unique": n_unique, "blocks": len(picked)})
+    return [{key: v for key, v in c.items() if key != "_emb"} for c in picked]
+
+
+def _fuse_lexical(
+    q: str,
+    q_emb: List[float],
+    dense: List[Dict[str, Any]],
+    k: int,
+    keep: int,
+    threshold: float,
+    lexical_weight: float,
+    store,
+    where: Optional[Dict[str, Any]] = None,
+) -> List[Dict[str, Any]]:
+    with stage("retrieval_lexical"):
+        lex_ids = [cid for cid, _ in lexical_index.search(q, k=k)]
+    if not lex_ids:
+        return [c for c in dense if c["score"] >= threshold]
+
+    by_id = {c["id"]: c for c in dense}
+    missing = [cid for cid in lex_ids if cid not in by_id]
+    if missing:
+        # chunk ที่ BM25 เจอแต่ vector ไม่เจอ → ดึง text + embedding มาคิด cosine (ใช้กับ extractive / threshold)
+        got = store.get(ids=missing, include=["documents", "metadatas", "embeddings"])
+        qv = np.asarray(q_emb, dtype=np.float32)
+        qv /= max(float(np.linalg.norm(qv)), 1e-12)
+        embs = got.get("embeddings")
+        embs = [] if embs is None else embs
+        for i, cid in enumerate(got.get("ids") or []):
+            meta = (got.get("metadatas") or [{}])[i] or {}
+            if not _match_where(meta, where):
+                continue
+            ev = np.asarray(embs[i], dtype=np.float32) if i < len(embs) else None
+            cos = float(ev @ qv / max(float(np.linalg.norm(ev)), 1e-12)) if ev is not None else 0.0
+            by_id[cid] = {
+                "id": cid,
+                "text": (got.get("documents") or [""])[i],
+                "score": cos,
+                "metadata": meta,
+                "_emb": ev,
+            }
+        # BM25 ค้นทั้ง index → ตัด chunk ที่ไม่ผ่าน filter ออกก่อนจัดอันดับ
+        lex_ids = [cid for cid in lex_ids if cid in by_id]
+
+    lexical_top = set(lex_ids[:keep])
+    kept = []
+    for cid, fused in rrf_fuse([c["id"] for c in dense], lex_ids, lexical_weight, RRF_K):
+        c = by_id.get(cid)
+        if c is None or (c["score"] < threshold and cid not in lexical_top):
+            continue
+        kept.append(dict(c, fused=round(fused, 6), lexical=cid in lexical_top))
+    return kept
+
+
+def _match_where(meta: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """ตรวจ metadata กับ where แบบง่าย ({"key": value} / {"key": {"$in": [...]}} / {"$and": [...]})"""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(_match_where(meta, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            if "$in" in cond and meta.get(key) not in cond["$in"]:
+                return False
+            if "$eq" in cond and meta.get(key) != cond["$eq"]:
+                return False
+        elif meta.get(key) != cond:
+            return False
+    return True
+
+
+def retrieve_for_profile(
+    query: str,
+    profile: Optional[RetrievalProfile] = None,
+    deadline: Optional[Deadline] = None,
+    llm: bool = True,
+) -> List[Dict[str, Any]]:
+    """retrieve ตาม profile ของ intent (filter หมวด + top_k / keep / threshold ของ profile)
+
+    filter แล้วไม่เหลือ chunk → ค้นทั้ง collection ด้วยค่า default
+    (router จัด intent ผิด หรือเอกสารถูกจัดหมวดผิด ไม่ควรทำให้ตอบ "ไม่พบข้อมูล")
+    MULTI_QUERY_ENABLED → ค้นด้วย variant ของคำถามด้วย (ดู multi_query_variants)
+    """
+    variants = multi_query_variants(query, profile.name if profile else None, deadline, llm=llm)
+    if profile is None:
+        return retrieve_chunks(query, k=TOP_K_RETRIEVE, variants=variants)
+
+    trace_set("profile", profile.name)
+    chunks = retrieve_chunks(
+        query,
+        k=profile.top_k,
+        keep=profile.keep,
+        threshold=profile.threshold,
+        where=profile.where(),
+        variants=variants,
+    )
+    if chunks or profile.where() is None:
+        return chunks
+    trace_set("profile_fallback", True)
+    return retrieve_chunks(query, k=TOP_K_RETRIEVE, variants=variants)
+
+
+def _with_hint(query: str, profile: Optional[RetrievalProfile]) -> str:
+    """hint ของ profile ใส่เฉพาะใน prompt ของ LLM (ไม่ใช้ตอน embed คำถาม)"""
+    if profile is None or not profile.hint:
+        return query
+    return f"{profile.hint}: {query}"
+
+
+@embedding_swap.shared()
+def expand_context(chunks: List[Dict[str, Any]], store=None) -> List[Dict[str, Any]]:
+    """small-to-big: hit (chunk เล็ก) → ช่วงข้างเคียง / ส่วนของเอกสาร ภายใน EXPAND_BUDGET_TOKENS
+
+    ใช้เฉพาะ context ที่ส่งให้ LLM — extractive answer ยังใช้ chunk เล็ก (ตรงประเด็นกว่า)
+    ดึง chunk ข้างเคียงไม่ได้ → คืน chunks เดิม
+    """
+    if SMALL_TO_BIG == "off" or not chunks:
+        return chunks
+    try:
+        with stage("context_expand"):
+            expanded, stats = expand_chunks(
+                chunks,
+                store if store is not None else collection,
+                EXPAND_BUDGET_TOKENS,
+                mode=SMALL_TO_BIG,
+                window=EXPAND_WINDOW,
+            )
+    except Exception as e:
+        logger.warning(f"[RAG] context expansion failed: {e}")
+        return chunks
+    if stats["added"]:
+        trace_set("context_expansion", stats)
+    return expanded
+
+
+def retrieve_context(query: str, k: int = TOP_K_RETRIEVE) -> List[str]:
+    return [c["text"] for c in retrieve_chunks(query, k=k)]
 
 
 # ============================================================
 # GEMINI HELPERS (NO systemInstruction)
 # ============================================================
 
-def call_gemini(prompt: str, max_tokens: int) -> str:
-    resp = client.models.generate_content(
-        model=GEMINI_MODEL_NAME,
-        contents=prompt,
-        config=GenerateContentConfig(
-            temperature=TEMPERATURE,
-            max_output_tokens=max_tokens,
-        ),
+def call_gemini(
+    prompt: str,
+    max_tokens: int,
+    timeout: Optional[float] = None,
+    call: str = "answer",
+) -> str:
+    """timeout (วินาที) มาจาก Deadline ของ request — None = ใช้ค่า default ของ SDK
+    call: ชื่อของ call สำหรับ metrics (answer / followups / ...)
+    """
+    from google.genai.types import GenerateContentConfig, HttpOptions
+
+    config = GenerateContentConfig(
+        temperature=TEMPERATURE,
+        max_output_tokens=max_tokens,
     )
-    return (resp.text or "").strip()
+    if timeout is not None:
+        config.http_options = HttpOptions(timeout=max(1, int(timeout * 1000)))
+
+    t0 = time.perf_counter()
+    try:
+        resp = client.models.generate_content(
+            model=GEMINI_MODEL_NAME,
+            contents=prompt,
+            config=config,
+        )
+    except Exception:
+        record_llm_call(
+            call, time.perf_counter() - t0, error=True,
+            prompt_chars=len(prompt), est_prompt_tokens=estimate_tokens(prompt),
+        )
+        raise
+    text = (resp.text or "").strip()
+    record_llm_call(
+        call, time.perf_counter() - t0, resp,
+        prompt_chars=len(prompt),
+        est_prompt_tokens=estimate_tokens(prompt),
+        est_completion_tokens=estimate_tokens(text),
+    )
+    return text
+
+
+def _history_block(history: str) -> str:
+    """ประวัติแชทของ session (ดู app/services/conversation.py) — ไม่มี = ไม่ใส่หัวข้อนี้ใน prompt"""
+    if not history:
+        return ""
+    return f"""
+[บทสนทนาก่อนหน้า] (ใช้เข้าใจว่าคำถามอ้างถึงอะไร — ข้อมูลที่ตอบต้องมาจาก CONTEXT)
+{history}
+"""
 
 
-def _build_answer_prompt(context_text: str, query: str) -> str:
+def _build_answer_prompt(context_text: str, query: str, history: str = "") -> str:
     return f"""
 คุณเป็นผู้ช่วยนักศึกษามหาวิทยาลัยแม่ฟ้าหลวง (MFU)
 ตอบคำถามให้ "ตรงประเด็นที่สุด" โดยใช้เฉพาะข้อมูลใน CONTEXT เท่านั้น
@@ -265,7 +1061,7 @@ def _build_answer_prompt(context_text: str, query: str) -> str:
 
 [CONTEXT]
 {context_text}
-
+{_history_block(history)}
 [คำถาม]
 {query}
 
@@ -273,6 +1069,23 @@ def _build_answer_prompt(context_text: str, query: str) -> str:
 """.strip()
 
 
+def assemble_context(chunks: List[Dict[str, Any]], query: str, history: str = "") -> str:
+    """chunk (เรียงตามผล retrieve: ดีสุดก่อน) → context text ที่ prompt ทั้งก้อนไม่เกิน PROMPT_MAX_INPUT_TOKENS
+
+    budget ของ context = PROMPT_MAX_INPUT_TOKENS − (template + คำถาม + ประวัติแชท)
+    ก้อนที่ใส่ไม่พอดีถูกตัดที่ขอบประโยค (ดู app/services/prompt_budget.py)
+    """
+    overhead = estimate_tokens(_build_answer_prompt("", query, history))
+    texts, stats = pack_context(
+        [c["text"] for c in chunks],
+        max(0, PROMPT_MAX_INPUT_TOKENS - overhead),
+        min_piece_tokens=PROMPT_MIN_PIECE_TOKENS,
+    )
+    if stats["trimmed"] or stats["dropped"]:
+        trace_set("prompt_budget", dict(stats, budget=PROMPT_MAX_INPUT_TOKENS, overhead=overhead))
+    return "\n\n---\n\n".join(texts)
+
+
 def _build_followups_prompt(context_text: str, query: str, answer: str) -> str:
     return f"""
 คุณคือผู้ช่วยแนะนำคำถามต่อเนื่องสำหรับนักศึกษา MFU
@@ -309,6 +1122,11 @@ def _parse_followups(text: str) -> List[str]:
     return lines[:3]
 
 
+def extractive_answer(query: str, chunks: List[Dict[str, Any]]) -> str:
+    """คำตอบแบบไม่ใช้ LLM จาก chunk ที่ retrieve มา (ดู app/services/extractive.py)"""
+    return extractive.answer(query, chunks)["answer"]
+
+
 # ============================================================
 # MULTI-AGENT ROUTER (lazy)
 # ============================================================
@@ -339,66 +1157,221 @@ def _get_router():
 # GENERATE ANSWER (export)
 # ============================================================
 
-def generate_answer(question: str) -> Dict[str, Any]:
+def _extractive_result(query: str, chunks: List[Dict[str, Any]], deadline: Deadline) -> Dict[str, Any]:
+    with stage("extractive"):
+        answer = extractive_answer(query, chunks)
+    return {
+        "answer": answer,
+        "next_topics": [],
+        "skipped": list(deadline.skipped),
+        "answer_mode": "extractive",
+    }
+
+
+def generate_answer(
+    question: str,
+    deadline: Optional[Deadline] = None,
+    mode: str = "auto",
+    profile: Optional[RetrievalProfile] = None,
+    chunks: Optional[List[Dict[str, Any]]] = None,
+    history: str = "",
+    search_query: Optional[str] = None,
+) -> Dict[str, Any]:
     """
     คืนค่าแบบ dict เพื่อให้ main.py ใช้ได้:
-      { "answer": str, "next_topics": List[str] }
+      { "answer": str, "next_topics": List[str], "skipped": List[str], "answer_mode": str }
+    answer_mode: "llm" | "extractive" | "none" (ไม่มีคำตอบจากเอกสาร — NO_INFO_ANSWER)
+
+    mode:
+      - "auto": ใช้ Gemini ถ้าเรียกไม่ได้ (error / ช้าเกิน deadline) → extractive answer
+      - "fast": extractive answer จาก chunk อย่างเดียว ไม่เรียก LLM
+    deadline: budget เวลาของ request — ถ้าเวลาไม่พอจะ
+      - ข้าม follow-ups
+      - ใช้ extractive answer จาก chunk แทนการเรียก Gemini
+    profile: retrieval profile ของ intent (หมวดเอกสาร / top_k / threshold) — None = ค้นทั้ง collection
+    chunks: ผลของ retrieve_for_profile(question, profile) ที่ได้มาก่อนแล้ว
+      (speculative retrieval ใน orchestrator) — None = retrieve เอง
+    history: ประวัติแชทของ session (จำกัด token แล้ว) ใส่ใน prompt
+    search_query: query ที่ใช้ retrieve (คำถามต่อเนื่อง + คำถามก่อนหน้า) — None = question
     """
+    deadline = deadline or Deadline()
+
     query = (question or "").strip()
     if not query:
-        return {"answer": "กรุณาพิมพ์คำถามก่อนนะครับ", "next_topics": []}
-
-    # 0) Multi-agent first (ถ้ามี)
-    if ENABLE_MULTI_AGENT:
-        router = _get_router()
-        if router:
-            try:
-                routed = router.route(query)
-                # คาดว่า router.route คืน dict แบบเดียวกัน
-                if isinstance(routed, dict) and "answer" in routed:
-                    return {
-                        "answer": str(routed.get("answer", "")).strip()
-                                   or "ไม่พบข้อมูลในระบบ กรุณาติดต่อเจ้าหน้าที่มหาวิทยาลัย",
-                        "next_topics": routed.get("next_topics") or [],
-                    }
-            except Exception as e:
-                logger.warning(f"[RAG] Router failed, fallback RAG: {e}")
+        return {"answer": "กรุณาพิมพ์คำถามก่อนนะครับ", "next_topics": [], "skipped": [], "answer_mode": "none"}
 
     # 1) Normal RAG
-    contexts = retrieve_context(query, k=TOP_K_RETRIEVE)
-    if not contexts:
+    # (routing ทำที่ orchestrator แล้ว — ไม่เรียก router ซ้ำที่นี่)
+    if chunks is None:
+        chunks = retrieve_for_profile(search_query or query, profile, deadline, llm=mode != "fast")
+    if not chunks:
         return {
-            "answer": "ไม่พบข้อมูลในระบบ กรุณาติดต่อเจ้าหน้าที่มหาวิทยาลัย",
+            "answer": NO_INFO_ANSWER,
             "next_topics": [],
+            "skipped": list(deadline.skipped),
+            "answer_mode": "none",
         }
 
-    context_text = "\n\n---\n\n".join(contexts)
-    prompt = _build_answer_prompt(context_text, query)
+    if mode == "fast":
+        return _extractive_result(query, chunks, deadline)
+
+    if not deadline.allows("generate"):
+        deadline.skip("generate")
+        deadline.skip("followups")
+        return _extractive_result(query, chunks, deadline)
+
+    hinted = _with_hint(query, profile)
+    context_text = assemble_context(expand_context(chunks), hinted, history)
+    prompt = _build_answer_prompt(context_text, hinted, history)
 
     try:
-        answer = call_gemini(prompt, MAX_OUTPUT_TOKENS)
+        with stage("generation"):
+            answer = call_gemini(prompt, MAX_OUTPUT_TOKENS, timeout=deadline.timeout_s())
     except Exception as e:
-        logger.error(f"[RAG] Gemini generate failed: {e}")
-        return {"answer": "ระบบไม่สามารถสร้างคำตอบได้ในขณะนี้ครับ", "next_topics": []}
+        if deadline.expired():
+            logger.warning(f"[RAG] Gemini generate hit deadline, extractive fallback: {e}")
+            deadline.skip("generate")
+            deadline.skip("followups")
+        else:
+            logger.error(f"[RAG] Gemini generate failed, extractive fallback: {e}")
+        return _extractive_result(query, chunks, deadline)
 
     if not answer:
-        return {"answer": "ระบบไม่สามารถสร้างคำตอบได้ในขณะนี้ครับ", "next_topics": []}
+        return _extractive_result(query, chunks, deadline)
 
     if "ไม่พบข้อมูลในระบบ" in answer:
         return {
-            "answer": "ไม่พบข้อมูลในระบบ กรุณาติดต่อเจ้าหน้าที่มหาวิทยาลัย",
+            "answer": NO_INFO_ANSWER,
             "next_topics": [],
+            "skipped": list(deadline.skipped),
+            "answer_mode": "none",
         }
 
     # 2) Follow-ups → next_topics (optional)
     next_topics: List[str] = []
     if ENABLE_FOLLOWUPS:
-        try:
-            fup_prompt = _build_followups_prompt(context_text, query, answer)
-            fup_text = call_gemini(fup_prompt, FOLLOWUPS_MAX_TOKENS)
-            next_topics = _parse_followups(fup_text)
-        except Exception as e:
-            logger.warning(f"[RAG] Followups failed: {e}")
+        if deadline.allows("followups"):
+            try:
+                fup_prompt = _build_followups_prompt(context_text, query, answer)
+                with stage("followups"):
+                    fup_text = call_gemini(
+                        fup_prompt,
+                        FOLLOWUPS_MAX_TOKENS,
+                        timeout=deadline.timeout_s(),
+                        call="followups",
+                    )
+                next_topics = _parse_followups(fup_text)
+            except Exception as e:
+                logger.warning(f"[RAG] Followups failed: {e}")
+        else:
+            deadline.skip("followups")
+
+    return {
+        "answer": answer.strip(),
+        "next_topics": next_topics,
+        "skipped": list(deadline.skipped),
+        "answer_mode": "llm",
+    }
 
-    return {"answer": answer.strip(), "next_topics": next_topics}
 
+# ============================================================
+# STREAM ANSWER (pre-answer แบบ extractive → LLM stream)
+# ============================================================
+
+def stream_answer(
+    question: str,
+    deadline: Optional[Deadline] = None,
+    profile: Optional[RetrievalProfile] = None,
+    history: str = "",
+    search_query: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    generator ของ event สำหรับ /chat/stream:
+      { "type": "pre_answer", "answer": str }   ← extractive (เร็ว, แสดงก่อน)
+      { "type": "delta", "text": str }          ← ข้อความจาก Gemini ทีละส่วน
+      { "type": "final", "answer": str, "answer_mode": str, "skipped": [...], "usage": {...} }
+    usage (เมื่อเรียก Gemini): calls / prompt_tokens / completion_tokens
+    history / search_query: เหมือน generate_answer
+    """
+    deadline = deadline or Deadline()
+
+    query = (question or "").strip()
+    # ไม่ใช้ LLM rewrite ของ multi-query: pre-answer ต้องออกเร็ว
+    chunks = retrieve_for_profile(search_query or query, profile, deadline, llm=False) if query else []
+    if not chunks:
+        yield {"type": "final", "answer": NO_INFO_ANSWER, "answer_mode": "none", "skipped": []}
+        return
+
+    with stage("extractive"):
+        pre = extractive_answer(query, chunks)
+    yield {"type": "pre_answer", "answer": pre}
+
+    if not deadline.allows("generate"):
+        deadline.skip("generate")
+        yield {"type": "final", "answer": pre, "answer_mode": "extractive", "skipped": list(deadline.skipped)}
+        return
+
+    hinted = _with_hint(query, profile)
+    context_text = assemble_context(expand_context(chunks), hinted, history)
+    prompt = _build_answer_prompt(context_text, hinted, history)
+    from google.genai.types import GenerateContentConfig, HttpOptions
+
+    config = GenerateContentConfig(
+        temperature=TEMPERATURE,
+        max_output_tokens=MAX_OUTPUT_TOKENS,
+    )
+    timeout = deadline.timeout_s()
+    if timeout is not None:
+        config.http_options = HttpOptions(timeout=max(1, int(timeout * 1000)))
+
+    parts: List[str] = []
+    last = None
+    t0 = time.perf_counter()
+    try:
+        for piece in client.models.generate_content_stream(
+            model=GEMINI_MODEL_NAME,
+            contents=prompt,
+            config=config,
+        ):
+            last = piece
+            text = piece.text or ""
+            if text:
+                parts.append(text)
+                yield {"type": "delta", "text": text}
+    except Exception as e:
+        record_llm_call(
+            "answer_stream", time.perf_counter() - t0, error=True,
+            prompt_chars=len(prompt), est_prompt_tokens=estimate_tokens(prompt),
+        )
+        logger.warning(f"[RAG] Gemini stream failed, keep extractive answer: {e}")
+        if deadline.expired():
+            deadline.skip("generate")
+        usage = {"calls": 1, "prompt_tokens": estimate_tokens(prompt), "completion_tokens": 0}
+        yield {"type": "final", "answer": pre, "answer_mode": "extractive",
+               "skipped": list(deadline.skipped), "usage": usage}
+        return
+
+    answer = "".join(parts).strip()
+    # usage_metadata ของ chunk สุดท้ายเป็นยอดรวมของทั้ง stream
+    record_llm_call(
+        "answer_stream", time.perf_counter() - t0, last,
+        prompt_chars=len(prompt),
+        est_prompt_tokens=estimate_tokens(prompt),
+        est_completion_tokens=estimate_tokens(answer),
+    )
+    # event final มียอด token ของ call นี้ (stream ไม่มี trace ของ request ให้ QuestionLog อ่าน)
+    meta_usage = getattr(last, "usage_metadata", None)
+    usage = {
+        "calls": 1,
+        "prompt_tokens": getattr(meta_usage, "prompt_token_count", None) or estimate_tokens(prompt),
+        "completion_tokens": getattr(meta_usage, "candidates_token_count", None) or estimate_tokens(answer),
+    }
+    if not answer:
+        yield {"type": "final", "answer": pre, "answer_mode": "extractive",
+               "skipped": list(deadline.skipped), "usage": usage}
+    elif "ไม่พบข้อมูลในระบบ" in answer:
+        yield {"type": "final", "answer": NO_INFO_ANSWER, "answer_mode": "none",
+               "skipped": list(deadline.skipped), "usage": usage}
+    else:
+        yield {"type": "final", "answer": answer, "answer_mode": "llm",
+               "skipped": list(deadline.skipped), "usage": usage}
@@ -0,0 +1,232 @@
+# app/services/remote.py
+"""
+Client ของ model server (app/services/model_server.py) — ใช้ใน API worker เมื่อ MODEL_SERVER_MODE=client
+
+worker ไม่โหลด embedding model / vector store / BM25 index เอง (ไม่ import torch / chromadb)
+→ ทุก worker เรียก process เดียวผ่าน Unix socket:
+  - RemoteEmbedder.encode       (interface แบบ SentenceTransformer)
+  - RemoteVectorStore           (interface แบบ VectorStore ใน app/services/vectorstore.py)
+  - RemoteLexicalIndex.search   (BM25)
+  - ModelServerClient.call      (ฟังก์ชัน ingest ของ rag — รันที่ owner process ทีละงาน)
+
+Protocol (ทั้งสองทาง): header 8 byte (ความยาว JSON, ความยาว payload) + JSON + payload
+numpy array ไม่ถูก serialize เป็น JSON/pickle: JSON มีแค่ dtype/shape/offset
+ส่ง buffer ของ array ตรง ๆ (sendall(memoryview)) และฝั่งรับสร้าง array เป็น view บน buffer ที่รับมา
+(np.frombuffer — ไม่ copy ซ้ำ)
+"""
+
+import json
+import logging
+import socket
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("!II")
+_ALIGN = 16
+
+
+# ============================================================
+# FRAMING
+# ============================================================
+
+def _pack(obj: Any, bufs: List[np.ndarray], offset: List[int]) -> Any:
+    """แทน ndarray ใน obj ด้วย reference ไปยัง payload"""
+    if isinstance(obj, np.ndarray):
+        arr = np.ascontiguousarray(obj)
+        start = offset[0]
+        pad = (-start) % _ALIGN
+        if pad:
+            bufs.append(np.zeros(pad, dtype=np.uint8))
+            start += pad
+        bufs.append(arr)
+        offset[0] = start + arr.nbytes
+        return {"__nd__": start, "dtype": arr.dtype.str, "shape": list(arr.shape)}
+    if isinstance(obj, dict):
+        return {k: _pack(v, bufs, offset) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_pack(v, bufs, offset) for v in obj]
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+
+def _unpack(obj: Any, payload: memoryview) -> Any:
+    if isinstance(obj, dict):
+        if "__nd__" in obj:
+            dtype = np.dtype(obj["dtype"])
+            shape = tuple(obj["shape"])
+            count = int(np.prod(shape)) if shape else 1
+            return np.frombuffer(payload, dtype=dtype, count=count, offset=obj["__nd__"]).reshape(shape)
+        return {k: _unpack(v, payload) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_unpack(v, payload) for v in obj]
+    return obj
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytearray:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = sock.recv_into(view[got:], n - got)
+        if r == 0:
+            raise ConnectionError("model server connection closed")
+        got += r
+    return buf
+
+
+def send_message(sock: socket.socket, obj: Any):
+    bufs: List[np.ndarray] = []
+    offset = [0]
+    head = json.dumps(_pack(obj, bufs, offset), ensure_ascii=False).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(head), offset[0]) + head)
+    for arr in bufs:
+        if arr.nbytes:
+            sock.sendall(memoryview(arr).cast("B"))
+
+
+def recv_message(sock: socket.socket) -> Any:
+    head_len, payload_len = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    head = json.loads(_recv_exact(sock, head_len).decode("utf-8"))
+    payload = memoryview(_recv_exact(sock, payload_len)) if payload_len else memoryview(b"")
+    return _unpack(head, payload)
+
+
+# ============================================================
+# CLIENT
+# ============================================================
+
+class ModelServerError(RuntimeError):
+    pass
+
+
+class ModelServerClient:
+    """connection ต่อ thread (request แต่ละตัววิ่งใน thread ของตัวเอง) — ต่อใหม่อัตโนมัติเมื่อหลุด"""
+
+    def __init__(self, path: str, connect_timeout: float = 60.0):
+        self.path = path
+        self.connect_timeout = connect_timeout
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        deadline = time.monotonic() + self.connect_timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                return sock
+            except OSError as e:
+                sock.close()
+                if time.monotonic() >= deadline:
+                    raise ModelServerError(f"cannot connect to model server at {self.path}: {e}") from e
+                time.sleep(0.2)
+
+    def request(self, op: str, **fields) -> Any:
+        msg = dict(fields, op=op)
+        for attempt in (0, 1):
+            sock = getattr(self._local, "sock", None)
+            fresh = sock is None
+            if fresh:
+                sock = self._local.sock = self._connect()
+            try:
+                send_message(sock, msg)
+                resp = recv_message(sock)
+                break
+            except (ConnectionError, OSError):
+                sock.close()
+                self._local.sock = None
+                # connection เก่าหลุด (server restart) → ลองใหม่ครั้งเดียว; ต่อใหม่แล้วยังพัง → error
+                if fresh or attempt:
+                    raise
+        if not resp.get("ok"):
+            raise ModelServerError(resp.get("error") or "model server error")
+        return resp.get("result")
+
+    def ping(self) -> Dict[str, Any]:
+        return self.request("ping")
+
+    def call(self, fn: str, *args, **kwargs) -> Any:
+        return self.request("call", fn=fn, args=list(args), kwargs=kwargs)
+
+
+class RemoteEmbedder:
+    def __init__(self, client: ModelServerClient):
+        self._client = client
+        info = client.ping()
+        self.embed_backend = info.get("embed_backend")
+        self._dim = info.get("dim")
+
+    def encode(self, sentences, show_progress_bar: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        opts = {k: v for k, v in kwargs.items() if k in ("batch_size", "normalize_embeddings")}
+        vecs = self._client.request("encode", texts=texts, kwargs=opts)
+        return vecs[0] if single else vecs
+
+    def get_sentence_embedding_dimension(self):
+        return self._dim
+
+
+def _as_matrix(embeddings):
+    return None if embeddings is None else np.asarray(embeddings, dtype=np.float32)
+
+
+class RemoteVectorStore:
+    """VectorStore ที่อยู่ใน model server — write ทำที่ owner process ทีละ request"""
+
+    def __init__(self, client: ModelServerClient):
+        self._client = client
+        self.backend = client.ping().get("vector_backend")
+
+    def _store(self, method: str, **kwargs):
+        return self._client.request("store", method=method, kwargs=kwargs)
+
+    def count(self) -> int:
+        return int(self._store("count"))
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+        self._store("upsert", ids=ids, embeddings=_as_matrix(embeddings), documents=documents, metadatas=metadatas)
+
+    def update(self, ids, embeddings=None, documents=None, metadatas=None):
+        self._store("update", ids=ids, embeddings=_as_matrix(embeddings), documents=documents, metadatas=metadatas)
+
+    def delete(self, ids=None, where=None):
+        self._store("delete", ids=ids, where=where)
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None):
+        return self._store("get", ids=ids, where=where, include=include, limit=limit, offset=offset)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        return self._store("query", query_embeddings=_as_matrix(query_embeddings),
+                           n_results=n_results, where=where, include=include)
+
+    @contextmanager
+    def bulk(self) -> Iterator["RemoteVectorStore"]:
+        yield self
+
+
+class RemoteLexicalIndex:
+    def __init__(self, client: ModelServerClient):
+        self._client = client
+
+    def _lexical(self, method: str, *args):
+        return self._client.request("lexical", method=method, args=list(args))
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        return [(cid, float(score)) for cid, score in self._lexical("search", query, k)]
+
+    def upsert_doc(self, doc_id: str, chunk_ids, texts):
+        self._lexical("upsert_doc", doc_id, list(chunk_ids), list(texts))
+
+    def delete_doc(self, doc_id: str):
+        self._lexical("delete_doc", doc_id)
+
+    def __len__(self) -> int:
+        return int(self._lexical("len"))
@@ -0,0 +1,121 @@
+# app/services/singleflight.py
+"""
+Single-flight: รวมคำถามเดียวกันที่เข้ามาพร้อม ๆ กันให้รัน pipeline แค่ครั้งเดียว
+
+- request แรกของ key = leader → รัน fn จริง
+- request ที่ตามมาระหว่างที่ leader ยังรันอยู่ = follower → รอผลของ leader แล้วใช้ร่วมกัน
+- leader error → follower ลองใหม่ 1 ครั้ง (ตัวแรกที่ลองใหม่จะกลายเป็น leader คนใหม่)
+- follower รอนานเกิน wait_timeout → เลิกรอ แล้วรัน fn เอง (ไม่ค้างตาม leader ที่ช้า)
+- shareable(result) เป็นเท็จ (เช่นผลที่ degrade เพราะ deadline ของ leader) → follower รัน fn เอง
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "1") == "1"
+SINGLEFLIGHT_WAIT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_WAIT_TIMEOUT", "30"))
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """coalesce การเรียก fn ที่ key เดียวกันและกำลังรันอยู่ (thread-based)"""
+
+    def __init__(self, wait_timeout: float = SINGLEFLIGHT_WAIT_TIMEOUT):
+        self.wait_timeout = wait_timeout
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "leaders": 0,
+            "coalesced": 0,
+            "leader_errors": 0,
+            "follower_timeouts": 0,
+            "follower_retries": 0,
+            "follower_reruns": 0,
+        }
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        wait_timeout: Optional[float] = None,
+        shareable: Optional[Callable[[Any], bool]] = None,
+        _retry: bool = True,
+    ) -> Tuple[Any, bool]:
+        """คืน (result, shared) — shared=True ถ้าได้ผลมาจาก leader คนอื่น
+
+        wait_timeout: เวลารอ leader สูงสุดของ request นี้ (เช่น deadline ที่เหลือ)
+        shareable: ผลของ leader ที่ follower ใช้ร่วมได้ไหม — False → follower รัน fn เอง
+        """
+        if not SINGLEFLIGHT_ENABLED or not key:
+            return fn(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["leaders"] += 1
+                leader = True
+            else:
+                call.followers += 1
+                leader = False
+
+        if leader:
+            return self._lead(key, call, fn), False
+
+        # ---------- follower ----------
+        timeout = self.wait_timeout if wait_timeout is None else min(self.wait_timeout, wait_timeout)
+        if not call.done.wait(timeout):
+            with self._lock:
+                self._stats["follower_timeouts"] += 1
+            logger.warning(f"[SINGLEFLIGHT] Leader too slow, running own request: {key[:60]}")
+            return fn(), False
+
+        if call.error is not None:
+            if not _retry:
+                raise call.error
+            with self._lock:
+                self._stats["follower_retries"] += 1
+            return self.do(key, fn, wait_timeout=wait_timeout, shareable=shareable, _retry=False)
+
+        if shareable is not None and not shareable(call.result):
+            with self._lock:
+                self._stats["follower_reruns"] += 1
+            return fn(), False
+
+        with self._lock:
+            self._stats["coalesced"] += 1
+        return call.result, True
+
+    def _lead(self, key: str, call: _Call, fn: Callable[[], Any]) -> Any:
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                self._stats["leader_errors"] += 1
+            raise
+        finally:
+            # เอาออกจาก in-flight ก่อนปลุก follower → request ใหม่หลังจากนี้จะเริ่ม flight ใหม่
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            s["inflight"] = len(self._calls)
+        return s
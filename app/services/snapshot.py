@@ -0,0 +1,272 @@
+# app/services/snapshot.py
+"""
+Snapshot ของ vector index (export / import) สำหรับ bootstrap replica ใหม่
+โดยไม่ต้อง copy volume ของ Chroma หรือ re-embed เอกสารทั้งหมด
+
+  python -m app.services.snapshot export data/snapshots/2025-01-06 --dtype float16
+  python -m app.services.snapshot import data/snapshots/2025-01-06 [--replace]
+  python -m app.services.snapshot info data/snapshots/2025-01-06
+
+หรือ VECTOR_SNAPSHOT_PATH=<dir>: vector store ว่างตอนเปิด → import ให้อัตโนมัติ (ดู rag._open_collection)
+
+Format (directory, version 1) — ทุกคอลัมน์เปิดแบบ memory-map ได้ ไม่ต้อง parse ทั้งก้อน:
+  manifest.json          format / version / model / dim / dtype / rows / chunker config / created_at
+  embeddings.npy         (rows, dim) float16 | float32  (np.load(mmap_mode="r"))
+  <col>.offsets.npy      int64 (rows + 1) ตำแหน่งเริ่ม/จบของแต่ละแถวใน <col>.bin
+  <col>.bin              UTF-8 ต่อกัน — col = ids / documents / metadatas (JSON ต่อแถว)
+
+import ไม่ยอมโหลด snapshot ที่สร้างด้วย embedding model อื่น (vector คนละ space)
+chunker config ต่างกันแค่เตือน (chunk เดิมยังใช้ได้ แต่เอกสารที่ ingest ใหม่จะถูกตัดคนละแบบ)
+"""
+
+import argparse
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = "mfu-vector-snapshot"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DTYPES = ("float32", "float16")
+
+_MANIFEST = "manifest.json"
+_EMBEDDINGS = "embeddings.npy"
+_COLUMNS = ("ids", "documents", "metadatas")
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+# ============================================================
+# STRING COLUMNS
+# ============================================================
+
+def _write_column(path: str, name: str, values: List[str]):
+    blobs = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(blobs) + 1, dtype=np.int64)
+    if blobs:
+        np.cumsum([len(b) for b in blobs], out=offsets[1:])
+    np.save(os.path.join(path, f"{name}.offsets.npy"), offsets)
+    with open(os.path.join(path, f"{name}.bin"), "wb") as f:
+        for b in blobs:
+            f.write(b)
+
+
+class _Column:
+    """คอลัมน์ string แบบ memory-mapped: อ่านทีละแถวหรือทีละช่วง"""
+
+    def __init__(self, path: str, name: str):
+        self.offsets = np.load(os.path.join(path, f"{name}.offsets.npy"), mmap_mode="r")
+        bin_path = os.path.join(path, f"{name}.bin")
+        size = os.path.getsize(bin_path)
+        self.data = np.memmap(bin_path, dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def slice(self, lo: int, hi: int) -> List[str]:
+        offs = self.offsets[lo:hi + 1]
+        raw = bytes(self.data[int(offs[0]):int(offs[-1])])
+        base = int(offs[0])
+        return [raw[int(a) - base:int(b) - base].decode("utf-8") for a, b in zip(offs[:-1], offs[1:])]
+
+
+# ============================================================
+# EXPORT / IMPORT
+# ============================================================
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    try:
+        with open(os.path.join(path, _MANIFEST), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        raise SnapshotError(f"no snapshot at {path} (missing {_MANIFEST})")
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"{path} is not a vector snapshot")
+    if int(manifest.get("version", 0)) > SNAPSHOT_VERSION:
+        raise SnapshotError(
+            f"snapshot version {manifest.get('version')} is newer than supported ({SNAPSHOT_VERSION})"
+        )
+    return manifest
+
+
+def export_snapshot(
+    store,
+    path: str,
+    model_name: str,
+    chunker: Optional[Dict[str, Any]] = None,
+    dtype: str = "float16",
+    batch_size: int = 2048,
+) -> Dict[str, Any]:
+    """เขียน chunk ทั้งหมดใน store ลง path (directory ใหม่ หรือว่าง) → manifest"""
+    if dtype not in SNAPSHOT_DTYPES:
+        raise SnapshotError(f"unsupported snapshot dtype: {dtype} (expected {', '.join(SNAPSHOT_DTYPES)})")
+    if os.path.isdir(path) and os.listdir(path):
+        raise SnapshotError(f"{path} is not empty")
+    os.makedirs(path, exist_ok=True)
+
+    total = store.count()
+    ids: List[str] = []
+    docs: List[str] = []
+    metas: List[str] = []
+    emb = None
+    for offset in range(0, total, batch_size):
+        got = store.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset)
+        batch_ids = list(got.get("ids") or [])
+        if not batch_ids:
+            break
+        vecs = np.asarray(got.get("embeddings"), dtype=np.float32)
+        if emb is None:
+            # เขียนตรงลงไฟล์ .npy (ไม่ต้องถือทั้ง matrix ใน RAM)
+            emb = np.lib.format.open_memmap(
+                os.path.join(path, _EMBEDDINGS), mode="w+", dtype=dtype, shape=(total, vecs.shape[1])
+            )
+        emb[len(ids):len(ids) + len(batch_ids)] = vecs.astype(dtype)
+        ids.extend(batch_ids)
+        docs.extend(d or "" for d in (got.get("documents") or [""] * len(batch_ids)))
+        metas.extend(
+            json.dumps(m or {}, ensure_ascii=False, sort_keys=True)
+            for m in (got.get("metadatas") or [{}] * len(batch_ids))
+        )
+    if emb is None:
+        emb = np.lib.format.open_memmap(os.path.join(path, _EMBEDDINGS), mode="w+", dtype=dtype, shape=(0, 0))
+    rows = len(ids)
+    emb.flush()
+    del emb
+    if rows != total:
+        # store เปลี่ยนระหว่าง export — ตัดไฟล์ embeddings ให้ตรงกับจำนวนแถวที่อ่านได้จริง
+        full = np.load(os.path.join(path, _EMBEDDINGS))[:rows]
+        np.save(os.path.join(path, _EMBEDDINGS), full)
+
+    for name, values in zip(_COLUMNS, (ids, docs, metas)):
+        _write_column(path, name, values)
+
+    dim = int(np.load(os.path.join(path, _EMBEDDINGS), mmap_mode="r").shape[1]) if rows else 0
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "model": model_name,
+        "dim": dim,
+        "dtype": dtype,
+        "rows": rows,
+        "chunker": chunker or {},
+        "source_backend": getattr(store, "backend", None),
+    }
+    # เขียน manifest เป็นไฟล์สุดท้าย: snapshot ที่ export ไม่จบจะไม่มี manifest → import ไม่ได้
+    with open(os.path.join(path, _MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    logger.info(f"[SNAPSHOT] exported {rows} chunks ({dtype}) to {path}")
+    return manifest
+
+
+def iter_snapshot(path: str, batch_size: int = 2048) -> Iterator[Tuple[List[str], np.ndarray, List[str], List[dict]]]:
+    """(ids, embeddings float32, documents, metadatas) ทีละ batch"""
+    emb = np.load(os.path.join(path, _EMBEDDINGS), mmap_mode="r")
+    cols = {name: _Column(path, name) for name in _COLUMNS}
+    rows = len(cols["ids"])
+    for lo in range(0, rows, batch_size):
+        hi = min(rows, lo + batch_size)
+        yield (
+            cols["ids"].slice(lo, hi),
+            np.asarray(emb[lo:hi], dtype=np.float32),
+            cols["documents"].slice(lo, hi),
+            [json.loads(m) for m in cols["metadatas"].slice(lo, hi)],
+        )
+
+
+def import_snapshot(
+    store,
+    path: str,
+    model_name: str,
+    chunker: Optional[Dict[str, Any]] = None,
+    lexical=None,
+    replace: bool = False,
+    batch_size: int = 2048,
+) -> Dict[str, Any]:
+    """โหลด snapshot เข้า store (+ rebuild BM25 index ถ้าให้ lexical) → manifest
+
+    store ต้องว่าง เว้นแต่ replace=True (ลบ chunk เดิมทั้งหมดก่อน)
+    """
+    manifest = read_manifest(path)
+    if manifest.get("model") != model_name:
+        raise SnapshotError(
+            f"snapshot was embedded with {manifest.get('model')!r}, this node uses {model_name!r}"
+        )
+    if chunker is not None and manifest.get("chunker") and manifest["chunker"] != chunker:
+        diff = {k: (manifest["chunker"].get(k), v) for k, v in chunker.items() if manifest["chunker"].get(k) != v}
+        logger.warning(f"[SNAPSHOT] chunker config differs (snapshot, node): {diff}")
+
+    existing = store.count()
+    if existing:
+        if not replace:
+            raise SnapshotError(f"vector store already has {existing} chunks (use replace)")
+        old_ids = store.get(include=[]).get("ids") or []
+        for i in range(0, len(old_ids), batch_size):
+            store.delete(ids=old_ids[i:i + batch_size])
+
+    loaded = 0
+    lexical_items: List[Tuple[str, str, str]] = []
+    with store.bulk():
+        for ids, vecs, docs, metas in iter_snapshot(path, batch_size):
+            store.upsert(ids=ids, embeddings=vecs, documents=docs, metadatas=metas)
+            loaded += len(ids)
+            if lexical is not None:
+                lexical_items.extend(
+                    (str(m.get("doc_id") or cid.split("::")[0]), cid, doc)
+                    for cid, doc, m in zip(ids, docs, metas)
+                )
+    if lexical is not None:
+        lexical.rebuild(lexical_items)
+    logger.info(f"[SNAPSHOT] imported {loaded} chunks from {path}")
+    return manifest
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Export / import vector index snapshots")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ex = sub.add_parser("export")
+    ex.add_argument("path")
+    ex.add_argument("--dtype", default="float16", choices=SNAPSHOT_DTYPES)
+    im = sub.add_parser("import")
+    im.add_argument("path")
+    im.add_argument("--replace", action="store_true", help="ลบ chunk เดิมใน vector store ก่อน import")
+    info = sub.add_parser("info")
+    info.add_argument("path")
+    args = ap.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.cmd == "info":
+        print(json.dumps(read_manifest(args.path), ensure_ascii=False, indent=2))
+        return
+
+    # ไม่ใช้ snapshot bootstrap อัตโนมัติตอนเปิด store ในคำสั่งนี้
+    os.environ.pop("VECTOR_SNAPSHOT_PATH", None)
+    from app.services import rag
+
+    if rag.MODEL_SERVER_MODE == "client" and args.cmd == "import":
+        raise SystemExit("import writes the BM25 index too: run it with MODEL_SERVER_MODE=off "
+                         "on the model server host while the model server is stopped")
+
+    if args.cmd == "export":
+        manifest = export_snapshot(rag.collection, args.path, rag.EMBED_MODEL_NAME, rag.chunker_config(), args.dtype)
+    else:
+        manifest = import_snapshot(
+            rag.collection, args.path, rag.EMBED_MODEL_NAME, rag.chunker_config(),
+            lexical=rag.lexical_index, replace=args.replace,
+        )
+    print(json.dumps(manifest, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+# app/services/tokens.py
+"""
+ประมาณจำนวน token ของข้อความ (ไม่เรียก API — ใช้ตอนจัด context ก่อนส่งให้ Gemini)
+
+tokenizer ของ Gemini ตัดภาษาไทยละเอียดกว่าภาษาอังกฤษมาก → นับแยก:
+  ตัวอักษรไทย / TOKEN_THAI_CHARS_PER_TOKEN + ตัวอักษรอื่น / TOKEN_CHARS_PER_TOKEN
+ค่า default ตั้งให้ประมาณเกินเล็กน้อย (budget ไม่หลุด)
+"""
+
+import math
+import os
+import re
+
+TOKEN_CHARS_PER_TOKEN = float(os.getenv("TOKEN_CHARS_PER_TOKEN", "4"))
+TOKEN_THAI_CHARS_PER_TOKEN = float(os.getenv("TOKEN_THAI_CHARS_PER_TOKEN", "2.5"))
+
+_THAI = re.compile(r"[\u0E00-\u0E7F]")
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    thai = len(_THAI.findall(text))
+    other = len(text) - thai
+    return math.ceil(thai / TOKEN_THAI_CHARS_PER_TOKEN + other / TOKEN_CHARS_PER_TOKEN)
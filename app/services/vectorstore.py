@@ -0,0 +1,745 @@
+# app/services/vectorstore.py
+"""
+Vector store ของ chunk (backend สลับได้)
+
+ทุก backend มี API ชุดเดียวกับ Chroma collection ที่ rag.py / RetrieverAgent / eval ใช้อยู่
+(count / upsert / update / delete / get / query และผลลัพธ์ shape เดียวกัน) → เปลี่ยน backend
+ได้โดยไม่ต้องแก้ caller
+
+- ChromaVectorStore: PersistentClient + HNSW (ของเดิม)
+- NumpyVectorStore: exact search บน matrix float32 (normalize แล้ว) ที่ memory-map จากไฟล์ .npy
+  + metadata arrays — corpus หลักหมื่น chunk ค้นแบบ brute force ได้ในระดับ sub-millisecond
+  และไม่ต้องผ่าน SQLite / HNSW ของ Chroma
+
+เลือก backend ด้วย env VECTOR_BACKEND = chroma | numpy | auto
+(auto → ดูผล benchmarks/vector_store.py ถ้ามี ไม่งั้นใช้ numpy เมื่อจำนวน chunk ไม่เกิน VECTOR_NUMPY_MAX_ROWS)
+"""
+
+import json
+import logging
+import math
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Protocol, Sequence
+
+import numpy as np
+
+from app.services.quantize import check_dtype, dequantize, quantize, scores as quantized_scores
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "uni_docs"
+
+
+class VectorStore(Protocol):
+    """subset ของ Chroma Collection API ที่ใช้ในโปรเจกต์"""
+
+    backend: str
+
+    def count(self) -> int: ...
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None) -> None: ...
+
+    def update(self, ids, embeddings=None, documents=None, metadatas=None) -> None: ...
+
+    def delete(self, ids=None, where=None) -> None: ...
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None) -> Dict[str, Any]: ...
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None) -> Dict[str, Any]: ...
+
+
+# ============================================================
+# CHROMA
+# ============================================================
+
+class ChromaVectorStore:
+    """wrap Chroma collection (hnsw:space=cosine)"""
+
+    backend = "chroma"
+
+    def __init__(self, path: Optional[str] = None, name: str = COLLECTION_NAME, collection=None):
+        if collection is None:
+            from chromadb import EphemeralClient, PersistentClient
+            from chromadb.config import Settings
+
+            settings = Settings(anonymized_telemetry=False)
+            client = PersistentClient(path=path, settings=settings) if path else EphemeralClient(settings=settings)
+            collection = client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
+        self.path = path
+        self.collection = collection
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def update(self, ids, embeddings=None, documents=None, metadatas=None):
+        self.collection.update(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids=None, where=None):
+        self.collection.delete(ids=ids, where=where)
+
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None):
+        kwargs = {"ids": ids, "where": where, "limit": limit, "offset": offset}
+        if include is not None:
+            kwargs["include"] = include
+        return self.collection.get(**kwargs)
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        kwargs = {"query_embeddings": query_embeddings, "n_results": n_results, "where": where}
+        if include is not None:
+            kwargs["include"] = include
+        return self.collection.query(**kwargs)
+
+    @contextmanager
+    def bulk(self) -> Iterator["ChromaVectorStore"]:
+        yield self
+
+
+# ============================================================
+# NUMPY (memory-mapped exact search)
+# ============================================================
+
+_EMB_FILE = "embeddings.npy"
+_QUANT_FILES = {"float16": "embeddings.f16.npy", "int8": "embeddings.i8.npy"}
+_SCALE_FILE = "scales.npy"
+_META_FILE = "meta.json"
+_MIN_CAPACITY = 1024
+
+
+class _Rows:
+    """array (capacity × ...) บนไฟล์ .npy แบบ memory-mapped (path=None → in-memory) ขยายทีละ 2 เท่า"""
+
+    def __init__(self, path: Optional[str], dtype, tail: tuple):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.tail = tail
+        self.arr: Optional[np.ndarray] = None
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self.arr is None else self.arr.shape[0]
+
+    def load(self) -> bool:
+        if not self.path or not os.path.exists(self.path):
+            return False
+        self.arr = np.load(self.path, mmap_mode="r+")
+        return True
+
+    def ensure(self, rows: int):
+        cap = self.capacity
+        if rows <= cap:
+            return
+        new_cap = max(_MIN_CAPACITY, cap * 2)
+        while new_cap < rows:
+            new_cap *= 2
+        shape = (new_cap,) + self.tail
+        if self.path:
+            # เขียนไฟล์ใหม่แล้ว replace → process อื่นที่ map ไฟล์เก่าอยู่ยังอ่านได้จน reload
+            tmp = f"{self.path}.tmp{os.getpid()}"
+            grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=self.dtype, shape=shape)
+            if cap:
+                grown[:cap] = self.arr[:cap]
+            grown.flush()
+            del grown
+            os.replace(tmp, self.path)
+            self.arr = np.load(self.path, mmap_mode="r+")
+        else:
+            grown = np.zeros(shape, dtype=self.dtype)
+            if cap:
+                grown[:cap] = self.arr[:cap]
+            self.arr = grown
+
+    def flush(self):
+        if isinstance(self.arr, np.memmap):
+            self.arr.flush()
+
+    def nbytes(self, rows: int) -> int:
+        return 0 if self.arr is None else int(self.arr[:rows].nbytes)
+
+    def remove(self):
+        self.arr = None
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class _Column:
+    """metadata key หนึ่งตัวในรูป code (int32) ต่อ slot → filter ด้วย numpy แทน loop ทีละ dict"""
+
+    def __init__(self, values: Sequence[Any]):
+        self.lookup: Dict[Any, int] = {}
+        codes = np.empty(len(values), dtype=np.int32)
+        for i, v in enumerate(values):
+            key = _hashable(v)
+            code = self.lookup.get(key)
+            if code is None:
+                code = self.lookup[key] = len(self.lookup)
+            codes[i] = code
+        self.codes = codes
+        self._numeric: Optional[np.ndarray] = None
+        self._values = values
+
+    def isin(self, values: Sequence[Any]) -> np.ndarray:
+        wanted = [self.lookup[k] for k in (_hashable(v) for v in values) if k in self.lookup]
+        if not wanted:
+            return np.zeros(len(self.codes), dtype=bool)
+        return np.isin(self.codes, np.asarray(wanted, dtype=np.int32))
+
+    def numeric(self) -> np.ndarray:
+        if self._numeric is None:
+            self._numeric = np.array(
+                [float(v) if isinstance(v, (int, float)) and not isinstance(v, bool) else math.nan for v in self._values],
+                dtype=np.float64,
+            )
+        return self._numeric
+
+
+def _hashable(v: Any) -> Any:
+    # แยก True กับ 1 ออกจากกัน (dict key ของ Python ถือว่าเท่ากัน)
+    return (type(v).__name__, v) if isinstance(v, bool) else v
+
+
+class NumpyVectorStore:
+    """exact cosine search บน matrix ที่ memory-map จาก `<path>/embeddings.npy`
+
+    - embedding ถูก normalize ตอนเขียน → query = matmul ครั้งเดียว + argpartition
+    - slot ที่ถูกลบถูกนำกลับมาใช้ใหม่, upsert id เดิมเขียนทับแถวเดิมใน mmap (ไม่ต้องเขียนไฟล์ใหม่ทั้งไฟล์)
+    - ไฟล์ .npy จองความจุไว้ล่วงหน้า (ขยายทีละ 2 เท่า)
+    - ids / documents / metadatas เก็บใน meta.json (เขียนแบบ atomic หลัง embedding)
+      process อื่น (uvicorn worker) reload เมื่อ mtime ของ meta.json เปลี่ยน
+    - path=None → in-memory (ใช้ใน benchmark / eval)
+
+    dtype = float16 / int8 (VECTOR_DTYPE): scan รอบแรกด้วย matrix ที่ quantize แล้ว (เล็กกว่า 2-4 เท่า)
+    → rescore candidate rescore_factor × k อันดับแรกด้วย float32 แล้วตัดเหลือ k
+    keep_float32=False: ไม่เก็บ float32 เลย (ประหยัด disk ด้วย) — rescore จากค่าที่ dequantize
+    keep_float32=True: ไฟล์ float32 ยังอยู่บน disk แต่ถูกอ่านเฉพาะแถวที่ rescore (ไม่ค้างใน RAM)
+    """
+
+    backend = "numpy"
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        dim: Optional[int] = None,
+        dtype: str = "float32",
+        keep_float32: bool = True,
+        rescore_factor: int = 4,
+    ):
+        self.path = path
+        self.dim = dim
+        self.dtype = check_dtype(dtype)
+        self.keep_float32 = keep_float32 or self.dtype == "float32"
+        self.rescore_factor = max(1, rescore_factor)
+        self._lock = threading.RLock()
+        self._f32: Optional[_Rows] = None            # capacity × dim (float32)
+        self._qv: Optional[_Rows] = None             # capacity × dim (float16 / int8)
+        self._scales: Optional[_Rows] = None         # capacity (int8)
+        self._ids: List[Optional[str]] = []          # slot → id (None = ว่าง)
+        self._docs: List[Optional[str]] = []
+        self._metas: List[Dict[str, Any]] = []
+        self._slot: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._columns: Dict[str, _Column] = {}
+        self._alive: Optional[np.ndarray] = None
+        self._mtime = 0.0
+        self._bulk = 0
+        self._dirty = False
+        if path:
+            os.makedirs(path, exist_ok=True)
+        if dim is not None:
+            self._init_matrices(dim)
+        if path:
+            self._load()
+            if self._dirty:
+                # เปลี่ยน dtype / ทิ้ง float32 ตอนเปิด → บันทึก meta ให้ตรงกับไฟล์
+                self.save()
+
+    # ------------------------------------------------------------
+    # persistence
+    # ------------------------------------------------------------
+    def _file(self, name: str) -> Optional[str]:
+        return os.path.join(self.path, name) if self.path else None
+
+    def _init_matrices(self, dim: int):
+        self.dim = int(dim)
+        self._f32 = _Rows(self._file(_EMB_FILE), np.float32, (self.dim,)) if self.keep_float32 else None
+        self._qv = self._scales = None
+        if self.dtype != "float32":
+            qdtype = np.float16 if self.dtype == "float16" else np.int8
+            self._qv = _Rows(self._file(_QUANT_FILES[self.dtype]), qdtype, (self.dim,))
+            if self.dtype == "int8":
+                self._scales = _Rows(self._file(_SCALE_FILE), np.float32, ())
+
+    def _matrices(self) -> List[_Rows]:
+        return [m for m in (self._f32, self._qv, self._scales) if m is not None]
+
+    def _load(self):
+        meta_path = self._file(_META_FILE)
+        if not os.path.exists(meta_path):
+            return
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._load_matrices(data)
+        except Exception as e:
+            logger.warning(f"[VECTOR] cannot load {self.path}: {e}")
+            return
+        self._ids = data["ids"]
+        self._docs = data["documents"]
+        self._metas = [m or {} for m in data["metadatas"]]
+        self._slot = {cid: i for i, cid in enumerate(self._ids) if cid is not None}
+        self._free = [i for i, cid in enumerate(self._ids) if cid is None]
+        self._invalidate()
+        self._mtime = os.path.getmtime(meta_path)
+
+    def _load_matrices(self, data: Dict[str, Any]):
+        stored_dtype = data.get("dtype", "float32")
+        has_f32 = data.get("float32", True) and os.path.exists(self._file(_EMB_FILE))
+        if stored_dtype != self.dtype and not has_f32:
+            # ไม่มี float32 ให้ quantize ใหม่ → ใช้ dtype เดิมของ store
+            logger.warning(f"[VECTOR] {self.path} stored as {stored_dtype} without float32; keep {stored_dtype}")
+            self.dtype = stored_dtype
+        if self.keep_float32 and not has_f32:
+            logger.warning(f"[VECTOR] {self.path} has no float32 copy; rescoring uses dequantized vectors")
+            self.keep_float32 = False
+
+        want_f32 = self.keep_float32
+        self.keep_float32 = True if has_f32 else want_f32
+        self._init_matrices(data["dim"])
+        for m in self._matrices():
+            m.load()
+
+        rows = len(data["ids"])
+        if stored_dtype != self.dtype and self._qv is not None:
+            # เปลี่ยน VECTOR_DTYPE → quantize ใหม่จาก float32
+            self._requantize(rows)
+            self._dirty = True
+        if has_f32 and not want_f32:
+            # VECTOR_KEEP_FLOAT32=0 → ทิ้งไฟล์ float32 หลังมีค่าที่ quantize แล้ว
+            if self._qv is not None and self._qv.arr is None:
+                self._requantize(rows)
+            self._f32.remove()
+            self._f32 = None
+            self.keep_float32 = False
+            self._dirty = True
+
+    def _requantize(self, rows: int):
+        self._qv.ensure(max(rows, 1))
+        if self._scales is not None:
+            self._scales.ensure(max(rows, 1))
+        for i in range(0, rows, 8192):
+            q, sc = quantize(self._f32.arr[i:i + 8192], self.dtype)
+            self._qv.arr[i:i + len(q)] = q
+            if sc is not None:
+                self._scales.arr[i:i + len(q)] = sc
+        logger.info(f"[VECTOR] quantized {rows} vectors to {self.dtype}")
+
+    def _maybe_reload(self):
+        if not self.path or self._bulk or self._dirty:
+            return
+        try:
+            mtime = os.path.getmtime(self._file(_META_FILE))
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._load()
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            for m in self._matrices():
+                m.flush()
+            data = {
+                "version": 1,
+                "dim": self.dim,
+                "dtype": self.dtype,
+                "float32": self._f32 is not None,
+                "ids": self._ids,
+                "documents": self._docs,
+                "metadatas": self._metas,
+            }
+            meta_path = self._file(_META_FILE)
+            tmp = f"{meta_path}.tmp{os.getpid()}"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, meta_path)
+            self._mtime = os.path.getmtime(meta_path)
+            self._dirty = False
+
+    def _changed(self):
+        self._invalidate()
+        self._dirty = True
+        if not self._bulk:
+            self.save()
+
+    @contextmanager
+    def bulk(self) -> Iterator["NumpyVectorStore"]:
+        """upsert/ลบหลายเอกสารแล้ว save ครั้งเดียวตอนจบ"""
+        with self._lock:
+            self._bulk += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._bulk -= 1
+                if not self._bulk and self._dirty:
+                    self.save()
+
+    def _invalidate(self):
+        self._columns = {}
+        self._alive = None
+
+    def _ensure_capacity(self, rows: int):
+        for m in self._matrices():
+            m.ensure(rows)
+
+    def _write_rows(self, slots: List[int], vecs: np.ndarray):
+        if self._f32 is not None:
+            self._f32.arr[slots] = vecs
+        if self._qv is not None:
+            q, sc = quantize(vecs, self.dtype)
+            self._qv.arr[slots] = q
+            if sc is not None:
+                self._scales.arr[slots] = sc
+
+    def _float32_rows(self, slots) -> np.ndarray:
+        if self._f32 is not None:
+            return np.asarray(self._f32.arr[slots], dtype=np.float32)
+        sc = self._scales.arr[slots] if self._scales is not None else None
+        return dequantize(self._qv.arr[slots], sc)
+
+    def memory_bytes(self) -> Dict[str, int]:
+        """ขนาดของ matrix ที่ใช้ scan (ต้องอยู่ใน RAM) และที่ใช้เฉพาะตอน rescore"""
+        n = len(self._ids)
+        scan = self._qv if self._qv is not None else self._f32
+        out = {"scan": scan.nbytes(n) if scan else 0}
+        if self._scales is not None:
+            out["scan"] += self._scales.nbytes(n)
+        if self._qv is not None and self._f32 is not None:
+            out["rescore"] = self._f32.nbytes(n)
+        return out
+
+    # ------------------------------------------------------------
+    # write
+    # ------------------------------------------------------------
+    @staticmethod
+    def _normalized(embeddings) -> np.ndarray:
+        m = np.asarray(embeddings, dtype=np.float32)
+        if m.ndim == 1:
+            m = m[None, :]
+        norms = np.linalg.norm(m, axis=1, keepdims=True)
+        return m / np.maximum(norms, 1e-12)
+
+    def count(self) -> int:
+        with self._lock:
+            self._maybe_reload()
+            return len(self._slot)
+
+    def upsert(self, ids, embeddings=None, documents=None, metadatas=None):
+        if not ids:
+            return
+        if embeddings is None:
+            raise ValueError("NumpyVectorStore.upsert requires embeddings")
+        vecs = self._normalized(embeddings)
+        with self._lock:
+            self._maybe_reload()
+            if self.dim is None:
+                self._init_matrices(int(vecs.shape[1]))
+            elif vecs.shape[1] != self.dim:
+                raise ValueError(f"embedding dim {vecs.shape[1]} != store dim {self.dim}")
+
+            new = sum(1 for cid in ids if cid not in self._slot)
+            reuse = min(new, len(self._free))
+            self._ensure_capacity(len(self._ids) + new - reuse)
+
+            slots = []
+            for i, cid in enumerate(ids):
+                slot = self._slot.get(cid)
+                if slot is None:
+                    if self._free:
+                        slot = self._free.pop()
+                    else:
+                        slot = len(self._ids)
+                        self._ids.append(None)
+                        self._docs.append(None)
+                        self._metas.append({})
+                    self._slot[cid] = slot
+                    self._ids[slot] = cid
+                slots.append(slot)
+                self._docs[slot] = documents[i] if documents is not None else None
+                self._metas[slot] = dict(metadatas[i] or {}) if metadatas is not None else {}
+            self._write_rows(slots, vecs)
+            self._changed()
+
+    add = upsert
+
+    def update(self, ids, embeddings=None, documents=None, metadatas=None):
+        vecs = self._normalized(embeddings) if embeddings is not None else None
+        with self._lock:
+            self._maybe_reload()
+            for i, cid in enumerate(ids):
+                slot = self._slot.get(cid)
+                if slot is None:
+                    continue
+                if vecs is not None:
+                    self._write_rows([slot], vecs[i:i + 1])
+                if documents is not None:
+                    self._docs[slot] = documents[i]
+                if metadatas is not None:
+                    self._metas[slot] = dict(metadatas[i] or {})
+            self._changed()
+
+    def delete(self, ids=None, where=None):
+        with self._lock:
+            self._maybe_reload()
+            slots = set()
+            if ids:
+                slots.update(self._slot[cid] for cid in ids if cid in self._slot)
+            if where:
+                slots.update(int(s) for s in np.flatnonzero(self._mask(where)))
+            if not slots:
+                return
+            for slot in slots:
+                self._slot.pop(self._ids[slot], None)
+                self._ids[slot] = None
+                self._docs[slot] = None
+                self._metas[slot] = {}
+                self._free.append(slot)
+            self._changed()
+
+    # ------------------------------------------------------------
+    # filter
+    # ------------------------------------------------------------
+    def _alive_mask(self) -> np.ndarray:
+        if self._alive is None:
+            self._alive = np.fromiter((cid is not None for cid in self._ids), dtype=bool, count=len(self._ids))
+        return self._alive
+
+    def _column(self, key: str) -> _Column:
+        col = self._columns.get(key)
+        if col is None:
+            col = self._columns[key] = _Column([m.get(key) for m in self._metas])
+        return col
+
+    def _mask(self, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        """where แบบ Chroma: {"k": v}, {"k": {"$eq|$ne|$in|$nin|$gt|$gte|$lt|$lte": ...}}, {"$and"|"$or": [...]}"""
+        mask = self._alive_mask().copy()
+        if not where:
+            return mask
+        for key, cond in where.items():
+            if key == "$and":
+                for sub in cond:
+                    mask &= self._mask(sub)
+            elif key == "$or":
+                anym = np.zeros_like(mask)
+                for sub in cond:
+                    anym |= self._mask(sub)
+                mask &= anym
+            else:
+                mask &= self._cond(key, cond if isinstance(cond, dict) else {"$eq": cond})
+        return mask
+
+    def _cond(self, key: str, cond: Dict[str, Any]) -> np.ndarray:
+        col = self._column(key)
+        out = np.ones(len(self._ids), dtype=bool)
+        for op, val in cond.items():
+            if op == "$eq":
+                out &= col.isin([val])
+            elif op == "$ne":
+                out &= ~col.isin([val])
+            elif op == "$in":
+                out &= col.isin(val)
+            elif op == "$nin":
+                out &= ~col.isin(val)
+            elif op in ("$gt", "$gte", "$lt", "$lte"):
+                num = col.numeric()
+                with np.errstate(invalid="ignore"):
+                    out &= {
+                        "$gt": num > val, "$gte": num >= val, "$lt": num < val, "$lte": num <= val,
+                    }[op]
+            else:
+                raise ValueError(f"unsupported where operator: {op}")
+        return out
+
+    # ------------------------------------------------------------
+    # read
+    # ------------------------------------------------------------
+    def get(self, ids=None, where=None, include=None, limit=None, offset=None):
+        include = ["documents", "metadatas"] if include is None else include
+        with self._lock:
+            self._maybe_reload()
+            if ids is not None:
+                mask = self._mask(where)
+                slots = [self._slot[cid] for cid in ids if cid in self._slot and mask[self._slot[cid]]]
+            else:
+                slots = [int(s) for s in np.flatnonzero(self._mask(where))]
+            if offset:
+                slots = slots[offset:]
+            if limit:
+                slots = slots[:limit]
+            return self._rows(slots, include)
+
+    def _rows(self, slots: List[int], include: Sequence[str]) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"ids": [self._ids[s] for s in slots]}
+        if "documents" in include:
+            out["documents"] = [self._docs[s] for s in slots]
+        if "metadatas" in include:
+            out["metadatas"] = [dict(self._metas[s]) for s in slots]
+        if "embeddings" in include:
+            out["embeddings"] = self._float32_rows(slots) if slots else np.zeros((0, self.dim or 0), np.float32)
+        return out
+
+    def query(self, query_embeddings, n_results=10, where=None, include=None):
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        qs = self._normalized(query_embeddings)
+        with self._lock:
+            self._maybe_reload()
+            results: Dict[str, List[Any]] = {"ids": []}
+            for key in ("documents", "metadatas", "distances", "embeddings"):
+                if key in include:
+                    results[key] = []
+
+            n = len(self._ids)
+            mask = self._mask(where) if n else np.zeros(0, dtype=bool)
+            candidates = np.flatnonzero(mask)
+            k = min(int(n_results), len(candidates))
+            if k == 0:
+                for key in results:
+                    results[key] = [[] for _ in range(len(qs))]
+                return results
+
+            for qv in qs:
+                slots, sims = self._search(qv, candidates, n, k)
+                got = self._rows(slots, include)
+                results["ids"].append(got["ids"])
+                if "documents" in include:
+                    results["documents"].append(got["documents"])
+                if "metadatas" in include:
+                    results["metadatas"].append(got["metadatas"])
+                if "embeddings" in include:
+                    results["embeddings"].append(got["embeddings"])
+                if "distances" in include:
+                    # cosine distance แบบเดียวกับ hnsw:space=cosine ของ Chroma
+                    results["distances"].append([float(1.0 - x) for x in sims])
+            return results
+
+    @staticmethod
+    def _top(row: np.ndarray, k: int) -> np.ndarray:
+        top = np.argpartition(-row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+        return top[np.argsort(-row[top])]
+
+    def _search(self, qv: np.ndarray, candidates: np.ndarray, n: int, k: int):
+        """คืน (slots, cosine) ของ k อันดับแรก"""
+        whole = len(candidates) == n
+        if self._qv is None:
+            # float32: matmul กับ matrix ต่อเนื่องเมื่อไม่มี filter (เร็วกว่า fancy index)
+            row = self._f32.arr[:n] @ qv if whole else self._f32.arr[candidates] @ qv
+            top = self._top(row, k)
+            slots = top if whole else candidates[top]
+            return [int(s) for s in slots], row[top]
+
+        # รอบแรก: scan ค่าที่ quantize แล้ว
+        qm = self._qv.arr[:n] if whole else self._qv.arr[candidates]
+        sc = None
+        if self._scales is not None:
+            sc = self._scales.arr[:n] if whole else self._scales.arr[candidates]
+        approx = quantized_scores(qm, sc, qv)
+        pool = self._top(approx, min(len(approx), k * self.rescore_factor))
+        pool_slots = pool if whole else candidates[pool]
+        # รอบสอง: rescore ด้วย float32 (อ่านเฉพาะแถวที่เป็น candidate)
+        exact = self._float32_rows(np.sort(pool_slots))
+        order = np.argsort(pool_slots)
+        sims = np.empty(len(pool_slots), dtype=np.float32)
+        sims[order] = exact @ qv
+        top = self._top(sims, k)
+        return [int(s) for s in pool_slots[top]], sims[top]
+
+
+# ============================================================
+# BACKEND SELECTION
+# ============================================================
+
+def _chroma_row_count(path: str) -> int:
+    try:
+        return ChromaVectorStore(path).count()
+    except Exception as e:
+        logger.warning(f"[VECTOR] cannot open Chroma at {path}: {e}")
+        return 0
+
+
+def _numpy_max_rows(choice_file: Optional[str], default: int) -> int:
+    """อ่าน crossover จากผล benchmarks/vector_store.py (--write-choice) ถ้ามี"""
+    if choice_file and os.path.exists(choice_file):
+        try:
+            with open(choice_file, "r", encoding="utf-8") as f:
+                return int(json.load(f)["numpy_max_rows"])
+        except Exception as e:
+            logger.warning(f"[VECTOR] ignore invalid {choice_file}: {e}")
+    return default
+
+
+def copy_store(src, dst, batch_size: int = 512) -> int:
+    """คัดลอก chunk ทั้งหมด (พร้อม embedding) จาก store หนึ่งไปอีก store — ไม่ต้อง re-embed"""
+    got = src.get(include=["documents", "metadatas", "embeddings"])
+    ids = got.get("ids") or []
+    embs = got.get("embeddings")
+    with dst.bulk():
+        for i in range(0, len(ids), batch_size):
+            dst.upsert(
+                ids=ids[i:i + batch_size],
+                embeddings=[list(map(float, e)) for e in embs[i:i + batch_size]],
+                documents=(got.get("documents") or [])[i:i + batch_size],
+                metadatas=(got.get("metadatas") or [])[i:i + batch_size],
+            )
+    return len(ids)
+
+
+def open_vector_store(
+    backend: str,
+    chroma_path: str,
+    numpy_path: str,
+    numpy_max_rows: int = 200_000,
+    choice_file: Optional[str] = None,
+    numpy_options: Optional[Dict[str, Any]] = None,
+):
+    """เปิด vector store ตาม VECTOR_BACKEND
+
+    auto:
+      - numpy store มีข้อมูลอยู่แล้ว → ใช้ numpy (ข้อมูลอยู่ที่นี่ — เกิน crossover แค่เตือน)
+      - ไม่งั้นดูจำนวน chunk ใน Chroma: ไม่เกิน crossover → คัดลอกเข้า numpy store แล้วใช้ numpy
+      - เกิน → Chroma (HNSW)
+    """
+    numpy_options = numpy_options or {}
+    backend = (backend or "chroma").lower()
+    if backend == "chroma":
+        if numpy_options.get("dtype", "float32") != "float32":
+            logger.warning("[VECTOR] VECTOR_DTYPE applies to the numpy backend only; Chroma stores float32")
+        return ChromaVectorStore(chroma_path)
+    if backend == "numpy":
+        return NumpyVectorStore(numpy_path, **numpy_options)
+    if backend != "auto":
+        raise ValueError(f"unknown VECTOR_BACKEND: {backend}")
+
+    max_rows = _numpy_max_rows(choice_file, numpy_max_rows)
+    store = NumpyVectorStore(numpy_path, **numpy_options)
+    rows = store.count()
+    if rows:
+        if rows > max_rows:
+            logger.warning(
+                f"[VECTOR] numpy store has {rows} chunks (> {max_rows}); "
+                f"consider VECTOR_BACKEND=chroma"
+            )
+        return store
+
+    chroma_has_data = os.path.exists(os.path.join(chroma_path, "chroma.sqlite3"))
+    chroma_rows = _chroma_row_count(chroma_path) if chroma_has_data else 0
+    if chroma_rows > max_rows:
+        return ChromaVectorStore(chroma_path)
+    if chroma_rows:
+        n = copy_store(ChromaVectorStore(chroma_path), store)
+        logger.info(f"[VECTOR] copied {n} chunks from Chroma into numpy store at {numpy_path}")
+    return store
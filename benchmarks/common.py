@@ -0,0 +1,219 @@
+# benchmarks/common.py
+"""
+helper ที่ใช้ร่วมกันระหว่าง benchmark / replay
+
+- percentile / summarize latency
+- HTTP client เล็ก ๆ (urllib, ไม่ต้องลง lib เพิ่ม)
+- spawn backend (uvicorn) ใน subprocess พร้อม env ที่ชี้ไปยัง fake Gemini + DB/Chroma ชั่วคราว
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_ADMIN_TOKEN = "bench-admin-token"
+
+
+# ============================================================
+# STATS
+# ============================================================
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """nearest-rank percentile (p = 0..100)"""
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    k = max(0, min(len(xs) - 1, int(round(p / 100.0 * len(xs) + 0.5)) - 1))
+    return float(xs[k])
+
+
+def summarize(latencies_ms: Sequence[float]) -> Dict[str, float]:
+    if not latencies_ms:
+        return {"count": 0}
+    return {
+        "count": len(latencies_ms),
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 2),
+        "p50_ms": round(percentile(latencies_ms, 50), 2),
+        "p95_ms": round(percentile(latencies_ms, 95), 2),
+        "p99_ms": round(percentile(latencies_ms, 99), 2),
+        "max_ms": round(max(latencies_ms), 2),
+    }
+
+
+def run_meta(extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """ข้อมูลประกอบผล benchmark (commit, เวลา, env knobs ที่มีผลกับ latency)"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR, capture_output=True, text=True, timeout=10,
+        ).stdout.strip()
+    except Exception:
+        commit = ""
+    knobs = {
+        k: v for k, v in os.environ.items()
+        if k.startswith(("TOP_K", "RERANK", "SIM_", "CHUNK", "ANSWER_CACHE", "SINGLEFLIGHT",
+                         "CHAT_DEADLINE", "EMBED_", "ENABLE_", "EXTRACTIVE", "VECTOR_"))
+    }
+    meta = {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "env": knobs,
+    }
+    meta.update(extra or {})
+    return meta
+
+
+def write_json(path: Optional[str], payload: Dict[str, Any]):
+    text = json.dumps(payload, ensure_ascii=False, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"[BENCH] wrote {path}", flush=True)
+    else:
+        print(text)
+
+
+# ============================================================
+# HTTP
+# ============================================================
+
+def http_json(
+    method: str,
+    url: str,
+    payload: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 120.0,
+) -> Tuple[int, Any]:
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else None
+    req = urllib.request.Request(url, data=data, method=method)
+    req.add_header("Content-Type", "application/json")
+    for k, v in (headers or {}).items():
+        req.add_header(k, v)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            body = resp.read()
+            return resp.status, json.loads(body) if body else None
+    except urllib.error.HTTPError as e:
+        try:
+            return e.code, json.loads(e.read() or b"null")
+        except ValueError:
+            return e.code, None
+
+
+def http_multipart(
+    url: str,
+    field: str,
+    filename: str,
+    content: bytes,
+    content_type: str = "application/pdf",
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 300.0,
+) -> Tuple[int, Any]:
+    boundary = f"----mfubench{int(time.time() * 1000)}"
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode("utf-8") + content + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    req = urllib.request.Request(url, data=body, method="POST")
+    req.add_header("Content-Type", f"multipart/form-data; boundary={boundary}")
+    for k, v in (headers or {}).items():
+        req.add_header(k, v)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def wait_healthy(base_url: str, timeout_s: float = 300.0):
+    t_end = time.time() + timeout_s
+    while time.time() < t_end:
+        try:
+            status, _ = http_json("GET", f"{base_url}/health", timeout=5)
+            if status == 200:
+                return
+        except Exception:
+            pass
+        time.sleep(1.0)
+    raise RuntimeError(f"backend at {base_url} did not become healthy in {timeout_s:.0f}s")
+
+
+# ============================================================
+# BACKEND SUBPROCESS
+# ============================================================
+
+def bench_env(workdir: str, gemini_url: Optional[str], database_url: Optional[str] = None) -> Dict[str, str]:
+    """env ของ backend ที่แยกจากของจริง: SQLite + Chroma ใน workdir, Gemini ชี้ไปที่ fake"""
+    env = dict(os.environ)
+    if database_url:
+        env["DATABASE_URL"] = database_url
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    env.setdefault("CHROMA_DIR", os.path.join(workdir, "chroma"))
+    env["ADMIN_TOKEN"] = BENCH_ADMIN_TOKEN
+    if gemini_url:
+        env["GEMINI_BASE_URL"] = gemini_url
+        env.setdefault("GEMINI_API_KEY", "fake-key")
+    env["PYTHONPATH"] = ROOT_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+@contextmanager
+def backend_process(
+    workdir: str,
+    gemini_url: Optional[str],
+    port: int = 8765,
+    workers: int = 1,
+    database_url: Optional[str] = None,
+) -> Iterator[str]:
+    """รัน uvicorn app.main:app ใน subprocess แล้ว yield base_url"""
+    env = bench_env(workdir, gemini_url, database_url=database_url)
+    log_path = os.path.join(workdir, "backend.log")
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app",
+             "--host", "127.0.0.1", "--port", str(port),
+             "--workers", str(workers), "--log-level", "warning"],
+            cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            wait_healthy(base_url)
+            yield base_url
+        except Exception:
+            print(f"[BENCH] backend failed, see {log_path}", flush=True)
+            raise
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def admin_headers() -> Dict[str, str]:
+    return {"X-API-Key": os.getenv("ADMIN_TOKEN", BENCH_ADMIN_TOKEN)}
+
+
+def ingest_docs(base_url: str, docs: List[Any]) -> Dict[str, int]:
+    """เพิ่มเอกสารสังเคราะห์ผ่าน admin API → คืน {doc.key: doc_id ใน DB}"""
+    ids: Dict[str, int] = {}
+    for d in docs:
+        status, body = http_json(
+            "POST", f"{base_url}/admin/documents",
+            {"title": d.title, "content": d.content, "updated_by": "benchmark"},
+            headers=admin_headers(),
+        )
+        if status != 200:
+            raise RuntimeError(f"ingest failed ({status}): {body}")
+        ids[d.key] = int(body["id"])
+    return ids
@@ -0,0 +1,123 @@
+# benchmarks/corpus.py
+"""
+Synthetic Thai corpus สำหรับ benchmark
+
+สร้างเอกสารแนวระเบียบ/ประกาศของมหาวิทยาลัย (ภาษาไทย) แบบ deterministic ตาม seed
+พร้อมคำถามที่รู้คำตอบว่าอยู่ในเอกสารไหน (ใช้วัด retrieval ได้ด้วย)
+
+- ระเบียบ: "ข้อ 1 ... ข้อ N" + เลขที่ประกาศ
+- รายวิชา: รหัสวิชา 7 หลัก, หน่วยกิต, วิชาบังคับก่อน
+- ค่าธรรมเนียม / หอพัก / ปฏิทินการศึกษา
+"""
+
+import random
+from dataclasses import dataclass
+from typing import List, Tuple
+
+_FACULTIES = [
+    "สำนักวิชาเทคโนโลยีสารสนเทศ", "สำนักวิชาการจัดการ", "สำนักวิชาวิทยาศาสตร์",
+    "สำนักวิชาพยาบาลศาสตร์", "สำนักวิชาศิลปศาสตร์", "สำนักวิชานิติศาสตร์",
+    "สำนักวิชาอุตสาหกรรมเกษตร", "สำนักวิชาจีนวิทยา",
+]
+_TOPICS = [
+    ("การแต่งกายของนักศึกษา", "regulation", ["เครื่องแบบ", "รองเท้า", "เข็มขัด", "บัตรนักศึกษา"]),
+    ("วินัยนักศึกษา", "regulation", ["การลงโทษ", "ภาคทัณฑ์", "ตัดคะแนนความประพฤติ", "พักการศึกษา"]),
+    ("การวัดและประเมินผล", "academic", ["เกรด", "การสอบแก้ตัว", "ค่าระดับคะแนน", "เกียรตินิยม"]),
+    ("การลงทะเบียนเรียน", "academic", ["เพิ่มถอนรายวิชา", "ลงทะเบียนล่าช้า", "หน่วยกิตขั้นต่ำ", "ค่าปรับ"]),
+    ("ทุนการศึกษา", "scholarship", ["กยศ", "ทุนเรียนดี", "ทุนขาดแคลน", "การผ่อนผันค่าธรรมเนียม"]),
+    ("หอพักนักศึกษา", "dorm", ["ค่าหอ", "การเข้าพัก", "ระเบียบหอพัก", "เวลาปิดหอ"]),
+    ("ช่องทางติดต่อหน่วยงาน", "contact", ["เบอร์โทร", "อีเมล", "อาคาร", "เวลาทำการ"]),
+]
+_MONTHS = [
+    "มกราคม", "กุมภาพันธ์", "มีนาคม", "เมษายน", "พฤษภาคม", "มิถุนายน",
+    "กรกฎาคม", "สิงหาคม", "กันยายน", "ตุลาคม", "พฤศจิกายน", "ธันวาคม",
+]
+_FILLER = [
+    "ทั้งนี้ให้เป็นไปตามประกาศของมหาวิทยาลัยที่เกี่ยวข้อง",
+    "นักศึกษาสามารถสอบถามรายละเอียดเพิ่มเติมได้ที่ส่วนทะเบียนและประมวลผล",
+    "กรณีมีเหตุจำเป็นให้ยื่นคำร้องต่ออาจารย์ที่ปรึกษาเพื่อพิจารณา",
+    "ประกาศนี้ให้ใช้บังคับตั้งแต่ภาคการศึกษาที่ 1 ปีการศึกษา 2567 เป็นต้นไป",
+    "หากไม่ปฏิบัติตามจะถูกดำเนินการตามข้อบังคับว่าด้วยวินัยนักศึกษา",
+]
+
+
+@dataclass
+class SyntheticDoc:
+    key: str
+    title: str
+    content: str
+    intent: str
+
+
+@dataclass
+class SyntheticQuestion:
+    text: str
+    doc_key: str
+    intent: str
+
+
+def _article(rng: random.Random, n: int, topic: str, keyword: str) -> Tuple[str, str]:
+    amount = rng.choice([50, 100, 200, 500, 1000, 1500, 3000, 5000])
+    day = rng.randint(1, 28)
+    month = rng.choice(_MONTHS)
+    body = (
+        f"ข้อ {n} ในส่วนของ{keyword} นักศึกษาต้องดำเนินการภายในวันที่ {day} {month} "
+        f"หากดำเนินการล่าช้าจะมีค่าปรับ {amount} บาท {rng.choice(_FILLER)}"
+    )
+    question = f"ข้อ {n} เรื่อง{keyword}ของ{topic}กำหนดไว้ว่าอย่างไร"
+    return body, question
+
+
+def generate_corpus(
+    n_docs: int = 50,
+    articles_per_doc: int = 8,
+    questions_per_doc: int = 3,
+    seed: int = 42,
+) -> Tuple[List[SyntheticDoc], List[SyntheticQuestion]]:
+    rng = random.Random(seed)
+    docs: List[SyntheticDoc] = []
+    questions: List[SyntheticQuestion] = []
+
+    for i in range(n_docs):
+        topic, intent, keywords = _TOPICS[i % len(_TOPICS)]
+        faculty = rng.choice(_FACULTIES)
+        notice_no = f"{rng.randint(1, 99)}/{rng.choice([2565, 2566, 2567])}"
+        course_code = f"{rng.randint(100, 999)}{rng.randint(1000, 9999)}"
+        key = f"doc-{i:05d}"
+        title = f"ประกาศ{faculty} ที่ {notice_no} เรื่อง{topic}"
+
+        paras = [
+            f"ประกาศ{faculty} ที่ {notice_no}",
+            f"เรื่อง {topic}",
+            f"เพื่อให้การบริหารงานด้าน{topic}เป็นไปด้วยความเรียบร้อย จึงออกประกาศไว้ดังนี้",
+        ]
+        art_questions: List[str] = []
+        for n in range(1, articles_per_doc + 1):
+            body, q = _article(rng, n, topic, rng.choice(keywords))
+            paras.append(body)
+            art_questions.append(q)
+        credits = rng.choice([1, 2, 3, 4])
+        paras.append(
+            f"รายวิชา {course_code} มี {credits} หน่วยกิต ผู้ที่จะลงทะเบียนต้องผ่านรายวิชาบังคับก่อนตามที่หลักสูตรกำหนด"
+        )
+        paras.append(rng.choice(_FILLER))
+        docs.append(SyntheticDoc(key=key, title=title, content="\n".join(paras), intent=intent))
+
+        picks = rng.sample(art_questions, k=min(max(questions_per_doc - 1, 0), len(art_questions)))
+        for q in picks:
+            questions.append(SyntheticQuestion(text=q, doc_key=key, intent=intent))
+        if questions_per_doc > 0:
+            questions.append(SyntheticQuestion(
+                text=f"รายวิชา {course_code} มีกี่หน่วยกิต",
+                doc_key=key,
+                intent="academic",
+            ))
+
+    return docs, questions
+
+
+def casual_variants(question: str, rng: random.Random) -> str:
+    """ทำให้คำถามเป็นภาษาพูดแบบนักศึกษา (ใช้สร้าง near-duplicate สำหรับ cache / load test)"""
+    prefix = rng.choice(["", "สอบถามครับ ", "อยากรู้ว่า ", "ขอถามหน่อยค่ะ "])
+    suffix = rng.choice(["", " ครับ", " คะ", " หน่อย", "?"])
+    return f"{prefix}{question}{suffix}"
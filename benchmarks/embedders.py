@@ -0,0 +1,161 @@
+# benchmarks/embedders.py
+"""
+เทียบ embedding backend บน CPU (EMBED_BACKEND) กับ torch fp32
+
+ต่อ backend × จำนวน thread:
+  - load_ms: เวลาโหลดโมเดล
+  - query: latency ของ encode ทีละ 1 ข้อความ (p50/p95/p99) — แบบที่ /chat ใช้
+  - ingest: throughput (ข้อความ/วินาที) ของ encode ทีละ batch — แบบที่ add_or_update_doc_to_vector ใช้
+  - agreement กับ fp32: cosine ต่อข้อความ (mean / p5 / min) และ overlap ของ top-k เมื่อค้น
+    chunk ด้วยคำถาม (recall@k ของผลค้นเทียบกับผลจาก vector fp32)
+
+ข้อความ: chunk จาก vector store จริง (--live) หรือ synthetic corpus ภาษาไทย (benchmarks/corpus.py)
+
+ตัวอย่าง:
+  python -m benchmarks.embedders --out embedders.json
+  python -m benchmarks.embedders --backends torch,torch-int8,onnx --threads 1,2,4 --texts 1000
+"""
+
+import argparse
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.common import run_meta, summarize, write_json
+from benchmarks.corpus import generate_corpus
+
+
+def _texts(n: int, n_queries: int, live: bool) -> Tuple[List[str], List[str]]:
+    if live:
+        from app.services.rag import collection
+
+        docs = [d for d in (collection.get(include=["documents"]).get("documents") or []) if d]
+        if docs:
+            return docs[:n], [d[:80] for d in docs[:n_queries]]
+        print("[BENCH] vector store is empty; using synthetic corpus", flush=True)
+    docs, questions = generate_corpus(n_docs=max(1, n // 8), articles_per_doc=8, questions_per_doc=3)
+    texts = [p for d in docs for p in d.content.split("\n") if p.strip()]
+    return texts[:n], [q.text for q in questions[:n_queries]]
+
+
+def _unit(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+
+
+def _encode(model, texts: List[str], batch_size: int) -> np.ndarray:
+    return _unit(model.encode(texts, batch_size=batch_size, show_progress_bar=False))
+
+
+def _agreement(vecs: np.ndarray, ref: np.ndarray, q: np.ndarray, q_ref: np.ndarray, k: int) -> Dict[str, float]:
+    cos = np.sum(vecs * ref, axis=1)
+    top = np.argsort(-(q @ vecs.T), axis=1)[:, :k]
+    top_ref = np.argsort(-(q_ref @ ref.T), axis=1)[:, :k]
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, top_ref)]) if len(q) else 0.0
+    return {
+        "cosine_mean": round(float(cos.mean()), 5),
+        "cosine_p5": round(float(np.percentile(cos, 5)), 5),
+        "cosine_min": round(float(cos.min()), 5),
+        f"recall@{k}": round(float(overlap), 4),
+    }
+
+
+def bench_backend(
+    model_name: str,
+    backend: str,
+    threads: int,
+    texts: List[str],
+    queries: List[str],
+    args,
+) -> Tuple[Dict[str, Any], Optional[np.ndarray], Optional[np.ndarray]]:
+    from app.services.embedders import load_embedder
+
+    row: Dict[str, Any] = {"backend": backend, "threads": threads}
+    t0 = time.perf_counter()
+    try:
+        model = load_embedder(model_name, backend=backend, threads=threads,
+                              file_name=args.model_file, local_files_only=args.local_only)
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+        return row, None, None
+    row["load_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+    row["effective_backend"] = getattr(model, "embed_backend", backend)
+
+    model.encode(texts[: args.batch_size], batch_size=args.batch_size, show_progress_bar=False)  # warmup
+
+    latencies = []
+    for q in queries:
+        t0 = time.perf_counter()
+        model.encode(q, show_progress_bar=False)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+    row["query"] = summarize(latencies)
+
+    t0 = time.perf_counter()
+    vecs = _encode(model, texts, args.batch_size)
+    elapsed = time.perf_counter() - t0
+    row["ingest"] = {"texts": len(texts), "batch_size": args.batch_size,
+                     "seconds": round(elapsed, 3), "texts_per_s": round(len(texts) / max(elapsed, 1e-9), 1)}
+    q_vecs = _encode(model, queries, args.batch_size)
+    return row, vecs, q_vecs
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Compare CPU embedding backends against torch fp32")
+    ap.add_argument("--model", default=os.getenv(
+        "EMBED_MODEL_NAME", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"))
+    ap.add_argument("--backends", default="torch,torch-int8,onnx,openvino")
+    ap.add_argument("--threads", default="0", help="จำนวน thread ที่จะลอง คั่นด้วย , (0 = default)")
+    ap.add_argument("--texts", type=int, default=512, help="จำนวนข้อความที่ใช้วัด ingest")
+    ap.add_argument("--queries", type=int, default=100)
+    ap.add_argument("--batch-size", type=int, default=32)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--model-file", default=os.getenv("EMBED_MODEL_FILE") or None)
+    ap.add_argument("--local-only", action="store_true", help="โหลดจาก HF cache ในเครื่องเท่านั้น")
+    ap.add_argument("--live", action="store_true", help="ใช้ chunk จาก vector store จริง")
+    ap.add_argument("--out")
+    args = ap.parse_args(argv)
+
+    texts, queries = _texts(args.texts, args.queries, args.live)
+    print(f"[BENCH] {len(texts)} texts, {len(queries)} queries, model={args.model}", flush=True)
+    thread_counts = [int(t) for t in args.threads.split(",") if t.strip()]
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+
+    # baseline fp32 (threads แรก) — vector อ้างอิงของ agreement
+    base_row, ref, q_ref = bench_backend(args.model, "torch", thread_counts[0], texts, queries, args)
+    if ref is None:
+        raise SystemExit(f"[BENCH] torch fp32 baseline failed: {base_row.get('error')}")
+
+    rows: List[Dict[str, Any]] = []
+    for backend in backends:
+        for threads in thread_counts:
+            if backend == "torch" and threads == thread_counts[0]:
+                row, vecs, q_vecs = base_row, ref, q_ref
+            else:
+                row, vecs, q_vecs = bench_backend(args.model, backend, threads, texts, queries, args)
+            if vecs is not None:
+                row["agreement"] = _agreement(vecs, ref, q_vecs, q_ref, min(args.k, len(texts)))
+                row["ingest"]["speedup"] = round(
+                    row["ingest"]["texts_per_s"] / max(base_row["ingest"]["texts_per_s"], 1e-9), 2)
+            rows.append(row)
+            if "error" in row:
+                print(f"[BENCH] {backend} threads={threads}: {row['error']}", flush=True)
+            else:
+                print(
+                    f"[BENCH] {backend} threads={threads} ({row['effective_backend']}): "
+                    f"query p50={row['query'].get('p50_ms')} ms, ingest={row['ingest']['texts_per_s']} texts/s "
+                    f"(x{row['ingest']['speedup']}), cosine mean={row['agreement']['cosine_mean']} "
+                    f"min={row['agreement']['cosine_min']}",
+                    flush=True,
+                )
+
+    write_json(args.out, {
+        "meta": run_meta({"model": args.model, "texts": len(texts), "queries": len(queries),
+                          "batch_size": args.batch_size, "cpu_count": os.cpu_count()}),
+        "results": rows,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+# benchmarks/eval_retrieval.py
+"""
+Offline retrieval evaluation — sweep ค่า retrieval แล้วดู recall เทียบกับ latency / ขนาด context
+
+labeled set:
+  - admin: ตาราง retrieval_labels (คำถาม → document_id) ผ่าน /admin/eval/labels
+  - feedback: AnswerFeedback ที่ is_helpful = True → หาเอกสารต้นทางของคำตอบ
+    (encode คำตอบแล้ว query collection; ใช้ได้เมื่อ score >= --attribution-min)
+    เป็น label แบบอ่อน รายงานแยกด้วย label_source
+  คำถามเดียวกันที่ admin label ไว้แล้วจะไม่ใช้ label จาก feedback
+
+sweep:
+  CHUNK_SIZE      สร้าง collection ชั่วคราว (in-memory) จากเอกสารใน DB ต่อ chunk size
+                  (ค่าเท่ากับ CHUNK_SIZE ปัจจุบัน → ใช้ collection จริง ไม่ต้อง embed ใหม่)
+  TOP_K_RETRIEVE  query จริงต่อค่า k (วัด latency)
+  SIM_THRESHOLD / RERANK_KEEP   กรองผลของ query เดียวกัน (ตรรกะเดียวกับ retrieve_chunks)
+  HYBRID_LEXICAL_WEIGHT         น้ำหนัก BM25 ใน RRF (มีผลเฉพาะ collection จริงที่มี lexical index)
+  MULTI_QUERY     ค้นด้วยคำถามเดิม + variant แบบ local (synonym / intent keyword — ไม่รวม LLM rewrite)
+                  latency รวมเวลาสร้าง variant + encode / query แบบ batch
+  FAQ threshold   hit rate + precision (คำตอบ FAQ มาจากเอกสารที่ label ไว้หรือไม่)
+
+รายงานต่อ config: recall@keep, MRR, context chars ที่ส่งให้ LLM, retrieval latency
++ config ที่ถูกที่สุด (context น้อยสุด) ที่ recall ไม่ต่ำกว่าค่าที่ดีที่สุดเกิน --tolerance
+
+ตัวอย่าง:
+  python -m benchmarks.eval_retrieval --out eval.json
+  python -m benchmarks.eval_retrieval --chunk-size 600 --top-k 5,10 --keep 3,4 --threshold 0.3,0.35
+  python -m benchmarks.eval_retrieval --chunk-size 600 --multi-query off,on --lexical-weight 0.5
+"""
+
+import argparse
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from benchmarks.common import run_meta, summarize, write_json
+
+
+@dataclass
+class EvalLabel:
+    question: str
+    doc_ids: Set[str] = field(default_factory=set)
+    source: str = "admin"
+
+
+def _csv(value: str, cast):
+    return [cast(x) for x in value.split(",") if x.strip()]
+
+
+# ============================================================
+# LABELED SET
+# ============================================================
+
+def attribute_answer(answer: str, store, min_score: float) -> Optional[str]:
+    """doc_id ของเอกสารที่คำตอบน่าจะมาจาก (chunk ที่ใกล้คำตอบที่สุด)"""
+    from app.services.rag import retrieve_chunks
+
+    chunks = retrieve_chunks(answer, k=5, keep=1, threshold=min_score, store=store)
+    if not chunks:
+        return None
+    return str((chunks[0].get("metadata") or {}).get("doc_id") or "") or None
+
+
+def load_labels(db, store, attribution_min: float, use_feedback: bool = True) -> List[EvalLabel]:
+    from app.models.sql import AnswerFeedback, RetrievalLabel
+    from app.services.answer_cache import normalize_question
+
+    labels: Dict[str, EvalLabel] = {}
+    for row in db.query(RetrievalLabel).all():
+        key = normalize_question(row.question)
+        lab = labels.setdefault(key, EvalLabel(question=row.question, source="admin"))
+        lab.doc_ids.add(str(row.document_id))
+
+    if use_feedback:
+        for row in db.query(AnswerFeedback).filter(AnswerFeedback.is_helpful.is_(True)).all():
+            key = normalize_question(row.question)
+            if key in labels or "ไม่พบข้อมูล" in (row.answer or ""):
+                continue
+            doc_id = attribute_answer(row.answer, store, attribution_min)
+            if doc_id:
+                labels[key] = EvalLabel(question=row.question, doc_ids={doc_id}, source="feedback")
+
+    return list(labels.values())
+
+
+# ============================================================
+# STORES PER CHUNK SIZE
+# ============================================================
+
+def build_store(chunk_size: int, documents) -> Any:
+    """store ชั่วคราว (in-memory, backend เดียวกับ collection จริง) ที่ chunk ด้วย chunk_size"""
+    from app.services.rag import chunk_document, collection, embedder
+    from app.services.vectorstore import ChromaVectorStore, NumpyVectorStore
+
+    if collection.backend == "numpy":
+        store = NumpyVectorStore()
+    else:
+        store = ChromaVectorStore(name=f"eval_chunk_{chunk_size}")
+    for d in documents:
+        ids, texts, metas = chunk_document(
+            str(d.id), d.current_content or "", {"title": d.title}, chunk_size=chunk_size,
+        )
+        if not texts:
+            continue
+        embeds = embedder.encode(texts, show_progress_bar=False).tolist()
+        store.upsert(ids=ids, embeddings=embeds, documents=texts, metadatas=metas)
+    return store
+
+
+# ============================================================
+# SWEEP
+# ============================================================
+
+def _score(chunks: List[Dict[str, Any]], label: EvalLabel) -> Tuple[float, float]:
+    """(recall, reciprocal rank) ของ chunk ที่จะส่งให้ LLM"""
+    found: Set[str] = set()
+    rr = 0.0
+    for rank, c in enumerate(chunks, 1):
+        doc_id = str((c.get("metadata") or {}).get("doc_id") or "")
+        if doc_id in label.doc_ids:
+            if not rr:
+                rr = 1.0 / rank
+            found.add(doc_id)
+    return len(found) / len(label.doc_ids), rr
+
+
+def sweep_retrieval(
+    labels: List[EvalLabel],
+    store,
+    chunk_size: int,
+    top_ks: List[int],
+    keeps: List[int],
+    thresholds: List[float],
+    lexical_weights: List[float],
+    multi_query: List[bool] = (False,),
+    max_variants: int = 2,
+) -> List[Dict[str, Any]]:
+    from app.agents.router import heuristic_route
+    from app.services.query_expansion import expand_queries
+    from app.services.rag import collection, retrieve_chunks
+
+    live = store is collection
+    rows: List[Dict[str, Any]] = []
+    for k, w, mq in itertools.product(top_ks, lexical_weights if live else [0.0], multi_query):
+        # query ครั้งเดียวต่อ (chunk_size, k, w, mq) — threshold / keep เป็นแค่ตัวกรองผล
+        raw: List[List[Dict[str, Any]]] = []
+        latencies: List[float] = []
+        for lab in labels:
+            t0 = time.perf_counter()
+            variants = (
+                expand_queries(lab.question, heuristic_route(lab.question).intent, max_variants=max_variants)
+                if mq else None
+            )
+            raw.append(retrieve_chunks(
+                lab.question, k=k, keep=k, threshold=-1.0,
+                store=None if live else store, lexical_weight=w, variants=variants,
+            ))
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+        lat = summarize(latencies)
+
+        for keep, thr in itertools.product(keeps, thresholds):
+            recalls, rrs, ctx = [], [], []
+            by_source: Dict[str, List[float]] = {}
+            for lab, chunks in zip(labels, raw):
+                kept = [c for c in chunks if c["score"] >= thr or c.get("lexical")][:keep]
+                recall, rr = _score(kept, lab)
+                recalls.append(recall)
+                rrs.append(rr)
+                ctx.append(sum(len(c["text"]) for c in kept))
+                by_source.setdefault(lab.source, []).append(recall)
+            rows.append({
+                "chunk_size": chunk_size,
+                "top_k": k,
+                "rerank_keep": keep,
+                "sim_threshold": thr,
+                "lexical_weight": w,
+                "multi_query": mq,
+                "recall": round(float(np.mean(recalls)), 4),
+                "mrr": round(float(np.mean(rrs)), 4),
+                "recall_by_label_source": {s: round(float(np.mean(v)), 4) for s, v in by_source.items()},
+                "context_chars_mean": round(float(np.mean(ctx)), 1),
+                "context_chars_p95": round(float(np.percentile(ctx, 95)), 1),
+                "empty_context_rate": round(sum(1 for c in ctx if c == 0) / len(ctx), 4),
+                "latency": lat,
+            })
+    return rows
+
+
+def sweep_faq(labels: List[EvalLabel], db, store, thresholds: List[float], attribution_min: float) -> List[Dict[str, Any]]:
+    """FaqAgent threshold: hit rate และ precision (FAQ ที่ตอบ มาจากเอกสารที่ label ไว้)"""
+    from app.models.sql import FaqEntry
+    from app.services.quantize import decode_vector
+    from app.services.rag import embedder
+
+    faqs = [f for f in db.query(FaqEntry).all() if f.question_embedding]
+    if not faqs or not labels:
+        return []
+    mat = np.asarray([decode_vector(f.question_embedding) for f in faqs], dtype=np.float32)
+    mat /= np.maximum(np.linalg.norm(mat, axis=1, keepdims=True), 1e-12)
+    q = np.asarray(embedder.encode([lab.question for lab in labels]), dtype=np.float32)
+    q /= np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+    sims = q @ mat.T
+    best = sims.argmax(axis=1)
+    best_score = sims.max(axis=1)
+
+    faq_doc: Dict[int, Optional[str]] = {}
+    rows = []
+    for thr in thresholds:
+        hits = correct = 0
+        for i, lab in enumerate(labels):
+            if best_score[i] < thr:
+                continue
+            hits += 1
+            f = faqs[int(best[i])]
+            if f.id not in faq_doc:
+                faq_doc[f.id] = attribute_answer(f.answer, store, attribution_min)
+            if faq_doc[f.id] in lab.doc_ids:
+                correct += 1
+        rows.append({
+            "faq_threshold": thr,
+            "hit_rate": round(hits / len(labels), 4),
+            "precision": round(correct / hits, 4) if hits else None,
+        })
+    return rows
+
+
+def recommend(rows: List[Dict[str, Any]], tolerance: float) -> Optional[Dict[str, Any]]:
+    """config ที่ context เล็กสุด (แล้วเร็วสุด) ที่ recall ไม่ต่ำกว่าค่าที่ดีที่สุดเกิน tolerance"""
+    if not rows:
+        return None
+    best = max(r["recall"] for r in rows)
+    ok = [r for r in rows if r["recall"] >= best - tolerance]
+    return min(ok, key=lambda r: (r["context_chars_mean"], r["latency"].get("p50_ms", 0.0)))
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Sweep retrieval knobs against labeled questions")
+    ap.add_argument("--chunk-size", default="400,600,900")
+    ap.add_argument("--top-k", default="5,10,20")
+    ap.add_argument("--keep", default="2,3,4,6")
+    ap.add_argument("--threshold", default="0.25,0.32,0.4")
+    ap.add_argument("--lexical-weight", default="0,0.2,0.4,0.6")
+    ap.add_argument("--multi-query", default="off", help="off,on = เทียบ retrieval แบบ multi-query")
+    ap.add_argument("--max-variants", type=int, default=2)
+    ap.add_argument("--faq-threshold", default="0.75,0.8,0.85,0.9,0.95")
+    ap.add_argument("--attribution-min", type=float, default=0.5,
+                    help="score ขั้นต่ำที่จะถือว่าคำตอบใน feedback มาจากเอกสารนั้น")
+    ap.add_argument("--no-feedback", action="store_true", help="ใช้เฉพาะ label ที่ admin กำหนด")
+    ap.add_argument("--tolerance", type=float, default=0.02)
+    ap.add_argument("--out")
+    args = ap.parse_args(argv)
+
+    from app.core.database import SessionLocal
+    from app.models.sql import Document
+    from app.services.rag import CHUNK_SIZE, collection
+
+    db = SessionLocal()
+    try:
+        labels = load_labels(db, collection, args.attribution_min, use_feedback=not args.no_feedback)
+        if not labels:
+            ap.error("no labels: add pairs via /admin/eval/labels or collect helpful feedback first")
+        counts: Dict[str, int] = {}
+        for lab in labels:
+            counts[lab.source] = counts.get(lab.source, 0) + 1
+        print(f"[EVAL] {len(labels)} labeled questions {counts}", flush=True)
+
+        documents = db.query(Document).all()
+        rows: List[Dict[str, Any]] = []
+        for cs in _csv(args.chunk_size, int):
+            t0 = time.perf_counter()
+            store = collection if cs == CHUNK_SIZE else build_store(cs, documents)
+            print(f"[EVAL] chunk_size={cs}: {store.count()} chunks ({time.perf_counter() - t0:.1f}s)", flush=True)
+            rows.extend(sweep_retrieval(
+                labels, store, cs,
+                _csv(args.top_k, int), _csv(args.keep, int), _csv(args.threshold, float),
+                _csv(args.lexical_weight, float),
+                _csv(args.multi_query, lambda x: x.strip() == "on"), args.max_variants,
+            ))
+
+        faq_rows = sweep_faq(labels, db, collection, _csv(args.faq_threshold, float), args.attribution_min)
+    finally:
+        db.close()
+
+    rec = recommend(rows, args.tolerance)
+    if rec:
+        print(
+            f"[EVAL] recommended: CHUNK_SIZE={rec['chunk_size']} TOP_K_RETRIEVE={rec['top_k']} "
+            f"RERANK_KEEP={rec['rerank_keep']} SIM_THRESHOLD={rec['sim_threshold']} "
+            f"HYBRID_LEXICAL_WEIGHT={rec['lexical_weight']} "
+            f"MULTI_QUERY_ENABLED={int(rec['multi_query'])} "
+            f"(recall={rec['recall']}, mrr={rec['mrr']}, context={rec['context_chars_mean']} chars)",
+            flush=True,
+        )
+    write_json(args.out, {
+        "meta": run_meta({"tool": "eval_retrieval", "labels": counts, "current_chunk_size": CHUNK_SIZE}),
+        "retrieval": rows,
+        "faq": faq_rows,
+        "recommended": rec,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+# benchmarks/fake_gemini.py
+"""
+Fake Gemini API (HTTP) สำหรับ benchmark / load test — ไม่ต้องใช้ API key จริงและไม่เสียเงิน
+
+รองรับ path ของทั้ง google-genai และ google-generativeai (REST):
+  POST /{version}/models/{model}:generateContent
+  POST /{version}/models/{model}:streamGenerateContent   (SSE, ?alt=sse)
+
+ตั้งค่าได้:
+  - latency (ms) + jitter (ms) ต่อ request, แยก router call ได้
+  - fail_rate: สัดส่วน request ที่ตอบ 500 / 429
+  - stream_chunks: จำนวน chunk ตอน stream
+
+ใช้งาน:
+  python -m benchmarks.fake_gemini --port 8089 --latency-ms 800 --jitter-ms 300 --fail-rate 0.02
+  แล้วตั้ง GEMINI_BASE_URL=http://127.0.0.1:8089 ให้ backend
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+_PATH_RE = re.compile(r"^/[^/]+/models/(?P<model>[^:/]+):(?P<method>generateContent|streamGenerateContent)")
+
+# keyword → intent (ให้ router ได้ intent ที่สมเหตุสมผลกับคำถามสังเคราะห์)
+_ROUTER_KEYWORDS = [
+    ("scholarship", ["ทุน", "ค่าธรรมเนียม", "ผ่อนผัน"]),
+    ("dorm", ["หอพัก", "ค่าหอ"]),
+    ("contact", ["ติดต่อ", "เบอร์", "อีเมล"]),
+    ("regulation", ["ระเบียบ", "แต่งกาย", "วินัย", "ข้อบังคับ"]),
+    ("academic", ["ลงทะเบียน", "รายวิชา", "เกรด", "สอบ", "หน่วยกิต"]),
+    ("capabilities", ["ทำอะไรได้บ้าง"]),
+]
+
+
+@dataclass
+class FakeGeminiConfig:
+    latency_ms: float = 600.0
+    jitter_ms: float = 200.0
+    router_latency_ms: Optional[float] = 250.0
+    fail_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    stream_chunks: int = 6
+    seed: int = 7
+    stats: Dict[str, int] = field(default_factory=lambda: {"requests": 0, "failures": 0})
+
+
+def _prompt_text(body: Dict[str, Any]) -> str:
+    parts = []
+    for content in body.get("contents") or []:
+        if isinstance(content, str):
+            parts.append(content)
+            continue
+        for part in content.get("parts") or []:
+            if "text" in part:
+                parts.append(part["text"])
+    return "\n".join(parts)
+
+
+def _is_router_prompt(prompt: str) -> bool:
+    return "ให้ตอบเป็น JSON เท่านั้น" in prompt
+
+
+def _router_answer(prompt: str) -> str:
+    m = re.search(r'คำถาม: "(.*?)"', prompt, re.S)
+    question = m.group(1) if m else prompt
+    for intent, words in _ROUTER_KEYWORDS:
+        if any(w in question for w in words):
+            return json.dumps({"intent": intent, "confidence": 0.9})
+    return json.dumps({"intent": "general_rag", "confidence": 0.6})
+
+
+def _answer_text(prompt: str) -> str:
+    if "[คำถามถัดไป]" in prompt:
+        return "- ต้องเตรียมเอกสารอะไรบ้าง\n- ติดต่อหน่วยงานไหน\n- มีค่าใช้จ่ายเท่าไหร่"
+    # เอาบรรทัดแรก ๆ ของ CONTEXT มาสรุป ให้ความยาวคำตอบใกล้ของจริง
+    m = re.search(r"\[CONTEXT\]\s*(.*?)\s*\[คำถาม\]", prompt, re.S)
+    context = (m.group(1) if m else "").replace("---", " ")
+    words = context.split()[:60]
+    if not words:
+        return "ไม่พบข้อมูลในระบบ กรุณาติดต่อเจ้าหน้าที่มหาวิทยาลัย"
+    return "- " + " ".join(words[:30]) + "\n- " + " ".join(words[30:60])
+
+
+def _response_json(text: str, prompt: str) -> Dict[str, Any]:
+    prompt_tokens = max(1, len(prompt) // 3)
+    completion_tokens = max(1, len(text) // 3)
+    return {
+        "candidates": [
+            {
+                "content": {"parts": [{"text": text}], "role": "model"},
+                "finishReason": "STOP",
+                "index": 0,
+            }
+        ],
+        "usageMetadata": {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": completion_tokens,
+            "totalTokenCount": prompt_tokens + completion_tokens,
+        },
+        "modelVersion": "fake-gemini",
+    }
+
+
+def make_handler(config: FakeGeminiConfig):
+    rng = random.Random(config.seed)
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):  # เงียบ (เป็น load test)
+            pass
+
+        def _send_json(self, status: int, payload: Dict[str, Any]):
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _sleep_and_fault(self, router: bool) -> Optional[Tuple[int, str]]:
+            with lock:
+                config.stats["requests"] += 1
+                base = config.router_latency_ms if (router and config.router_latency_ms is not None) else config.latency_ms
+                delay = max(0.0, rng.gauss(base, config.jitter_ms)) / 1000.0
+                roll = rng.random()
+            time.sleep(delay)
+            if roll < config.fail_rate:
+                return 500, "INTERNAL"
+            if roll < config.fail_rate + config.rate_limit_rate:
+                return 429, "RESOURCE_EXHAUSTED"
+            return None
+
+        def do_GET(self):
+            if self.path.startswith("/stats"):
+                self._send_json(200, dict(config.stats))
+            else:
+                self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+
+        def do_POST(self):
+            m = _PATH_RE.match(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b"{}"
+            if not m:
+                self._send_json(404, {"error": {"code": 404, "message": "not found"}})
+                return
+            try:
+                body = json.loads(raw or b"{}")
+            except ValueError:
+                self._send_json(400, {"error": {"code": 400, "message": "bad json"}})
+                return
+
+            prompt = _prompt_text(body)
+            router = _is_router_prompt(prompt)
+            fault = self._sleep_and_fault(router)
+            if fault:
+                with lock:
+                    config.stats["failures"] += 1
+                status, reason = fault
+                self._send_json(status, {"error": {"code": status, "message": "injected", "status": reason}})
+                return
+
+            text = _router_answer(prompt) if router else _answer_text(prompt)
+
+            if m.group("method") == "generateContent":
+                self._send_json(200, _response_json(text, prompt))
+                return
+
+            # streamGenerateContent → SSE
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            n = max(1, config.stream_chunks)
+            step = max(1, len(text) // n)
+            pieces = [text[i:i + step] for i in range(0, len(text), step)]
+            for i, piece in enumerate(pieces):
+                payload = _response_json(piece, prompt)
+                if i < len(pieces) - 1:
+                    payload["candidates"][0].pop("finishReason", None)
+                self.wfile.write(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\r\n\r\n")
+                self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+
+class FakeGeminiServer:
+    """รัน fake Gemini ใน thread (ใช้จาก benchmark / replay)"""
+
+    def __init__(self, config: Optional[FakeGeminiConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or FakeGeminiConfig()
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.config))
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeGeminiServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Fake Gemini API for benchmarks")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8089)
+    ap.add_argument("--latency-ms", type=float, default=600.0)
+    ap.add_argument("--jitter-ms", type=float, default=200.0)
+    ap.add_argument("--router-latency-ms", type=float, default=250.0)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--rate-limit-rate", type=float, default=0.0)
+    ap.add_argument("--stream-chunks", type=int, default=6)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+
+    config = FakeGeminiConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        router_latency_ms=args.router_latency_ms,
+        fail_rate=args.fail_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        stream_chunks=args.stream_chunks,
+        seed=args.seed,
+    )
+    server = FakeGeminiServer(config, host=args.host, port=args.port)
+    print(f"[FAKE_GEMINI] listening on {server.url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
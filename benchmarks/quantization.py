@@ -0,0 +1,196 @@
+# benchmarks/quantization.py
+"""
+วัดผลของการเก็บ vector แบบ float16 / int8 (VECTOR_DTYPE, FAQ_VECTOR_DTYPE)
+
+corpus: embedding ของ chunk จาก vector store จริง (หรือ --synthetic N) → สร้าง NumpyVectorStore
+ชั่วคราวต่อ dtype แล้ววัด
+  - memory: ขนาด matrix ที่ใช้ scan (ต้องอยู่ใน RAM) / ที่อ่านเฉพาะตอน rescore
+  - disk: ขนาดไฟล์ของ store
+  - latency ของ query (p50/p95/p99) เทียบกับ float32
+  - recall@k เทียบกับผล exact float32 (ต่อ rescore factor และแบบไม่เก็บ float32)
+FAQ: ขนาดคอลัมน์ question_embedding ต่อ dtype + อัตราที่ FAQ อันดับ 1 ตรงกับ float32
+
+query = คำถามจาก question_logs (encode ด้วย embedder) ถ้าไม่มีใช้ vector ใน corpus + noise
+
+ตัวอย่าง:
+  python -m benchmarks.quantization --out quant.json
+  python -m benchmarks.quantization --synthetic 50000 --rescore 1,2,4,8
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.common import run_meta, summarize, write_json
+
+
+def _live_corpus():
+    from app.services.rag import collection
+
+    got = collection.get(include=["embeddings", "metadatas"])
+    ids = list(got.get("ids") or [])
+    embs = got.get("embeddings")
+    if not ids:
+        return [], np.zeros((0, 0), np.float32), []
+    return ids, np.asarray(embs, dtype=np.float32), [m or {} for m in got.get("metadatas") or [{}] * len(ids)]
+
+
+def _queries(vecs: np.ndarray, n: int, rng: np.random.Generator, use_logs: bool) -> np.ndarray:
+    if use_logs:
+        try:
+            from app.core.database import SessionLocal
+            from app.models.sql import QuestionLog
+            from app.services.rag import embedder
+
+            with SessionLocal() as db:
+                rows = db.query(QuestionLog.question).order_by(QuestionLog.id.desc()).limit(n).all()
+            texts = [r[0] for r in rows if r[0]]
+            if texts:
+                return np.asarray(embedder.encode(texts, show_progress_bar=False), dtype=np.float32)
+        except Exception as e:
+            print(f"[BENCH] question_logs unavailable ({e}); using corpus vectors + noise", flush=True)
+    picks = rng.integers(0, len(vecs), n)
+    return vecs[picks] + 0.3 * rng.standard_normal((n, vecs.shape[1])).astype(np.float32)
+
+
+def _disk_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def _search(store, queries: np.ndarray, k: int):
+    latencies, ids = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        res = store.query(query_embeddings=[q.tolist()], n_results=k, include=["distances"])
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        ids.append(res["ids"][0])
+    return latencies, ids
+
+
+def _recall(got: List[List[str]], exact: List[List[str]]) -> float:
+    total = sum(len(e) for e in exact)
+    return round(sum(len(set(g) & set(e)) for g, e in zip(got, exact)) / total, 4) if total else 0.0
+
+
+def bench_corpus(ids, vecs, metas, queries, args, workdir: str) -> List[Dict[str, Any]]:
+    from app.services.vectorstore import NumpyVectorStore
+
+    rows: List[Dict[str, Any]] = []
+    exact_ids = None
+    base_p50 = None
+    configs = [("float32", True, 1)]
+    for dtype in ("float16", "int8"):
+        for factor in args.rescore:
+            configs.append((dtype, True, factor))
+        configs.append((dtype, False, max(args.rescore)))
+
+    for dtype, keep, factor in configs:
+        path = os.path.join(workdir, f"{dtype}-{int(keep)}-{factor}")
+        store = NumpyVectorStore(path, dtype=dtype, keep_float32=keep, rescore_factor=factor)
+        with store.bulk():
+            for i in range(0, len(ids), 4096):
+                store.upsert(ids=ids[i:i + 4096], embeddings=vecs[i:i + 4096],
+                             documents=[""] * len(ids[i:i + 4096]), metadatas=metas[i:i + 4096])
+        _search(store, queries[:5], args.k)        # warm page cache
+        lat, got = _search(store, queries, args.k)
+        if exact_ids is None:
+            exact_ids = got
+        mem = store.memory_bytes()
+        row = {
+            "dtype": dtype,
+            "keep_float32": keep,
+            "rescore_factor": factor,
+            "scan_mb": round(mem["scan"] / 1e6, 2),
+            "rescore_mb": round(mem.get("rescore", 0) / 1e6, 2),
+            # ไม่นับ meta.json (เท่ากันทุก dtype)
+            "disk_mb": round((_disk_bytes(path) - os.path.getsize(os.path.join(path, "meta.json"))) / 1e6, 2),
+            "latency": summarize(lat),
+            f"recall_at_{args.k}": _recall(got, exact_ids),
+        }
+        base_p50 = base_p50 or row["latency"]["p50_ms"]
+        row["speedup_p50"] = round(base_p50 / max(row["latency"]["p50_ms"], 1e-6), 2)
+        rows.append(row)
+        print(
+            f"[BENCH] {dtype:8s} keep_f32={int(keep)} rescore={factor}: scan={row['scan_mb']} MB "
+            f"p50={row['latency']['p50_ms']} ms recall={row[f'recall_at_{args.k}']}",
+            flush=True,
+        )
+    return rows
+
+
+def bench_faq(queries: np.ndarray) -> Optional[Dict[str, Any]]:
+    from app.core.database import SessionLocal
+    from app.models.sql import FaqEntry
+    from app.services.quantize import decode_vector, encode_vector
+
+    with SessionLocal() as db:
+        texts = [f.question_embedding for f in db.query(FaqEntry).all() if f.question_embedding]
+    if not texts:
+        return None
+    base = np.vstack([decode_vector(t) for t in texts])
+    if base.shape[1] != queries.shape[1]:
+        return None
+    q = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+    def top1(mat):
+        return ((q @ mat.T) / np.maximum(np.linalg.norm(mat, axis=1), 1e-12)).argmax(axis=1)
+
+    ref = top1(base)
+    out = {"faq_entries": len(texts)}
+    for dtype in ("float32", "float16", "int8"):
+        enc = [encode_vector(v, dtype) for v in base]
+        out[dtype] = {
+            "column_kb": round(sum(len(t) for t in enc) / 1e3, 1),
+            "top1_agreement": round(float(np.mean(top1(np.vstack([decode_vector(t) for t in enc])) == ref)), 4),
+        }
+    return out
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Measure float16 / int8 vector storage on the corpus")
+    ap.add_argument("--synthetic", type=int, default=0, help="ใช้ corpus สุ่มขนาดนี้แทน vector store จริง")
+    ap.add_argument("--dim", type=int, default=384, help="(กับ --synthetic)")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--rescore", default="1,2,4,8", help="rescore factor ที่จะลอง")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--no-faq", action="store_true")
+    ap.add_argument("--out")
+    args = ap.parse_args(argv)
+    args.rescore = [int(x) for x in args.rescore.split(",") if x.strip()]
+
+    rng = np.random.default_rng(args.seed)
+    if args.synthetic:
+        from benchmarks.vector_store import _corpus
+
+        ids, vecs, metas = _corpus(args.synthetic, args.dim, rng)
+    else:
+        ids, vecs, metas = _live_corpus()
+        if not ids:
+            ap.error("vector store is empty: ingest documents first or use --synthetic N")
+    print(f"[BENCH] {len(ids)} vectors, dim={vecs.shape[1]}", flush=True)
+    queries = _queries(vecs, args.queries, rng, use_logs=not args.synthetic)
+
+    workdir = tempfile.mkdtemp(prefix="bench-quant-")
+    try:
+        corpus_rows = bench_corpus(ids, vecs, metas, queries, args, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    payload = {
+        "meta": run_meta({"vectors": len(ids), "dim": int(vecs.shape[1]), "k": args.k,
+                          "source": "synthetic" if args.synthetic else "vector_store"}),
+        "corpus": corpus_rows,
+    }
+    if not args.no_faq and not args.synthetic:
+        payload["faq"] = bench_faq(queries)
+    write_json(args.out, payload)
+
+
+if __name__ == "__main__":
+    main()
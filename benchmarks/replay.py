@@ -0,0 +1,308 @@
+# benchmarks/replay.py
+"""
+Replay คำถามจริงจาก question_logs เป็น load test
+
+- อ่านคำถามในช่วงเวลาที่กำหนดจาก DB ต้นทาง (--source-db, default = DATABASE_URL)
+- ส่งตามจังหวะเดิม (inter-arrival เดิม) หรือเร่งด้วย --speed (เช่น 60 = 1 ชั่วโมงใน 1 นาที)
+- target:
+    http      ยิง /chat (spawn backend เองพร้อม fake Gemini หรือใช้ --base-url)
+    pipeline  เรียก run_pipeline ใน process
+    cached    เรียก run_cached_pipeline ใน process (answer cache + single-flight)
+- ใช้ fake Gemini เป็นค่าเริ่มต้น (--real-llm เพื่อใช้ Gemini จริงตาม env)
+- รายงาน latency แยกตาม intent / route ที่ log ไว้ + ความล่าช้าในการส่ง (schedule lag)
+
+การเขียนของ pipeline (question_logs ใหม่, FAQ auto, hits) ลง --target-db (default: SQLite ชั่วคราว)
+ไม่ใช่ DB ต้นทาง — ใช้ Chroma ตาม CHROMA_DIR ของ env (corpus จริง)
+
+ตัวอย่าง:
+  python -m benchmarks.replay --since 2025-01-06T08:00 --until 2025-01-06T12:00 --speed 30 --out replay.json
+  python -m benchmarks.replay --since 2025-01-06 --target pipeline --speed 0   (ยิงติดกันไม่รอ)
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.models.sql import QuestionLog
+from benchmarks.common import backend_process, http_json, run_meta, summarize, write_json
+from benchmarks.fake_gemini import FakeGeminiConfig, FakeGeminiServer
+
+
+@dataclass
+class ReplayItem:
+    offset_s: float
+    question: str
+    intent: str
+    route: str
+
+
+@dataclass
+class ReplayResult:
+    item: ReplayItem
+    latency_ms: float
+    lag_ms: float
+    ok: bool
+    answer_mode: Optional[str] = None
+
+
+def load_window(
+    source_db: str,
+    since: Optional[datetime],
+    until: Optional[datetime],
+    limit: Optional[int] = None,
+) -> List[ReplayItem]:
+    """อ่าน question_logs ในช่วงเวลา → offset (วินาที) จากคำถามแรก"""
+    engine = create_engine(source_db, future=True)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    try:
+        q = db.query(QuestionLog).order_by(QuestionLog.created_at.asc(), QuestionLog.id.asc())
+        if since:
+            q = q.filter(QuestionLog.created_at >= since)
+        if until:
+            q = q.filter(QuestionLog.created_at < until)
+        if limit:
+            q = q.limit(limit)
+        rows = q.all()
+    finally:
+        db.close()
+        engine.dispose()
+
+    if not rows:
+        return []
+    t0 = rows[0].created_at
+    return [
+        ReplayItem(
+            offset_s=(r.created_at - t0).total_seconds(),
+            question=r.question,
+            intent=r.intent or "unknown",
+            route=r.route or "unknown",
+        )
+        for r in rows
+    ]
+
+
+def schedule(items: List[ReplayItem], speed: float, max_gap_s: Optional[float]) -> List[float]:
+    """เวลา (วินาทีจากเริ่ม) ที่จะส่งแต่ละคำถาม; speed <= 0 → ส่งทันทีทั้งหมด"""
+    if speed <= 0:
+        return [0.0] * len(items)
+    out: List[float] = []
+    t = 0.0
+    prev = items[0].offset_s if items else 0.0
+    for it in items:
+        gap = it.offset_s - prev
+        if max_gap_s is not None:
+            gap = min(gap, max_gap_s)
+        t += gap / speed
+        prev = it.offset_s
+        out.append(t)
+    return out
+
+
+def replay(
+    items: List[ReplayItem],
+    send: Callable[[str], Optional[str]],
+    speed: float,
+    max_gap_s: Optional[float] = None,
+    max_inflight: int = 256,
+) -> List[ReplayResult]:
+    """ส่ง items ตาม schedule; send(question) คืน answer_mode ของคำตอบ (หรือ raise = error)"""
+    times = schedule(items, speed, max_gap_s)
+    results: List[ReplayResult] = []
+    lock = threading.Lock()
+
+    def _one(item: ReplayItem, due: float, start: float):
+        lag_ms = (time.perf_counter() - start - due) * 1000.0
+        t0 = time.perf_counter()
+        ok, answer_mode = True, None
+        try:
+            answer_mode = send(item.question)
+        except Exception:
+            ok = False
+        res = ReplayResult(item, (time.perf_counter() - t0) * 1000.0, max(0.0, lag_ms), ok, answer_mode)
+        with lock:
+            results.append(res)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_inflight) as pool:
+        for item, due in zip(items, times):
+            wait = due - (time.perf_counter() - start)
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(_one, item, due, start)
+    return results
+
+
+def report(results: List[ReplayResult], wall_s: float) -> Dict[str, Any]:
+    def _group(key: Callable[[ReplayResult], str]) -> Dict[str, Any]:
+        groups: Dict[str, List[ReplayResult]] = {}
+        for r in results:
+            groups.setdefault(key(r), []).append(r)
+        return {
+            k: {
+                "errors": sum(1 for r in rs if not r.ok),
+                "latency": summarize([r.latency_ms for r in rs if r.ok]),
+            }
+            for k, rs in sorted(groups.items())
+        }
+
+    ok = [r for r in results if r.ok]
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "wall_s": round(wall_s, 2),
+        "throughput_rps": round(len(ok) / wall_s, 2) if wall_s > 0 else 0.0,
+        "latency": summarize([r.latency_ms for r in ok]),
+        "schedule_lag": summarize([r.lag_ms for r in results]),
+        "by_intent": _group(lambda r: r.item.intent),
+        "by_route": _group(lambda r: r.item.route),
+        "by_answer_mode": _group(lambda r: r.answer_mode or "unknown"),
+    }
+
+
+# ============================================================
+# TARGETS
+# ============================================================
+
+def _http_sender(base_url: str, mode: str) -> Callable[[str], Optional[str]]:
+    def _send(question: str) -> Optional[str]:
+        status, body = http_json("POST", f"{base_url}/chat", {"question": question, "mode": mode})
+        if status != 200:
+            raise RuntimeError(f"/chat returned {status}")
+        return (body or {}).get("answer_mode")
+    return _send
+
+
+def _inprocess_sender(target: str, mode: str) -> Callable[[str], Optional[str]]:
+    """import app.* ตอนนี้ (หลังตั้ง env แล้ว) — DATABASE_URL / GEMINI_BASE_URL ถูกอ่านตอน import"""
+    from app.core.database import SessionLocal, engine
+    from app.models.sql import Base
+    from app.services.orchestrator import run_cached_pipeline, run_pipeline
+
+    Base.metadata.create_all(bind=engine)
+    fn = run_cached_pipeline if target == "cached" else run_pipeline
+
+    def _send(question: str) -> Optional[str]:
+        db = SessionLocal()
+        try:
+            _, meta = fn(question, db, mode=mode)
+            db.add(QuestionLog(
+                question=question,
+                intent=meta.get("intent"),
+                route=meta.get("route"),
+                confidence=str(meta.get("confidence")),
+            ))
+            db.commit()
+            return meta.get("answer_mode") or meta.get("source")
+        finally:
+            db.close()
+    return _send
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def main(argv: Optional[List[str]] = None):
+    load_dotenv()
+    ap = argparse.ArgumentParser(description="Replay question_logs against /chat or the pipeline")
+    ap.add_argument("--source-db", default=os.getenv("DATABASE_URL"), help="DB ที่มี question_logs (default: DATABASE_URL)")
+    ap.add_argument("--target-db", help="DB ที่ pipeline เขียนลง (default: SQLite ชั่วคราว)")
+    ap.add_argument("--since", help="ISO datetime (UTC ตามที่ log เก็บ)")
+    ap.add_argument("--until", help="ISO datetime (ไม่รวม)")
+    ap.add_argument("--limit", type=int)
+    ap.add_argument("--speed", type=float, default=1.0, help="ตัวคูณความเร็ว; 0 = ส่งทั้งหมดพร้อมกัน")
+    ap.add_argument("--max-gap-s", type=float, help="ตัดช่วงว่างระหว่างคำถามให้ไม่เกินนี้ (วินาทีของเวลาจริง)")
+    ap.add_argument("--max-inflight", type=int, default=256)
+    ap.add_argument("--target", default="http", choices=["http", "pipeline", "cached"])
+    ap.add_argument("--base-url", help="(target=http) ยิงไปที่ backend ที่รันอยู่แล้ว")
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--mode", default="auto", choices=["auto", "fast"])
+    ap.add_argument("--real-llm", action="store_true", help="ใช้ Gemini จริงแทน fake (เสียเงินจริง)")
+    ap.add_argument("--llm-latency-ms", type=float, default=600.0)
+    ap.add_argument("--llm-jitter-ms", type=float, default=200.0)
+    ap.add_argument("--llm-fail-rate", type=float, default=0.0)
+    ap.add_argument("--workdir")
+    ap.add_argument("--out")
+    args = ap.parse_args(argv)
+
+    if not args.source_db:
+        ap.error("--source-db or DATABASE_URL is required")
+
+    items = load_window(args.source_db, _parse_time(args.since), _parse_time(args.until), args.limit)
+    if not items:
+        ap.error("no question_logs in the selected window")
+    span = items[-1].offset_s
+    print(f"[REPLAY] {len(items)} questions over {span:.0f}s (speed x{args.speed})", flush=True)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="mfu-replay-")
+    target_db = args.target_db or f"sqlite:///{os.path.join(workdir, 'replay.db')}"
+
+    fake: Optional[FakeGeminiServer] = None
+    if not args.real_llm and not args.base_url:
+        fake = FakeGeminiServer(FakeGeminiConfig(
+            latency_ms=args.llm_latency_ms,
+            jitter_ms=args.llm_jitter_ms,
+            fail_rate=args.llm_fail_rate,
+        )).start()
+
+    try:
+        if args.target == "http":
+            if args.base_url:
+                send = _http_sender(args.base_url.rstrip("/"), args.mode)
+                t0 = time.perf_counter()
+                results = replay(items, send, args.speed, args.max_gap_s, args.max_inflight)
+                wall = time.perf_counter() - t0
+            else:
+                with backend_process(
+                    workdir, fake.url if fake else None,
+                    port=args.port, workers=args.workers, database_url=target_db,
+                ) as base_url:
+                    send = _http_sender(base_url, args.mode)
+                    t0 = time.perf_counter()
+                    results = replay(items, send, args.speed, args.max_gap_s, args.max_inflight)
+                    wall = time.perf_counter() - t0
+        else:
+            os.environ["DATABASE_URL"] = target_db
+            if fake:
+                os.environ["GEMINI_BASE_URL"] = fake.url
+                os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+            send = _inprocess_sender(args.target, args.mode)
+            t0 = time.perf_counter()
+            results = replay(items, send, args.speed, args.max_gap_s, args.max_inflight)
+            wall = time.perf_counter() - t0
+    finally:
+        if fake:
+            fake.stop()
+
+    result = report(results, wall)
+    print(
+        f"[REPLAY] done: {result['throughput_rps']} rps, p95={result['latency'].get('p95_ms')} ms, "
+        f"errors={result['errors']}",
+        flush=True,
+    )
+    write_json(args.out, {
+        "meta": run_meta({
+            "tool": "replay",
+            "window": {"since": args.since, "until": args.until, "questions": len(items), "span_s": span},
+            "target": args.target,
+            "speed": args.speed,
+            "fake_llm": fake is not None,
+        }),
+        "results": result,
+    })
+
+
+if __name__ == "__main__":
+    main()
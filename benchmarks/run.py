@@ -0,0 +1,402 @@
+# benchmarks/run.py
+"""
+Benchmark suite ของ backend (ไม่ใช้ Gemini จริง)
+
+scenario:
+  chat        /chat throughput + p50/p95/p99 ที่ concurrency ต่าง ๆ (spawn backend + fake Gemini)
+  pdf         ความเร็ว ingest PDF ผ่าน /admin/upload_pdf (pages/s, chars/s)
+  faq         FaqAgent.find_best_faq_scored เมื่อจำนวน FAQ เพิ่มขึ้น
+  suggestion  SuggestionAgent.suggest_next_topics เมื่อ question_logs เพิ่มขึ้น
+  retrieval   retrieve_chunks (vector store ตาม VECTOR_BACKEND) เมื่อ corpus เพิ่มขึ้น + recall@k ของคำถามสังเคราะห์
+
+ตัวอย่าง:
+  python -m benchmarks.run --scenario chat --concurrency 1,4,16,32 --out bench-chat.json
+  python -m benchmarks.run --scenario faq,suggestion,retrieval --sizes 100,1000,5000
+  python -m benchmarks.run --scenario chat --base-url http://localhost:8000   (ใช้ server ที่รันอยู่แล้ว)
+
+scenario ที่รันใน process (faq / suggestion / retrieval) ใช้ SQLite + Chroma ชั่วคราวใน --workdir
+ผลลัพธ์เป็น JSON (meta + ผลของแต่ละ scenario) เพื่อเทียบระหว่าง commit
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import (
+    admin_headers,
+    backend_process,
+    http_json,
+    http_multipart,
+    ingest_docs,
+    run_meta,
+    summarize,
+    write_json,
+)
+from benchmarks.corpus import casual_variants, generate_corpus
+from benchmarks.fake_gemini import FakeGeminiConfig, FakeGeminiServer
+
+
+# ============================================================
+# CHAT (HTTP)
+# ============================================================
+
+def _chat_level(base_url: str, questions: List[str], concurrency: int, requests_n: int, mode: str) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    modes: Dict[str, int] = {}
+    lock = threading.Lock()
+    rng = random.Random(concurrency)
+    payloads = [
+        {"question": casual_variants(rng.choice(questions), rng), "mode": mode}
+        for _ in range(requests_n)
+    ]
+
+    def _one(payload):
+        nonlocal errors
+        t0 = time.perf_counter()
+        try:
+            status, body = http_json("POST", f"{base_url}/chat", payload)
+        except Exception:
+            status, body = 0, None
+        ms = (time.perf_counter() - t0) * 1000.0
+        with lock:
+            if status != 200:
+                errors += 1
+                return
+            latencies.append(ms)
+            key = (body or {}).get("answer_mode") or "unknown"
+            modes[key] = modes.get(key, 0) + 1
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(_one, payloads))
+    wall = time.perf_counter() - t_start
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests_n,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+        "latency": summarize(latencies),
+        "answer_modes": modes,
+    }
+
+
+def bench_chat(args, workdir: str) -> Dict[str, Any]:
+    docs, questions = generate_corpus(n_docs=args.docs, seed=args.seed)
+    texts = [q.text for q in questions]
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    fake_cfg = FakeGeminiConfig(
+        latency_ms=args.llm_latency_ms,
+        jitter_ms=args.llm_jitter_ms,
+        fail_rate=args.llm_fail_rate,
+        seed=args.seed,
+    )
+
+    def _run(base_url: str, ingest: bool) -> Dict[str, Any]:
+        if ingest:
+            t0 = time.perf_counter()
+            ingest_docs(base_url, docs)
+            print(f"[BENCH] ingested {len(docs)} docs in {time.perf_counter() - t0:.1f}s", flush=True)
+        out = []
+        for c in levels:
+            n = max(args.requests, c * 4)
+            res = _chat_level(base_url, texts, c, n, args.mode)
+            print(f"[BENCH] chat c={c}: {res['throughput_rps']} rps, p95={res['latency'].get('p95_ms')} ms", flush=True)
+            out.append(res)
+        return {"levels": out}
+
+    if args.base_url:
+        result = _run(args.base_url.rstrip("/"), ingest=args.ingest)
+        result["target"] = args.base_url
+        return result
+
+    with FakeGeminiServer(fake_cfg) as fake:
+        with backend_process(workdir, fake.url, port=args.port, workers=args.workers) as base_url:
+            result = _run(base_url, ingest=True)
+        result["fake_gemini"] = {
+            "latency_ms": fake_cfg.latency_ms,
+            "jitter_ms": fake_cfg.jitter_ms,
+            "fail_rate": fake_cfg.fail_rate,
+            **fake_cfg.stats,
+        }
+    result["workers"] = args.workers
+    return result
+
+
+# ============================================================
+# PDF INGEST (HTTP)
+# ============================================================
+
+def make_pdf(pages: int, lines_per_page: int = 40, seed: int = 0) -> bytes:
+    """PDF เล็กที่สุดที่ PyPDF2 อ่านได้ (Helvetica → ข้อความ ASCII)"""
+    rng = random.Random(seed)
+    objects: List[bytes] = []
+    page_ids = []
+    n_fixed = 3  # catalog, pages, font
+    for p in range(pages):
+        lines = []
+        for i in range(lines_per_page):
+            lines.append(
+                f"Article {p * lines_per_page + i + 1}: students must submit form {rng.randint(100, 999)} "
+                f"before day {rng.randint(1, 28)}, late fee {rng.choice([100, 200, 500])} baht."
+            )
+        stream = "BT /F1 9 Tf 36 800 Td 11 TL " + " ".join(f"({ln}) '" for ln in lines) + " ET"
+        content_id = n_fixed + 2 * p + 1
+        page_id = content_id + 1
+        page_ids.append(page_id)
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode("latin-1"))
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>".encode("latin-1")
+        )
+    kids = " ".join(f"{i} 0 R" for i in page_ids)
+    fixed = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode("latin-1"),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    all_objs = fixed + objects
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(all_objs, 1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n".encode("latin-1") + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(all_objs) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    for off in offsets:
+        out += f"{off:010d} 00000 n \n".encode("latin-1")
+    out += f"trailer\n<< /Size {len(all_objs) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+def bench_pdf(args, workdir: str) -> Dict[str, Any]:
+    page_counts = [int(x) for x in args.pdf_pages.split(",") if x.strip()]
+
+    def _run(base_url: str) -> List[Dict[str, Any]]:
+        out = []
+        for pages in page_counts:
+            pdf = make_pdf(pages, seed=pages)
+            t0 = time.perf_counter()
+            status, body = http_multipart(
+                f"{base_url}/admin/upload_pdf", "file", f"bench-{pages}p.pdf", pdf,
+                headers=admin_headers(),
+            )
+            sec = time.perf_counter() - t0
+            chars = (body or {}).get("chars", 0)
+            out.append({
+                "pages": pages,
+                "bytes": len(pdf),
+                "status": status,
+                "seconds": round(sec, 3),
+                "pages_per_s": round(pages / sec, 2) if sec > 0 else 0.0,
+                "chars_per_s": round(chars / sec, 1) if sec > 0 else 0.0,
+            })
+            print(f"[BENCH] pdf {pages}p: {sec:.2f}s", flush=True)
+        return out
+
+    if args.base_url:
+        return {"uploads": _run(args.base_url.rstrip("/"))}
+    with backend_process(workdir, None, port=args.port) as base_url:
+        return {"uploads": _run(base_url)}
+
+
+# ============================================================
+# IN-PROCESS (FAQ / SUGGESTION / RETRIEVAL)
+# ============================================================
+
+def _prepare_inprocess_env(workdir: str):
+    """ต้องเรียกก่อน import app.* (DATABASE_URL / CHROMA_DIR ถูกอ่านตอน import)"""
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'inprocess.db')}")
+    os.environ.setdefault("CHROMA_DIR", os.path.join(workdir, "chroma-inprocess"))
+    os.environ.setdefault("GEMINI_API_KEY", "fake-key")
+
+
+def _timed(fn, queries: List[str]) -> List[float]:
+    out = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        out.append((time.perf_counter() - t0) * 1000.0)
+    return out
+
+
+def bench_faq(args, workdir: str) -> Dict[str, Any]:
+    _prepare_inprocess_env(workdir)
+    import numpy as np
+
+    from app.agents.faq import FaqAgent
+    from app.services.quantize import encode_vector
+    from app.core.database import SessionLocal, engine
+    from app.models.sql import Base, FaqEntry
+    from app.services.rag import embedder
+
+    Base.metadata.create_all(bind=engine)
+    agent = FaqAgent(embedder=embedder, threshold=0.85)
+    _, questions = generate_corpus(n_docs=40, seed=args.seed)
+    queries = [q.text for q in questions][: args.queries]
+    dim = len(embedder.encode("ทดสอบ"))
+    rng = np.random.default_rng(args.seed)
+
+    out = []
+    db = SessionLocal()
+    try:
+        db.query(FaqEntry).delete()
+        db.commit()
+        current = 0
+        for size in sorted(int(x) for x in args.sizes.split(",") if x.strip()):
+            # ใช้ vector สุ่ม (normalize แล้ว) — เวลาของ lookup ไม่ขึ้นกับเนื้อหา
+            for i in range(current, size):
+                v = rng.standard_normal(dim).astype(np.float32)
+                v /= np.linalg.norm(v)
+                db.add(FaqEntry(
+                    question=f"คำถามสังเคราะห์ที่ {i}",
+                    answer="คำตอบสังเคราะห์",
+                    question_embedding=encode_vector(v, agent.vector_dtype),
+                    hits=1,
+                ))
+            db.commit()
+            current = size
+            lat = _timed(lambda q: agent.find_best_faq_scored(q, db), queries)
+            out.append({"faq_entries": size, "latency": summarize(lat)})
+            print(f"[BENCH] faq n={size}: p95={out[-1]['latency']['p95_ms']} ms", flush=True)
+    finally:
+        db.close()
+    return {"levels": out}
+
+
+def bench_suggestion(args, workdir: str) -> Dict[str, Any]:
+    _prepare_inprocess_env(workdir)
+    from app.agents.suggestion import SuggestionAgent
+    from app.core.database import SessionLocal, engine
+    from app.models.sql import Base, QuestionLog
+    from app.services.rag import embedder
+
+    Base.metadata.create_all(bind=engine)
+    agent = SuggestionAgent(embedder)
+    _, questions = generate_corpus(n_docs=max(40, args.docs), seed=args.seed)
+    texts = [q.text for q in questions]
+    queries = texts[: args.queries]
+    rng = random.Random(args.seed)
+
+    out = []
+    db = SessionLocal()
+    try:
+        db.query(QuestionLog).delete()
+        db.commit()
+        current = 0
+        for size in sorted(int(x) for x in args.sizes.split(",") if x.strip()):
+            for i in range(current, size):
+                db.add(QuestionLog(question=f"{rng.choice(texts)} #{i % 997}", intent="academic", route="academic"))
+            db.commit()
+            current = size
+            lat = _timed(lambda q: agent.suggest_next_topics(q, db, limit=3), queries)
+            out.append({"question_logs": size, "latency": summarize(lat)})
+            print(f"[BENCH] suggestion n={size}: p95={out[-1]['latency']['p95_ms']} ms", flush=True)
+    finally:
+        db.close()
+    return {"levels": out}
+
+
+def bench_retrieval(args, workdir: str) -> Dict[str, Any]:
+    _prepare_inprocess_env(workdir)
+    from app.services.rag import add_or_update_doc_to_vector, lexical_index, retrieve_chunks
+
+    sizes = sorted(int(x) for x in args.sizes.split(",") if x.strip())
+    docs, questions = generate_corpus(n_docs=max(sizes), seed=args.seed)
+
+    out = []
+    current = 0
+    for size in sizes:
+        t0 = time.perf_counter()
+        with lexical_index.bulk():
+            for d in docs[current:size]:
+                add_or_update_doc_to_vector(
+                    doc_id=d.key, content=d.content, metadata={"title": d.title, "source": "benchmark"},
+                )
+        ingest_s = time.perf_counter() - t0
+        added = size - current
+        current = size
+
+        in_corpus = [q for q in questions if int(q.doc_key.split("-")[1]) < size]
+        sample = random.Random(size).sample(in_corpus, k=min(args.queries, len(in_corpus)))
+        latencies, hits = [], 0
+        for q in sample:
+            t1 = time.perf_counter()
+            chunks = retrieve_chunks(q.text)
+            latencies.append((time.perf_counter() - t1) * 1000.0)
+            if any((c.get("metadata") or {}).get("doc_id") == q.doc_key for c in chunks):
+                hits += 1
+        out.append({
+            "docs": size,
+            "ingest_docs_per_s": round(added / ingest_s, 2) if ingest_s > 0 else 0.0,
+            "latency": summarize(latencies),
+            "recall_at_k": round(hits / len(sample), 4) if sample else 0.0,
+        })
+        print(f"[BENCH] retrieval docs={size}: p95={out[-1]['latency']['p95_ms']} ms recall={out[-1]['recall_at_k']}", flush=True)
+    return {"levels": out}
+
+
+SCENARIOS = {
+    "chat": bench_chat,
+    "pdf": bench_pdf,
+    "faq": bench_faq,
+    "suggestion": bench_suggestion,
+    "retrieval": bench_retrieval,
+}
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="MFU chatbot benchmark suite")
+    ap.add_argument("--scenario", default="chat", help=f"comma-separated: {','.join(SCENARIOS)} or all")
+    ap.add_argument("--out", help="เขียนผล JSON ลงไฟล์ (default: stdout)")
+    ap.add_argument("--workdir", help="ที่เก็บ DB / Chroma ชั่วคราว (default: temp dir)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--docs", type=int, default=60, help="จำนวนเอกสารสังเคราะห์ของ scenario chat")
+    # chat
+    ap.add_argument("--base-url", help="ยิงไปที่ backend ที่รันอยู่แล้วแทนการ spawn")
+    ap.add_argument("--ingest", action="store_true", help="(กับ --base-url) ingest corpus สังเคราะห์ก่อน")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=1)
+    ap.add_argument("--concurrency", default="1,4,16,32")
+    ap.add_argument("--requests", type=int, default=64, help="จำนวน request ขั้นต่ำต่อระดับ concurrency")
+    ap.add_argument("--mode", default="auto", choices=["auto", "fast"])
+    ap.add_argument("--llm-latency-ms", type=float, default=600.0)
+    ap.add_argument("--llm-jitter-ms", type=float, default=200.0)
+    ap.add_argument("--llm-fail-rate", type=float, default=0.0)
+    # pdf
+    ap.add_argument("--pdf-pages", default="1,10,50")
+    # in-process
+    ap.add_argument("--sizes", default="100,1000,5000", help="ขนาดตาราง / corpus ที่จะไล่วัด")
+    ap.add_argument("--queries", type=int, default=50)
+    args = ap.parse_args(argv)
+
+    names = list(SCENARIOS) if args.scenario == "all" else [s.strip() for s in args.scenario.split(",") if s.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        ap.error(f"unknown scenario: {', '.join(unknown)}")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="mfu-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    print(f"[BENCH] workdir={workdir}", flush=True)
+
+    results: Dict[str, Any] = {}
+    for name in names:
+        t0 = time.perf_counter()
+        results[name] = SCENARIOS[name](args, workdir)
+        results[name]["seconds"] = round(time.perf_counter() - t0, 2)
+
+    write_json(args.out, {
+        "meta": run_meta({"scenarios": names, "args": vars(args)}),
+        "results": results,
+    })
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# benchmarks/startup.py
+"""
+วัดเวลา cold start ของ backend
+
+1. import-time profile: `python -X importtime -c "import app.main"` → เวลารวม + module ที่ช้าที่สุด
+   (cumulative) — ดูว่าอะไรยังถูกโหลดตอน import (sentence_transformers / torch / chromadb / google.*
+   ควรไม่อยู่ในรายการหลังทำ lazy init)
+2. ต่อ STARTUP_WARMUP (off / background / blocking): spawn uvicorn ใหม่ (DB / Chroma ว่างใน temp dir,
+   Gemini = fake) แล้ววัดจากเวลา spawn
+   - health_ms: /health ตอบ 200 ครั้งแรก (liveness)
+   - ready_ms:  /ready ตอบ 200 ครั้งแรก (off = หลัง request แรกโหลดของครบ)
+   - first_chat_ms: latency ของ /chat แรก (fast mode: embedder + vector store, ไม่รอ LLM)
+   - components: เวลาโหลดต่อ component จาก /ready
+
+"blocking" = โหลดทุกอย่างก่อนรับ request เหมือนก่อนมี lazy init (ตัวเทียบ "before")
+
+ตัวอย่าง:
+  python -m benchmarks.startup --out startup.json
+  python -m benchmarks.startup --modes background --repeat 3
+"""
+
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from benchmarks.common import ROOT_DIR, bench_env, http_json, run_meta, summarize, write_json
+from benchmarks.fake_gemini import FakeGeminiServer
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_profile(env: Dict[str, str], top: int) -> Dict[str, Any]:
+    """-X importtime ของ app.main → เวลารวม (ms) + module ระดับบนสุดที่ cumulative มากที่สุด"""
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True, timeout=600,
+    )
+    wall_ms = (time.perf_counter() - t0) * 1000.0
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME.match(line)
+        if m:
+            rows.append({"module": m.group(4), "self_ms": int(m.group(1)) / 1000.0,
+                         "cumulative_ms": int(m.group(2)) / 1000.0, "depth": len(m.group(3)) // 2})
+    total = next((r["cumulative_ms"] for r in rows if r["module"] == "app.main"), None)
+    # ระดับบนสุดของ package ภายนอก (ตัด submodule ออก) เรียงตาม cumulative
+    roots: Dict[str, float] = {}
+    for r in rows:
+        name = r["module"].split(".")[0]
+        if r["module"] == name:
+            roots[name] = max(roots.get(name, 0.0), r["cumulative_ms"])
+    heavy = sorted(roots.items(), key=lambda x: x[1], reverse=True)[:top]
+    return {
+        "ok": proc.returncode == 0,
+        "wall_ms": round(wall_ms, 1),
+        "app_main_ms": round(total, 1) if total is not None else None,
+        "top_packages": [{"package": k, "cumulative_ms": round(v, 1)} for k, v in heavy],
+        "error": proc.stderr.strip().splitlines()[-1] if proc.returncode else None,
+    }
+
+
+def _poll(url: str, t0: float, timeout_s: float, want: int = 200) -> Optional[float]:
+    while time.perf_counter() - t0 < timeout_s:
+        try:
+            status, _ = http_json("GET", url, timeout=5)
+            if status == want:
+                return round((time.perf_counter() - t0) * 1000.0, 1)
+        except Exception:
+            pass
+        time.sleep(0.05)
+    return None
+
+
+def cold_start(mode: str, gemini_url: str, port: int, timeout_s: float) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    env = bench_env(workdir, gemini_url)
+    env["STARTUP_WARMUP"] = mode
+    log_path = os.path.join(workdir, "backend.log")
+    base_url = f"http://127.0.0.1:{port}"
+    row: Dict[str, Any] = {"mode": mode}
+    with open(log_path, "wb") as log:
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+             "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+        )
+        try:
+            row["health_ms"] = _poll(f"{base_url}/health", t0, timeout_s)
+            if mode != "off":
+                row["ready_ms"] = _poll(f"{base_url}/ready", t0, timeout_s)
+            t1 = time.perf_counter()
+            status, _ = http_json("POST", f"{base_url}/chat", {"question": "ลงทะเบียนเรียนวันไหน", "mode": "fast"})
+            row["first_chat_ms"] = round((time.perf_counter() - t1) * 1000.0, 1)
+            row["first_chat_status"] = status
+            if mode == "off":
+                # warmup ไม่ได้รัน: component ที่ request แรกไม่ได้ใช้ยัง cold (ไม่นับใน /ready ของโหมด off)
+                row["ready_ms"] = _poll(f"{base_url}/ready", t0, 1.0)
+            _, ready = http_json("GET", f"{base_url}/ready")
+            row["import_ms"] = (ready or {}).get("import_ms")
+            row["components"] = {k: v.get("ms") for k, v in ((ready or {}).get("components") or {}).items()}
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            shutil.rmtree(workdir, ignore_errors=True)
+    return row
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Measure backend cold start (import time, /health, /ready)")
+    ap.add_argument("--modes", default="off,background,blocking", help="ค่า STARTUP_WARMUP ที่จะวัด")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--port", type=int, default=8766)
+    ap.add_argument("--top", type=int, default=12, help="จำนวน package ที่ import ช้าที่สุดที่จะแสดง")
+    ap.add_argument("--timeout", type=float, default=600.0)
+    ap.add_argument("--out")
+    args = ap.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="bench-import-")
+    try:
+        profile = import_profile(bench_env(workdir, "http://127.0.0.1:9"), args.top)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(f"[BENCH] import app.main: {profile['app_main_ms']} ms "
+          f"(top: {', '.join(p['package'] for p in profile['top_packages'][:5])})", flush=True)
+
+    runs: Dict[str, List[Dict[str, Any]]] = {}
+    with FakeGeminiServer() as fake:
+        for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+            for _ in range(args.repeat):
+                row = cold_start(mode, fake.url, args.port, args.timeout)
+                runs.setdefault(mode, []).append(row)
+                print(f"[BENCH] STARTUP_WARMUP={mode}: health={row.get('health_ms')} ms "
+                      f"ready={row.get('ready_ms')} ms first_chat={row.get('first_chat_ms')} ms", flush=True)
+
+    summary = {
+        mode: {
+            key: summarize([r[key] for r in rows if r.get(key) is not None])
+            for key in ("health_ms", "ready_ms", "first_chat_ms")
+        }
+        for mode, rows in runs.items()
+    }
+    write_json(args.out, {"meta": run_meta({"repeat": args.repeat}), "import": profile,
+                          "runs": runs, "summary": summary})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+# benchmarks/vector_store.py
+"""
+เทียบ vector store backend (Chroma HNSW vs numpy exact search) ที่ขนาด corpus ต่าง ๆ
+
+ใช้ embedding สุ่ม (normalize แล้ว) ขนาดเท่า MiniLM (384) + metadata แบบเดียวกับ chunk จริง
+(doc_id / chunk_index / category) — ไม่ต้องโหลด embedding model
+query = vector ใน corpus + noise, วัดทั้งแบบไม่ filter และ filter หมวด (retrieval profile)
+
+ต่อขนาด: เวลา upsert, latency ของ query (p50/p95/p99), recall@k ของ Chroma เทียบกับ exact
+แล้วสรุป crossover: จำนวน chunk สูงสุดที่ numpy ยังเร็วกว่า (→ VECTOR_BACKEND=auto ใช้ค่านี้)
+
+ตัวอย่าง:
+  python -m benchmarks.vector_store --sizes 1000,10000,50000 --out bench-vector.json
+  python -m benchmarks.vector_store --write-choice data/vector_backend.json
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.common import run_meta, summarize, write_json
+
+CATEGORIES = ["academic", "regulation", "scholarship", "dorm", "contact", "general"]
+CHUNKS_PER_DOC = 20
+
+
+def _corpus(n: int, dim: int, rng: np.random.Generator):
+    # กลุ่มละ CHUNKS_PER_DOC chunk รอบ "หัวข้อ" เดียวกัน → มีเพื่อนบ้านใกล้ ๆ เหมือน corpus จริง
+    centers = rng.standard_normal((max(1, n // CHUNKS_PER_DOC + 1), dim)).astype(np.float32)
+    vecs = centers[np.arange(n) // CHUNKS_PER_DOC] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    vecs /= np.linalg.norm(vecs, axis=1, keepdims=True)
+    ids = [f"{i // CHUNKS_PER_DOC}::{i % CHUNKS_PER_DOC}" for i in range(n)]
+    metas = [
+        {
+            "doc_id": str(i // CHUNKS_PER_DOC),
+            "chunk_index": i % CHUNKS_PER_DOC,
+            "category": CATEGORIES[(i // CHUNKS_PER_DOC) % len(CATEGORIES)],
+        }
+        for i in range(n)
+    ]
+    return ids, vecs, metas
+
+
+def _fill(store, ids, vecs, metas, batch: int = 2000) -> float:
+    t0 = time.perf_counter()
+    with store.bulk():
+        for i in range(0, len(ids), batch):
+            store.upsert(
+                ids=ids[i:i + batch],
+                embeddings=vecs[i:i + batch].tolist(),
+                documents=[f"chunk {cid}" for cid in ids[i:i + batch]],
+                metadatas=metas[i:i + batch],
+            )
+    return time.perf_counter() - t0
+
+
+def _run_queries(store, queries: np.ndarray, k: int, where) -> Dict[str, Any]:
+    latencies, results = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        res = store.query(query_embeddings=[q.tolist()], n_results=k, where=where,
+                          include=["documents", "metadatas", "distances"])
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        results.append((res.get("ids") or [[]])[0])
+    return {"latency": summarize(latencies), "ids": results}
+
+
+def _recall(got: List[List[str]], exact: List[List[str]]) -> float:
+    hits = sum(len(set(g) & set(e)) for g, e in zip(got, exact))
+    total = sum(len(e) for e in exact)
+    return round(hits / total, 4) if total else 0.0
+
+
+def bench_size(size: int, args, workdir: str, rng: np.random.Generator) -> Dict[str, Any]:
+    from app.services.vectorstore import ChromaVectorStore, NumpyVectorStore
+
+    ids, vecs, metas = _corpus(size, args.dim, rng)
+    picks = rng.integers(0, size, args.queries)
+    queries = vecs[picks] + 0.3 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    where = {"category": {"$in": ["academic", "general"]}}
+
+    row: Dict[str, Any] = {"size": size}
+    numpy_store = NumpyVectorStore(os.path.join(workdir, f"numpy-{size}"))
+    row["numpy"] = {"ingest_s": round(_fill(numpy_store, ids, vecs, metas), 3)}
+    exact = {}
+    for name, w in (("all", None), ("filtered", where)):
+        out = _run_queries(numpy_store, queries, args.k, w)
+        row["numpy"][name] = out["latency"]
+        exact[name] = out["ids"]
+
+    # เปิดใหม่จากไฟล์ (memory-mapped) — เทียบกับ process ที่เพิ่ง start
+    reopened = NumpyVectorStore(os.path.join(workdir, f"numpy-{size}"))
+    row["numpy"]["reopened_all"] = _run_queries(reopened, queries, args.k, None)["latency"]
+
+    if args.no_chroma:
+        return row
+    try:
+        chroma_store = ChromaVectorStore(os.path.join(workdir, f"chroma-{size}"))
+    except ImportError as e:
+        row["chroma"] = {"error": f"chromadb not installed: {e}"}
+        return row
+    row["chroma"] = {"ingest_s": round(_fill(chroma_store, ids, vecs, metas), 3)}
+    for name, w in (("all", None), ("filtered", where)):
+        out = _run_queries(chroma_store, queries, args.k, w)
+        row["chroma"][name] = out["latency"]
+        row["chroma"][f"recall_{name}"] = _recall(out["ids"], exact[name])
+    return row
+
+
+def recommend(rows: List[Dict[str, Any]], default_max_rows: int) -> Dict[str, Any]:
+    """crossover = จำนวน chunk สูงสุดที่ numpy p95 ยังไม่ช้ากว่า Chroma (ทั้งแบบ all และ filtered)
+
+    numpy ชนะทุกขนาดที่วัด → ประมาณต่อจากขนาดใหญ่สุด (brute force โตแบบเส้นตรง, HNSW แทบคงที่)
+    """
+    measured = [r for r in rows if "all" in r.get("chroma", {})]
+    if not measured:
+        return {"numpy_max_rows": default_max_rows, "basis": "default (no Chroma measurements)"}
+
+    def p95(r, backend):
+        return max(r[backend]["all"]["p95_ms"], r[backend]["filtered"]["p95_ms"])
+
+    wins = [r for r in measured if p95(r, "numpy") <= p95(r, "chroma")]
+    if not wins:
+        return {"numpy_max_rows": 0, "basis": "Chroma faster at every measured size"}
+    largest = max(measured, key=lambda r: r["size"])
+    if largest in wins:
+        ratio = p95(largest, "chroma") / max(p95(largest, "numpy"), 1e-6)
+        est = int(largest["size"] * max(1.0, ratio))
+        return {"numpy_max_rows": est, "basis": f"extrapolated from {largest['size']} chunks (x{ratio:.1f})"}
+    best = max(wins, key=lambda r: r["size"])
+    return {"numpy_max_rows": best["size"], "basis": "largest measured size where numpy p95 <= Chroma p95"}
+
+
+def main(argv: Optional[List[str]] = None):
+    ap = argparse.ArgumentParser(description="Compare Chroma and numpy vector store backends")
+    ap.add_argument("--sizes", default="1000,10000,50000")
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--workdir", help="ที่เก็บ store ชั่วคราว (default: temp dir)")
+    ap.add_argument("--no-chroma", action="store_true", help="วัดเฉพาะ numpy")
+    ap.add_argument("--default-max-rows", type=int, default=200_000)
+    ap.add_argument("--write-choice", help="เขียน {numpy_max_rows} สำหรับ VECTOR_BACKEND=auto")
+    ap.add_argument("--out")
+    args = ap.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench-vector-")
+    rng = np.random.default_rng(args.seed)
+    rows = []
+    try:
+        for size in sorted(int(x) for x in args.sizes.split(",") if x.strip()):
+            row = bench_size(size, args, workdir, rng)
+            rows.append(row)
+            line = f"[BENCH] vector size={size}: numpy p95={row['numpy']['all']['p95_ms']} ms"
+            if "all" in row.get("chroma", {}):
+                line += (f" chroma p95={row['chroma']['all']['p95_ms']} ms"
+                         f" recall={row['chroma']['recall_all']}")
+            print(line, flush=True)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    choice = recommend(rows, args.default_max_rows)
+    print(f"[BENCH] VECTOR_BACKEND=auto → numpy up to {choice['numpy_max_rows']} chunks ({choice['basis']})", flush=True)
+    payload = {"meta": run_meta({"dim": args.dim, "k": args.k}), "sizes": rows, "choice": choice}
+    write_json(args.out, payload)
+    if args.write_choice:
+        os.makedirs(os.path.dirname(os.path.abspath(args.write_choice)), exist_ok=True)
+        write_json(args.write_choice, dict(choice, meta=payload["meta"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# tests/test_batcher.py
+"""EmbeddingBatcher (app/services/batcher.py): รวม batch, flush เมื่อครบ max_batch, encode ตรง, error"""
+
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from app.services.batcher import EmbeddingBatcher
+
+
+class FakeModel:
+    """vector ของข้อความ = [len(text), index ใน batch] — ตรวจได้ว่าผลกลับถึง caller ถูกตัว"""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+        self._lock = threading.Lock()
+
+    def encode(self, sentences, *args, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        with self._lock:
+            self.calls.append((texts, kwargs))
+        if self.fail:
+            raise RuntimeError("model failed")
+        vecs = np.array([[len(t), i] for i, t in enumerate(texts)], dtype=np.float32)
+        return vecs[0] if single else vecs
+
+    def get_sentence_embedding_dimension(self):
+        return 2
+
+
+def _encode_concurrently(batcher, texts):
+    results = [None] * len(texts)
+    errors = []
+    barrier = threading.Barrier(len(texts))
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = batcher.encode(texts[i])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(texts))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5.0)
+    return results, errors
+
+
+def test_concurrent_requests_share_a_batch():
+    model = FakeModel()
+    batcher = EmbeddingBatcher(model, max_batch=64, max_wait_ms=100)
+    texts = ["a" * n for n in range(1, 9)]
+    results, errors = _encode_concurrently(batcher, texts)
+
+    assert not errors
+    assert len(model.calls) < len(texts)
+    for text, vec in zip(texts, results):
+        assert vec.shape == (2,) and vec[0] == len(text)
+    assert all(kwargs == {"show_progress_bar": False} for _, kwargs in model.calls)
+
+
+def test_full_batch_flushes_without_waiting():
+    model = FakeModel()
+    batcher = EmbeddingBatcher(model, max_batch=4, max_wait_ms=10_000)
+    t0 = time.perf_counter()
+    results, errors = _encode_concurrently(batcher, ["aa", "bbb", "c", "dddd"])
+    assert not errors
+    assert time.perf_counter() - t0 < 5.0
+    assert sorted(v[0] for v in results) == [1, 2, 3, 4]
+
+
+def test_list_input_returns_matrix_in_order():
+    model = FakeModel()
+    batcher = EmbeddingBatcher(model, max_batch=8, max_wait_ms=1)
+    vecs = batcher.encode(["a", "bbb"])
+    assert vecs.shape == (2, 2)
+    assert list(vecs[:, 0]) == [1, 3]
+
+
+@pytest.mark.parametrize(
+    "call",
+    [
+        lambda b: b.encode(["x"] * 4),                              # ≥ max_batch (เช่น ingest)
+        lambda b: b.encode("x", normalize_embeddings=True),         # option ที่เปลี่ยนผล
+        lambda b: b.encode("x", 16),                                # positional args
+    ],
+)
+def test_direct_encode_bypasses_queue(call):
+    model = FakeModel()
+    batcher = EmbeddingBatcher(model, max_batch=4, max_wait_ms=1)
+    call(batcher)
+    assert len(model.calls) == 1
+    assert batcher._worker is None
+
+
+def test_model_error_reaches_every_caller():
+    batcher = EmbeddingBatcher(FakeModel(fail=True), max_batch=64, max_wait_ms=50)
+    results, errors = _encode_concurrently(batcher, ["a", "b", "c"])
+    assert len(errors) == 3 and all(isinstance(e, RuntimeError) for e in errors)
+    # worker ยังรับงานต่อได้หลัง batch ที่ error
+    batcher._model.fail = False
+    assert batcher.encode("abcd")[0] == 4
+
+
+def test_attributes_delegate_to_model():
+    batcher = EmbeddingBatcher(FakeModel())
+    assert batcher.get_sentence_embedding_dimension() == 2
@@ -0,0 +1,67 @@
+# tests/test_deadline.py
+"""Deadline (app/services/deadline.py): ลำดับการ degrade ที่ run_pipeline ตัดสินไว้ก่อนเริ่ม DAG"""
+
+import pytest
+
+from app.services.deadline import DEGRADE_ORDER, STAGE_COST_MS, Deadline
+
+
+def _plan(deadline: Deadline):
+    """แผนเดียวกับ orchestrator.run_pipeline: router ก่อน แล้วจึง suggestion (ตัดสินครั้งเดียวก่อน launch)"""
+    use_llm_router = deadline.allows("router")
+    if not use_llm_router:
+        deadline.skip("router")
+    use_suggestion = deadline.allows("suggestion")
+    if not use_suggestion:
+        deadline.skip("suggestion")
+    return use_llm_router, use_suggestion
+
+
+def test_unlimited_allows_everything():
+    d = Deadline(None)
+    assert d.unlimited
+    assert all(d.allows(stage) for stage in DEGRADE_ORDER)
+    assert d.timeout_s(2.0) == 2.0
+
+
+def test_generous_budget_keeps_every_stage():
+    d = Deadline(60_000)
+    assert _plan(d) == (True, True)
+    assert d.allows("followups") and d.allows("multi_query")
+    assert d.skipped == []
+
+
+def test_router_cut_cuts_everything_before_it():
+    """เวลาพอสำหรับ suggestion แต่ไม่พอ router (+ reserve ของ generate) → suggestion ต้องถูกตัดด้วย"""
+    budget = STAGE_COST_MS["router"] + STAGE_COST_MS["generate"] - 500
+    assert budget >= STAGE_COST_MS["suggestion"]
+    d = Deadline(budget)
+    assert _plan(d) == (False, False)
+    assert d.skipped == ["router", "suggestion"]
+    for stage in ("query_rewrite", "multi_query", "followups"):
+        assert not d.allows(stage)
+    assert d.allows("generate")
+
+
+def test_reserve_for_more_important_stages():
+    d = Deadline(STAGE_COST_MS["followups"] + STAGE_COST_MS["suggestion"] - 1)
+    assert not d.allows("followups")
+    assert d.allows("suggestion")
+
+
+@pytest.mark.parametrize("stage", DEGRADE_ORDER[:-1])
+def test_skipping_a_stage_blocks_earlier_stages_only(stage):
+    d = Deadline(60_000)
+    d.skip(stage)
+    i = DEGRADE_ORDER.index(stage)
+    assert not any(d.allows(s) for s in DEGRADE_ORDER[:i])
+    assert all(d.allows(s) for s in DEGRADE_ORDER[i + 1:])
+
+
+def test_timeout_capped_by_remaining_budget():
+    d = Deadline(1000)
+    assert 0 < d.timeout_s() <= 1.0
+    assert d.timeout_s(0.2) == 0.2
+    d.skip("router")
+    d.skip("router")
+    assert d.skipped == ["router"]
@@ -0,0 +1,147 @@
+# tests/test_pipeline.py
+"""DAG executor (app/agents/pipeline.py): ลำดับ dependency, when, short-circuit + ยกเลิก speculative stage"""
+
+import threading
+import time
+
+import pytest
+
+from app.agents.base import AgentState
+from app.agents.pipeline import Pipeline, stage_fn
+
+MODES = [pytest.param(True, id="concurrent"), pytest.param(False, id="sequential")]
+
+
+def _record(log, name, delay=0.0):
+    def fn(state):
+        if delay:
+            time.sleep(delay)
+        log.append(name)
+    return fn
+
+
+@pytest.mark.parametrize("concurrent", MODES)
+def test_dependencies_run_in_order(concurrent):
+    log = []
+    pipe = Pipeline(
+        [
+            stage_fn("c", _record(log, "c"), after=("a", "b")),
+            stage_fn("a", _record(log, "a", 0.02)),
+            stage_fn("b", _record(log, "b")),
+        ],
+        concurrent=concurrent,
+    )
+    state = pipe.run(AgentState(question="q"))
+    assert log[-1] == "c" and set(log) == {"a", "b", "c"}
+    dag = state.debug["dag"]
+    assert all(dag[n]["status"] == "done" for n in "abc")
+    assert dag["c"]["start_ms"] >= dag["a"]["end_ms"]
+
+
+def test_independent_stages_overlap():
+    pipe = Pipeline([stage_fn(n, lambda s: time.sleep(0.1)) for n in ("a", "b", "c")])
+    t0 = time.perf_counter()
+    pipe.run(AgentState(question="q"))
+    assert time.perf_counter() - t0 < 0.25
+
+
+@pytest.mark.parametrize("concurrent", MODES)
+def test_when_false_skips_stage_and_dependents_still_run(concurrent):
+    log = []
+    pipe = Pipeline(
+        [
+            stage_fn("a", _record(log, "a"), when=lambda s: False),
+            stage_fn("b", _record(log, "b"), after=("a",)),
+        ],
+        concurrent=concurrent,
+    )
+    state = pipe.run(AgentState(question="q"))
+    assert log == ["b"]
+    assert state.debug["dag"]["a"]["status"] == "skipped"
+
+
+@pytest.mark.parametrize("concurrent", MODES)
+def test_short_circuit_cancels_pending_speculative_stage(concurrent):
+    log = []
+
+    def hit(state):
+        state.data["hit"] = True
+
+    pipe = Pipeline(
+        [
+            stage_fn("faq", hit),
+            stage_fn("answer", _record(log, "answer"), after=("faq",), speculative=True),
+            stage_fn("log", _record(log, "log"), after=("faq",)),
+        ],
+        short_circuit=lambda s: s.data.get("hit"),
+        concurrent=concurrent,
+    )
+    state = pipe.run(AgentState(question="q"))
+    assert log == ["log"]
+    assert state.debug["dag"]["answer"]["status"] == "cancelled"
+    assert state.data["cancel"].is_set()
+
+
+def test_short_circuit_signals_running_speculative_stage():
+    """speculative stage ที่รันอยู่แล้วเห็น cancel event → เลิกก่อนงานแพง และ pipeline ไม่รอมัน"""
+    saw_cancel = threading.Event()
+    finished = threading.Event()
+
+    def slow(state):
+        if state.data["cancel"].wait(2.0):
+            saw_cancel.set()
+        finished.set()
+
+    def hit(state):
+        time.sleep(0.02)
+        state.data["hit"] = True
+
+    pipe = Pipeline(
+        [stage_fn("faq", hit), stage_fn("router", slow, speculative=True)],
+        short_circuit=lambda s: s.data.get("hit"),
+    )
+    t0 = time.perf_counter()
+    state = pipe.run(AgentState(question="q"))
+    assert time.perf_counter() - t0 < 1.0
+    assert state.debug["dag"]["router"]["status"] == "cancelled"
+    assert finished.wait(1.0) and saw_cancel.is_set()
+
+
+def test_caller_cancel_event_is_reused():
+    cancel = threading.Event()
+    state = AgentState(question="q")
+    state.data["cancel"] = cancel
+    pipe = Pipeline([stage_fn("a", lambda s: s.data.update(hit=True))], short_circuit=lambda s: s.data.get("hit"))
+    pipe.run(state)
+    assert state.data["cancel"] is cancel and cancel.is_set()
+
+
+def test_stage_error_propagates_and_cancels_the_rest():
+    other = threading.Event()
+
+    def boom(state):
+        raise RuntimeError("boom")
+
+    def waiter(state):
+        if state.data["cancel"].wait(2.0):
+            other.set()
+
+    pipe = Pipeline([stage_fn("boom", boom), stage_fn("slow", waiter)])
+    state = AgentState(question="q")
+    with pytest.raises(RuntimeError, match="boom"):
+        pipe.run(state)
+    assert other.wait(1.0)
+    assert state.debug["dag"]["slow"]["status"] == "cancelled"
+
+
+@pytest.mark.parametrize(
+    "stages, message",
+    [
+        ([stage_fn("a", print, after=("b",)), stage_fn("b", print, after=("a",))], "cycle"),
+        ([stage_fn("a", print, after=("x",))], "unknown stage"),
+        ([stage_fn("a", print), stage_fn("a", print)], "duplicate"),
+    ],
+)
+def test_invalid_graph(stages, message):
+    with pytest.raises(ValueError, match=message):
+        Pipeline(stages)
@@ -0,0 +1,181 @@
+# tests/test_remote.py
+"""framing ของ model server (app/services/remote.py) + ModelServerClient บน Unix socket"""
+
+import os
+import socket
+import tempfile
+import threading
+
+import numpy as np
+import pytest
+
+from app.services.remote import (
+    _ALIGN,
+    ModelServerClient,
+    ModelServerError,
+    _pack,
+    recv_message,
+    send_message,
+)
+
+
+def _roundtrip(obj):
+    a, b = socket.socketpair()
+    try:
+        # ส่งใน thread แยก: payload ใหญ่กว่า buffer ของ socket ต้องมีคนอ่านระหว่างส่ง
+        t = threading.Thread(target=send_message, args=(a, obj))
+        t.start()
+        got = recv_message(b)
+        t.join(5.0)
+        return got
+    finally:
+        a.close()
+        b.close()
+
+
+def test_roundtrip_nested_arrays():
+    msg = {
+        "op": "encode",
+        "vecs": np.arange(12, dtype=np.float32).reshape(3, 4),
+        "items": [np.array([1, 2, 3], dtype=np.int64), {"deep": np.array([[True, False]])}],
+        "scalar": np.float32(0.5),
+        "tuple": (1, "สวัสดี"),
+        "empty": np.zeros((0, 384), dtype=np.float32),
+        "none": None,
+    }
+    got = _roundtrip(msg)
+    assert got["op"] == "encode" and got["none"] is None
+    np.testing.assert_array_equal(got["vecs"], msg["vecs"])
+    assert got["vecs"].dtype == np.float32
+    np.testing.assert_array_equal(got["items"][0], [1, 2, 3])
+    np.testing.assert_array_equal(got["items"][1]["deep"], [[True, False]])
+    assert got["scalar"] == 0.5 and isinstance(got["scalar"], float)
+    assert got["tuple"] == [1, "สวัสดี"]
+    assert got["empty"].shape == (0, 384)
+
+
+def test_roundtrip_large_payload():
+    big = np.random.default_rng(0).standard_normal((2000, 384)).astype(np.float32)  # ~3 MB
+    got = _roundtrip({"m": big})
+    np.testing.assert_array_equal(got["m"], big)
+
+
+def test_payload_offsets_are_aligned():
+    bufs, offset = [], [0]
+    packed = _pack([np.zeros(3, dtype=np.uint8), np.zeros(5, dtype=np.float64), np.zeros(1, dtype=np.int16)], bufs, offset)
+    assert all(ref["__nd__"] % _ALIGN == 0 for ref in packed)
+    assert offset[0] == sum(b.nbytes for b in bufs)
+
+
+def test_non_contiguous_array():
+    m = np.arange(20, dtype=np.float32).reshape(4, 5)[:, ::2]
+    got = _roundtrip({"m": m})
+    np.testing.assert_array_equal(got["m"], m)
+
+
+def test_closed_connection_raises():
+    a, b = socket.socketpair()
+    a.close()
+    with pytest.raises(ConnectionError):
+        recv_message(b)
+    b.close()
+
+
+class _Server:
+    """model server จำลอง: echo ข้อความกลับ, op=fail → error, op=drop → ปิดโดยไม่ตอบ, op=bye → ตอบแล้วปิด"""
+
+    def __init__(self, path):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(8)
+        self.connections = 0
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn:
+            while True:
+                try:
+                    msg = recv_message(conn)
+                except (ConnectionError, OSError):
+                    return
+                if msg["op"] == "drop":
+                    return
+                if msg["op"] == "fail":
+                    send_message(conn, {"ok": False, "error": "boom"})
+                else:
+                    send_message(conn, {"ok": True, "result": msg})
+                if msg["op"] == "bye":
+                    return
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture
+def server():
+    with tempfile.TemporaryDirectory() as d:
+        srv = _Server(os.path.join(d, "model.sock"))
+        yield srv
+        srv.close()
+
+
+def test_client_request_roundtrip(server):
+    client = ModelServerClient(server.path, connect_timeout=2.0)
+    vec = np.ones((2, 3), dtype=np.float32)
+    result = client.request("encode", texts=["a"], vec=vec)
+    assert result["op"] == "encode" and result["texts"] == ["a"]
+    np.testing.assert_array_equal(result["vec"], vec)
+    # connection ต่อ thread ถูกใช้ซ้ำ
+    client.request("ping")
+    assert server.connections == 1
+
+
+def test_client_error_response(server):
+    client = ModelServerClient(server.path, connect_timeout=2.0)
+    with pytest.raises(ModelServerError, match="boom"):
+        client.request("fail")
+
+
+def test_client_reconnects_after_server_closed(server):
+    client = ModelServerClient(server.path, connect_timeout=2.0)
+    client.request("bye")
+    # connection เดิมถูกปิดฝั่ง server (เช่น restart) → ลองใหม่บน connection ใหม่ครั้งเดียว
+    assert client.request("ping")["op"] == "ping"
+    assert server.connections == 2
+
+
+def test_client_gives_up_when_fresh_connection_fails(server):
+    client = ModelServerClient(server.path, connect_timeout=2.0)
+    client.request("ping")
+    with pytest.raises((ConnectionError, OSError)):
+        client.request("drop")
+    # ไม่ลองซ้ำไม่จบ: connection เดิม + connection ใหม่ 1 ครั้ง
+    assert server.connections == 2
+    assert client.request("ping")["op"] == "ping"
+
+
+def test_client_connection_per_thread(server):
+    client = ModelServerClient(server.path, connect_timeout=2.0)
+    threads = [threading.Thread(target=client.request, args=("ping",)) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5.0)
+    assert server.connections == 3
+
+
+def test_connect_timeout():
+    with tempfile.TemporaryDirectory() as d:
+        client = ModelServerClient(os.path.join(d, "missing.sock"), connect_timeout=0.1)
+        with pytest.raises(ModelServerError, match="cannot connect"):
+            client.request("ping")
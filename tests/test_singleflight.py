@@ -0,0 +1,150 @@
+# tests/test_singleflight.py
+"""SingleFlight (app/services/singleflight.py): coalesce, leader error, follower timeout, shareable"""
+
+import threading
+import time
+
+import pytest
+
+from app.services.singleflight import SingleFlight
+
+
+class _Leader:
+    """fn ของ leader ที่ค้างจนกว่าจะ release() — ให้ follower เข้ามาทันระหว่างรัน"""
+
+    def __init__(self, result="leader", error=None):
+        self.result = result
+        self.error = error
+        self.started = threading.Event()
+        self.released = threading.Event()
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self.released.wait(5.0)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def release(self):
+        self.released.set()
+
+
+def _start(fn, *args, **kwargs):
+    out = {}
+
+    def run():
+        try:
+            out["value"] = fn(*args, **kwargs)
+        except BaseException as e:
+            out["error"] = e
+
+    t = threading.Thread(target=run)
+    t.start()
+    return t, out
+
+
+def _wait_followers(sf, key, n):
+    deadline = time.monotonic() + 5.0
+    while time.monotonic() < deadline:
+        with sf._lock:
+            call = sf._calls.get(key)
+            if call is not None and call.followers >= n:
+                return
+        time.sleep(0.005)
+    raise AssertionError("followers did not arrive")
+
+
+def test_followers_share_leader_result():
+    sf = SingleFlight()
+    leader = _Leader()
+    t0, out0 = _start(sf.do, "k", leader)
+    assert leader.started.wait(5.0)
+
+    own = []
+    followers = [_start(sf.do, "k", lambda: own.append(1) or "own") for _ in range(3)]
+    _wait_followers(sf, "k", 3)
+    leader.release()
+    for t, _ in [(t0, out0)] + followers:
+        t.join(5.0)
+
+    assert out0["value"] == ("leader", False)
+    assert all(out["value"] == ("leader", True) for _, out in followers)
+    assert leader.calls == 1 and not own
+    stats = sf.stats()
+    assert stats["leaders"] == 1 and stats["coalesced"] == 3 and stats["inflight"] == 0
+
+
+def test_leader_error_follower_retries_once():
+    sf = SingleFlight()
+    leader = _Leader(error=RuntimeError("gemini down"))
+    t0, out0 = _start(sf.do, "k", leader)
+    assert leader.started.wait(5.0)
+    t1, out1 = _start(sf.do, "k", lambda: "retried")
+    _wait_followers(sf, "k", 1)
+    leader.release()
+    t0.join(5.0)
+    t1.join(5.0)
+
+    assert isinstance(out0["error"], RuntimeError)
+    assert out1["value"] == ("retried", False)
+    stats = sf.stats()
+    assert stats["leader_errors"] == 1 and stats["follower_retries"] == 1
+
+
+def test_follower_timeout_runs_own_request():
+    sf = SingleFlight(wait_timeout=5.0)
+    leader = _Leader()
+    t0, out0 = _start(sf.do, "k", leader)
+    assert leader.started.wait(5.0)
+
+    started = time.perf_counter()
+    result = sf.do("k", lambda: "own", wait_timeout=0.05)
+    assert time.perf_counter() - started < 1.0
+    assert result == ("own", False)
+    assert sf.stats()["follower_timeouts"] == 1
+
+    leader.release()
+    t0.join(5.0)
+    assert out0["value"] == ("leader", False)
+
+
+def test_unshareable_result_makes_follower_rerun():
+    sf = SingleFlight()
+    leader = _Leader(result={"skipped": ["router"]})
+    shareable = lambda result: not result.get("skipped")
+    t0, out0 = _start(sf.do, "k", leader, shareable=shareable)
+    assert leader.started.wait(5.0)
+    t1, out1 = _start(sf.do, "k", lambda: {"skipped": []}, shareable=shareable)
+    _wait_followers(sf, "k", 1)
+    leader.release()
+    t0.join(5.0)
+    t1.join(5.0)
+
+    assert out0["value"] == ({"skipped": ["router"]}, False)
+    assert out1["value"] == ({"skipped": []}, False)
+    assert sf.stats()["follower_reruns"] == 1
+
+
+def test_new_flight_after_leader_finishes():
+    sf = SingleFlight()
+    assert sf.do("k", lambda: 1) == (1, False)
+    assert sf.do("k", lambda: 2) == (2, False)
+    assert sf.stats()["leaders"] == 2
+
+
+def test_empty_key_is_not_coalesced():
+    sf = SingleFlight()
+    assert sf.do("", lambda: "x") == ("x", False)
+    assert sf.stats()["leaders"] == 0
+
+
+def test_leader_error_reaches_leader():
+    def boom():
+        raise ValueError("bad")
+
+    sf = SingleFlight()
+    with pytest.raises(ValueError):
+        sf.do("k", boom)
+    assert sf.stats()["inflight"] == 0
@@ -0,0 +1,139 @@
+# tests/test_swaplock.py
+"""SwapLock (app/core/startup.py): reader พร้อมกัน, writer มาก่อน, ซ้อนใน thread เดียวกัน"""
+
+import threading
+import time
+
+import pytest
+
+from app.core.startup import SwapLock
+
+
+def _thread(fn):
+    t = threading.Thread(target=fn, daemon=True)
+    t.start()
+    return t
+
+
+def test_readers_share():
+    lock = SwapLock()
+    inside = threading.Barrier(3, timeout=2.0)
+
+    def reader():
+        with lock.shared():
+            inside.wait()  # ทั้ง 3 ตัวต้องอยู่ใน shared พร้อมกันได้
+
+    threads = [_thread(reader) for _ in range(3)]
+    for t in threads:
+        t.join(3.0)
+        assert not t.is_alive()
+
+
+def test_writer_waits_for_readers_and_blocks_new_readers():
+    lock = SwapLock()
+    log = []
+    reader_in = threading.Event()
+    release_reader = threading.Event()
+
+    def reader():
+        with lock.shared():
+            reader_in.set()
+            release_reader.wait(2.0)
+            log.append("reader-out")
+
+    def writer():
+        with lock.exclusive():
+            log.append("writer")
+
+    def late_reader():
+        with lock.shared():
+            log.append("late-reader")
+
+    r = _thread(reader)
+    assert reader_in.wait(2.0)
+    w = _thread(writer)
+    while not lock._writers_waiting:
+        time.sleep(0.001)
+    late = _thread(late_reader)
+    time.sleep(0.05)
+    # writer รอ reader เดิม และ reader ใหม่ต่อคิวหลัง writer (ไม่แซง → writer ไม่อดตาย)
+    assert log == []
+    release_reader.set()
+    for t in (r, w, late):
+        t.join(2.0)
+    assert log == ["reader-out", "writer", "late-reader"]
+
+
+def test_shared_is_reentrant_while_writer_waits():
+    """reader ที่ถือ shared อยู่แล้วซ้อน shared ได้แม้มี writer รอ (ไม่งั้น deadlock)"""
+    lock = SwapLock()
+    outer_in = threading.Event()
+    writer_waiting = threading.Event()
+    done = threading.Event()
+
+    def reader():
+        with lock.shared():
+            outer_in.set()
+            writer_waiting.wait(2.0)
+            with lock.shared():
+                done.set()
+
+    r = _thread(reader)
+    assert outer_in.wait(2.0)
+    writer_done = threading.Event()
+
+    def writer():
+        with lock.exclusive():
+            writer_done.set()
+
+    w = _thread(writer)
+    while not lock._writers_waiting:
+        time.sleep(0.001)
+    writer_waiting.set()
+    assert done.wait(2.0)
+    r.join(2.0)
+    assert writer_done.wait(2.0)
+    w.join(2.0)
+    assert lock._readers == 0 and lock._writer is None
+
+
+def test_shared_inside_exclusive_same_thread():
+    lock = SwapLock()
+    with lock.exclusive():
+        with lock.shared():
+            pass
+    # ปล่อยครบ → thread อื่นเข้า exclusive ได้
+    t = _thread(lambda: lock.exclusive().__enter__().__exit__(None, None, None))
+    t.join(1.0)
+    assert not t.is_alive()
+    assert lock._readers == 0 and lock._writer is None
+
+
+def test_exclusive_inside_shared_raises():
+    lock = SwapLock()
+    with lock.shared():
+        with pytest.raises(RuntimeError):
+            with lock.exclusive():
+                pass
+
+
+def test_decorator_holds_shared():
+    lock = SwapLock()
+
+    @lock.shared()
+    def read():
+        return lock._readers
+
+    assert read() == 1
+    assert read() == 1
+    assert lock._readers == 0
+
+
+def test_release_on_exception():
+    lock = SwapLock()
+    with pytest.raises(ValueError):
+        with lock.shared():
+            raise ValueError
+    assert lock._readers == 0
+    with lock.exclusive():
+        pass
@@ -339,9 +339,11 @@ export default function StudentPage() {
     setIsLoading(true);
 
     try {
+      const sessionId = conversations.find((c) => c.id === currentId)?.sessionId;
       const data = await callApi<ApiChatResponse>("/chat", {
         question: text,
         user_id: "web",
+        session_id: sessionId,
       });
 
       const botMsg: Message = {
@@ -359,6 +361,7 @@ export default function StudentPage() {
               ...c,
               updatedAt: new Date().toISOString(),
               messages: [...c.messages, botMsg],
+              sessionId: data.session_id ?? c.sessionId,
             }
             : c
         )
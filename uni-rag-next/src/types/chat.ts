@@ -11,6 +11,7 @@ export interface Message {
 export interface ApiChatResponse {
     answer: string;
     next_topics?: string[];
+    session_id?: string | null;
 }
 
 export interface StoredConversation {
@@ -19,4 +20,6 @@ export interface StoredConversation {
     createdAt: string;
     updatedAt: string;
     messages: Message[];
+    // session ฝั่ง backend (ประวัติแชทสำหรับคำถามต่อเนื่อง)
+    sessionId?: string;
 }